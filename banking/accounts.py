@@ -1,10 +1,10 @@
 # Accounts module
-import sqlite3
-import random
-import string
 from threading import Lock
-from config import DB_CONFIG, DB_TYPE
-import time
+from . import events
+from .events import event_bus
+from .provisioning import account_provisioner
+from .storage import get_storage
+from .verification import verification_service
 
 account_lock = Lock()
 
@@ -13,326 +13,103 @@ class AccountManager:
     def create_account(user_id, account_type, initial_balance=0.0):
         """Create a new account for a user"""
         try:
-            # Generate a unique account number
-            account_number = ''.join(random.choices(string.digits, k=12))
-            
-            if DB_TYPE == 'sqlite':
-                conn = sqlite3.connect(DB_CONFIG['database'])
-                cursor = conn.cursor()
-                
-                cursor.execute("""
-                    INSERT INTO accounts (user_id, account_number, account_type, balance)
-                    VALUES (?, ?, ?, ?)
-                """, (user_id, account_number, account_type, initial_balance))
-                
-                conn.commit()
-            else:
-                import mysql.connector
-                conn = mysql.connector.connect(**DB_CONFIG)
-                cursor = conn.cursor()
-                
-                cursor.execute("""
-                    INSERT INTO accounts (user_id, account_number, account_type, balance)
-                    VALUES (%s, %s, %s, %s)
-                """, (user_id, account_number, account_type, initial_balance))
-                
-                conn.commit()
-            
+            # The allocator never hands out the same account number twice
+            account_number = account_provisioner.create_one(user_id, account_type, initial_balance)
+
+            event_bus.publish(events.ACCOUNT_CREATED, user_id=user_id, account_number=account_number)
             return True, account_number
-        
+
         except Exception as err:
             return False, str(err)
-        
-        finally:
-            if 'cursor' in locals():
-                cursor.close()
-            if 'conn' in locals():
-                conn.close()
-    
+
+    @staticmethod
+    def create_accounts_bulk(accounts, chunk_size=None, progress=None):
+        """Create many accounts from (user_id, account_type[, initial_balance]) rows.
+
+        Rows are inserted in chunked transactions; progress(update) is called
+        after every chunk (see AccountProvisioner.provision). Returns
+        (True, number created) or (False, message).
+        """
+        created = 0
+        try:
+            for update in account_provisioner.provision(accounts, chunk_size):
+                created = update['created']
+                if progress:
+                    progress(update)
+            return True, created
+
+        except Exception as err:
+            return False, f"Provisioning stopped after {created} accounts: {err}"
+
     @staticmethod
     def get_accounts(user_id):
         """Get all accounts for a user"""
         try:
-            if DB_TYPE == 'sqlite':
-                conn = sqlite3.connect(DB_CONFIG['database'])
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                
-                cursor.execute("""
-                    SELECT * FROM accounts WHERE user_id = ?
-                    ORDER BY created_at DESC
-                """, (user_id,))
-                
-                accounts = cursor.fetchall()
-                return [dict(account) for account in accounts]
-            else:
-                import mysql.connector
-                conn = mysql.connector.connect(**DB_CONFIG)
-                cursor = conn.cursor(dictionary=True)
-                
-                cursor.execute("""
-                    SELECT * FROM accounts WHERE user_id = %s
-                    ORDER BY created_at DESC
-                """, (user_id,))
-                
-                return cursor.fetchall()
-        
+            return get_storage().get_accounts(user_id)
+
         except Exception as err:
             print(f"Error getting accounts: {err}")
             return None
-        
-        finally:
-            if 'cursor' in locals():
-                cursor.close()
-            if 'conn' in locals():
-                conn.close()
-    
+
     @staticmethod
     def get_account_balance(account_number):
         """Get the balance of an account"""
         try:
-            if DB_TYPE == 'sqlite':
-                conn = sqlite3.connect(DB_CONFIG['database'])
-                cursor = conn.cursor()
-                
-                cursor.execute("""
-                    SELECT balance FROM accounts WHERE account_number = ?
-                """, (account_number,))
-                
-                result = cursor.fetchone()
-                return result[0] if result else None
-            else:
-                import mysql.connector
-                conn = mysql.connector.connect(**DB_CONFIG)
-                cursor = conn.cursor()
-                
-                cursor.execute("""
-                    SELECT balance FROM accounts WHERE account_number = %s
-                """, (account_number,))
-                
-                result = cursor.fetchone()
-                return result[0] if result else None
-        
+            return get_storage().get_balance(account_number)
+
         except Exception as err:
             print(f"Error getting account balance: {err}")
             return None
-        
-        finally:
-            if 'cursor' in locals():
-                cursor.close()
-            if 'conn' in locals():
-                conn.close()
-    
+
     @staticmethod
     def update_balance(account_number, amount_change):
         """Update the balance of an account"""
         try:
-            if DB_TYPE == 'sqlite':
-                conn = sqlite3.connect(DB_CONFIG['database'])
-                cursor = conn.cursor()
-                
-                cursor.execute("""
-                    UPDATE accounts 
-                    SET balance = balance + ? 
-                    WHERE account_number = ?
-                """, (amount_change, account_number))
-                
-                conn.commit()
-                return cursor.rowcount > 0
-            else:
-                import mysql.connector
-                conn = mysql.connector.connect(**DB_CONFIG)
-                cursor = conn.cursor()
-                
-                cursor.execute("""
-                    UPDATE accounts 
-                    SET balance = balance + %s 
-                    WHERE account_number = %s
-                """, (amount_change, account_number))
-                
-                conn.commit()
-                return cursor.rowcount > 0
-        
+            updated = get_storage().adjust_balance(account_number, amount_change)
+            if updated:
+                event_bus.publish(events.BALANCE_CHANGED, account_number=account_number,
+                                  amount_change=amount_change)
+            return updated
+
         except Exception as err:
             print(f"Error updating account balance: {err}")
             return False
-        
-        finally:
-            if 'cursor' in locals():
-                cursor.close()
-            if 'conn' in locals():
-                conn.close()
 
     @staticmethod
     def link_external_bank_account(user_id, bank_name, account_number, account_holder_name, ifsc_code=None):
         """Link an external bank account to a user profile"""
         try:
-            # Create the linked_bank_accounts table if it doesn't exist
-            if DB_TYPE == 'sqlite':
-                conn = sqlite3.connect(DB_CONFIG['database'])
-                cursor = conn.cursor()
-                
-                # Create table if it doesn't exist
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS linked_bank_accounts (
-                        link_id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id INTEGER NOT NULL,
-                        bank_name TEXT NOT NULL,
-                        account_number TEXT NOT NULL,
-                        account_holder_name TEXT NOT NULL,
-                        ifsc_code TEXT,
-                        is_verified INTEGER DEFAULT 0,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
-                        UNIQUE(user_id, account_number)
-                    )
-                """)
-                
-                # Insert the linked bank account
-                cursor.execute("""
-                    INSERT INTO linked_bank_accounts 
-                    (user_id, bank_name, account_number, account_holder_name, ifsc_code)
-                    VALUES (?, ?, ?, ?, ?)
-                """, (user_id, bank_name, account_number, account_holder_name, ifsc_code))
-                
-                conn.commit()
-            else:
-                import mysql.connector
-                conn = mysql.connector.connect(**DB_CONFIG)
-                cursor = conn.cursor()
-                
-                # Create table if it doesn't exist
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS linked_bank_accounts (
-                        link_id INT AUTO_INCREMENT PRIMARY KEY,
-                        user_id INT NOT NULL,
-                        bank_name VARCHAR(100) NOT NULL,
-                        account_number VARCHAR(50) NOT NULL,
-                        account_holder_name VARCHAR(100) NOT NULL,
-                        ifsc_code VARCHAR(20),
-                        is_verified TINYINT DEFAULT 0,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
-                        UNIQUE(user_id, account_number)
-                    )
-                """)
-                
-                # Insert the linked bank account
-                cursor.execute("""
-                    INSERT INTO linked_bank_accounts 
-                    (user_id, bank_name, account_number, account_holder_name, ifsc_code)
-                    VALUES (%s, %s, %s, %s, %s)
-                """, (user_id, bank_name, account_number, account_holder_name, ifsc_code))
-                
-                conn.commit()
-            
-            # In a real app, here we would initiate a verification process
-            # For demo purposes, we'll simulate a successful verification
+            get_storage().link_bank_account(user_id, bank_name, account_number, account_holder_name, ifsc_code)
+            event_bus.publish(events.BANK_LINKED, user_id=user_id, account_number=account_number)
+
+            # Verification runs in the background; BANK_VERIFIED follows when it succeeds
             AccountManager.verify_external_bank_account(user_id, account_number)
-            
+
             return True, "Bank account linked successfully"
-        
+
         except Exception as err:
             return False, f"Error linking bank account: {str(err)}"
-        
-        finally:
-            if 'cursor' in locals():
-                cursor.close()
-            if 'conn' in locals():
-                conn.close()
-    
+
     @staticmethod
     def verify_external_bank_account(user_id, account_number):
-        """Verify an external bank account (in a real app, this would involve micro-deposits)"""
+        """Queue micro-deposit verification of an external bank account.
+
+        Returns the verification job id (poll it with
+        verification_service.get_job), or None if it could not be queued.
+        """
         try:
-            # In a real app, this would be a complex process involving:
-            # 1. Making small deposits to the account (e.g., $0.32, $0.45)
-            # 2. User verifying the deposit amounts
-            # 3. Marking the account as verified
-            
-            # For demo purposes, we'll just mark it as verified after a short delay
-            time.sleep(1)  # Simulate verification process
-            
-            if DB_TYPE == 'sqlite':
-                conn = sqlite3.connect(DB_CONFIG['database'])
-                cursor = conn.cursor()
-                
-                cursor.execute("""
-                    UPDATE linked_bank_accounts 
-                    SET is_verified = 1
-                    WHERE user_id = ? AND account_number = ?
-                """, (user_id, account_number))
-                
-                conn.commit()
-                return cursor.rowcount > 0
-            else:
-                import mysql.connector
-                conn = mysql.connector.connect(**DB_CONFIG)
-                cursor = conn.cursor()
-                
-                cursor.execute("""
-                    UPDATE linked_bank_accounts 
-                    SET is_verified = 1
-                    WHERE user_id = %s AND account_number = %s
-                """, (user_id, account_number))
-                
-                conn.commit()
-                return cursor.rowcount > 0
-        
+            return verification_service.submit(user_id, account_number)
+
         except Exception as err:
             print(f"Error verifying bank account: {err}")
-            return False
-        
-        finally:
-            if 'cursor' in locals():
-                cursor.close()
-            if 'conn' in locals():
-                conn.close()
-    
+            return None
+
     @staticmethod
     def get_linked_bank_accounts(user_id):
         """Get all linked external bank accounts for a user"""
         try:
-            if DB_TYPE == 'sqlite':
-                conn = sqlite3.connect(DB_CONFIG['database'])
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                
-                # Check if table exists
-                cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='linked_bank_accounts'")
-                if not cursor.fetchone():
-                    return []
-                
-                cursor.execute("""
-                    SELECT * FROM linked_bank_accounts WHERE user_id = ?
-                    ORDER BY created_at DESC
-                """, (user_id,))
-                
-                accounts = cursor.fetchall()
-                return [dict(account) for account in accounts]
-            else:
-                import mysql.connector
-                conn = mysql.connector.connect(**DB_CONFIG)
-                cursor = conn.cursor(dictionary=True)
-                
-                # Check if table exists
-                cursor.execute("SHOW TABLES LIKE 'linked_bank_accounts'")
-                if not cursor.fetchone():
-                    return []
-                
-                cursor.execute("""
-                    SELECT * FROM linked_bank_accounts WHERE user_id = %s
-                    ORDER BY created_at DESC
-                """, (user_id,))
-                
-                return cursor.fetchall()
-        
+            return get_storage().get_linked_bank_accounts(user_id)
+
         except Exception as err:
             print(f"Error getting linked bank accounts: {err}")
             return None
-        
-        finally:
-            if 'cursor' in locals():
-                cursor.close()
-            if 'conn' in locals():
-                conn.close()
\ No newline at end of file
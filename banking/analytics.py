@@ -0,0 +1,227 @@
+# Transfer analytics module
+#
+# transfer_history is rolled up into small summary rows so the dashboard
+# never scans the history itself:
+#
+#   per account            hourly, daily and monthly totals
+#   per account and payee  daily, monthly and all-time totals
+#
+# Every row holds the money and number of transfers in and out. A
+# RollupEngine folds in the transfers after a high-water mark on
+# transfer_id, in batches; each batch and the new mark commit together, so
+# no batch is counted twice however often the engine runs or crashes. The
+# mark only moves over a missing transfer_id once the row after it has
+# settled (HISTORY_SCAN_CONFIG), since on MySQL a transfer with a lower id
+# can commit after one with a higher id; a transfer whose transaction stays
+# open longer than that is missed. The engine runs in the background after
+# transfers (coalescing bursts) and publishes ANALYTICS_UPDATED; it can also
+# be run from the command line:
+#
+#     python -m banking.analytics
+#
+# Queries then read at most a few dozen rows per account, independent of
+# how much history there is.
+import argparse
+import logging
+import sys
+import threading
+from datetime import datetime, timedelta, timezone
+from config import ANALYTICS_CONFIG, HISTORY_SCAN_CONFIG
+from . import events
+from .events import event_bus
+from .storage import get_storage, settled_through, utc_timestamp
+
+logger = logging.getLogger(__name__)
+
+# Rollup granularities
+HOURLY = 'H'
+DAILY = 'D'
+MONTHLY = 'M'
+ALL_TIME = 'A'
+
+ALL_COUNTERPARTIES = ''
+
+# (granularity, per counterparty) of every rollup kept. Hourly rows are
+# per account only: per payee they would be about as many as the transfers
+ROLLUPS = (
+    (HOURLY, False),
+    (DAILY, False),
+    (MONTHLY, False),
+    (DAILY, True),
+    (MONTHLY, True),
+    (ALL_TIME, True)
+)
+
+def bucket_start(created_at, granularity):
+    """The bucket a 'YYYY-MM-DD HH:MM:SS' time falls in, in the same format"""
+    stamp = str(created_at)  # MySQL returns datetimes
+    if granularity == HOURLY:
+        return stamp[:13] + ':00:00'
+    if granularity == DAILY:
+        return stamp[:10] + ' 00:00:00'
+    if granularity == MONTHLY:
+        return stamp[:7] + '-01 00:00:00'
+    return ''
+
+def recent_buckets(granularity, periods, now=None):
+    """The starts of the last `periods` buckets up to now (UTC), oldest first"""
+    now = now or datetime.now(timezone.utc)
+    if granularity == MONTHLY:
+        months = [(now.year * 12 + now.month - 1) - i for i in range(periods)]
+        return [f'{month // 12:04d}-{month % 12 + 1:02d}-01 00:00:00' for month in reversed(months)]
+    step = timedelta(hours=1) if granularity == HOURLY else timedelta(days=1)
+    return [bucket_start((now - i * step).strftime('%Y-%m-%d %H:%M:%S'), granularity)
+            for i in reversed(range(periods))]
+
+def aggregate(rows):
+    """Sum rows of StorageBackend.get_transfers_after into rollup rows
+    (account_number, granularity, counterparty, bucket, amount_in, count_in, amount_out, count_out)"""
+    totals = {}
+    for _, account_number, counterparty, transaction_type, amount, created_at in rows:
+        amount = float(amount)
+        outgoing = transaction_type == 'OUTGOING'
+        for granularity, per_counterparty in ROLLUPS:
+            key = (account_number, granularity, counterparty if per_counterparty else ALL_COUNTERPARTIES,
+                   bucket_start(created_at, granularity))
+            entry = totals.get(key)
+            if entry is None:
+                entry = totals[key] = [0.0, 0, 0.0, 0]
+            if outgoing:
+                entry[2] += amount
+                entry[3] += 1
+            else:
+                entry[0] += amount
+                entry[1] += 1
+    return [key + (round(e[0], 2), e[1], round(e[2], 2), e[3]) for key, e in totals.items()]
+
+class RollupEngine:
+    """Keeps the rollups up to date with transfer_history"""
+    def __init__(self, batch_size=None, delay=None, bus=event_bus):
+        self.batch_size = batch_size or ANALYTICS_CONFIG['batch_size']
+        self.delay = ANALYTICS_CONFIG['delay'] if delay is None else delay
+        self.bus = bus
+        self.lock = threading.Lock()  # One update at a time in this process
+        self.condition = threading.Condition()
+        self.requested = False
+        self.stopping = False
+        self.waiting = False  # Stopped at a missing transfer_id that may still commit
+        self.thread = None
+
+    def update(self, max_batches=None):
+        """Roll up the transfers after the high-water mark, up to the first missing
+        transfer_id that has not settled. Returns the number of rows rolled up"""
+        storage = get_storage()
+        rolled = 0
+        batches = 0
+        accounts = set()
+        with self.lock:
+            self.waiting = False
+            while max_batches is None or batches < max_batches:
+                after = storage.get_rollup_watermark()
+                settled_before = utc_timestamp(HISTORY_SCAN_CONFIG['settle_seconds'])
+                rows = storage.get_transfers_after(after, self.batch_size)
+                last, self.waiting = settled_through(after, [(row[0], row[5]) for row in rows], settled_before)
+                rows = [row for row in rows if row[0] <= last]
+                if not rows:
+                    break
+                if not storage.apply_rollup(after, rows[-1][0], aggregate(rows)):
+                    # Another process rolled these up first; continue from where it got to
+                    continue
+                rolled += len(rows)
+                batches += 1
+                accounts.update(row[1] for row in rows)
+
+        if accounts:
+            self.bus.publish(events.ANALYTICS_UPDATED, account_numbers=accounts)
+        return rolled
+
+    # --- Background updates ---
+
+    def start(self):
+        """Roll up in the background: now, and after transfers"""
+        with self.condition:
+            if self.thread:
+                return False
+            self.stopping = False
+            self.requested = True  # Catch up with whatever happened while we were not running
+            self.thread = threading.Thread(target=self._worker, daemon=True, name="AnalyticsRollup")
+            self.thread.start()
+        self.bus.subscribe(events.TRANSFER_COMPLETED, self._on_transfer)
+        return True
+
+    def stop(self, timeout=5.0):
+        self.bus.unsubscribe(events.TRANSFER_COMPLETED, self._on_transfer)
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+            thread, self.thread = self.thread, None
+        if thread:
+            thread.join(timeout)
+
+    def request(self):
+        """Ask the background worker for an update"""
+        with self.condition:
+            self.requested = True
+            self.condition.notify()
+
+    def _on_transfer(self, topic, payload):
+        self.request()
+
+    def _worker(self):
+        while True:
+            with self.condition:
+                # After stopping at a missing transfer_id, look again once it has settled
+                self.condition.wait_for(lambda: self.requested or self.stopping,
+                                        HISTORY_SCAN_CONFIG['settle_seconds'] if self.waiting else None)
+                if self.stopping:
+                    return
+                # Let a burst of transfers accumulate into one update
+                self.condition.wait_for(lambda: self.stopping, self.delay)
+                if self.stopping:
+                    return
+                self.requested = False
+            try:
+                self.update()
+            except Exception:
+                logger.exception("Analytics rollup failed")
+
+rollup_engine = RollupEngine()
+
+def top_payees(user_id, limit=None):
+    """The user's largest payees (all time) as dicts with counterparty, amount and count"""
+    return get_storage().get_top_payees(user_id, limit or ANALYTICS_CONFIG['top_payees'])
+
+def spending_trend(user_id, granularity=DAILY, periods=None, now=None):
+    """Money in and out of the user's accounts over the last periods buckets,
+    oldest first, with empty buckets included"""
+    buckets = recent_buckets(granularity, periods or ANALYTICS_CONFIG['trend_periods'], now)
+    rows = {row['bucket']: row for row in get_storage().get_rollup_series(user_id, granularity, buckets[0])}
+    trend = []
+    for bucket in buckets:
+        row = rows.get(bucket, {})
+        trend.append({
+            'bucket': bucket,
+            'amount_in': float(row.get('amount_in') or 0.0),
+            'count_in': int(row.get('count_in') or 0),
+            'amount_out': float(row.get('amount_out') or 0.0),
+            'count_out': int(row.get('count_out') or 0)
+        })
+    return trend
+
+def main(argv=None):
+    """Command line entry point: bring the rollups up to date"""
+    parser = argparse.ArgumentParser(prog='python -m banking.analytics',
+                                     description="Roll up new transfer history into the analytics tables")
+    parser.add_argument('--batch-size', type=int, default=ANALYTICS_CONFIG['batch_size'])
+    args = parser.parse_args(argv)
+
+    try:
+        rolled = RollupEngine(args.batch_size).update()
+    except Exception as err:
+        print(f"Rollup failed: {err}", file=sys.stderr)
+        return 1
+    print(f"Rolled up {rolled} transfer history rows", file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,698 @@
+# Database bootstrap
+#
+# Schema changes are numbered migrations. The version a database is at is
+# stored in the database itself (PRAGMA user_version on SQLite, the
+# schema_version table on MySQL), so an up-to-date database is recognized
+# with a single query and startup runs no DDL at all.
+#
+# SQLite runs all pending migrations in one transaction. MySQL commits DDL
+# as it goes, so there every statement is recorded in schema_steps once it
+# has run, and an upgrade that failed partway resumes after the last one.
+import threading
+import time
+from config import DB_TYPE
+from .db_adapter import DatabaseAdapter
+
+# Accounts that exist before opening balances are recorded get the one
+# that makes their current balance agree with their history. The history
+# is summed per account into reconciliation_balances first (one pass over
+# each table), then subtracted, then the scratch rows are removed. Scratch
+# rows left by an interrupted run are cleared first.
+_BACKFILL_OPENING_BALANCES = [
+    "DELETE FROM reconciliation_balances",
+    """
+    INSERT INTO reconciliation_balances (account_id, expected_balance)
+    SELECT account_id, SUM(delta) FROM (
+        SELECT a.account_id AS account_id,
+               CASE WHEN t.transaction_type = 'OUTGOING' THEN -t.amount ELSE t.amount END AS delta
+        FROM transfer_history t
+        JOIN accounts a ON a.account_number =
+            CASE WHEN t.transaction_type = 'OUTGOING' THEN t.source_account ELSE t.destination_account END
+        UNION ALL
+        SELECT account_id, CASE WHEN transaction_type = 'DEPOSIT' THEN amount ELSE -amount END
+        FROM transactions
+        WHERE status = 'COMPLETED' AND transaction_type IN ('DEPOSIT', 'WITHDRAWAL')
+    ) history
+    GROUP BY account_id
+    """,
+    """
+    UPDATE accounts SET opening_balance = balance - COALESCE(
+        (SELECT r.expected_balance FROM reconciliation_balances r WHERE r.account_id = accounts.account_id), 0
+    )
+    """,
+    "DELETE FROM reconciliation_balances"
+]
+
+MIGRATIONS = {
+    1: {
+        'sqlite': [
+            """
+            CREATE TABLE IF NOT EXISTS users (
+                user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                username TEXT NOT NULL UNIQUE,
+                password_hash TEXT NOT NULL,
+                salt TEXT NOT NULL,
+                full_name TEXT NOT NULL,
+                email TEXT NOT NULL UNIQUE,
+                phone TEXT,
+                is_admin INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS accounts (
+                account_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                account_number TEXT NOT NULL UNIQUE,
+                account_type TEXT NOT NULL,
+                balance REAL DEFAULT 0.00,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS linked_bank_accounts (
+                link_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                bank_name TEXT NOT NULL,
+                account_number TEXT NOT NULL,
+                account_holder_name TEXT NOT NULL,
+                ifsc_code TEXT,
+                is_verified INTEGER DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
+                UNIQUE(user_id, account_number)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS transactions (
+                transaction_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                account_id INTEGER NOT NULL,
+                transaction_type TEXT NOT NULL,
+                amount REAL NOT NULL,
+                description TEXT,
+                related_account TEXT,
+                status TEXT DEFAULT 'PENDING',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (account_id) REFERENCES accounts(account_id) ON DELETE CASCADE
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS transaction_queue (
+                queue_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                transaction_id INTEGER NOT NULL,
+                priority INTEGER DEFAULT 5,
+                status TEXT DEFAULT 'QUEUED',
+                added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (transaction_id) REFERENCES transactions(transaction_id) ON DELETE CASCADE
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS transfer_history (
+                transfer_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                source_account TEXT NOT NULL,
+                destination_account TEXT NOT NULL,
+                amount REAL NOT NULL,
+                description TEXT,
+                transaction_type TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """
+        ],
+        'mysql': [
+            """
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INT PRIMARY KEY,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS users (
+                user_id INT AUTO_INCREMENT PRIMARY KEY,
+                username VARCHAR(50) NOT NULL UNIQUE,
+                password_hash VARCHAR(64) NOT NULL,
+                salt VARCHAR(64) NOT NULL,
+                full_name VARCHAR(100) NOT NULL,
+                email VARCHAR(100) NOT NULL UNIQUE,
+                phone VARCHAR(20),
+                is_admin BOOLEAN DEFAULT FALSE,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS accounts (
+                account_id INT AUTO_INCREMENT PRIMARY KEY,
+                user_id INT NOT NULL,
+                account_number VARCHAR(20) NOT NULL UNIQUE,
+                account_type ENUM('SAVINGS', 'CHECKING', 'BUSINESS') NOT NULL,
+                balance DECIMAL(15, 2) DEFAULT 0.00,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS linked_bank_accounts (
+                link_id INT AUTO_INCREMENT PRIMARY KEY,
+                user_id INT NOT NULL,
+                bank_name VARCHAR(100) NOT NULL,
+                account_number VARCHAR(50) NOT NULL,
+                account_holder_name VARCHAR(100) NOT NULL,
+                ifsc_code VARCHAR(20),
+                is_verified TINYINT DEFAULT 0,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (user_id) REFERENCES users(user_id) ON DELETE CASCADE,
+                UNIQUE(user_id, account_number)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS transactions (
+                transaction_id INT AUTO_INCREMENT PRIMARY KEY,
+                account_id INT NOT NULL,
+                transaction_type ENUM('DEPOSIT', 'WITHDRAWAL', 'TRANSFER_IN', 'TRANSFER_OUT') NOT NULL,
+                amount DECIMAL(15, 2) NOT NULL,
+                description VARCHAR(255),
+                related_account VARCHAR(20),
+                status ENUM('PENDING', 'COMPLETED', 'FAILED') DEFAULT 'PENDING',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (account_id) REFERENCES accounts(account_id) ON DELETE CASCADE
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS transaction_queue (
+                queue_id INT AUTO_INCREMENT PRIMARY KEY,
+                transaction_id INT NOT NULL,
+                priority INT DEFAULT 5,
+                status ENUM('QUEUED', 'PROCESSING', 'COMPLETED', 'FAILED') DEFAULT 'QUEUED',
+                added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (transaction_id) REFERENCES transactions(transaction_id) ON DELETE CASCADE
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS transfer_history (
+                transfer_id INT AUTO_INCREMENT PRIMARY KEY,
+                source_account VARCHAR(20) NOT NULL,
+                destination_account VARCHAR(20) NOT NULL,
+                amount DECIMAL(15,2) NOT NULL,
+                description TEXT,
+                transaction_type VARCHAR(10) NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """
+        ]
+    },
+    # Phone number directory (E.164 keys) for phone payments
+    2: {
+        'sqlite': [
+            """
+            CREATE TABLE IF NOT EXISTS phone_directory (
+                phone TEXT PRIMARY KEY,
+                account_number TEXT NOT NULL,
+                display_name TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_phone_directory_account ON phone_directory (account_number)",
+            "CREATE INDEX IF NOT EXISTS idx_transfer_history_source ON transfer_history (source_account)"
+        ],
+        'mysql': [
+            """
+            CREATE TABLE IF NOT EXISTS phone_directory (
+                phone VARCHAR(16) PRIMARY KEY,
+                account_number VARCHAR(20) NOT NULL,
+                display_name VARCHAR(100) NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_phone_directory_account (account_number)
+            )
+            """,
+            "CREATE INDEX idx_transfer_history_source ON transfer_history (source_account)"
+        ]
+    },
+    # Idempotency keys of payment requests
+    3: {
+        'sqlite': [
+            """
+            CREATE TABLE IF NOT EXISTS idempotency_keys (
+                idem_key TEXT PRIMARY KEY,
+                status TEXT NOT NULL DEFAULT 'PENDING',
+                success INTEGER,
+                message TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_idempotency_keys_created ON idempotency_keys (created_at)"
+        ],
+        'mysql': [
+            """
+            CREATE TABLE IF NOT EXISTS idempotency_keys (
+                idem_key VARCHAR(64) PRIMARY KEY,
+                status ENUM('PENDING', 'DONE') NOT NULL DEFAULT 'PENDING',
+                success TINYINT,
+                message VARCHAR(255),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_idempotency_keys_created (created_at)
+            )
+            """
+        ]
+    },
+    # Bank account verification jobs
+    4: {
+        'sqlite': [
+            """
+            CREATE TABLE IF NOT EXISTS verification_jobs (
+                job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                account_number TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'PENDING',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL,
+                last_error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_verification_jobs_status ON verification_jobs (status, next_attempt_at)",
+            "CREATE INDEX IF NOT EXISTS idx_verification_jobs_user ON verification_jobs (user_id)"
+        ],
+        'mysql': [
+            """
+            CREATE TABLE IF NOT EXISTS verification_jobs (
+                job_id INT AUTO_INCREMENT PRIMARY KEY,
+                user_id INT NOT NULL,
+                account_number VARCHAR(50) NOT NULL,
+                status ENUM('PENDING', 'RUNNING', 'VERIFIED', 'FAILED') NOT NULL DEFAULT 'PENDING',
+                attempts INT NOT NULL DEFAULT 0,
+                next_attempt_at DOUBLE NOT NULL,
+                last_error VARCHAR(255),
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_verification_jobs_status (status, next_attempt_at),
+                INDEX idx_verification_jobs_user (user_id)
+            )
+            """
+        ]
+    },
+    # Named sequences (account number allocation)
+    5: {
+        'sqlite': [
+            """
+            CREATE TABLE IF NOT EXISTS sequences (
+                name TEXT PRIMARY KEY,
+                next_value INTEGER NOT NULL DEFAULT 0
+            )
+            """
+        ],
+        'mysql': [
+            """
+            CREATE TABLE IF NOT EXISTS sequences (
+                name VARCHAR(50) PRIMARY KEY,
+                next_value BIGINT NOT NULL DEFAULT 0
+            )
+            """
+        ]
+    },
+    # Checkpoints and pending balance changes of bulk history imports
+    6: {
+        'sqlite': [
+            """
+            CREATE TABLE IF NOT EXISTS import_checkpoints (
+                import_id TEXT PRIMARY KEY,
+                table_name TEXT NOT NULL,
+                source TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'LOADING',
+                rows_done INTEGER NOT NULL DEFAULT 0,
+                rows_loaded INTEGER NOT NULL DEFAULT 0,
+                rows_rejected INTEGER NOT NULL DEFAULT 0,
+                dropped_indexes TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS import_balance_deltas (
+                import_id TEXT NOT NULL,
+                account_number TEXT NOT NULL,
+                delta REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (import_id, account_number)
+            )
+            """
+        ],
+        'mysql': [
+            """
+            CREATE TABLE IF NOT EXISTS import_checkpoints (
+                import_id VARCHAR(64) PRIMARY KEY,
+                table_name VARCHAR(50) NOT NULL,
+                source VARCHAR(255) NOT NULL,
+                status ENUM('LOADING', 'DONE') NOT NULL DEFAULT 'LOADING',
+                rows_done BIGINT NOT NULL DEFAULT 0,
+                rows_loaded BIGINT NOT NULL DEFAULT 0,
+                rows_rejected BIGINT NOT NULL DEFAULT 0,
+                dropped_indexes TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS import_balance_deltas (
+                import_id VARCHAR(64) NOT NULL,
+                account_number VARCHAR(20) NOT NULL,
+                delta DECIMAL(15,2) NOT NULL DEFAULT 0,
+                PRIMARY KEY (import_id, account_number)
+            )
+            """
+        ]
+    },
+    # Opening balances, reconciled balances and reconciliation watermarks
+    7: {
+        'sqlite': [
+            "ALTER TABLE accounts ADD COLUMN opening_balance REAL NOT NULL DEFAULT 0.00",
+            """
+            CREATE TABLE IF NOT EXISTS reconciliation_balances (
+                account_id INTEGER PRIMARY KEY,
+                expected_balance REAL NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS reconciliation_runs (
+                run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                mode TEXT NOT NULL,
+                transfer_watermark INTEGER NOT NULL,
+                transaction_watermark INTEGER NOT NULL,
+                accounts INTEGER NOT NULL,
+                discrepancies INTEGER NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """
+        ] + _BACKFILL_OPENING_BALANCES,
+        'mysql': [
+            "ALTER TABLE accounts ADD COLUMN opening_balance DECIMAL(15, 2) NOT NULL DEFAULT 0.00 AFTER balance",
+            """
+            CREATE TABLE IF NOT EXISTS reconciliation_balances (
+                account_id INT PRIMARY KEY,
+                expected_balance DECIMAL(15, 2) NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS reconciliation_runs (
+                run_id INT AUTO_INCREMENT PRIMARY KEY,
+                mode ENUM('FULL', 'INCREMENTAL') NOT NULL,
+                transfer_watermark BIGINT NOT NULL,
+                transaction_watermark BIGINT NOT NULL,
+                accounts INT NOT NULL,
+                discrepancies INT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """
+        ] + _BACKFILL_OPENING_BALANCES
+    },
+    # Transfer analytics rollups and their high-water mark
+    8: {
+        'sqlite': [
+            """
+            CREATE TABLE IF NOT EXISTS transfer_rollups (
+                account_number TEXT NOT NULL,
+                granularity TEXT NOT NULL,
+                counterparty TEXT NOT NULL DEFAULT '',
+                bucket TEXT NOT NULL,
+                amount_in REAL NOT NULL DEFAULT 0,
+                count_in INTEGER NOT NULL DEFAULT 0,
+                amount_out REAL NOT NULL DEFAULT 0,
+                count_out INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (account_number, granularity, counterparty, bucket)
+            ) WITHOUT ROWID
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS rollup_state (
+                name TEXT PRIMARY KEY,
+                high_water INTEGER NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            "INSERT OR IGNORE INTO rollup_state (name, high_water) VALUES ('transfer_history', 0)"
+        ],
+        'mysql': [
+            """
+            CREATE TABLE IF NOT EXISTS transfer_rollups (
+                account_number VARCHAR(20) NOT NULL,
+                granularity CHAR(1) NOT NULL,
+                counterparty VARCHAR(20) NOT NULL DEFAULT '',
+                bucket VARCHAR(19) NOT NULL,
+                amount_in DECIMAL(15, 2) NOT NULL DEFAULT 0,
+                count_in INT NOT NULL DEFAULT 0,
+                amount_out DECIMAL(15, 2) NOT NULL DEFAULT 0,
+                count_out INT NOT NULL DEFAULT 0,
+                PRIMARY KEY (account_number, granularity, counterparty, bucket)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS rollup_state (
+                name VARCHAR(50) PRIMARY KEY,
+                high_water BIGINT NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """,
+            "INSERT IGNORE INTO rollup_state (name, high_water) VALUES ('transfer_history', 0)"
+        ]
+    },
+    # Transactions held by risk scoring, and their review
+    9: {
+        'sqlite': [
+            """
+            CREATE TABLE IF NOT EXISTS transaction_holds (
+                transaction_id INTEGER PRIMARY KEY,
+                reason TEXT NOT NULL,
+                decision TEXT,
+                held_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                reviewed_at TIMESTAMP,
+                FOREIGN KEY (transaction_id) REFERENCES transactions(transaction_id) ON DELETE CASCADE
+            )
+            """
+        ],
+        'mysql': [
+            """
+            ALTER TABLE transactions
+            MODIFY status ENUM('PENDING', 'COMPLETED', 'FAILED', 'HELD') DEFAULT 'PENDING'
+            """,
+            """
+            ALTER TABLE transaction_queue
+            MODIFY status ENUM('QUEUED', 'PROCESSING', 'COMPLETED', 'FAILED', 'HELD') DEFAULT 'QUEUED'
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS transaction_holds (
+                transaction_id INT PRIMARY KEY,
+                reason VARCHAR(100) NOT NULL,
+                decision ENUM('APPROVED', 'REJECTED'),
+                held_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                reviewed_at TIMESTAMP NULL,
+                FOREIGN KEY (transaction_id) REFERENCES transactions(transaction_id) ON DELETE CASCADE
+            )
+            """
+        ]
+    },
+    # Queue workers (threads or processes) poll for QUEUED rows in FIFO order,
+    # then claim and finish them by transaction_id
+    10: {
+        'sqlite': [
+            "CREATE INDEX IF NOT EXISTS idx_transaction_queue_status ON transaction_queue (status, added_at, queue_id)",
+            "CREATE INDEX IF NOT EXISTS idx_transaction_queue_transaction ON transaction_queue (transaction_id)"
+        ],
+        'mysql': [
+            # InnoDB already indexes transaction_id for its foreign key
+            "CREATE INDEX idx_transaction_queue_status ON transaction_queue (status, added_at, queue_id)"
+        ]
+    },
+    # Who claimed a queued transaction and when, so the claims of a worker
+    # that died are queued again. Claims left from before get the time of
+    # the upgrade; reviews of held transactions are never queued again
+    11: {
+        'sqlite': [
+            "ALTER TABLE transaction_queue ADD COLUMN claimed_by TEXT",
+            "ALTER TABLE transaction_queue ADD COLUMN claimed_at TIMESTAMP",
+            """
+            UPDATE transaction_queue SET claimed_at = CURRENT_TIMESTAMP
+            WHERE status = 'PROCESSING'
+              AND transaction_id NOT IN (SELECT transaction_id FROM transaction_holds WHERE decision IS NOT NULL)
+            """
+        ],
+        'mysql': [
+            "ALTER TABLE transaction_queue ADD COLUMN claimed_by VARCHAR(100) NULL, ADD COLUMN claimed_at TIMESTAMP NULL",
+            """
+            UPDATE transaction_queue SET claimed_at = CURRENT_TIMESTAMP
+            WHERE status = 'PROCESSING'
+              AND transaction_id NOT IN (SELECT transaction_id FROM transaction_holds WHERE decision IS NOT NULL)
+            """
+        ]
+    }
+}
+
+SCHEMA_VERSION = max(MIGRATIONS)
+
+def get_schema_version(conn):
+    """Get the schema version of a database (0 if it was never bootstrapped)"""
+    cursor = conn.cursor()
+    try:
+        if DB_TYPE == 'sqlite':
+            cursor.execute("PRAGMA user_version")
+        else:
+            try:
+                cursor.execute("SELECT MAX(version) FROM schema_version")
+            except Exception:
+                # No schema_version table yet
+                return 0
+        row = cursor.fetchone()
+        return (row[0] or 0) if row else 0
+    finally:
+        cursor.close()
+
+def _set_schema_version(cursor, version):
+    if DB_TYPE == 'sqlite':
+        cursor.execute(f"PRAGMA user_version = {int(version)}")
+    else:
+        cursor.execute(f"INSERT INTO schema_version (version) VALUES ({int(version)})")
+
+def _completed_steps(cursor, version):
+    """Indexes of the statements of a MySQL migration that already ran"""
+    if DB_TYPE == 'sqlite':
+        return set()
+    cursor.execute(f"SELECT step FROM schema_steps WHERE version = {int(version)}")
+    return {row[0] for row in cursor.fetchall()}
+
+def _record_step(conn, cursor, version, step):
+    if DB_TYPE != 'sqlite':
+        cursor.execute(f"INSERT INTO schema_steps (version, step) VALUES ({int(version)}, {int(step)})")
+        # Commits a data change together with its record (DDL has committed itself)
+        conn.commit()
+
+def _ensure_admin(conn):
+    """Create the default admin user if there is none"""
+    if DatabaseAdapter.fetch_one(conn, 'users.username_exists', ('admin',)):
+        return False
+
+    from security.hashing import generate_hash
+    salt, password_hash = generate_hash("admin123")
+    DatabaseAdapter.execute(conn, 'users.create', (
+        "admin", password_hash, salt, "Administrator", "admin@bank.com", 1
+    )).close()
+    print("Admin user created.")
+    return True
+
+def bootstrap_schema():
+    """Bring the database schema up to SCHEMA_VERSION.
+
+    Idempotent: a database that is already current costs one query.
+    Returns the number of migrations applied.
+    """
+    with DatabaseAdapter.writer() as conn:
+        current = get_schema_version(conn)
+        if current >= SCHEMA_VERSION:
+            return 0
+
+        cursor = conn.cursor()
+        try:
+            if DB_TYPE == 'sqlite':
+                if not conn.in_transaction:
+                    # DDL does not open a transaction implicitly; make the
+                    # migrations and the version bump commit together
+                    cursor.execute("BEGIN")
+            else:
+                cursor.execute(
+                    "CREATE TABLE IF NOT EXISTS schema_steps ("
+                    "version INT NOT NULL, step INT NOT NULL, PRIMARY KEY (version, step))"
+                )
+            for version in range(current + 1, SCHEMA_VERSION + 1):
+                done = _completed_steps(cursor, version)
+                for step, statement in enumerate(MIGRATIONS[version][DB_TYPE]):
+                    if step not in done:
+                        cursor.execute(statement)
+                        _record_step(conn, cursor, version, step)
+                _set_schema_version(cursor, version)
+        finally:
+            cursor.close()
+
+        # Hashing the default password is slow, so it only happens on a fresh database
+        _ensure_admin(conn)
+
+    return SCHEMA_VERSION - current
+
+def _probe_database():
+    """Open a connection and run a trivial query"""
+    with DatabaseAdapter.writer() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+        finally:
+            cursor.close()
+
+def wait_for_database(timeout=30.0, initial_delay=0.1, max_delay=2.0, probe=None):
+    """Poll until the database accepts connections, backing off exponentially.
+
+    Raises the last connection error if it is still unavailable after timeout seconds.
+    """
+    probe = probe or _probe_database
+    deadline = time.monotonic() + timeout
+    delay = initial_delay
+    attempt = 0
+
+    while True:
+        attempt += 1
+        try:
+            probe()
+            return attempt
+        except Exception:
+            if time.monotonic() + delay > deadline:
+                raise
+            time.sleep(delay)
+            delay = min(delay * 2, max_delay)
+
+class DatabaseBootstrap:
+    """Connects to the database and bootstraps the schema on a background thread"""
+    CONNECTING = 'connecting'
+    READY = 'ready'
+    FAILED = 'failed'
+
+    def __init__(self):
+        self.state = DatabaseBootstrap.CONNECTING
+        self.error = None
+        self._done = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Start bootstrapping in the background"""
+        if self._thread and self._thread.is_alive():
+            return False
+
+        self._thread = threading.Thread(
+            target=self.run,
+            daemon=True,
+            name="DatabaseBootstrap"
+        )
+        self._thread.start()
+        return True
+
+    def run(self):
+        """Wait for the database and bootstrap the schema. Returns True when ready"""
+        self.state = DatabaseBootstrap.CONNECTING
+        self.error = None
+        self._done.clear()
+        try:
+            wait_for_database()
+            bootstrap_schema()
+            self.state = DatabaseBootstrap.READY
+        except Exception as err:
+            self.error = str(err)
+            self.state = DatabaseBootstrap.FAILED
+        finally:
+            self._done.set()
+        return self.state == DatabaseBootstrap.READY
+
+    def is_ready(self):
+        return self.state == DatabaseBootstrap.READY
+
+    def wait(self, timeout=None):
+        """Block until bootstrapping finished. Returns True if the database is ready"""
+        self._done.wait(timeout)
+        return self.is_ready()
+
+database_bootstrap = DatabaseBootstrap()
@@ -1,83 +1,512 @@
 import sqlite3
-import mysql.connector
-from config import DB_CONFIG, DB_TYPE
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from functools import lru_cache
+from queue import Queue, Empty, Full
+from config import DB_CONFIG, DB_TYPE, SQLITE_TUNING
+from .queries import Statement, get_statement
+from .instrumentation import query_monitor, query_name
+
+# SQLite connection model: one shared writer connection and a pool of
+# read-only connections per database file
+_sqlite_pools = {}
+_sqlite_pools_lock = threading.Lock()
+
+class _SQLitePool:
+    """Writer connection and read-only connection pool for one database file"""
+    def __init__(self, database):
+        self.database = database
+        self.writer_lock = threading.RLock()
+        self.writer = None
+        self.readers = Queue(maxsize=SQLITE_TUNING['read_pool_size'])
+
+    def get_writer(self):
+        if self.writer is None:
+            self.writer = DatabaseAdapter.connect_sqlite(self.database)
+        return self.writer
+
+    def get_reader(self):
+        try:
+            return self.readers.get_nowait()
+        except Empty:
+            # Make sure the file (and the WAL index) exist before opening read-only
+            with self.writer_lock:
+                self.get_writer()
+            return DatabaseAdapter.connect_sqlite(self.database, readonly=True)
+
+    def release_reader(self, conn):
+        try:
+            self.readers.put_nowait(conn)
+        except Full:
+            conn.close()
+
+    def close(self):
+        with self.writer_lock:
+            if self.writer is not None:
+                self.writer.close()
+                self.writer = None
+        while True:
+            try:
+                self.readers.get_nowait().close()
+            except Empty:
+                break
+
+# MySQL connection model: connections stay open and are reused by the thread
+# that opened them, each with its prepared cursors kept by statement name
+_MYSQL_IDLE_PER_THREAD = 2  # Enough for one block nested in another
+_MYSQL_PING_AFTER = 60.0  # Seconds idle after which a kept connection is checked before reuse
+
+class _MySQLPool:
+    """Open MySQL connections of each thread, and the prepared cursors of each connection"""
+    def __init__(self):
+        self.local = threading.local()
+        self.cursors = weakref.WeakKeyDictionary()
+
+    def _idle(self):
+        idle = getattr(self.local, 'idle', None)
+        if idle is None:
+            idle = self.local.idle = []
+        return idle
+
+    def get(self):
+        """A connection of this thread that no other block is using"""
+        idle = self._idle()
+        while idle:
+            conn, released_at = idle.pop()
+            if time.monotonic() - released_at < _MYSQL_PING_AFTER or self._alive(conn):
+                return conn
+            self.discard(conn)
+        conn = DatabaseAdapter.get_connection()
+        self.cursors[conn] = {}
+        return conn
+
+    def release(self, conn, ok=True):
+        """Keep a connection for the next block of this thread. After an error
+        it is only kept if it is still connected"""
+        idle = self._idle()
+        if len(idle) < _MYSQL_IDLE_PER_THREAD and (ok or self._alive(conn)):
+            idle.append((conn, time.monotonic()))
+        else:
+            self.discard(conn)
+
+    @staticmethod
+    def _alive(conn):
+        try:
+            return conn.is_connected()
+        except Exception:
+            return False
+
+    def discard(self, conn):
+        for cursor in self.cursors.pop(conn, {}).values():
+            try:
+                cursor.close()
+            except Exception:
+                pass
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def prepared(self, conn, name):
+        """The connection's prepared cursor for a statement, and whether the caller closes it"""
+        cursors = self.cursors.get(conn)
+        if cursors is None:
+            return conn.cursor(prepared=True), True
+        cursor = cursors.get(name)
+        if cursor is None:
+            cursor = cursors[name] = conn.cursor(prepared=True)
+        return cursor, False
+
+    def close(self):
+        """Close the idle connections of this thread"""
+        idle = self._idle()
+        while idle:
+            self.discard(idle.pop()[0])
+
+_mysql_pool = _MySQLPool()
+
+class _KeptCursor:
+    """A pooled prepared cursor handed to a caller that will close it: close() keeps it"""
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def close(self):
+        pass
 
 class DatabaseAdapter:
+    @staticmethod
+    def connect_sqlite(database=None, readonly=False):
+        """Open a SQLite connection with the tuning profile applied"""
+        database = database or DB_CONFIG['database']
+        timeout = SQLITE_TUNING['busy_timeout_ms'] / 1000.0
+
+        cache_size = SQLITE_TUNING['statement_cache_size']
+
+        if readonly:
+            conn = sqlite3.connect(f"file:{database}?mode=ro", uri=True, timeout=timeout,
+                                   check_same_thread=False, cached_statements=cache_size)
+        else:
+            conn = sqlite3.connect(database, timeout=timeout, check_same_thread=False,
+                                   cached_statements=cache_size)
+
+        DatabaseAdapter.apply_sqlite_pragmas(conn, readonly)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def apply_sqlite_pragmas(conn, readonly=False):
+        """Apply the SQLITE_TUNING profile to a connection"""
+        if not readonly:
+            # journal_mode is persistent and can only be changed by a writer
+            conn.execute(f"PRAGMA journal_mode={SQLITE_TUNING['journal_mode']}")
+        conn.execute(f"PRAGMA synchronous={SQLITE_TUNING['synchronous']}")
+        conn.execute(f"PRAGMA busy_timeout={int(SQLITE_TUNING['busy_timeout_ms'])}")
+        conn.execute(f"PRAGMA cache_size=-{int(SQLITE_TUNING['cache_size_kb'])}")
+        conn.execute(f"PRAGMA mmap_size={int(SQLITE_TUNING['mmap_size'])}")
+        conn.execute(f"PRAGMA temp_store={SQLITE_TUNING['temp_store']}")
+
     @staticmethod
     def get_connection():
         """Get a database connection based on the configured DB_TYPE"""
         if DB_TYPE == 'sqlite':
-            conn = sqlite3.connect(DB_CONFIG['database'])
-            conn.row_factory = sqlite3.Row
-            return conn
+            return DatabaseAdapter.connect_sqlite()
         else:
+            import mysql.connector
             return mysql.connector.connect(**DB_CONFIG)
-    
+
+    @staticmethod
+    def _get_sqlite_pool():
+        """Get the connection pool for the configured SQLite database"""
+        database = DB_CONFIG['database']
+        with _sqlite_pools_lock:
+            pool = _sqlite_pools.get(database)
+            if pool is None:
+                pool = _SQLitePool(database)
+                _sqlite_pools[database] = pool
+            return pool
+
+    @staticmethod
+    @contextmanager
+    def writer():
+        """Use the dedicated writer connection.
+
+        Writers are serialized on SQLite, so only one thread writes at a time
+        and readers never see "database is locked". The transaction is
+        committed on exit, or rolled back if the block raises.
+        """
+        if DB_TYPE == 'sqlite':
+            pool = DatabaseAdapter._get_sqlite_pool()
+            start = time.perf_counter()
+            with pool.writer_lock:
+                conn = pool.get_writer()
+                query_monitor.record_wait(time.perf_counter() - start)
+                try:
+                    yield conn
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+        else:
+            start = time.perf_counter()
+            conn = _mysql_pool.get()
+            query_monitor.record_wait(time.perf_counter() - start)
+            ok = False
+            try:
+                yield conn
+                conn.commit()
+                ok = True
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                _mysql_pool.release(conn, ok)
+
+    @staticmethod
+    @contextmanager
+    def reader():
+        """Borrow a read-only connection from the pool"""
+        if DB_TYPE == 'sqlite':
+            pool = DatabaseAdapter._get_sqlite_pool()
+            start = time.perf_counter()
+            conn = pool.get_reader()
+            query_monitor.record_wait(time.perf_counter() - start)
+            try:
+                yield conn
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()
+                pool.release_reader(conn)
+        else:
+            start = time.perf_counter()
+            conn = _mysql_pool.get()
+            query_monitor.record_wait(time.perf_counter() - start)
+            ok = True
+            try:
+                yield conn
+            except Exception:
+                ok = False
+                raise
+            finally:
+                # A kept connection must not keep reading from an old snapshot
+                try:
+                    if conn.in_transaction:
+                        conn.rollback()
+                except Exception:
+                    ok = False
+                _mysql_pool.release(conn, ok)
+
+    @staticmethod
+    @contextmanager
+    def snapshot():
+        """Borrow a reader that holds one read transaction, so every
+        statement run on it sees the same committed state"""
+        with DatabaseAdapter.reader() as conn:
+            if DB_TYPE == 'sqlite':
+                conn.execute("BEGIN")
+            else:
+                conn.start_transaction(consistent_snapshot=True, readonly=True)
+            try:
+                yield conn
+            finally:
+                conn.rollback()
+
+    @staticmethod
+    def close_all():
+        """Close every pooled SQLite connection, and the MySQL connections kept by this thread"""
+        with _sqlite_pools_lock:
+            pools = list(_sqlite_pools.values())
+            _sqlite_pools.clear()
+        for pool in pools:
+            pool.close()
+        _mysql_pool.close()
+
+    @staticmethod
+    def execute(conn, name, params=()):
+        """Execute a registered statement on an open connection.
+        
+        Returns the cursor, for rowcount/lastrowid. The caller closes it.
+        """
+        statement = get_statement(name)
+        start = time.perf_counter()
+        try:
+            if DB_TYPE == 'sqlite':
+                cursor = conn.execute(statement.sql, params)
+            else:
+                cursor, owned = _mysql_pool.prepared(conn, name)
+                cursor.execute(statement.sql, params)
+                if not owned:
+                    cursor = _KeptCursor(cursor)
+        except Exception as e:
+            query_monitor.record(name, statement.sql, params, time.perf_counter() - start, error=e)
+            raise
+        elapsed = time.perf_counter() - start
+        statement.record_call(elapsed)
+        query_monitor.record(name, statement.sql, params, elapsed, rows=max(cursor.rowcount, 0))
+        return cursor
+
+    @staticmethod
+    def execute_many(conn, name, seq_of_params):
+        """Execute a registered statement once per parameter tuple, as one batch.
+
+        Returns the number of rows affected.
+        """
+        statement = get_statement(name)
+        seq_of_params = list(seq_of_params)
+        first = seq_of_params[0] if seq_of_params else ()  # Logged as a sample of the batch
+        start = time.perf_counter()
+        try:
+            if DB_TYPE == 'sqlite':
+                cursor = conn.executemany(statement.sql, seq_of_params)
+            else:
+                # A plain cursor sends an INSERT batch as one multi-row statement
+                cursor = conn.cursor()
+                cursor.executemany(statement.sql, seq_of_params)
+            rows = max(cursor.rowcount, 0)
+            cursor.close()
+        except Exception as e:
+            query_monitor.record(name, statement.sql, first, time.perf_counter() - start, error=e)
+            raise
+        elapsed = time.perf_counter() - start
+        statement.record_call(elapsed)
+        query_monitor.record(name, statement.sql, first, elapsed, rows=rows)
+        return rows
+
+    @staticmethod
+    def stream(conn, name, params=(), batch_size=1000, raw=False):
+        """Run a registered SELECT and yield its rows in lists of up to batch_size.
+
+        Rows are fetched only as the batches are consumed (on MySQL through
+        an unbuffered cursor), so memory use does not grow with the result.
+        With raw=True the rows are the driver's tuples instead of dicts.
+        """
+        statement = get_statement(name)
+        rows = 0
+        elapsed = 0.0  # Time spent in the database, not in the consumer
+        start = time.perf_counter()
+        try:
+            if DB_TYPE == 'sqlite':
+                cursor = conn.execute(statement.sql, params)
+            else:
+                cursor = conn.cursor(buffered=False)
+                cursor.execute(statement.sql, params)
+            try:
+                columns = [column[0] for column in cursor.description]
+                while True:
+                    batch = cursor.fetchmany(batch_size)
+                    elapsed += time.perf_counter() - start
+                    if not batch:
+                        break
+                    rows += len(batch)
+                    yield batch if raw else [dict(zip(columns, row)) for row in batch]
+                    start = time.perf_counter()
+            finally:
+                cursor.close()
+        except Exception as e:
+            query_monitor.record(name, statement.sql, params, elapsed + time.perf_counter() - start, error=e)
+            raise
+        statement.record_call(elapsed)
+        query_monitor.record(name, statement.sql, params, elapsed, rows=rows)
+
+    @staticmethod
+    def fetch_one(conn, name, params=()):
+        """Execute a registered statement and return its first row (or None)"""
+        rows = DatabaseAdapter._fetch(conn, name, params, one=True)
+        return rows[0] if rows else None
+
+    @staticmethod
+    def fetch_all(conn, name, params=()):
+        """Execute a registered statement and return all rows"""
+        return DatabaseAdapter._fetch(conn, name, params, one=False)
+
+    @staticmethod
+    def _fetch(conn, name, params, one):
+        """Run a registered SELECT and return rows with column-name access"""
+        statement = get_statement(name)
+        start = time.perf_counter()
+        try:
+            if DB_TYPE == 'sqlite':
+                cursor = conn.execute(statement.sql, params)
+                try:
+                    rows = cursor.fetchmany(1) if one else cursor.fetchall()
+                finally:
+                    cursor.close()
+            else:
+                cursor, owned = _mysql_pool.prepared(conn, name)
+                try:
+                    cursor.execute(statement.sql, params)
+                    # Read to the end, so the cursor can run its statement again
+                    rows = cursor.fetchall()[:1] if one else cursor.fetchall()
+                    rows = [dict(zip(cursor.column_names, row)) for row in rows]
+                finally:
+                    if owned:
+                        cursor.close()
+        except Exception as e:
+            query_monitor.record(name, statement.sql, params, time.perf_counter() - start, error=e)
+            raise
+        elapsed = time.perf_counter() - start
+        statement.record_call(elapsed)
+        query_monitor.record(name, statement.sql, params, elapsed, rows=len(rows))
+        return rows
+
     @staticmethod
     def execute_query(query, params=None, fetch_one=False, fetch_all=False, commit=False, dictionary=False):
         """Execute a database query with the appropriate placeholders"""
+        if DB_TYPE == 'sqlite':
+            # Replace %s with ? for SQLite (memoized per query string)
+            query = _compile_sqlite(query)
+            is_write = commit or not query.lstrip().upper().startswith(("SELECT", "WITH"))
+
+            with (DatabaseAdapter.writer() if is_write else DatabaseAdapter.reader()) as conn:
+                cursor = conn.cursor()
+                cursor.row_factory = sqlite3.Row if dictionary else None
+                start = time.perf_counter()
+                try:
+                    if params:
+                        cursor.execute(query, params)
+                    else:
+                        cursor.execute(query)
+
+                    if fetch_one:
+                        result = cursor.fetchone()
+                        rows = 1 if result is not None else 0
+                    elif fetch_all:
+                        result = cursor.fetchall()
+                        rows = len(result)
+                    else:
+                        result = cursor.lastrowid
+                        rows = max(cursor.rowcount, 0)
+                except Exception as e:
+                    query_monitor.record(query_name(query), query, params,
+                                         time.perf_counter() - start, error=e)
+                    raise
+                finally:
+                    cursor.close()
+
+                query_monitor.record(query_name(query), query, params,
+                                     time.perf_counter() - start, rows=rows)
+                return result
+
+        import mysql.connector
         conn = None
         cursor = None
         result = None
-        
+
+        start = None
+
         try:
-            if DB_TYPE == 'sqlite':
-                conn = sqlite3.connect(DB_CONFIG['database'])
-                if dictionary:
-                    conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                
-                # Replace %s with ? for SQLite
-                query = query.replace("%s", "?")
-                
-                if params:
-                    cursor.execute(query, params)
-                else:
-                    cursor.execute(query)
-                
-                if fetch_one:
-                    result = cursor.fetchone()
-                elif fetch_all:
-                    result = cursor.fetchall()
-                else:
-                    result = cursor.lastrowid
-                
-                if commit:
-                    conn.commit()
-                
+            wait_start = time.perf_counter()
+            conn = mysql.connector.connect(**DB_CONFIG)
+            query_monitor.record_wait(time.perf_counter() - wait_start)
+            cursor = conn.cursor(dictionary=dictionary)
+
+            start = time.perf_counter()
+            if params:
+                cursor.execute(query, params)
             else:
-                conn = mysql.connector.connect(**DB_CONFIG)
-                cursor = conn.cursor(dictionary=dictionary)
-                
-                if params:
-                    cursor.execute(query, params)
-                else:
-                    cursor.execute(query)
-                
-                if fetch_one:
-                    result = cursor.fetchone()
-                elif fetch_all:
-                    result = cursor.fetchall()
-                else:
-                    result = cursor.lastrowid
-                
-                if commit:
-                    conn.commit()
-            
+                cursor.execute(query)
+
+            if fetch_one:
+                result = cursor.fetchone()
+                rows = 1 if result is not None else 0
+            elif fetch_all:
+                result = cursor.fetchall()
+                rows = len(result)
+            else:
+                result = cursor.lastrowid
+                rows = max(cursor.rowcount, 0)
+
+            if commit:
+                conn.commit()
+
+            query_monitor.record(query_name(query), query, params,
+                                 time.perf_counter() - start, rows=rows)
             return result
-            
+
         except Exception as e:
+            if start is not None:
+                query_monitor.record(query_name(query), query, params,
+                                     time.perf_counter() - start, error=e)
             if conn and commit:
                 conn.rollback()
             raise e
-            
+
         finally:
             if cursor:
                 cursor.close()
             if conn:
                 conn.close()
-    
+
     @staticmethod
     def get_placeholder():
         """Get the appropriate placeholder for the current DB_TYPE"""
-        return "?" if DB_TYPE == 'sqlite' else "%s" 
\ No newline at end of file
+        return "?" if DB_TYPE == 'sqlite' else "%s"
+
+@lru_cache(maxsize=256)
+def _compile_sqlite(query):
+    """Compile an ad hoc query for SQLite once per distinct query string"""
+    return Statement.compile_sqlite(query)
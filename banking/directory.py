@@ -0,0 +1,185 @@
+# Phone directory module
+#
+# Maps phone numbers, normalized to E.164, to the accounts that receive
+# payments for them. Exact lookups and incremental (prefix) search go
+# through a sorted in-memory index that is loaded from storage on first
+# use, so both stay O(log n) however large the directory grows.
+import bisect
+import re
+import threading
+from .storage import get_storage
+from .transfers import TransferManager
+
+DEFAULT_COUNTRY_CODE = '+91'
+
+# E.164 allows at most 15 digits; anything under 8 is not a full number
+MIN_DIGITS = 8
+MAX_DIGITS = 15
+
+_separators = re.compile(r'[\s\-().]')
+
+def _to_e164(number, country_code):
+    cleaned = _separators.sub('', str(number or ''))
+    if cleaned.startswith('00'):
+        # International dialing prefix
+        cleaned = '+' + cleaned[2:]
+    if cleaned and not cleaned.startswith('+'):
+        # National number: drop the trunk prefix and add the country code
+        cleaned = country_code + cleaned.lstrip('0')
+    if cleaned[1:] and not cleaned[1:].isdigit():
+        raise ValueError(f"Invalid phone number: {number}")
+    return cleaned
+
+def normalize_phone(number, country_code=DEFAULT_COUNTRY_CODE):
+    """Normalize a phone number to E.164 (e.g. '+919876543210').
+
+    Raises ValueError if it is not a complete phone number.
+    """
+    phone = _to_e164(number, country_code)
+    if not MIN_DIGITS <= len(phone) - 1 <= MAX_DIGITS:
+        raise ValueError(f"Invalid phone number: {number}")
+    return phone
+
+def normalize_prefix(text, country_code=DEFAULT_COUNTRY_CODE):
+    """Normalize a partially typed phone number for prefix search ('' if empty)"""
+    prefix = _to_e164(text, country_code)[:MAX_DIGITS + 1]
+    return prefix if len(prefix) > 1 else ''
+
+class PhoneIndex:
+    """Sorted index of directory entries for exact and prefix lookups.
+
+    Entries are kept in parallel lists sorted by phone number, which is far
+    smaller than a dict (or trie) of entries and answers both kinds of
+    lookup with a binary search.
+    """
+    def __init__(self, entries=()):
+        entries = sorted(entries, key=lambda entry: entry['phone'])
+        self.phones = [entry['phone'] for entry in entries]
+        self.accounts = [entry['account_number'] for entry in entries]
+        self.names = [entry['display_name'] for entry in entries]
+
+    @classmethod
+    def from_columns(cls, phones, accounts, names):
+        """Build an index from parallel lists already sorted by phone (e.g. a bulk load)"""
+        index = cls()
+        index.phones, index.accounts, index.names = list(phones), list(accounts), list(names)
+        return index
+
+    def __len__(self):
+        return len(self.phones)
+
+    def _entry(self, position):
+        return {
+            'phone': self.phones[position],
+            'account_number': self.accounts[position],
+            'display_name': self.names[position]
+        }
+
+    def add(self, entry):
+        """Insert or replace an entry"""
+        position = bisect.bisect_left(self.phones, entry['phone'])
+        if position < len(self.phones) and self.phones[position] == entry['phone']:
+            self.accounts[position] = entry['account_number']
+            self.names[position] = entry['display_name']
+            return
+        self.phones.insert(position, entry['phone'])
+        self.accounts.insert(position, entry['account_number'])
+        self.names.insert(position, entry['display_name'])
+
+    def get(self, phone):
+        """Get the entry of an E.164 phone number, or None"""
+        position = bisect.bisect_left(self.phones, phone)
+        if position < len(self.phones) and self.phones[position] == phone:
+            return self._entry(position)
+        return None
+
+    def search(self, prefix, limit=10):
+        """Get up to limit entries whose phone number starts with prefix"""
+        if not prefix:
+            return []
+        results = []
+        position = bisect.bisect_left(self.phones, prefix)
+        while position < len(self.phones) and len(results) < limit:
+            if not self.phones[position].startswith(prefix):
+                break
+            results.append(self._entry(position))
+            position += 1
+        return results
+
+class PhoneDirectory:
+    """Phone number to account directory used by phone payments"""
+    def __init__(self):
+        self._index = None
+        self._lock = threading.Lock()
+
+    @property
+    def index(self):
+        """The in-memory index, loaded from storage on first use"""
+        with self._lock:
+            if self._index is None:
+                self._index = PhoneIndex(get_storage().list_directory())
+            return self._index
+
+    def reload(self):
+        """Drop the index so the next lookup reloads it from storage"""
+        with self._lock:
+            self._index = None
+
+    def register(self, number, account_number, display_name, country_code=DEFAULT_COUNTRY_CODE):
+        """Register a phone number for an account"""
+        try:
+            phone = normalize_phone(number, country_code)
+            success, message = get_storage().add_directory_entry(phone, account_number, display_name)
+        except Exception as err:
+            return False, str(err)
+
+        if success:
+            with self._lock:
+                if self._index is not None:
+                    self._index.add({
+                        'phone': phone,
+                        'account_number': account_number,
+                        'display_name': display_name
+                    })
+        return success, message
+
+    def lookup(self, number, country_code=DEFAULT_COUNTRY_CODE):
+        """Get the directory entry of a phone number, or None"""
+        try:
+            phone = normalize_phone(number, country_code)
+        except ValueError:
+            return None
+        return self.index.get(phone)
+
+    def search(self, text, country_code=DEFAULT_COUNTRY_CODE, limit=10):
+        """Incremental search: entries whose number starts with what was typed so far"""
+        try:
+            prefix = normalize_prefix(text, country_code)
+        except ValueError:
+            return []
+        return self.index.search(prefix, limit)
+
+    def recent_payees(self, user_id, limit=5):
+        """Get the directory entries a user paid most recently"""
+        try:
+            return get_storage().recent_payees(user_id, limit)
+        except Exception as err:
+            print(f"Error getting recent payees: {err}")
+            return []
+
+    def pay(self, source_account, number, amount, description=None, country_code=DEFAULT_COUNTRY_CODE,
+            idempotency_key=None):
+        """Pay a phone number through the transfer engine"""
+        entry = self.lookup(number, country_code)
+        if entry is None:
+            return False, "Phone number is not registered"
+
+        if entry['account_number'] == source_account:
+            return False, "Cannot pay your own account"
+
+        return TransferManager.transfer_funds(
+            source_account, entry['account_number'], amount,
+            description or f"Payment to {entry['phone']}", idempotency_key=idempotency_key
+        )
+
+phone_directory = PhoneDirectory()
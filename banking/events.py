@@ -0,0 +1,59 @@
+# In-process event bus
+#
+# The transfer, account and queue engines publish what changed; views such
+# as the dashboard summary subscribe instead of re-querying the database.
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Topics published by the banking engines
+TRANSFER_COMPLETED = 'transfer.completed'  # source_account, destination_account, amount, description
+BALANCE_CHANGED = 'balance.changed'  # account_number, amount_change
+ACCOUNT_CREATED = 'account.created'  # user_id, account_number
+ACCOUNTS_PROVISIONED = 'accounts.provisioned'  # user_ids, count (one per bulk provisioning chunk)
+BANK_LINKED = 'bank.linked'  # user_id, account_number
+BANK_VERIFIED = 'bank.verified'  # user_id, account_number
+TRANSACTION_QUEUED = 'transaction.queued'  # transaction_id, account_id
+TRANSACTION_FINISHED = 'transaction.finished'  # transaction_id, account_number, status
+VERIFICATION_UPDATED = 'verification.updated'  # job_id, user_id, account_number, status, attempts, last_error
+ANALYTICS_UPDATED = 'analytics.updated'  # account_numbers (whose rollups changed)
+
+class EventBus:
+    """Synchronous publish/subscribe within one process.
+
+    Handlers run on the publishing thread, so GUI subscribers must hand the
+    event over to the GUI thread themselves (e.g. by emitting a Qt signal).
+    """
+    def __init__(self):
+        self._handlers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, topic, handler):
+        """Call handler(topic, payload) whenever topic is published"""
+        with self._lock:
+            handlers = list(self._handlers.get(topic, ()))
+            if handler not in handlers:
+                handlers.append(handler)
+            self._handlers[topic] = handlers
+
+    def unsubscribe(self, topic, handler):
+        """Stop calling handler for topic"""
+        with self._lock:
+            handlers = [h for h in self._handlers.get(topic, ()) if h != handler]
+            self._handlers[topic] = handlers
+
+    def publish(self, topic, **payload):
+        """Deliver an event to every subscriber of its topic"""
+        with self._lock:
+            # Handler lists are replaced, never mutated, so this snapshot is safe
+            handlers = self._handlers.get(topic, ())
+
+        for handler in handlers:
+            try:
+                handler(topic, payload)
+            except Exception:
+                # A broken subscriber must not fail the operation that published
+                logger.exception("Event handler for %s failed", topic)
+
+event_bus = EventBus()
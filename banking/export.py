@@ -0,0 +1,191 @@
+# Data export module
+#
+# Streams the transfer history, the transaction ledger and the processing
+# queue to CSV, JSON lines or Parquet. Rows are read from a streaming
+# cursor one batch at a time and written as they arrive, so memory use
+# stays flat however large the table is. The file only appears under its
+# final name once the export is complete. Also runs from the command line:
+#
+#     python -m banking.export transfer_history transfers.csv --since 2024-01-01
+import argparse
+import csv
+import json
+import os
+import sys
+from contextlib import closing
+from datetime import datetime, timedelta
+from config import EXPORT_CONFIG
+from .storage import get_storage
+
+# Exportable tables and their columns (name, type)
+TABLES = {
+    'transfer_history': (
+        ('transfer_id', int), ('source_account', str), ('destination_account', str), ('amount', float),
+        ('description', str), ('transaction_type', str), ('created_at', str)
+    ),
+    'transactions': (
+        ('transaction_id', int), ('account_number', str), ('transaction_type', str), ('amount', float),
+        ('description', str), ('related_account', str), ('status', str), ('created_at', str)
+    ),
+    'transaction_queue': (
+        ('queue_id', int), ('transaction_id', int), ('account_number', str), ('transaction_type', str),
+        ('amount', float), ('priority', int), ('status', str), ('added_at', str)
+    )
+}
+
+FORMATS = ('csv', 'jsonl', 'parquet')
+
+EXTENSIONS = {
+    '.csv': 'csv',
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+    '.json': 'jsonl',
+    '.parquet': 'parquet',
+    '.pq': 'parquet'
+}
+
+class ExportCancelled(Exception):
+    """The export was cancelled before it finished"""
+
+class CSVExportWriter:
+    def __init__(self, path, columns):
+        self.names = [name for name, _ in columns]
+        self.file = open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(self.names)
+
+    def write(self, rows):
+        self.writer.writerows([row[name] for name in self.names] for row in rows)
+
+    def close(self):
+        self.file.close()
+
+class JSONLinesExportWriter:
+    def __init__(self, path, columns):
+        self.names = [name for name, _ in columns]
+        self.file = open(path, 'w', encoding='utf-8')
+
+    def write(self, rows):
+        # default=str covers MySQL's Decimal and datetime values
+        self.file.writelines(
+            json.dumps({name: row[name] for name in self.names}, default=str) + '\n' for row in rows
+        )
+
+    def close(self):
+        self.file.close()
+
+class ParquetExportWriter:
+    """Writes every batch as a row group (needs the optional pyarrow package)"""
+    def __init__(self, path, columns):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)") from None
+
+        self.pyarrow = pyarrow
+        types = {int: pyarrow.int64(), float: pyarrow.float64(), str: pyarrow.string()}
+        self.columns = columns
+        self.schema = pyarrow.schema([(name, types[kind]) for name, kind in columns])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def write(self, rows):
+        # Column types are fixed up front, so a batch of NULLs cannot change the schema
+        data = {
+            name: [None if row[name] is None else kind(row[name]) for row in rows]
+            for name, kind in self.columns
+        }
+        self.writer.write_table(self.pyarrow.table(data, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+WRITERS = {
+    'csv': CSVExportWriter,
+    'jsonl': JSONLinesExportWriter,
+    'parquet': ParquetExportWriter
+}
+
+def detect_format(path):
+    """Pick the export format from a file extension ('csv' if unknown)"""
+    return EXTENSIONS.get(os.path.splitext(path)[1].lower(), 'csv')
+
+def parse_bound(value, end=False):
+    """Normalize a date ('2024-01-31') or time ('2024-01-31 12:00') filter bound.
+
+    A bare date used as the end of a range includes that whole day.
+    Returns None for an empty value; raises ValueError if it is not a date.
+    """
+    if not value:
+        return None
+    moment = datetime.fromisoformat(value.strip())
+    if end and len(value.strip()) == 10:
+        moment += timedelta(days=1)
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+def export_table(table, path, fmt=None, since=None, until=None, account_number=None,
+                 batch_size=None, progress=None, cancelled=None):
+    """Export a table to a file and return the number of rows written.
+
+    since and until are dates or times (UTC, as stored); until is
+    exclusive, except that a bare date includes that day. progress(rows)
+    is called after every batch; the export stops with ExportCancelled as
+    soon as cancelled() returns True.
+    """
+    if table not in TABLES:
+        raise ValueError(f"Unknown table '{table}' (choose from {', '.join(TABLES)})")
+    fmt = fmt or detect_format(path)
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown format '{fmt}' (choose from {', '.join(FORMATS)})")
+
+    since = parse_bound(since)
+    until = parse_bound(until, end=True)
+    batches = get_storage().export_rows(table, since, until, account_number or None,
+                                        batch_size or EXPORT_CONFIG['batch_size'])
+
+    partial = path + '.part'
+    writer = WRITERS[fmt](partial, TABLES[table])
+    rows = 0
+    try:
+        with closing(batches):
+            for batch in batches:
+                if cancelled and cancelled():
+                    raise ExportCancelled("Export cancelled")
+                writer.write(batch)
+                rows += len(batch)
+                if progress:
+                    progress(rows)
+        writer.close()
+        os.replace(partial, path)
+    except BaseException:
+        writer.close()
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    return rows
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(prog='python -m banking.export',
+                                     description="Export banking records to CSV, JSON lines or Parquet")
+    parser.add_argument('table', choices=list(TABLES))
+    parser.add_argument('path', help="Output file; the format follows its extension unless --format is given")
+    parser.add_argument('--format', choices=FORMATS)
+    parser.add_argument('--since', help="Start date or time (inclusive, UTC)")
+    parser.add_argument('--until', help="End date (inclusive) or time (exclusive), UTC")
+    parser.add_argument('--account', help="Only rows of this account number")
+    parser.add_argument('--batch-size', type=int, default=EXPORT_CONFIG['batch_size'])
+    args = parser.parse_args(argv)
+
+    try:
+        rows = export_table(args.table, args.path, args.format, args.since, args.until, args.account,
+                            args.batch_size, progress=lambda rows: print(f"\r{rows} rows", end='', file=sys.stderr))
+    except Exception as err:
+        print(f"\nExport failed: {err}", file=sys.stderr)
+        return 1
+
+    print(f"\nExported {rows} rows to {args.path}", file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,207 @@
+# Group commit module
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from config import GROUP_COMMIT_CONFIG
+from .db_adapter import DatabaseAdapter
+
+_writer = None
+_writer_lock = threading.Lock()
+
+class GroupCommitWriter:
+    """Single writer thread that commits queued writes in batches.
+
+    Callers submit an operation (a callable taking a connection) and block on
+    the returned future. The writer runs every queued operation inside one
+    database transaction on the adapter's writer connection, each wrapped in
+    its own savepoint so a failing write does not take the rest of the batch
+    down with it, and resolves the futures only after the batch has been
+    committed.
+    """
+
+    def __init__(self, flush_interval_ms=None, max_batch_size=None):
+        if flush_interval_ms is None:
+            flush_interval_ms = GROUP_COMMIT_CONFIG['flush_interval_ms']
+        if max_batch_size is None:
+            max_batch_size = GROUP_COMMIT_CONFIG['max_batch_size']
+
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.max_batch_size = max_batch_size
+
+        self._pending = deque()
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._thread = None
+
+        # Tuning statistics
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._writes = 0
+        self._failed_writes = 0
+        self._largest_batch = 0
+        self._recent_batch_sizes = deque(maxlen=1000)
+        self._recent_commit_times = deque(maxlen=1000)
+
+    def start(self):
+        """Start the writer thread"""
+        if self._thread and self._thread.is_alive():
+            return False
+
+        self._stopping = False
+        self._thread = threading.Thread(
+            target=self._run,
+            daemon=True,
+            name="GroupCommitWriter"
+        )
+        self._thread.start()
+        return True
+
+    def stop(self, timeout=None):
+        """Flush everything that is still queued and stop the writer thread"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def is_running(self):
+        """Check if the writer thread is alive"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def submit(self, operation):
+        """Queue a write and return a future for its result"""
+        future = Future()
+        with self._condition:
+            if self._stopping or not self.is_running():
+                raise RuntimeError("Group commit writer is not running")
+            self._pending.append((operation, future))
+            self._condition.notify()
+        return future
+
+    def execute(self, operation, timeout=None):
+        """Queue a write and block until the batch containing it is committed"""
+        return self.submit(operation).result(timeout)
+
+    def get_stats(self):
+        """Get batch size and commit latency statistics"""
+        with self._stats_lock:
+            sizes = list(self._recent_batch_sizes)
+            commit_times = sorted(self._recent_commit_times)
+            stats = {
+                'batches': self._batches,
+                'writes': self._writes,
+                'failed_writes': self._failed_writes,
+                'largest_batch': self._largest_batch,
+                'avg_batch_size': sum(sizes) / len(sizes) if sizes else 0.0,
+                'avg_commit_ms': 0.0,
+                'p95_commit_ms': 0.0,
+                'max_commit_ms': 0.0
+            }
+
+        if commit_times:
+            stats['avg_commit_ms'] = sum(commit_times) / len(commit_times) * 1000
+            stats['p95_commit_ms'] = commit_times[int(0.95 * (len(commit_times) - 1))] * 1000
+            stats['max_commit_ms'] = commit_times[-1] * 1000
+        return stats
+
+    def _run(self):
+        """Writer loop: collect a batch, then commit it"""
+        while True:
+            with self._condition:
+                if not self._pending and not self._stopping:
+                    self._condition.wait()
+
+                # Give the batch a chance to fill up
+                deadline = time.monotonic() + self.flush_interval
+                while (len(self._pending) < self.max_batch_size and not self._stopping):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+
+                batch = []
+                while self._pending and len(batch) < self.max_batch_size:
+                    batch.append(self._pending.popleft())
+
+                if not batch and self._stopping:
+                    return
+
+            if batch:
+                try:
+                    with DatabaseAdapter.writer() as conn:
+                        self._flush(conn, batch)
+                except Exception as err:
+                    # Could not get a connection at all
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(err)
+
+    def _flush(self, conn, batch):
+        """Run a batch of operations in one transaction and resolve their futures"""
+        cursor = conn.cursor()
+        results = []
+        failed = 0
+
+        try:
+            cursor.execute("BEGIN")
+            for operation, future in batch:
+                cursor.execute("SAVEPOINT group_write")
+                try:
+                    results.append((future, operation(conn), None))
+                    cursor.execute("RELEASE SAVEPOINT group_write")
+                except Exception as err:
+                    cursor.execute("ROLLBACK TO SAVEPOINT group_write")
+                    cursor.execute("RELEASE SAVEPOINT group_write")
+                    results.append((future, None, err))
+                    failed += 1
+
+            commit_start = time.perf_counter()
+            cursor.execute("COMMIT")
+            commit_time = time.perf_counter() - commit_start
+        except Exception as err:
+            try:
+                cursor.execute("ROLLBACK")
+            except Exception:
+                pass
+            for _, future in batch:
+                future.set_exception(err)
+            return
+        finally:
+            cursor.close()
+
+        with self._stats_lock:
+            self._batches += 1
+            self._writes += len(batch)
+            self._failed_writes += failed
+            self._largest_batch = max(self._largest_batch, len(batch))
+            self._recent_batch_sizes.append(len(batch))
+            self._recent_commit_times.append(commit_time)
+
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+def get_group_commit_writer():
+    """Get the shared writer, or None if group commit is disabled"""
+    global _writer
+
+    if not GROUP_COMMIT_CONFIG['enabled']:
+        return None
+
+    with _writer_lock:
+        if _writer is None or not _writer.is_running():
+            _writer = GroupCommitWriter()
+            _writer.start()
+        return _writer
+
+def shutdown_group_commit_writer():
+    """Flush and stop the shared writer"""
+    global _writer
+
+    with _writer_lock:
+        if _writer is not None:
+            _writer.stop()
+            _writer = None
@@ -0,0 +1,342 @@
+# Bulk history import module
+#
+# Loads historical transactions or transfers (e.g. from a legacy core) out
+# of CSV or JSON lines files, in the column layout banking.export writes.
+# The file is read as a stream and handled in large chunks: each chunk is
+# validated with NumPy array operations, inserted with executemany and
+# checkpointed in the same transaction, so an interrupted import resumes
+# where it stopped. Secondary indexes are dropped for the load and rebuilt
+# afterwards, also when the load fails. Balance changes are summed per
+# account as chunks go in and applied to accounts in one statement at the
+# end. Rows done, loaded and rejected all count records of the file (a
+# transfer without a type is loaded as two rows, one per side). Also runs
+# from the command line:
+#
+#     python -m banking.history_import transactions legacy_ledger.csv
+import argparse
+import csv
+import hashlib
+import itertools
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+import numpy as np
+from config import IMPORT_CONFIG
+from .export import detect_format
+from .storage import get_storage
+from .summary import summary_cache
+
+TABLES = ('transactions', 'transfer_history')
+
+TRANSACTION_TYPES = ('DEPOSIT', 'WITHDRAWAL', 'TRANSFER_IN', 'TRANSFER_OUT')
+# History is final: nothing imported is queued for processing again
+TRANSACTION_STATUSES = ('COMPLETED', 'FAILED')
+TRANSFER_TYPES = ('OUTGOING', 'INCOMING')
+
+def read_records(path, fmt=None):
+    """Yield the records of a CSV or JSON lines file as dicts (None for a malformed line)"""
+    fmt = fmt or detect_format(path)
+    with open(path, newline='', encoding='utf-8') as f:
+        if fmt == 'csv':
+            yield from csv.DictReader(f)
+        elif fmt == 'jsonl':
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    record = None
+                yield record if isinstance(record, dict) else None
+        else:
+            raise ValueError(f"Cannot import from {fmt} files (use csv or jsonl)")
+
+def _column(records, name, default=''):
+    return [str(record.get(name) or default).strip() if record is not None else '' for record in records]
+
+def _amounts(values):
+    """Parse amounts into a float array, NaN where a value is not a number"""
+    try:
+        return np.array([value or 'nan' for value in values], dtype=np.float64)
+    except ValueError:
+        amounts = np.empty(len(values), dtype=np.float64)
+        for i, value in enumerate(values):
+            try:
+                amounts[i] = float(value)
+            except ValueError:
+                amounts[i] = np.nan
+        return amounts
+
+def _timestamps(values):
+    """Parse timestamps into a datetime64 array, NaT where a value is not a time"""
+    try:
+        return np.array([value or 'NaT' for value in values], dtype='datetime64[s]')
+    except ValueError:
+        times = np.empty(len(values), dtype='datetime64[s]')
+        for i, value in enumerate(values):
+            try:
+                times[i] = np.datetime64(value or 'NaT', 's')
+            except ValueError:
+                times[i] = np.datetime64('NaT')
+        return times
+
+def _format_times(times):
+    # Same format as SQLite's CURRENT_TIMESTAMP
+    return np.char.replace(np.datetime_as_string(times, unit='s'), 'T', ' ')
+
+def _sum_by_account(accounts, changes):
+    """Add up balance changes per account: [(account_number, delta)]"""
+    if not len(accounts):
+        return []
+    numbers, positions = np.unique(accounts, return_inverse=True)
+    totals = np.round(np.bincount(positions, weights=changes), 2)
+    return [(str(number), float(total)) for number, total in zip(numbers, totals) if total]
+
+def _reasons(count, checks):
+    """Reason each record is rejected ('' if valid); the first failing check wins"""
+    reasons = np.full(count, '', dtype=object)
+    for failed, reason in reversed(checks):
+        reasons[failed] = reason
+    return reasons
+
+def validate_transactions(records, account_ids):
+    """Validate a chunk of transaction records.
+
+    Returns (rows to insert, balance deltas, reasons) where reasons has
+    one entry per record, '' for the valid ones.
+    """
+    count = len(records)
+    malformed = np.array([record is None for record in records], dtype=bool)
+    numbers = np.array(_column(records, 'account_number'), dtype=object)
+    ids = np.fromiter((account_ids.get(number, -1) for number in numbers), dtype=np.int64, count=count)
+    types = np.array([value.upper() for value in _column(records, 'transaction_type')], dtype=object)
+    statuses = np.array([value.upper() for value in _column(records, 'status', 'COMPLETED')], dtype=object)
+    amounts = np.round(_amounts(_column(records, 'amount')), 2)
+    times = _timestamps(_column(records, 'created_at'))
+
+    reasons = _reasons(count, [
+        (malformed, "Malformed record"),
+        (ids < 0, "Unknown account"),
+        (~np.isin(types, TRANSACTION_TYPES), "Invalid transaction type"),
+        (~(np.isfinite(amounts) & (amounts > 0)), "Invalid amount"),
+        (~np.isin(statuses, TRANSACTION_STATUSES), "Invalid status"),
+        (np.isnat(times), "Invalid created_at"),
+        (times > np.datetime64(datetime.now(timezone.utc).replace(tzinfo=None), 's'), "created_at is in the future")
+    ])
+    valid = reasons == ''
+
+    descriptions = _column(records, 'description')
+    related = _column(records, 'related_account')
+    created_at = _format_times(times[valid])
+    rows = [
+        (int(ids[i]), types[i], float(amounts[i]), descriptions[i] or None, related[i] or None, statuses[i], str(at))
+        for i, at in zip(np.flatnonzero(valid), created_at)
+    ]
+
+    # Completed deposits and withdrawals change balances; transfers are in transfer_history
+    sign = np.where(types == 'DEPOSIT', 1.0, np.where(types == 'WITHDRAWAL', -1.0, 0.0))
+    changes = valid & (statuses == 'COMPLETED') & (sign != 0)
+    deltas = _sum_by_account(numbers[changes].astype(str), (sign * amounts)[changes])
+    return rows, deltas, reasons
+
+def validate_transfers(records, account_ids):
+    """Validate a chunk of transfer records (see validate_transactions).
+
+    A transfer without a transaction_type is one transfer and becomes its
+    OUTGOING and INCOMING rows.
+    """
+    count = len(records)
+    malformed = np.array([record is None for record in records], dtype=bool)
+    sources = np.array(_column(records, 'source_account'), dtype=object)
+    destinations = np.array(_column(records, 'destination_account'), dtype=object)
+    types = np.array([value.upper() for value in _column(records, 'transaction_type')], dtype=object)
+    amounts = np.round(_amounts(_column(records, 'amount')), 2)
+    times = _timestamps(_column(records, 'created_at'))
+
+    reasons = _reasons(count, [
+        (malformed, "Malformed record"),
+        ((sources == '') | (destinations == ''), "Missing account"),
+        (sources == destinations, "Source and destination are the same"),
+        (~np.isin(types, TRANSFER_TYPES + ('',)), "Invalid transaction type"),
+        (~(np.isfinite(amounts) & (amounts > 0)), "Invalid amount"),
+        (np.isnat(times), "Invalid created_at"),
+        (times > np.datetime64(datetime.now(timezone.utc).replace(tzinfo=None), 's'), "created_at is in the future")
+    ])
+    valid = reasons == ''
+
+    descriptions = _column(records, 'description')
+    created_at = _format_times(times)
+    rows = []
+    for i in np.flatnonzero(valid):
+        for transaction_type in ((types[i],) if types[i] else TRANSFER_TYPES):
+            rows.append((sources[i], destinations[i], float(amounts[i]), descriptions[i] or None,
+                         transaction_type, str(created_at[i])))
+
+    # OUTGOING rows debit the source, INCOMING rows credit the destination;
+    # only accounts of this system have a balance to change
+    outgoing = valid & (types != 'INCOMING')
+    incoming = valid & (types != 'OUTGOING')
+    accounts = np.concatenate([sources[outgoing], destinations[incoming]])
+    changes = np.concatenate([-amounts[outgoing], amounts[incoming]])
+    known = np.fromiter((number in account_ids for number in accounts), dtype=bool, count=len(accounts))
+    deltas = _sum_by_account(accounts[known].astype(str), changes[known])
+    return rows, deltas, reasons
+
+VALIDATORS = {
+    'transactions': validate_transactions,
+    'transfer_history': validate_transfers
+}
+
+def default_import_id(table, path):
+    """Identify an import by its table and file, so rerunning it resumes it"""
+    stat = os.stat(path)
+    source = f"{table}:{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()[:32]
+
+def trim_rejects(rejects_path, rows_done):
+    """Drop rejects past the checkpoint, written by a run that stopped before
+    committing their chunk, so a resumed import does not list them twice"""
+    if not os.path.exists(rejects_path):
+        return
+    with open(rejects_path, encoding='utf-8') as f:
+        lines = f.readlines()
+    kept = []
+    for line in lines:
+        try:
+            if json.loads(line)['record'] <= rows_done:
+                kept.append(line)
+        except ValueError:
+            pass  # Cut off mid-write
+    if len(kept) < len(lines):
+        with open(rejects_path, 'w', encoding='utf-8') as f:
+            f.writelines(kept)
+
+def import_history(table, path, fmt=None, import_id=None, chunk_size=None, drop_indexes=None,
+                   rejects_path=None, progress=None):
+    """Import a file of historical records into transactions or transfer_history.
+
+    Rerunning an interrupted import (same import_id, by default the same
+    unchanged file) skips the records already loaded. Rejected records are
+    appended to rejects_path (default: the file name plus .rejects.jsonl)
+    with the reason, before their chunk is committed. progress(report) is
+    called after every chunk.
+    Returns the report: rows done, loaded and rejected, reasons and timing.
+    """
+    if table not in VALIDATORS:
+        raise ValueError(f"Unknown table '{table}' (choose from {', '.join(TABLES)})")
+    validate = VALIDATORS[table]
+    chunk_size = chunk_size or IMPORT_CONFIG['chunk_size']
+    drop_indexes = IMPORT_CONFIG['drop_indexes'] if drop_indexes is None else drop_indexes
+    import_id = import_id or default_import_id(table, path)
+    rejects_path = rejects_path or path + '.rejects.jsonl'
+    storage = get_storage()
+
+    checkpoint = storage.get_import_checkpoint(import_id)
+    resuming = checkpoint is not None
+    if not resuming:
+        storage.start_import(import_id, table, os.path.abspath(path), [])
+        checkpoint = storage.get_import_checkpoint(import_id)
+    elif checkpoint['table_name'] != table:
+        raise ValueError(f"Import {import_id} loads {checkpoint['table_name']}, not {table}")
+
+    report = {
+        'import_id': import_id,
+        'status': checkpoint['status'],
+        'resumed_at': checkpoint['rows_done'],
+        'rows_done': checkpoint['rows_done'],
+        'rows_loaded': checkpoint['rows_loaded'],
+        'rows_rejected': checkpoint['rows_rejected'],
+        'reasons': {},
+        'accounts_updated': 0,
+        'elapsed': 0.0
+    }
+    if checkpoint['status'] == 'DONE':
+        return report
+
+    start = time.perf_counter()
+    account_ids = storage.get_account_ids()
+    records = itertools.islice(read_records(path, fmt), checkpoint['rows_done'], None)
+    if resuming:
+        trim_rejects(rejects_path, checkpoint['rows_done'])
+
+    # The checkpoint keeps indexes that a killed run left dropped, so they are rebuilt too
+    dropped = dict(checkpoint['dropped_indexes'])
+    if drop_indexes:
+        dropped.update(storage.drop_secondary_indexes(table))
+        storage.set_import_indexes(import_id, list(dropped.items()))
+
+    try:
+        while True:
+            chunk = list(itertools.islice(records, chunk_size))
+            if not chunk:
+                break
+
+            rows, deltas, reasons = validate(chunk, account_ids)
+            rejected = np.flatnonzero(reasons != '')
+            report['rows_done'] += len(chunk)
+            report['rows_loaded'] += len(chunk) - len(rejected)
+            report['rows_rejected'] += len(rejected)
+
+            # Rejects reach the disk before the checkpoint moves past them
+            if len(rejected):
+                first = report['rows_done'] - len(chunk) + 1
+                with open(rejects_path, 'a', encoding='utf-8') as f:
+                    for i in rejected:
+                        report['reasons'][reasons[i]] = report['reasons'].get(reasons[i], 0) + 1
+                        f.write(json.dumps({'record': int(first + i), 'reason': reasons[i], 'data': chunk[i]}) + '\n')
+                    f.flush()
+                    os.fsync(f.fileno())
+
+            storage.load_history_chunk(import_id, table, rows, deltas, report['rows_done'],
+                                       report['rows_loaded'], report['rows_rejected'])
+
+            report['elapsed'] = time.perf_counter() - start
+            if progress:
+                progress(dict(report))
+    finally:
+        # Indexes are rebuilt once, over the whole table, whether or not the load got through
+        storage.restore_indexes(list(dropped.items()))
+
+    # Then every balance is brought up to date
+    report['accounts_updated'] = storage.finish_import(import_id)
+    report['status'] = 'DONE'
+    report['elapsed'] = time.perf_counter() - start
+
+    # Cached dashboard summaries predate the new balances and history
+    summary_cache.clear()
+    return report
+
+def main(argv=None):
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(prog='python -m banking.history_import',
+                                     description="Bulk import historical transactions or transfers")
+    parser.add_argument('table', choices=TABLES)
+    parser.add_argument('path', help="CSV or JSON lines file")
+    parser.add_argument('--format', choices=('csv', 'jsonl'))
+    parser.add_argument('--import-id', help="Resume or name an import (default: derived from the file)")
+    parser.add_argument('--chunk-size', type=int, default=IMPORT_CONFIG['chunk_size'])
+    parser.add_argument('--keep-indexes', action='store_true', help="Do not drop secondary indexes during the load")
+    args = parser.parse_args(argv)
+
+    def show(report):
+        print(f"\r{report['rows_done']} records: {report['rows_loaded']} loaded, "
+              f"{report['rows_rejected']} rejected", end='', file=sys.stderr)
+
+    try:
+        report = import_history(args.table, args.path, args.format, args.import_id, args.chunk_size,
+                                drop_indexes=not args.keep_indexes, progress=show)
+    except Exception as err:
+        print(f"\nImport failed: {err}", file=sys.stderr)
+        return 1
+
+    show(report)
+    print(f"\nImport {report['import_id']} done in {report['elapsed']:.1f}s; "
+          f"{report['accounts_updated']} account balances updated", file=sys.stderr)
+    for reason, count in sorted(report['reasons'].items()):
+        print(f"  {reason}: {count}", file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
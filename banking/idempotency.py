@@ -0,0 +1,152 @@
+# Idempotency module
+#
+# A payment request carries an idempotency key: supplied by the caller, or
+# derived from what was scanned plus a nonce of the scanning session. The
+# first request with a key reserves it in the idempotency_keys table (its
+# primary key is the unique index that settles races, also between
+# processes) and stores the result. Retries with the same key get that
+# result back without touching balances. A bounded TTL cache answers
+# recent retries without a query. A reservation left PENDING by a request
+# that crashed is taken over once its short lease runs out, and a result
+# once its TTL does.
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from config import IDEMPOTENCY_CONFIG
+from .storage import get_storage, utc_timestamp
+
+PENDING = 'PENDING'
+DONE = 'DONE'
+
+def new_key():
+    """Create a key for one payment request (e.g. when its dialog opens)"""
+    return uuid.uuid4().hex
+
+def derive_key(payload, nonce):
+    """Derive a key from a request payload (e.g. QR data) and a session nonce"""
+    return hashlib.sha256(f"{nonce}:{payload}".encode('utf-8')).hexdigest()
+
+class TTLCache:
+    """Bounded mapping whose entries expire ttl seconds after they were stored"""
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """Get an unexpired value, or None"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self.entries[key]
+                return None
+            return value
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            # Evict the oldest entries beyond the size bound
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+class IdempotencyStore:
+    """Runs each keyed request at most once and replays its result to retries"""
+    def __init__(self, ttl=None, cache_size=None, lease=None):
+        self.ttl = ttl or IDEMPOTENCY_CONFIG['ttl_seconds']
+        self.lease = lease or IDEMPOTENCY_CONFIG['lease_seconds']
+        self.cache = TTLCache(cache_size or IDEMPOTENCY_CONFIG['cache_size'], self.ttl)
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self.reset_metrics()
+
+    def _count(self, metric):
+        with self.lock:
+            self.metrics[metric] += 1
+
+    def run(self, key, operation):
+        """Run operation() once for key and return its (success, message) result.
+
+        Only successful results are kept: a failed request releases its key
+        so it can be retried. A retry while the first request is still
+        running (for up to the lease) is refused rather than run twice.
+        """
+        if key is None:
+            return operation()
+
+        self._count('requests')
+        result = self.cache.get(key)
+        if result is not None:
+            self._count('duplicates_suppressed')
+            self._count('cache_hits')
+            return result
+
+        storage = get_storage()
+        if not (storage.reserve_idempotency_key(key)
+                or storage.take_over_idempotency_key(key, utc_timestamp(self.lease), utc_timestamp(self.ttl))):
+            row = storage.get_idempotency_key(key)
+            if row is None:
+                # Released or purged in between
+                return self.run(key, operation)
+
+            self._count('duplicates_suppressed')
+            if row['status'] == DONE:
+                self._count('store_hits')
+                result = (bool(row['success']), row['message'])
+                self.cache.put(key, result)
+                return result
+
+            self._count('in_flight_rejected')
+            return False, "This payment is already being processed"
+
+        try:
+            result = operation()
+        except Exception:
+            storage.release_idempotency_key(key)
+            raise
+
+        self._count('executed')
+        success, message = result
+        if success:
+            storage.complete_idempotency_key(key, success, message)
+            self.cache.put(key, result)
+        else:
+            storage.release_idempotency_key(key)
+        return result
+
+    def purge_expired(self):
+        """Delete keys older than the TTL from storage. Returns how many were removed"""
+        return get_storage().purge_idempotency_keys(utc_timestamp(self.ttl))
+
+    def get_metrics(self):
+        """Get request, execution and duplicate counters"""
+        with self.lock:
+            metrics = dict(self.metrics)
+        metrics['cached_keys'] = len(self.cache)
+        return metrics
+
+    def reset_metrics(self):
+        with self.lock:
+            self.metrics = {
+                'requests': 0,
+                'executed': 0,
+                'duplicates_suppressed': 0,
+                'cache_hits': 0,
+                'store_hits': 0,
+                'in_flight_rejected': 0
+            }
+
+idempotency_store = IdempotencyStore()
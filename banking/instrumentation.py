@@ -0,0 +1,200 @@
+# Query instrumentation module
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+import traceback
+from collections import deque
+from config import INSTRUMENTATION_CONFIG
+
+slow_query_logger = logging.getLogger('banking.slow_query')
+query_error_logger = logging.getLogger('banking.query_error')
+
+# Latency histogram bucket upper bounds, in milliseconds
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, float('inf'))
+
+# Frames from these files are skipped when fingerprinting the caller
+_DB_LAYER_FILES = ('db_adapter.py', 'instrumentation.py', 'group_commit.py', 'contextlib.py')
+
+class QueryStats:
+    """Latency histogram and counters for one query"""
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.errors = 0
+        self.rows = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.wait_ms = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS_MS)
+
+    def add(self, elapsed_ms, rows, wait_ms, failed):
+        self.calls += 1
+        self.total_ms += elapsed_ms
+        self.wait_ms += wait_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        if failed:
+            self.errors += 1
+        if rows:
+            self.rows += rows
+        for i, bound in enumerate(LATENCY_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                self.buckets[i] += 1
+                break
+
+    def percentile(self, fraction):
+        """Approximate a latency percentile from the histogram (bucket upper bound)"""
+        if not self.calls:
+            return 0.0
+        target = fraction * self.calls
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets):
+            seen += count
+            if seen >= target:
+                return self.max_ms if bound == float('inf') else min(bound, self.max_ms)
+        return self.max_ms
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'calls': self.calls,
+            'errors': self.errors,
+            'rows': self.rows,
+            'total_ms': round(self.total_ms, 3),
+            'avg_ms': round(self.total_ms / self.calls, 3) if self.calls else 0.0,
+            'p50_ms': round(self.percentile(0.50), 3),
+            'p95_ms': round(self.percentile(0.95), 3),
+            'p99_ms': round(self.percentile(0.99), 3),
+            'max_ms': round(self.max_ms, 3),
+            'avg_wait_ms': round(self.wait_ms / self.calls, 3) if self.calls else 0.0,
+            'histogram': {
+                ('inf' if bound == float('inf') else str(bound)): count
+                for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets)
+            }
+        }
+
+class QueryMonitor:
+    """Collects per-query latency, rows and connection wait time, and logs slow queries"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.slow_queries = deque(maxlen=INSTRUMENTATION_CONFIG['slow_log_size'])
+        self._local = threading.local()
+
+    def record_wait(self, wait_seconds):
+        """Remember how long this thread waited for its connection"""
+        self._local.wait_ms = wait_seconds * 1000
+
+    def record(self, name, sql, params, elapsed_seconds, rows=None, error=None):
+        """Record one execution of a query"""
+        if not INSTRUMENTATION_CONFIG['enabled']:
+            return
+
+        elapsed_ms = elapsed_seconds * 1000
+        # The connection wait is charged to the first query run on that connection
+        wait_ms = getattr(self._local, 'wait_ms', 0.0)
+        self._local.wait_ms = 0.0
+
+        with self.lock:
+            stats = self.stats.get(name)
+            if stats is None:
+                stats = QueryStats(name)
+                self.stats[name] = stats
+            stats.add(elapsed_ms, rows, wait_ms, error is not None)
+
+        if error is not None:
+            query_error_logger.warning("Query %s failed: %s (params %s)",
+                                       name, error, redact_params(params))
+
+        if elapsed_ms >= INSTRUMENTATION_CONFIG['slow_query_ms']:
+            fingerprint, location = stack_fingerprint()
+            entry = {
+                'name': name,
+                'statement': normalize_sql(sql),
+                'params': redact_params(params),
+                'elapsed_ms': round(elapsed_ms, 3),
+                'wait_ms': round(wait_ms, 3),
+                'rows': rows,
+                'fingerprint': fingerprint,
+                'location': location,
+                'at': time.strftime('%Y-%m-%d %H:%M:%S')
+            }
+            with self.lock:
+                self.slow_queries.append(entry)
+            slow_query_logger.warning("Slow query %s took %.1f ms at %s [%s]: %s params=%s",
+                                      name, elapsed_ms, location, fingerprint,
+                                      entry['statement'], entry['params'])
+
+    def get_stats(self):
+        """Get per-query statistics, most expensive first"""
+        with self.lock:
+            stats = [s.to_dict() for s in self.stats.values()]
+        return sorted(stats, key=lambda s: s['total_ms'], reverse=True)
+
+    def get_slow_queries(self):
+        """Get the most recent slow queries, newest first"""
+        with self.lock:
+            return list(reversed(self.slow_queries))
+
+    def export_json(self, path=None):
+        """Export statistics and the slow query log as JSON (optionally to a file)"""
+        data = json.dumps({
+            'generated_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'slow_query_ms': INSTRUMENTATION_CONFIG['slow_query_ms'],
+            'queries': self.get_stats(),
+            'slow_queries': self.get_slow_queries()
+        }, indent=2, default=str)
+
+        if path:
+            with open(path, 'w') as f:
+                f.write(data)
+        return data
+
+    def reset(self):
+        """Clear all statistics and the slow query log"""
+        with self.lock:
+            self.stats.clear()
+            self.slow_queries.clear()
+
+def normalize_sql(sql):
+    """Collapse whitespace so a statement fits on one log line"""
+    return re.sub(r'\s+', ' ', sql).strip()
+
+def query_name(sql):
+    """Name an ad hoc query by its normalized text"""
+    name = normalize_sql(sql)
+    return name if len(name) <= 80 else name[:77] + '...'
+
+def redact_params(params):
+    """Describe parameters by type and size without exposing their values"""
+    if not params:
+        return []
+    redacted = []
+    for value in params:
+        if value is None:
+            redacted.append('NULL')
+        elif isinstance(value, (str, bytes)):
+            redacted.append(f"<{type(value).__name__}:{len(value)}>")
+        else:
+            redacted.append(f"<{type(value).__name__}>")
+    return redacted
+
+def stack_fingerprint(depth=5):
+    """Identify the application code path that issued a query.
+
+    Returns a short hash of the innermost application frames (so the same
+    call site always gets the same fingerprint) and a readable location.
+    """
+    frames = [
+        frame for frame in traceback.extract_stack()[:-1]
+        if os.path.basename(frame.filename) not in _DB_LAYER_FILES
+    ][-depth:]
+    key = '|'.join(f"{os.path.basename(f.filename)}:{f.name}:{f.lineno}" for f in frames)
+    fingerprint = hashlib.sha1(key.encode('utf-8')).hexdigest()[:12]
+    location = f"{os.path.basename(frames[-1].filename)}:{frames[-1].name}:{frames[-1].lineno}" if frames else "?"
+    return fingerprint, location
+
+query_monitor = QueryMonitor()
@@ -0,0 +1,181 @@
+# Account provisioning module
+#
+# Account numbers come from a named sequence in storage, reserved a block
+# at a time, and each sequence value is mapped to a 12-digit number by a
+# keyed Feistel permutation. A permutation never maps two values to the
+# same number, so numbers are unique without checking the database, and
+# consecutive accounts still do not get guessable consecutive numbers.
+# Bulk provisioning inserts accounts with executemany, one transaction per
+# chunk, and reports progress after every chunk.
+import hashlib
+import itertools
+import threading
+import time
+from config import PROVISIONING_CONFIG
+from . import events
+from .events import event_bus
+from .storage import get_storage
+
+ACCOUNT_NUMBER_DIGITS = 12
+ACCOUNT_NUMBER_SEQUENCE = 'account_number'
+
+# Attempts at creating an account whose number was taken by a legacy
+# (randomly numbered) account before giving up
+MAX_NUMBER_ATTEMPTS = 5
+
+class FeistelPermutation:
+    """Keyed bijection on the numbers 0 .. 10**digits - 1.
+
+    The number is split into two decimal halves that are mixed over a few
+    rounds; every round can be undone, so distinct inputs always give
+    distinct outputs.
+    """
+    def __init__(self, key, digits=ACCOUNT_NUMBER_DIGITS, rounds=4):
+        if digits % 2:
+            raise ValueError("digits must be even")
+        self.half = 10 ** (digits // 2)
+        self.size = self.half * self.half
+        self.round_keys = [
+            int.from_bytes(hashlib.sha256(f"{key}:{i}".encode('utf-8')).digest()[:6], 'big')
+            for i in range(rounds)
+        ]
+
+    def _mix(self, value, round_key):
+        value = (value * 0x9E3779B1 + round_key) & 0xFFFFFFFFFFFF
+        value ^= value >> 17
+        return value % self.half
+
+    def permute(self, value):
+        left, right = divmod(value, self.half)
+        for round_key in self.round_keys:
+            left, right = right, (left + self._mix(right, round_key)) % self.half
+        return left * self.half + right
+
+    def invert(self, value):
+        left, right = divmod(value, self.half)
+        for round_key in reversed(self.round_keys):
+            left, right = (right - self._mix(left, round_key)) % self.half, left
+        return left * self.half + right
+
+class AccountNumberAllocator:
+    """Hands out account numbers that never repeat.
+
+    Single allocations are served from a block of sequence values reserved
+    in storage, so only one in block_size of them costs a round trip.
+    Storage hands each block out once, also between processes.
+    """
+    def __init__(self, key=None, block_size=None, sequence=ACCOUNT_NUMBER_SEQUENCE):
+        self.permutation = FeistelPermutation(key or PROVISIONING_CONFIG['number_key'])
+        self.block_size = block_size or PROVISIONING_CONFIG['block_size']
+        self.sequence = sequence
+        self.lock = threading.Lock()
+        self.storage = None
+        self.next_value = 0
+        self.end = 0
+
+    def format(self, value):
+        """The account number of a sequence value"""
+        if not 0 <= value < self.permutation.size:
+            raise ValueError("Account numbers are exhausted")
+        return f"{self.permutation.permute(value):0{ACCOUNT_NUMBER_DIGITS}d}"
+
+    def allocate(self):
+        """Get one new account number"""
+        with self.lock:
+            storage = get_storage()
+            if storage is not self.storage or self.next_value >= self.end:
+                # A block reserved from another backend is no use here
+                self.next_value = storage.reserve_sequence(self.sequence, self.block_size)
+                self.end = self.next_value + self.block_size
+                self.storage = storage
+            value = self.next_value
+            self.next_value += 1
+        return self.format(value)
+
+    def allocate_many(self, count):
+        """Get count new account numbers with a single reservation"""
+        first = get_storage().reserve_sequence(self.sequence, count)
+        return [self.format(value) for value in range(first, first + count)]
+
+def _parse(row):
+    # (user_id, account_type) or (user_id, account_type, initial_balance)
+    user_id, account_type, *rest = row
+    return user_id, account_type, float(rest[0]) if rest else 0.0
+
+class AccountProvisioner:
+    """Creates accounts, one at a time or in bulk, with allocated account numbers"""
+    def __init__(self, allocator=None):
+        self.allocator = allocator or AccountNumberAllocator()
+
+    def create_one(self, user_id, account_type, initial_balance=0.0):
+        """Create an account and return its account number"""
+        storage = get_storage()
+        for _ in range(MAX_NUMBER_ATTEMPTS):
+            account_number = self.allocator.allocate()
+            try:
+                storage.create_account(user_id, account_number, account_type, initial_balance)
+                return account_number
+            except Exception:
+                # Only a collision with an account numbered before the
+                # allocator existed is worth another number
+                if storage.get_balance(account_number) is None:
+                    raise
+        raise ValueError("Could not allocate a free account number")
+
+    def provision(self, accounts, chunk_size=None):
+        """Create accounts from (user_id, account_type[, initial_balance]) rows.
+
+        accounts may be any iterable (e.g. a generator reading a file); it is
+        consumed one chunk at a time, and each chunk is inserted in its own
+        transaction. Yields a progress dict after every chunk: 'created'
+        (so far), 'account_numbers' (of the chunk), 'elapsed' and 'rate'
+        (accounts per second). A row that cannot be created raises, after a
+        last progress dict that counts the accounts created before it; those
+        accounts stay.
+        """
+        chunk_size = chunk_size or PROVISIONING_CONFIG['chunk_size']
+        storage = get_storage()
+        rows = iter(accounts)
+        created = 0
+        start = time.perf_counter()
+
+        while True:
+            chunk = [_parse(row) for row in itertools.islice(rows, chunk_size)]
+            if not chunk:
+                break
+
+            numbers = self.allocator.allocate_many(len(chunk))
+            error = None
+            try:
+                storage.create_accounts([
+                    (user_id, account_number, account_type, balance)
+                    for (user_id, account_type, balance), account_number in zip(chunk, numbers)
+                ])
+            except Exception:
+                # The chunk was rolled back. Redo it row by row, so a number
+                # taken by a legacy account is replaced instead of failing it
+                numbers = []
+                try:
+                    for row in chunk:
+                        numbers.append(self.create_one(*row))
+                except Exception as err:
+                    error = err
+
+            # Only the rows that went in count; after a failure that is the ones before it
+            done = chunk[:len(numbers)]
+            created += len(done)
+            if done:
+                event_bus.publish(events.ACCOUNTS_PROVISIONED,
+                                  user_ids={user_id for user_id, _, _ in done}, count=len(done))
+
+            elapsed = time.perf_counter() - start
+            yield {
+                'created': created,
+                'account_numbers': numbers,
+                'elapsed': elapsed,
+                'rate': created / elapsed if elapsed > 0 else 0.0
+            }
+            if error:
+                raise error
+
+account_provisioner = AccountProvisioner()
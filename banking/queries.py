@@ -0,0 +1,789 @@
+# Query registry
+#
+# Every statement is declared once, in the portable %s placeholder form,
+# and compiled for the configured DB_TYPE when this module is imported.
+# Because the compiled text of a statement never changes, SQLite's
+# per-connection statement cache (cached_statements) and MySQL prepared
+# cursors can reuse the parsed statement on every call.
+import threading
+from config import DB_TYPE
+
+STATEMENTS = {}
+_stats_lock = threading.Lock()
+
+class Statement:
+    """A named SQL statement compiled for the configured database"""
+    def __init__(self, name, sql, sqlite=None, mysql=None):
+        self.name = name
+        if DB_TYPE == 'sqlite':
+            self.sql = Statement.compile_sqlite(sqlite or sql)
+        else:
+            self.sql = (mysql or sql).strip()
+
+        # Call statistics
+        self.calls = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    @staticmethod
+    def compile_sqlite(sql):
+        """Rewrite %s placeholders as ? for SQLite"""
+        return sql.strip().replace("%s", "?")
+
+    def record_call(self, elapsed):
+        """Record the duration of one execution"""
+        with _stats_lock:
+            self.calls += 1
+            self.total_time += elapsed
+            if elapsed > self.max_time:
+                self.max_time = elapsed
+
+def register(name, sql, sqlite=None, mysql=None):
+    """Declare a statement; sqlite/mysql override the SQL for one dialect"""
+    if name in STATEMENTS:
+        raise ValueError(f"Statement '{name}' is already registered")
+    statement = Statement(name, sql, sqlite=sqlite, mysql=mysql)
+    STATEMENTS[name] = statement
+    return statement
+
+def get_statement(name):
+    """Look up a registered statement by name"""
+    try:
+        return STATEMENTS[name]
+    except KeyError:
+        raise KeyError(f"Unknown statement '{name}'") from None
+
+def get_query_stats():
+    """Get call counts and timings per statement, most expensive first"""
+    with _stats_lock:
+        stats = [
+            {
+                'name': statement.name,
+                'calls': statement.calls,
+                'total_ms': statement.total_time * 1000,
+                'avg_ms': statement.total_time / statement.calls * 1000 if statement.calls else 0.0,
+                'max_ms': statement.max_time * 1000
+            }
+            for statement in STATEMENTS.values()
+        ]
+    return sorted(stats, key=lambda s: s['total_ms'], reverse=True)
+
+def reset_query_stats():
+    """Reset call statistics for every statement"""
+    with _stats_lock:
+        for statement in STATEMENTS.values():
+            statement.calls = 0
+            statement.total_time = 0.0
+            statement.max_time = 0.0
+
+# --- Schema helpers ---
+
+register('schema.table_exists',
+         "SELECT table_name FROM information_schema.tables "
+         "WHERE table_schema = DATABASE() AND table_name = %s",
+         sqlite="SELECT name FROM sqlite_master WHERE type = 'table' AND name = %s")
+
+# Non-unique secondary indexes of a table, with the DDL that recreates them
+# (MySQL keeps the indexes backing foreign keys, which cannot be dropped)
+register('schema.secondary_indexes', """
+    SELECT s.index_name AS name,
+           CONCAT('CREATE INDEX ', s.index_name, ' ON ', s.table_name, ' (',
+                  GROUP_CONCAT(s.column_name ORDER BY s.seq_in_index), ')') AS ddl
+    FROM information_schema.statistics s
+    WHERE s.table_schema = DATABASE() AND s.table_name = %s AND s.non_unique = 1
+      AND s.index_name NOT IN (
+          SELECT s2.index_name
+          FROM information_schema.statistics s2
+          JOIN information_schema.key_column_usage k
+            ON k.table_schema = s2.table_schema AND k.table_name = s2.table_name
+           AND k.column_name = s2.column_name
+          WHERE s2.table_schema = s.table_schema AND s2.table_name = s.table_name
+            AND s2.seq_in_index = 1 AND k.referenced_table_name IS NOT NULL
+      )
+    GROUP BY s.index_name, s.table_name
+""", sqlite="""
+    SELECT name, sql AS ddl FROM sqlite_master
+    WHERE type = 'index' AND tbl_name = %s AND sql IS NOT NULL
+      AND sql NOT LIKE 'CREATE UNIQUE%'
+""")
+
+# --- Users ---
+
+register('users.login', """
+    SELECT user_id, username, password_hash, salt, is_admin, full_name, email
+    FROM users
+    WHERE username = %s
+""")
+
+register('users.username_exists', "SELECT username FROM users WHERE username = %s")
+
+register('users.email_exists', "SELECT email FROM users WHERE email = %s")
+
+register('users.create', """
+    INSERT INTO users (username, password_hash, salt, full_name, email, is_admin)
+    VALUES (%s, %s, %s, %s, %s, %s)
+""")
+
+register('users.update_password', """
+    UPDATE users
+    SET password_hash = %s, salt = %s
+    WHERE username = %s
+""")
+
+register('users.list_with_account_counts', """
+    SELECT u.user_id, u.username, u.full_name, u.email,
+           COUNT(a.account_id) as account_count
+    FROM users u
+    LEFT JOIN accounts a ON u.user_id = a.user_id
+    GROUP BY u.user_id
+    ORDER BY u.user_id
+""")
+
+# --- Accounts ---
+
+# The initial balance is also kept as the opening balance reconciliation starts from
+register('accounts.create', """
+    INSERT INTO accounts (user_id, account_number, account_type, balance, opening_balance)
+    VALUES (%s, %s, %s, %s, %s)
+""")
+
+register('accounts.by_user', """
+    SELECT * FROM accounts WHERE user_id = %s
+    ORDER BY created_at DESC
+""")
+
+register('accounts.balance', "SELECT balance FROM accounts WHERE account_number = %s")
+
+register('accounts.ids', "SELECT account_number, account_id FROM accounts")
+
+register('accounts.update_balance', """
+    UPDATE accounts
+    SET balance = balance + %s
+    WHERE account_number = %s
+""")
+
+# Checks the funds and debits in one statement, so concurrent writers cannot overdraw
+register('accounts.debit', """
+    UPDATE accounts
+    SET balance = balance - %s
+    WHERE account_number = %s AND balance >= %s
+""")
+
+# --- Linked bank accounts ---
+
+register('linked_banks.create', """
+    INSERT INTO linked_bank_accounts
+    (user_id, bank_name, account_number, account_holder_name, ifsc_code)
+    VALUES (%s, %s, %s, %s, %s)
+""")
+
+register('linked_banks.verify', """
+    UPDATE linked_bank_accounts
+    SET is_verified = 1
+    WHERE user_id = %s AND account_number = %s
+""")
+
+register('linked_banks.by_user', """
+    SELECT * FROM linked_bank_accounts WHERE user_id = %s
+    ORDER BY created_at DESC
+""")
+
+# --- Transactions and the processing queue ---
+
+register('transactions.create', """
+    INSERT INTO transactions
+    (account_id, transaction_type, amount, description, related_account, status)
+    VALUES (%s, %s, %s, %s, %s, 'PENDING')
+""")
+
+register('transactions.history', """
+    SELECT transaction_id, transaction_type, amount, description,
+           related_account, status, created_at
+    FROM transactions
+    WHERE account_id = %s
+    ORDER BY created_at DESC
+    LIMIT %s
+""")
+
+register('queue.enqueue', """
+    INSERT INTO transaction_queue (transaction_id)
+    VALUES (%s)
+""")
+
+register('queue.recent', """
+    SELECT q.queue_id, q.transaction_id, a.account_number,
+           t.amount, q.status, q.added_at
+    FROM transaction_queue q
+    JOIN transactions t ON q.transaction_id = t.transaction_id
+    JOIN accounts a ON t.account_id = a.account_id
+    ORDER BY q.added_at DESC
+    LIMIT %s
+""")
+
+register('queue.next_fifo', """
+    SELECT q.queue_id, t.transaction_id, t.account_id, t.transaction_type,
+           t.amount, t.related_account, a.account_number, a.account_type, q.priority, q.added_at
+    FROM transaction_queue q
+    JOIN transactions t ON q.transaction_id = t.transaction_id
+    JOIN accounts a ON t.account_id = a.account_id
+    WHERE q.status = 'QUEUED'
+    ORDER BY q.added_at ASC, q.queue_id ASC
+    LIMIT %s
+""")
+
+register('queue.next_priority', """
+    SELECT q.queue_id, t.transaction_id, t.account_id, t.transaction_type,
+           t.amount, t.related_account, a.account_number, a.account_type, q.priority, q.added_at
+    FROM transaction_queue q
+    JOIN transactions t ON q.transaction_id = t.transaction_id
+    JOIN accounts a ON t.account_id = a.account_id
+    WHERE q.status = 'QUEUED'
+    ORDER BY q.priority DESC, q.added_at ASC, q.queue_id ASC
+    LIMIT %s
+""")
+
+# Queued transactions of the accounts in one partition (account_id modulo the partition count),
+# for worker processes that split the queue between them
+register('queue.next_partition', """
+    SELECT q.queue_id, t.transaction_id, t.account_id, t.transaction_type,
+           t.amount, t.related_account, a.account_number, a.account_type, q.priority, q.added_at
+    FROM transaction_queue q
+    JOIN transactions t ON q.transaction_id = t.transaction_id
+    JOIN accounts a ON t.account_id = a.account_id
+    WHERE q.status = 'QUEUED' AND MOD(t.account_id, %s) = %s
+    ORDER BY q.added_at ASC, q.queue_id ASC
+    LIMIT %s
+""", sqlite="""
+    SELECT q.queue_id, t.transaction_id, t.account_id, t.transaction_type,
+           t.amount, t.related_account, a.account_number, a.account_type, q.priority, q.added_at
+    FROM transaction_queue q
+    JOIN transactions t ON q.transaction_id = t.transaction_id
+    JOIN accounts a ON t.account_id = a.account_id
+    WHERE q.status = 'QUEUED' AND t.account_id % %s = %s
+    ORDER BY q.added_at ASC, q.queue_id ASC
+    LIMIT %s
+""")
+
+# Queued transactions added after a queue_id, for schedulers that index the queue in memory
+register('queue.next_after', """
+    SELECT q.queue_id, t.transaction_id, t.account_id, t.transaction_type,
+           t.amount, t.related_account, a.account_number, a.account_type, q.priority, q.added_at
+    FROM transaction_queue q
+    JOIN transactions t ON q.transaction_id = t.transaction_id
+    JOIN accounts a ON t.account_id = a.account_id
+    WHERE q.queue_id > %s AND q.status = 'QUEUED'
+    ORDER BY q.queue_id ASC
+    LIMIT %s
+""")
+
+# Oldest queued transaction of every account with work waiting
+register('queue.heads', """
+    SELECT q.queue_id, t.transaction_id, t.account_id, t.transaction_type,
+           t.amount, t.related_account, a.account_number, a.account_type, q.priority, q.added_at
+    FROM transaction_queue q
+    JOIN transactions t ON q.transaction_id = t.transaction_id
+    JOIN accounts a ON t.account_id = a.account_id
+    WHERE q.queue_id IN (
+        SELECT MIN(q2.queue_id)
+        FROM transaction_queue q2
+        JOIN transactions t2 ON q2.transaction_id = t2.transaction_id
+        WHERE q2.status = 'QUEUED'
+        GROUP BY t2.account_id
+    )
+    ORDER BY q.queue_id ASC
+""")
+
+# Only one worker can move a queued transaction to PROCESSING
+register('queue.claim', """
+    UPDATE transaction_queue
+    SET status = 'PROCESSING', claimed_by = %s, claimed_at = CURRENT_TIMESTAMP
+    WHERE transaction_id = %s AND status = 'QUEUED'
+""")
+
+# A whole batch is claimed with one locking read and one update; the ids are passed as a JSON array
+register('queue.claimable', """
+    SELECT transaction_id FROM transaction_queue
+    WHERE status = 'QUEUED' AND transaction_id IN (SELECT value FROM json_each(%s))
+""", mysql="""
+    SELECT transaction_id FROM transaction_queue
+    WHERE status = 'QUEUED' AND transaction_id IN (
+        SELECT j.id FROM JSON_TABLE(%s, '$[*]' COLUMNS (id BIGINT PATH '$')) AS j
+    )
+    FOR UPDATE
+""")
+
+register('queue.claim_batch', """
+    UPDATE transaction_queue
+    SET status = 'PROCESSING', claimed_by = %s, claimed_at = CURRENT_TIMESTAMP
+    WHERE status = 'QUEUED' AND transaction_id IN (SELECT value FROM json_each(%s))
+""", mysql="""
+    UPDATE transaction_queue
+    SET status = 'PROCESSING', claimed_by = %s, claimed_at = CURRENT_TIMESTAMP
+    WHERE status = 'QUEUED' AND transaction_id IN (
+        SELECT j.id FROM JSON_TABLE(%s, '$[*]' COLUMNS (id BIGINT PATH '$')) AS j
+    )
+""")
+
+register('queue.release', """
+    UPDATE transaction_queue
+    SET status = 'QUEUED', claimed_by = NULL, claimed_at = NULL
+    WHERE transaction_id = %s AND status = 'PROCESSING'
+""")
+
+# Claims of a worker that died, or that are older than the claim timeout
+register('queue.requeue_owner', """
+    UPDATE transaction_queue
+    SET status = 'QUEUED', claimed_by = NULL, claimed_at = NULL
+    WHERE status = 'PROCESSING' AND claimed_by = %s
+""")
+
+register('queue.requeue_stale', """
+    UPDATE transaction_queue
+    SET status = 'QUEUED', claimed_by = NULL, claimed_at = NULL
+    WHERE status = 'PROCESSING' AND claimed_at < %s
+""")
+
+# Finishes a claimed transaction only while the claim is still this worker's
+# (reviews of held transactions have no claim owner)
+register('queue.finish_claimed', """
+    UPDATE transaction_queue
+    SET status = %s
+    WHERE transaction_id = %s AND status = 'PROCESSING' AND (claimed_by IS NULL OR claimed_by = %s)
+""")
+
+register('queue.set_status', """
+    UPDATE transaction_queue
+    SET status = %s
+    WHERE transaction_id = %s
+""")
+
+register('queue.set_priority', """
+    UPDATE transaction_queue
+    SET priority = %s
+    WHERE transaction_id = %s
+""")
+
+register('transactions.set_status', """
+    UPDATE transactions
+    SET status = %s
+    WHERE transaction_id = %s
+""")
+
+# The tail of the ledger the risk scorer starts from, oldest first
+register('transactions.recent_completed', """
+    SELECT account_id, transaction_type, amount, created_at
+    FROM transactions
+    WHERE transaction_id > (SELECT COALESCE(MAX(transaction_id), 0) FROM transactions) - %s
+      AND status = 'COMPLETED'
+    ORDER BY transaction_id
+""")
+
+# --- Held transactions (risk review) ---
+
+register('holds.create', """
+    INSERT INTO transaction_holds (transaction_id, reason)
+    VALUES (%s, %s)
+""")
+
+register('holds.list', """
+    SELECT q.queue_id, t.transaction_id, t.account_id, t.transaction_type,
+           t.amount, t.related_account, a.account_number, a.account_type, q.priority, q.added_at,
+           h.reason, h.held_at
+    FROM transaction_queue q
+    JOIN transactions t ON q.transaction_id = t.transaction_id
+    JOIN accounts a ON t.account_id = a.account_id
+    JOIN transaction_holds h ON h.transaction_id = t.transaction_id
+    WHERE q.status = 'HELD'
+    ORDER BY q.queue_id ASC
+    LIMIT %s
+""")
+
+# Only one reviewer can take a held transaction back to PROCESSING
+register('holds.claim', """
+    UPDATE transaction_queue
+    SET status = 'PROCESSING', claimed_by = NULL, claimed_at = NULL
+    WHERE transaction_id = %s AND status = 'HELD'
+""")
+
+register('holds.review', """
+    UPDATE transaction_holds
+    SET decision = %s, reviewed_at = CURRENT_TIMESTAMP
+    WHERE transaction_id = %s
+""")
+
+# --- Transfers ---
+
+register('transfers.create_table', """
+    CREATE TABLE IF NOT EXISTS transfer_history (
+        transfer_id INT AUTO_INCREMENT PRIMARY KEY,
+        source_account VARCHAR(20) NOT NULL,
+        destination_account VARCHAR(20) NOT NULL,
+        amount DECIMAL(15,2) NOT NULL,
+        description TEXT,
+        transaction_type VARCHAR(10) NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+""", sqlite="""
+    CREATE TABLE IF NOT EXISTS transfer_history (
+        transfer_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        source_account TEXT NOT NULL,
+        destination_account TEXT NOT NULL,
+        amount REAL NOT NULL,
+        description TEXT,
+        transaction_type TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+""")
+
+register('transfers.record', """
+    INSERT INTO transfer_history
+    (source_account, destination_account, amount, description, transaction_type)
+    VALUES (%s, %s, %s, %s, %s)
+""")
+
+register('transfers.history', """
+    SELECT * FROM transfer_history
+    WHERE source_account = %s OR destination_account = %s
+    ORDER BY created_at DESC
+    LIMIT %s
+""")
+
+# Money leaving (OUTGOING rows) or entering (INCOMING rows) any account of a user
+register('transfers.recent_for_user', """
+    SELECT * FROM transfer_history
+    WHERE (transaction_type = 'OUTGOING'
+           AND source_account IN (SELECT account_number FROM accounts WHERE user_id = %s))
+       OR (transaction_type = 'INCOMING'
+           AND destination_account IN (SELECT account_number FROM accounts WHERE user_id = %s))
+    ORDER BY created_at DESC, transfer_id DESC
+    LIMIT %s
+""")
+
+# --- Phone directory ---
+
+register('directory.create', """
+    INSERT INTO phone_directory (phone, account_number, display_name)
+    VALUES (%s, %s, %s)
+""")
+
+register('directory.by_phone', """
+    SELECT phone, account_number, display_name FROM phone_directory
+    WHERE phone = %s
+""")
+
+register('directory.all', """
+    SELECT phone, account_number, display_name FROM phone_directory
+    ORDER BY phone
+""")
+
+# Directory entries a user paid, most recently paid first
+register('directory.recent_payees', """
+    SELECT d.phone, d.account_number, d.display_name,
+           MAX(th.created_at) AS last_paid, MAX(th.transfer_id) AS last_transfer_id
+    FROM transfer_history th
+    JOIN phone_directory d ON d.account_number = th.destination_account
+    WHERE th.transaction_type = 'OUTGOING'
+      AND th.source_account IN (SELECT account_number FROM accounts WHERE user_id = %s)
+    GROUP BY d.phone, d.account_number, d.display_name
+    ORDER BY last_transfer_id DESC
+    LIMIT %s
+""")
+
+# --- Idempotency keys ---
+
+# The primary key makes the reservation the single point of deduplication
+register('idempotency.reserve',
+         "INSERT IGNORE INTO idempotency_keys (idem_key, status) VALUES (%s, 'PENDING')",
+         sqlite="INSERT OR IGNORE INTO idempotency_keys (idem_key, status) VALUES (%s, 'PENDING')")
+
+register('idempotency.get', """
+    SELECT idem_key, status, success, message, created_at FROM idempotency_keys
+    WHERE idem_key = %s
+""")
+
+register('idempotency.complete', """
+    UPDATE idempotency_keys
+    SET status = 'DONE', success = %s, message = %s
+    WHERE idem_key = %s
+""")
+
+register('idempotency.release', "DELETE FROM idempotency_keys WHERE idem_key = %s")
+
+# One statement, so only one of several requests finding the same stale key takes it
+register('idempotency.take_over', """
+    UPDATE idempotency_keys
+    SET status = 'PENDING', success = NULL, message = NULL, created_at = CURRENT_TIMESTAMP
+    WHERE idem_key = %s
+      AND ((status = 'PENDING' AND created_at < %s) OR (status = 'DONE' AND created_at < %s))
+""")
+
+register('idempotency.purge', "DELETE FROM idempotency_keys WHERE created_at < %s")
+
+# --- Bank account verification jobs ---
+
+register('verification.create', """
+    INSERT INTO verification_jobs (user_id, account_number, status, attempts, next_attempt_at)
+    VALUES (%s, %s, 'PENDING', 0, %s)
+""")
+
+register('verification.update', """
+    UPDATE verification_jobs
+    SET status = %s, attempts = %s, next_attempt_at = %s, last_error = %s,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE job_id = %s
+""")
+
+register('verification.get', "SELECT * FROM verification_jobs WHERE job_id = %s")
+
+register('verification.by_user', """
+    SELECT * FROM verification_jobs WHERE user_id = %s
+    ORDER BY job_id DESC
+""")
+
+register('verification.unfinished', """
+    SELECT * FROM verification_jobs
+    WHERE status IN ('PENDING', 'RUNNING')
+    ORDER BY next_attempt_at, job_id
+""")
+
+register('transfers.totals_for_user', """
+    SELECT transaction_type, SUM(amount) AS total
+    FROM transfer_history
+    WHERE created_at >= %s
+      AND ((transaction_type = 'OUTGOING'
+            AND source_account IN (SELECT account_number FROM accounts WHERE user_id = %s))
+        OR (transaction_type = 'INCOMING'
+            AND destination_account IN (SELECT account_number FROM accounts WHERE user_id = %s)))
+    GROUP BY transaction_type
+""")
+
+# --- Sequences ---
+
+register('sequences.ensure',
+         "INSERT IGNORE INTO sequences (name, next_value) VALUES (%s, 0)",
+         sqlite="INSERT OR IGNORE INTO sequences (name, next_value) VALUES (%s, 0)")
+
+register('sequences.advance', "UPDATE sequences SET next_value = next_value + %s WHERE name = %s")
+
+register('sequences.get', "SELECT next_value FROM sequences WHERE name = %s")
+
+# --- Exports ---
+# Every filter is optional: passing NULL for a bound disables it
+
+register('export.transfer_history', """
+    SELECT transfer_id, source_account, destination_account, amount,
+           description, transaction_type, created_at
+    FROM transfer_history
+    WHERE (%s IS NULL OR created_at >= %s)
+      AND (%s IS NULL OR created_at < %s)
+      AND (%s IS NULL OR %s IN (source_account, destination_account))
+    ORDER BY transfer_id
+""")
+
+register('export.transactions', """
+    SELECT t.transaction_id, a.account_number, t.transaction_type, t.amount,
+           t.description, t.related_account, t.status, t.created_at
+    FROM transactions t
+    LEFT JOIN accounts a ON t.account_id = a.account_id
+    WHERE (%s IS NULL OR t.created_at >= %s)
+      AND (%s IS NULL OR t.created_at < %s)
+      AND (%s IS NULL OR a.account_number = %s)
+    ORDER BY t.transaction_id
+""")
+
+register('export.transaction_queue', """
+    SELECT q.queue_id, q.transaction_id, a.account_number, t.transaction_type,
+           t.amount, q.priority, q.status, q.added_at
+    FROM transaction_queue q
+    JOIN transactions t ON q.transaction_id = t.transaction_id
+    LEFT JOIN accounts a ON t.account_id = a.account_id
+    WHERE (%s IS NULL OR q.added_at >= %s)
+      AND (%s IS NULL OR q.added_at < %s)
+      AND (%s IS NULL OR a.account_number = %s)
+    ORDER BY q.queue_id
+""")
+
+# --- Bulk history imports ---
+
+register('import.checkpoint', "SELECT * FROM import_checkpoints WHERE import_id = %s")
+
+register('import.start', """
+    INSERT INTO import_checkpoints (import_id, table_name, source, dropped_indexes)
+    VALUES (%s, %s, %s, %s)
+""")
+
+register('import.dropped_indexes', """
+    UPDATE import_checkpoints SET dropped_indexes = %s, updated_at = CURRENT_TIMESTAMP WHERE import_id = %s
+""")
+
+register('import.progress', """
+    UPDATE import_checkpoints
+    SET rows_done = %s, rows_loaded = %s, rows_rejected = %s, updated_at = CURRENT_TIMESTAMP
+    WHERE import_id = %s
+""")
+
+register('import.done', """
+    UPDATE import_checkpoints
+    SET status = 'DONE', dropped_indexes = NULL, updated_at = CURRENT_TIMESTAMP
+    WHERE import_id = %s
+""")
+
+register('import.transaction', """
+    INSERT INTO transactions
+    (account_id, transaction_type, amount, description, related_account, status, created_at)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+""")
+
+register('import.transfer', """
+    INSERT INTO transfer_history
+    (source_account, destination_account, amount, description, transaction_type, created_at)
+    VALUES (%s, %s, %s, %s, %s, %s)
+""")
+
+register('import.add_delta', """
+    INSERT INTO import_balance_deltas (import_id, account_number, delta)
+    VALUES (%s, %s, %s)
+    ON DUPLICATE KEY UPDATE delta = delta + VALUES(delta)
+""", sqlite="""
+    INSERT INTO import_balance_deltas (import_id, account_number, delta)
+    VALUES (%s, %s, %s)
+    ON CONFLICT (import_id, account_number) DO UPDATE SET delta = delta + excluded.delta
+""")
+
+# Every balance change of an import in one statement
+register('import.apply_deltas', """
+    UPDATE accounts
+    SET balance = balance + (
+        SELECT d.delta FROM import_balance_deltas d
+        WHERE d.import_id = %s AND d.account_number = accounts.account_number
+    )
+    WHERE account_number IN (
+        SELECT account_number FROM import_balance_deltas WHERE import_id = %s
+    )
+""")
+
+register('import.clear_deltas', "DELETE FROM import_balance_deltas WHERE import_id = %s")
+
+# --- Reconciliation ---
+
+# settled_transaction_id: every transaction up to it is final (none is still PENDING)
+register('reconcile.watermarks', """
+    SELECT
+        (SELECT COALESCE(MAX(transfer_id), 0) FROM transfer_history) AS transfer_id,
+        (SELECT COALESCE(MAX(transaction_id), 0) FROM transactions) AS transaction_id,
+        COALESCE(
+            (SELECT MIN(transaction_id) - 1 FROM transactions WHERE status IN ('PENDING', 'HELD')),
+            (SELECT COALESCE(MAX(transaction_id), 0) FROM transactions)
+        ) AS settled_transaction_id
+""")
+
+register('reconcile.accounts', """
+    SELECT a.account_id, a.account_number, a.balance, a.opening_balance, r.expected_balance
+    FROM accounts a
+    LEFT JOIN reconciliation_balances r ON r.account_id = a.account_id
+    ORDER BY a.account_id
+""")
+
+# OUTGOING rows debit the source account, INCOMING rows credit the destination
+register('reconcile.transfers', """
+    SELECT transfer_id,
+           CASE WHEN transaction_type = 'OUTGOING' THEN source_account ELSE destination_account END,
+           CASE WHEN transaction_type = 'OUTGOING' THEN -amount ELSE amount END,
+           created_at
+    FROM transfer_history
+    WHERE transfer_id > %s AND transfer_id <= %s
+    ORDER BY transfer_id
+""")
+
+# Every type and status is read, so that ids missing from the snapshot can be told
+# apart from ids of rows that never move a balance
+register('reconcile.transactions', """
+    SELECT transaction_id, account_id,
+           CASE WHEN transaction_type = 'DEPOSIT' THEN amount ELSE -amount END,
+           status, transaction_type, created_at
+    FROM transactions
+    WHERE transaction_id > %s AND transaction_id <= %s
+    ORDER BY transaction_id
+""")
+
+register('reconcile.last_run', "SELECT * FROM reconciliation_runs ORDER BY run_id DESC LIMIT 1")
+
+register('reconcile.record_run', """
+    INSERT INTO reconciliation_runs
+    (mode, transfer_watermark, transaction_watermark, accounts, discrepancies)
+    VALUES (%s, %s, %s, %s, %s)
+""")
+
+register('reconcile.save_balance', """
+    INSERT INTO reconciliation_balances (account_id, expected_balance)
+    VALUES (%s, %s)
+    ON DUPLICATE KEY UPDATE expected_balance = VALUES(expected_balance), updated_at = CURRENT_TIMESTAMP
+""", sqlite="""
+    INSERT INTO reconciliation_balances (account_id, expected_balance)
+    VALUES (%s, %s)
+    ON CONFLICT (account_id) DO UPDATE SET expected_balance = excluded.expected_balance,
+                                           updated_at = CURRENT_TIMESTAMP
+""")
+
+# --- Analytics rollups ---
+
+register('analytics.watermark', "SELECT high_water FROM rollup_state WHERE name = %s")
+
+# Only moves the watermark if nobody else moved it since it was read
+register('analytics.advance', """
+    UPDATE rollup_state
+    SET high_water = %s, updated_at = CURRENT_TIMESTAMP
+    WHERE name = %s AND high_water = %s
+""")
+
+# Each row seen from its own side: the account it belongs to and the other party
+register('analytics.transfers_after', """
+    SELECT transfer_id,
+           CASE WHEN transaction_type = 'OUTGOING' THEN source_account ELSE destination_account END
+               AS account_number,
+           CASE WHEN transaction_type = 'OUTGOING' THEN destination_account ELSE source_account END
+               AS counterparty,
+           transaction_type, amount, created_at
+    FROM transfer_history
+    WHERE transfer_id > %s
+    ORDER BY transfer_id
+    LIMIT %s
+""")
+
+register('analytics.add', """
+    INSERT INTO transfer_rollups
+    (account_number, granularity, counterparty, bucket, amount_in, count_in, amount_out, count_out)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        amount_in = amount_in + VALUES(amount_in), count_in = count_in + VALUES(count_in),
+        amount_out = amount_out + VALUES(amount_out), count_out = count_out + VALUES(count_out)
+""", sqlite="""
+    INSERT INTO transfer_rollups
+    (account_number, granularity, counterparty, bucket, amount_in, count_in, amount_out, count_out)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    ON CONFLICT (account_number, granularity, counterparty, bucket) DO UPDATE SET
+        amount_in = amount_in + excluded.amount_in, count_in = count_in + excluded.count_in,
+        amount_out = amount_out + excluded.amount_out, count_out = count_out + excluded.count_out
+""")
+
+# All-time totals per counterparty; transfers between the user's own accounts are not payments
+register('analytics.top_payees', """
+    SELECT r.counterparty, SUM(r.amount_out) AS amount, SUM(r.count_out) AS count
+    FROM accounts a
+    JOIN transfer_rollups r ON r.account_number = a.account_number
+    WHERE a.user_id = %s AND r.granularity = 'A' AND r.count_out > 0
+      AND r.counterparty NOT IN (SELECT account_number FROM accounts WHERE user_id = %s)
+    GROUP BY r.counterparty
+    ORDER BY amount DESC, r.counterparty
+    LIMIT %s
+""")
+
+register('analytics.series', """
+    SELECT r.bucket, SUM(r.amount_in) AS amount_in, SUM(r.count_in) AS count_in,
+           SUM(r.amount_out) AS amount_out, SUM(r.count_out) AS count_out
+    FROM accounts a
+    JOIN transfer_rollups r ON r.account_number = a.account_number
+    WHERE a.user_id = %s AND r.granularity = %s AND r.counterparty = '' AND r.bucket >= %s
+    GROUP BY r.bucket
+    ORDER BY r.bucket
+""")
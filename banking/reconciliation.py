@@ -0,0 +1,270 @@
+# Balance reconciliation module
+#
+# Recomputes every account balance from the ledger and compares it with
+# accounts.balance. The expected balance of an account is its opening
+# balance, plus its transfer_history rows (OUTGOING debits the source,
+# INCOMING credits the destination), plus its completed deposits and
+# withdrawals. History is read from one consistent snapshot in large
+# batches, mapped to account indexes with np.searchsorted and summed with
+# np.bincount, so memory grows with the number of accounts but not with
+# the number of history rows. Amounts are summed as whole cents, which
+# float64 holds exactly, so 100M rows do not accumulate rounding error.
+#
+# A saved run stores each account's expected balance up to a watermark
+# (the last transfer_id, and the last transaction_id below any still
+# PENDING), and the next incremental run only reads history after it.
+# Neither watermark moves past a missing id until the row after it has
+# settled (HISTORY_SCAN_CONFIG): on MySQL a row with a lower id can commit
+# after the snapshot, and would otherwise never be read. Rows after the
+# watermarks are still compared, and read again by the next run.
+# Also runs from the command line:
+#
+#     python -m banking.reconciliation [--full] [--no-save]
+import argparse
+import sys
+import time
+import numpy as np
+from config import HISTORY_SCAN_CONFIG, RECONCILIATION_CONFIG
+from .storage import get_storage, settled_through, utc_timestamp
+
+FULL = 'FULL'
+INCREMENTAL = 'INCREMENTAL'
+
+def _cents(values):
+    """Amounts as a float64 array of whole cents (MySQL's Decimals included)"""
+    return np.rint(np.array(values, dtype=np.float64) * 100)
+
+class Reconciliation:
+    """Expected balances of one reconciliation pass.
+
+    Feed it the batches of StorageBackend.reconciliation_scan in order
+    (accounts before history), then call discrepancies().
+    """
+    def __init__(self, mode, watermarks, transfer_after=0, transaction_after=0):
+        self.mode = mode
+        self.watermarks = watermarks
+        # Last ids read with no unsettled gap before them, and the kinds a gap stopped
+        self.through = {'transfer_id': transfer_after, 'transaction_id': transaction_after}
+        self.stopped = set()
+        self.settled_before = utc_timestamp(HISTORY_SCAN_CONFIG['settle_seconds'])
+        self.transfers = 0
+        self.transactions = 0
+        self.unmatched = 0  # History rows of accounts that do not exist
+        self._columns = []
+        self.size = None
+
+    def add_accounts(self, rows):
+        account_ids, numbers, balances, openings, reconciled = zip(*rows)
+        self._columns.append((
+            np.array(account_ids, dtype=np.int64), np.array(numbers), _cents(balances),
+            _cents(openings), _cents([np.nan if value is None else value for value in reconciled])
+        ))
+
+    def _index_accounts(self):
+        """Build the account arrays once every account has been read"""
+        if self._columns:
+            columns = [np.concatenate(column) for column in zip(*self._columns)]
+        else:
+            columns = [np.empty(0, dtype=np.int64), np.empty(0, dtype=str)] + [np.empty(0)] * 3
+        self._columns = None
+        self.account_ids, self.numbers, self.actual, openings, reconciled = columns
+        self.size = len(self.account_ids)
+
+        # Accounts without a saved balance (new ones, or every account in a full run) start from their opening balance
+        if self.mode == FULL:
+            self.baseline = openings
+        else:
+            self.baseline = np.where(np.isnan(reconciled), openings, reconciled)
+        self.saved = ~np.isnan(reconciled) if self.mode == INCREMENTAL else np.zeros(self.size, dtype=bool)
+
+        self._by_number = np.argsort(self.numbers, kind='stable')
+        self._sorted_numbers = self.numbers[self._by_number]
+        self.settled = np.zeros(self.size)  # Changes up to the new watermarks
+        self.live = np.zeros(self.size)  # Changes after them
+        self.pending = np.zeros(self.size, dtype=np.int64)
+
+    def _lookup(self, sorted_keys, keys):
+        """Positions of keys in sorted_keys, and which keys were found"""
+        if not len(sorted_keys):
+            return np.zeros(len(keys), dtype=np.int64), np.zeros(len(keys), dtype=bool)
+        positions = np.minimum(np.searchsorted(sorted_keys, keys), len(sorted_keys) - 1)
+        return positions, sorted_keys[positions] == keys
+
+    def _settle(self, key, ids, created):
+        """Move through[key] over the ids of the next batch, up to the first unsettled gap"""
+        if key not in self.stopped:
+            self.through[key], stopped = settled_through(self.through[key], zip(ids, created),
+                                                         self.settled_before)
+            if stopped:
+                self.stopped.add(key)
+        return self.through[key]
+
+    def new_watermarks(self):
+        """(transfer_id, transaction_id) the history has been read up to for good"""
+        return (int(self.through['transfer_id']),
+                int(min(self.through['transaction_id'], self.watermarks['settled_transaction_id'])))
+
+    def add_transfers(self, rows):
+        if self.size is None:
+            self._index_accounts()
+        transfer_ids, numbers, changes, created = zip(*rows)
+        through = self._settle('transfer_id', transfer_ids, created)
+        positions, found = self._lookup(self._sorted_numbers, np.array(numbers))
+        indexes = self._by_number[positions[found]]
+        changes = _cents(changes)[found]
+        settled = np.array(transfer_ids, dtype=np.int64)[found] <= through
+        self.settled += np.bincount(indexes[settled], weights=changes[settled], minlength=self.size)
+        self.live += np.bincount(indexes[~settled], weights=changes[~settled], minlength=self.size)
+        self.transfers += len(rows)
+        self.unmatched += len(rows) - int(found.sum())
+
+    def add_transactions(self, rows):
+        if self.size is None:
+            self._index_accounts()
+        transaction_ids, account_ids, changes, statuses, types, created = zip(*rows)
+        through = min(self._settle('transaction_id', transaction_ids, created),
+                      self.watermarks['settled_transaction_id'])
+        # Only deposits and withdrawals move balances; the rest are read for their ids
+        ledger = np.isin(np.array(types), ('DEPOSIT', 'WITHDRAWAL'))
+        positions, found = self._lookup(self.account_ids, np.array(account_ids, dtype=np.int64)[ledger])
+        transaction_ids = np.array(transaction_ids, dtype=np.int64)[ledger][found]
+        changes = _cents(changes)[ledger][found]
+        statuses = np.array(statuses)[ledger][found]
+        completed = statuses == 'COMPLETED'
+        indexes = positions[found]
+
+        settled = completed & (transaction_ids <= through)
+        live = completed & ~settled
+        self.settled += np.bincount(indexes[settled], weights=changes[settled], minlength=self.size)
+        self.live += np.bincount(indexes[live], weights=changes[live], minlength=self.size)
+        # A pending transaction may already have moved the balance (it is marked COMPLETED after)
+        pending = np.isin(statuses, ('PENDING', 'HELD'))
+        self.pending += np.bincount(indexes[pending], minlength=self.size)
+        self.transactions += int(ledger.sum())
+        self.unmatched += int(ledger.sum()) - int(found.sum())
+
+    def expected_settled(self):
+        """Expected balances (cents) up to the new watermarks"""
+        if self.size is None:
+            self._index_accounts()
+        return self.baseline + self.settled
+
+    def discrepancies(self, limit=None):
+        """Accounts whose balance differs from the ledger, largest difference first.
+
+        Returns (count, [{'account_number', 'expected', 'actual', 'difference',
+        'pending'}]) with at most limit entries listed.
+        """
+        expected = self.expected_settled() + self.live
+        differences = self.actual - expected
+        wrong = np.flatnonzero(differences)
+        wrong = wrong[np.argsort(-np.abs(differences[wrong]), kind='stable')]
+        listed = []
+        for i in wrong[:limit]:
+            listed.append({
+                'account_number': str(self.numbers[i]),
+                'expected': float(expected[i]) / 100,
+                'actual': float(self.actual[i]) / 100,
+                'difference': float(differences[i]) / 100,
+                'pending': int(self.pending[i])
+            })
+        return len(wrong), listed
+
+    def changed_balances(self):
+        """(account_id, expected_balance) rows whose saved baseline must be written"""
+        expected = self.expected_settled()
+        changed = np.flatnonzero((self.settled != 0) | ~self.saved)
+        return [(int(self.account_ids[i]), float(expected[i]) / 100) for i in changed]
+
+def reconcile(incremental=True, save=True, batch_size=None, limit=None, progress=None):
+    """Compare every account balance with the balance its history implies.
+
+    An incremental run continues from the last saved run (a full run if
+    there is none). With save, the expected balances and watermarks are
+    stored for the next incremental run. progress(rows) is called after
+    every history batch. Returns a report dict.
+    """
+    storage = get_storage()
+    last = storage.get_last_reconciliation() if incremental else None
+    mode = INCREMENTAL if last else FULL
+    transfer_after = last['transfer_watermark'] if last else 0
+    transaction_after = last['transaction_watermark'] if last else 0
+    batch_size = batch_size or RECONCILIATION_CONFIG['batch_size']
+    start = time.perf_counter()
+
+    reconciliation = None
+    for kind, rows in storage.reconciliation_scan(transfer_after, transaction_after, batch_size):
+        if kind == 'watermarks':
+            reconciliation = Reconciliation(mode, rows, transfer_after, transaction_after)
+        elif kind == 'accounts':
+            reconciliation.add_accounts(rows)
+        else:
+            if kind == 'transfers':
+                reconciliation.add_transfers(rows)
+            else:
+                reconciliation.add_transactions(rows)
+            if progress:
+                progress(reconciliation.transfers + reconciliation.transactions)
+
+    count, discrepancies = reconciliation.discrepancies(
+        RECONCILIATION_CONFIG['report_limit'] if limit is None else limit)
+    transfer_watermark, transaction_watermark = reconciliation.new_watermarks()
+    report = {
+        'mode': mode,
+        'run_id': None,
+        'accounts': reconciliation.size,
+        'transfers_scanned': reconciliation.transfers,
+        'transactions_scanned': reconciliation.transactions,
+        'unmatched_rows': reconciliation.unmatched,
+        'discrepancy_count': count,
+        'discrepancies': discrepancies,
+        'transfer_watermark': transfer_watermark,
+        'transaction_watermark': transaction_watermark
+    }
+    if save:
+        report['run_id'] = storage.save_reconciliation({
+            'mode': mode,
+            'transfer_watermark': report['transfer_watermark'],
+            'transaction_watermark': report['transaction_watermark'],
+            'accounts': report['accounts'],
+            'discrepancies': count
+        }, reconciliation.changed_balances())
+    report['elapsed'] = time.perf_counter() - start
+    return report
+
+def main(argv=None):
+    """Command line entry point. Exits with 2 if any balance is off"""
+    parser = argparse.ArgumentParser(prog='python -m banking.reconciliation',
+                                     description="Check account balances against the transaction history")
+    parser.add_argument('--full', action='store_true', help="Recompute from opening balances, not from the last run")
+    parser.add_argument('--no-save', action='store_true', help="Do not record this run or move the watermark")
+    parser.add_argument('--batch-size', type=int, default=RECONCILIATION_CONFIG['batch_size'])
+    parser.add_argument('--limit', type=int, default=RECONCILIATION_CONFIG['report_limit'],
+                        help="Discrepancies to list")
+    args = parser.parse_args(argv)
+
+    try:
+        report = reconcile(not args.full, not args.no_save, args.batch_size, args.limit,
+                           progress=lambda rows: print(f"\r{rows} history rows", end='', file=sys.stderr))
+    except Exception as err:
+        print(f"\nReconciliation failed: {err}", file=sys.stderr)
+        return 1
+
+    print(f"\n{report['mode'].capitalize()} reconciliation of {report['accounts']} accounts "
+          f"({report['transfers_scanned']} transfers, {report['transactions_scanned']} transactions) "
+          f"in {report['elapsed']:.1f}s", file=sys.stderr)
+    if report['unmatched_rows']:
+        print(f"{report['unmatched_rows']} history rows belong to no account", file=sys.stderr)
+    if not report['discrepancy_count']:
+        print("All balances agree with the history")
+        return 0
+
+    print(f"{report['discrepancy_count']} accounts disagree with the history:")
+    for row in report['discrepancies']:
+        note = f"  ({row['pending']} pending)" if row['pending'] else ''
+        print(f"  {row['account_number']}: balance {row['actual']:.2f}, expected {row['expected']:.2f}, "
+              f"off by {row['difference']:+.2f}{note}")
+    return 2
+
+if __name__ == '__main__':
+    sys.exit(main())
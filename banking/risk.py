@@ -0,0 +1,199 @@
+# Transaction risk scoring
+#
+# The queue worker scores every claimed batch before executing it. For each
+# account the scorer keeps two small ring buffers, rows of NumPy arrays
+# indexed by an account slot:
+#
+#   times     when its last max_velocity transactions were queued
+#   amounts   its last history_size debits that went through
+#
+# and for a whole batch at once works out how many transactions the account
+# queued in the last velocity_window seconds and the z-score of each debit
+# against the account's recent debits. Debits that fail a check are put on
+# HELD for review instead of being executed. The buffers start from the most
+# recent completed transactions and learn from every batch after that.
+#
+# Only withdrawals are debits here: transfers are paid directly by
+# TransferManager and never pass through the queue.
+import logging
+import threading
+from datetime import datetime
+import numpy as np
+from config import RISK_CONFIG
+from .storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+DEBITS = ('WITHDRAWAL',)
+
+# Hold reasons, in the order the checks are applied
+TOO_FAST = "Too many transactions"
+UNUSUAL_AMOUNT = "Unusual amount"
+
+_EPOCH = datetime(1970, 1, 1)
+
+def _timestamps(values):
+    """Seconds since the epoch of 'YYYY-MM-DD HH:MM:SS' strings or (MySQL's) datetimes"""
+    if values and isinstance(values[0], datetime):
+        return np.fromiter(((value - _EPOCH).total_seconds() for value in values), np.float64, len(values))
+    return np.array(values, dtype='datetime64[s]').astype(np.float64)
+
+def _groups(slots):
+    """Sort a batch by slot once: the order, and where each sorted row's slot starts"""
+    order = np.argsort(slots, kind='stable')
+    ordered = slots[order]
+    positions = np.arange(len(slots))
+    starts = np.ones(len(slots), dtype=bool)
+    np.not_equal(ordered[1:], ordered[:-1], out=starts[1:])
+    return order, np.maximum.accumulate(np.where(starts, positions, 0)), positions
+
+def _ranks(groups, mask=None):
+    """How many earlier rows of the batch (of those in mask) share each row's slot"""
+    order, first, positions = groups
+    if mask is None:
+        before = positions
+    else:
+        selected = mask[order]
+        before = np.cumsum(selected) - selected
+    ranks = np.empty(len(order), dtype=np.int64)
+    ranks[order] = before - before[first]
+    return ranks
+
+class RingBuffers:
+    """The last `width` values of every slot, in one 2-D array.
+
+    Cells not written yet hold zero, which the checks treat as no value (no
+    amount, a time long ago), so they need no mask.
+    """
+    def __init__(self, width, dtype, capacity=1024):
+        self.values = np.zeros((capacity, width), dtype=dtype)
+        self.pushed = np.zeros(capacity, dtype=np.int64)  # Values ever pushed per slot
+
+    def grow(self, capacity):
+        if capacity > len(self.pushed):
+            capacity = max(capacity, 2 * len(self.pushed))
+            values = np.zeros((capacity, self.values.shape[1]), dtype=self.values.dtype)
+            values[:len(self.values)] = self.values
+            self.values = values
+            self.pushed = np.concatenate([self.pushed, np.zeros(capacity - len(self.pushed), dtype=np.int64)])
+
+    def counts(self, slots):
+        """How many values each slot holds"""
+        return np.minimum(self.pushed[slots], self.values.shape[1])
+
+    def push(self, slots, values, ranks):
+        """Append values in order (ranks as from _ranks); a slot pushed more than width times keeps its last ones"""
+        if len(slots):
+            self.values[slots, (self.pushed[slots] + ranks) % self.values.shape[1]] = values
+            self.pushed += np.bincount(slots, minlength=len(self.pushed))
+
+class RiskScorer:
+    """Scores batches of queued transactions"""
+    def __init__(self, config=None):
+        self.config = dict(RISK_CONFIG, **(config or {}))
+        self.lock = threading.Lock()
+        self._reset(None)
+
+    def _reset(self, storage):
+        config = self.config
+        self.storage = storage
+        # Known account_ids, sorted, and the row of the buffers each one has
+        self.account_ids = np.empty(0, dtype=np.int64)
+        self.account_slots = np.empty(0, dtype=np.int64)
+        self.times = RingBuffers(config['max_velocity'], np.float64)
+        self.amounts = RingBuffers(config['history_size'], np.float64)
+
+    def _slots(self, account_ids):
+        """Buffer rows of account_ids, giving new accounts the next free rows"""
+        account_ids = np.array(account_ids, dtype=np.int64)
+        known = self.account_ids
+        positions = np.minimum(np.searchsorted(known, account_ids), max(len(known) - 1, 0))
+        found = known[positions] == account_ids if len(known) else np.zeros(len(account_ids), dtype=bool)
+        if not found.all():
+            new = np.unique(account_ids[~found])
+            size = len(known)
+            merged = np.concatenate([known, new])
+            order = np.argsort(merged, kind='stable')
+            self.account_ids = merged[order]
+            self.account_slots = np.concatenate([self.account_slots, np.arange(size, size + len(new))])[order]
+            for buffers in (self.times, self.amounts):
+                buffers.grow(size + len(new))
+            return self._slots(account_ids)
+        return self.account_slots[positions]
+
+    def _columns(self, account_ids, transaction_types, amounts, queued_at):
+        slots = self._slots(account_ids)
+        debit = np.array([transaction_type in DEBITS for transaction_type in transaction_types], dtype=bool)
+        return slots, debit, np.array(amounts, dtype=np.float64), _timestamps(queued_at)
+
+    def _learn(self, slots, debit, amounts, times, passed, groups):
+        # Every transaction counts towards velocity; only debits that went through are history
+        self.times.push(slots, times, _ranks(groups))
+        passed = passed & debit
+        self.amounts.push(slots[passed], amounts[passed], _ranks(groups, passed)[passed])
+
+    def _warm(self, storage):
+        """Start the buffers from the most recent completed transactions"""
+        self._reset(storage)
+        try:
+            rows = storage.get_recent_transactions(self.config['warm_rows'])
+            if rows:
+                slots, debit, amounts, times = self._columns(*zip(*rows))
+                self._learn(slots, debit, amounts, times, np.ones(len(slots), dtype=bool), _groups(slots))
+        except Exception as err:
+            # A history the scorer cannot read must not stop the queue workers
+            logger.warning("Risk scoring starts without history: %s", err)
+            self._reset(storage)
+
+    def score(self, transactions):
+        """Check a batch of queued transaction rows (as returned by
+        StorageBackend.list_queued, oldest first).
+
+        Returns an array with the hold reason of each transaction, or ''
+        for the ones that may go ahead.
+        """
+        reasons = np.full(len(transactions), '', dtype=object)
+        if not transactions or not self.config['enabled']:
+            return reasons
+        config = self.config
+        columns = (
+            [t['account_id'] for t in transactions],
+            [t['transaction_type'] for t in transactions],
+            [t['amount'] for t in transactions],
+            [t['added_at'] for t in transactions]
+        )
+
+        with self.lock:
+            storage = get_storage()
+            if storage is not self.storage:
+                self._warm(storage)
+            slots, debit, amounts, times = self._columns(*columns)
+
+            groups = _groups(slots)
+            too_fast = np.zeros(len(slots), dtype=bool)
+            unusual = np.zeros(len(slots), dtype=bool)
+            # Each check only gathers the buffer rows of the debits it could hold
+
+            # Velocity: transactions queued within the window, earlier ones of this batch included
+            rows = np.flatnonzero(debit)
+            recent = (self.times.values[slots[rows]] > (times[rows] - config['velocity_window'])[:, None]).sum(axis=1)
+            too_fast[rows] = recent + _ranks(groups)[rows] >= config['max_velocity']
+
+            # Amount z-score against the account's recent debits
+            count = self.amounts.counts(slots)
+            rows = np.flatnonzero(debit & (amounts >= config['min_amount']) & (count >= config['min_history']))
+            history = self.amounts.values[slots[rows]]
+            n = np.maximum(count[rows], 1)
+            mean = history.sum(axis=1) / n
+            variance = np.maximum(np.einsum('ij,ij->i', history, history) / n - mean * mean, 0.0)
+            # Accounts that always pay the same amount still get some leeway
+            spread = np.maximum(np.sqrt(variance), np.maximum(mean * config['min_spread'], 0.01))
+            unusual[rows] = (amounts[rows] - mean) / spread > config['zscore_threshold']
+
+            # Checks applied in reverse, so the first one that failed gives the reason
+            reasons[unusual] = UNUSUAL_AMOUNT
+            reasons[too_fast] = TOO_FAST
+            self._learn(slots, debit, amounts, times, ~(too_fast | unusual), groups)
+        return reasons
+
+risk_scorer = RiskScorer()
@@ -0,0 +1,83 @@
+# Async service layer
+#
+# Coroutines over the banking managers, for callers that run an asyncio
+# event loop (the GUI through gui.async_bridge). Storage calls block, so
+# each one runs on a small pool of database threads. A semaphore bounds the
+# operations in flight; everything past it waits as a coroutine rather
+# than as a thread, so thousands of pending operations cost no more threads
+# than a handful.
+import asyncio
+import functools
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from config import SERVICE_CONFIG
+from security.authh import AuthSystem
+from .transactions import TransactionManager
+from .transfers import TransferManager
+
+class BankingService:
+    """Async transfer, history, login and enqueue"""
+    def __init__(self, config=None, auth=None):
+        self.config = dict(SERVICE_CONFIG, **(config or {}))
+        self.auth = auth or AuthSystem()
+        self.lock = threading.Lock()
+        self.executor = None
+        # asyncio primitives belong to one event loop, so each loop gets its own semaphore
+        self._semaphores = weakref.WeakKeyDictionary()
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def _executor(self):
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.config['db_threads'],
+                                                   thread_name_prefix="BankingService")
+            return self.executor
+
+    def _semaphore(self, loop):
+        with self.lock:
+            semaphore = self._semaphores.get(loop)
+            if semaphore is None:
+                semaphore = self._semaphores[loop] = asyncio.Semaphore(self.config['max_in_flight'])
+            return semaphore
+
+    async def call(self, function, *args, **kwargs):
+        """Run a blocking banking call on the database threads and return its result"""
+        loop = asyncio.get_running_loop()
+        async with self._semaphore(loop):
+            with self.lock:
+                self.in_flight += 1
+                self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            try:
+                return await loop.run_in_executor(self._executor(), functools.partial(function, *args, **kwargs))
+            finally:
+                with self.lock:
+                    self.in_flight -= 1
+
+    async def transfer(self, source_account, destination_account, amount, description=None, idempotency_key=None):
+        """Transfer funds between accounts. Returns (success, message)"""
+        return await self.call(TransferManager.transfer_funds, source_account, destination_account, amount,
+                               description, idempotency_key)
+
+    async def history(self, account_number, limit=10):
+        """Get the transfer history of an account, newest first"""
+        return await self.call(TransferManager.get_transfer_history, account_number, limit)
+
+    async def login(self, username, password):
+        """Authenticate a user. Returns (success, user data or message)"""
+        return await self.call(self.auth.login, username, password)
+
+    async def enqueue(self, account_id, transaction_type, amount, description=None, related_account=None):
+        """Record a transaction for the queue workers. Returns its transaction_id, or None"""
+        return await self.call(TransactionManager.record_transaction, account_id, transaction_type, amount,
+                               description, related_account)
+
+    def close(self):
+        """Stop the database threads once the calls already submitted have finished"""
+        with self.lock:
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+banking_service = BankingService()
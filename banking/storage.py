@@ -0,0 +1,1754 @@
+# Storage backends
+#
+# The managers (accounts, transfers, transactions, the scheduler and the
+# auth system) talk to a StorageBackend instead of opening connections
+# themselves. SQLiteStorage and MySQLStorage run the registered statements
+# through DatabaseAdapter; MemoryStorage keeps everything in dictionaries
+# so tests and benchmarks run without a database server.
+import itertools
+import json
+import os
+import re
+import socket
+import threading
+from datetime import datetime, timedelta, timezone
+from config import DB_TYPE, STORAGE_BACKEND
+from .db_adapter import DatabaseAdapter
+from .group_commit import get_group_commit_writer
+
+_storage = None
+_storage_lock = threading.Lock()
+
+def utc_timestamp(seconds_ago=0):
+    """Now (or seconds_ago before now) as the database writes CURRENT_TIMESTAMP: UTC, 'YYYY-MM-DD HH:MM:SS'"""
+    moment = datetime.now(timezone.utc) - timedelta(seconds=seconds_ago)
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+def settled_through(after, rows, settled_before):
+    """The id up to which (id, created_at) rows, ascending and all after id `after`,
+    are known complete, and whether the rows stop being complete there.
+
+    A missing id may belong to a transaction that has not committed yet (auto-increment
+    ids are handed out in insert order, not commit order). It is only taken as rolled
+    back once the row after it was created before settled_before ('YYYY-MM-DD HH:MM:SS').
+    """
+    for row_id, created_at in rows:
+        if row_id != after + 1 and str(created_at)[:19] >= settled_before:
+            return after, True
+        after = row_id
+    return after, False
+
+def claim_owner(pid=None):
+    """Name queued transactions are claimed under by this process (or process pid on this host)"""
+    return f"{socket.gethostname()}:{pid or os.getpid()}"
+
+class StorageBackend:
+    """Interface shared by every storage backend.
+
+    Sessions are kept in process memory by default: they only live as long
+    as the application that created them.
+    """
+    def __init__(self):
+        self._sessions = {}
+        self._session_lock = threading.Lock()
+
+    # --- Users ---
+
+    def get_user(self, username):
+        """Get a user (including password hash and salt) by username, or None"""
+        raise NotImplementedError
+
+    def create_user(self, username, password_hash, salt, full_name, email, is_admin=False):
+        """Create a user. Returns (True, user_id) or (False, reason)"""
+        raise NotImplementedError
+
+    def update_password(self, username, password_hash, salt):
+        """Replace a user's password hash and salt"""
+        raise NotImplementedError
+
+    def list_users(self):
+        """List all users with the number of accounts each one holds"""
+        raise NotImplementedError
+
+    # --- Sessions ---
+
+    def save_session(self, session_id, session):
+        """Store (or replace) a session"""
+        with self._session_lock:
+            self._sessions[session_id] = session
+
+    def get_session(self, session_id):
+        """Get a session by id, or None"""
+        with self._session_lock:
+            return self._sessions.get(session_id)
+
+    def delete_session(self, session_id):
+        """Remove a session. Returns True if it existed"""
+        with self._session_lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    # --- Accounts ---
+
+    def create_account(self, user_id, account_number, account_type, balance=0.0):
+        """Create an account and return its account_id"""
+        raise NotImplementedError
+
+    def create_accounts(self, rows):
+        """Create accounts from (user_id, account_number, account_type, balance) rows
+        in one transaction: all of them or, if any fails, none. Returns how many"""
+        raise NotImplementedError
+
+    def reserve_sequence(self, name, count):
+        """Reserve count consecutive values of a named sequence and return the first"""
+        raise NotImplementedError
+
+    def get_accounts(self, user_id):
+        """Get all accounts of a user, newest first"""
+        raise NotImplementedError
+
+    def get_balance(self, account_number):
+        """Get the balance of an account, or None if it does not exist"""
+        raise NotImplementedError
+
+    def adjust_balance(self, account_number, amount_change):
+        """Add amount_change to an account balance. Returns True if the account exists"""
+        raise NotImplementedError
+
+    def link_bank_account(self, user_id, bank_name, account_number, account_holder_name, ifsc_code=None):
+        """Link an external bank account to a user"""
+        raise NotImplementedError
+
+    def verify_bank_account(self, user_id, account_number):
+        """Mark a linked bank account as verified"""
+        raise NotImplementedError
+
+    def get_linked_bank_accounts(self, user_id):
+        """Get the external bank accounts linked to a user, newest first"""
+        raise NotImplementedError
+
+    # --- Transfers ---
+
+    def transfer(self, source_account, destination_account, amount, description=None):
+        """Move money between two accounts atomically. Returns (success, message)"""
+        raise NotImplementedError
+
+    def get_transfer_history(self, account_number, limit=10):
+        """Get the most recent transfers into or out of an account"""
+        raise NotImplementedError
+
+    def ensure_transfer_history(self):
+        """Make sure transfer history can be recorded"""
+
+    # --- Phone directory ---
+
+    def add_directory_entry(self, phone, account_number, display_name):
+        """Register an E.164 phone number for an account. Returns (success, message)"""
+        raise NotImplementedError
+
+    def get_directory_entry(self, phone):
+        """Get the directory entry of an E.164 phone number, or None"""
+        raise NotImplementedError
+
+    def list_directory(self):
+        """Get every directory entry, ordered by phone number"""
+        raise NotImplementedError
+
+    def recent_payees(self, user_id, limit=5):
+        """Get the directory entries a user paid most recently, newest first"""
+        raise NotImplementedError
+
+    # --- Idempotency keys ---
+
+    def reserve_idempotency_key(self, key):
+        """Record a new PENDING key. Returns False if the key already exists"""
+        raise NotImplementedError
+
+    def get_idempotency_key(self, key):
+        """Get a key's status, success, message and created_at, or None"""
+        raise NotImplementedError
+
+    def complete_idempotency_key(self, key, success, message):
+        """Store the result of the request a key was reserved for"""
+        raise NotImplementedError
+
+    def release_idempotency_key(self, key):
+        """Forget a key so the request can be retried"""
+        raise NotImplementedError
+
+    def take_over_idempotency_key(self, key, reserved_before, completed_before):
+        """Reserve a key again if it is PENDING since before reserved_before, or
+        DONE and created before completed_before. Returns whether it was taken"""
+        raise NotImplementedError
+
+    def purge_idempotency_keys(self, before):
+        """Forget keys created before a timestamp. Returns how many were removed"""
+        raise NotImplementedError
+
+    # --- Bank account verification jobs ---
+
+    def create_verification_job(self, user_id, account_number, next_attempt_at):
+        """Persist a PENDING verification job and return its job_id"""
+        raise NotImplementedError
+
+    def update_verification_job(self, job_id, status, attempts, next_attempt_at, last_error=None):
+        """Save the state of a verification job"""
+        raise NotImplementedError
+
+    def get_verification_job(self, job_id):
+        """Get a verification job, or None"""
+        raise NotImplementedError
+
+    def get_verification_jobs(self, user_id):
+        """Get the verification jobs of a user, newest first"""
+        raise NotImplementedError
+
+    def get_unfinished_verification_jobs(self):
+        """Get PENDING and RUNNING jobs, the next one due first"""
+        raise NotImplementedError
+
+    def get_dashboard_summary(self, user_id, transfer_limit=10, since=None):
+        """Get everything the dashboard shows for a user in one call.
+
+        Returns a dict with accounts, linked_banks, recent_transfers (the
+        user's side of each transfer, newest first) and daily_totals (money
+        in and out since the timestamp `since`).
+        """
+        raise NotImplementedError
+
+    # --- Transactions and the processing queue ---
+
+    def record_transaction(self, account_id, transaction_type, amount, description=None, related_account=None):
+        """Record a PENDING transaction, queue it and return its transaction_id"""
+        raise NotImplementedError
+
+    def get_transaction_history(self, account_id, limit=10):
+        """Get the most recent transactions of an account"""
+        raise NotImplementedError
+
+    def list_queued(self, order='FIFO', limit=1):
+        """Get queued transactions in FIFO or PRIORITY order"""
+        raise NotImplementedError
+
+    def list_queued_after(self, queue_id, limit=1000):
+        """Get up to limit queued transactions with a queue_id above queue_id, in queue_id order"""
+        raise NotImplementedError
+
+    def list_queued_partition(self, partitions, partition, limit=1):
+        """Get queued transactions in FIFO order of the accounts with account_id % partitions == partition"""
+        raise NotImplementedError
+
+    def queue_heads(self):
+        """Get the oldest queued transaction of every account with work waiting"""
+        raise NotImplementedError
+
+    def claim_transaction(self, transaction_id):
+        """Move a queued transaction to PROCESSING, claimed by this process
+        (claim_owner) now. Returns False if someone else got it"""
+        raise NotImplementedError
+
+    def claim_transactions(self, transaction_ids):
+        """Move a batch of queued transactions to PROCESSING in one transaction.
+        Returns the set of transaction_ids claimed (not those someone else got)"""
+        raise NotImplementedError
+
+    def release_transactions(self, transaction_ids):
+        """Put claimed transactions that did not run back on the queue"""
+        raise NotImplementedError
+
+    def requeue_claims(self, owner=None, claimed_before=None):
+        """Put PROCESSING transactions back on the queue that were claimed by
+        owner (a worker that died) or before claimed_before (a UTC timestamp).
+        Returns how many"""
+        raise NotImplementedError
+
+    def finish_transaction(self, transaction_id, status):
+        """Set the final status of a transaction and its queue entry"""
+        raise NotImplementedError
+
+    def apply_transaction(self, transaction_id, account_number, amount_change):
+        """Add amount_change to an account and finish the transaction in one
+        transaction: COMPLETED, or FAILED if the account does not exist.
+        Returns the status, or None (and changes nothing) if the claim is no
+        longer this process's because the transaction was queued again"""
+        raise NotImplementedError
+
+    def set_queue_priority(self, transaction_id, priority):
+        """Change the priority of a queued transaction"""
+        raise NotImplementedError
+
+    def recent_queue(self, limit=50):
+        """Get the most recently queued transactions"""
+        raise NotImplementedError
+
+    def get_recent_transactions(self, limit):
+        """Get the COMPLETED transactions among the last limit, oldest first, as
+        (account_id, transaction_type, amount, created_at)"""
+        raise NotImplementedError
+
+    # --- Held transactions (risk review) ---
+
+    def hold_transactions(self, holds):
+        """Put claimed transactions on HELD, with the reason of each ((transaction_id, reason) rows), in one transaction"""
+        raise NotImplementedError
+
+    def list_held(self, limit=50):
+        """Get held transactions, oldest first, as queue rows with their reason and held_at"""
+        raise NotImplementedError
+
+    def claim_held(self, transaction_id, decision):
+        """Move a held transaction to PROCESSING and record the decision
+        (APPROVED or REJECTED). Returns False if it is not held (any more)"""
+        raise NotImplementedError
+
+    # --- Exports ---
+
+    def export_rows(self, table, since=None, until=None, account_number=None, batch_size=1000):
+        """Yield the rows of 'transfer_history', 'transactions' or 'transaction_queue'
+        in lists of up to batch_size, oldest first, without loading them all.
+
+        since (inclusive) and until (exclusive) bound the creation time;
+        account_number keeps rows of that account. None disables a filter.
+        """
+        raise NotImplementedError
+
+    # --- Bulk history imports ---
+
+    def get_account_ids(self):
+        """Map every account number to its account_id"""
+        raise NotImplementedError
+
+    def get_import_checkpoint(self, import_id):
+        """Get the checkpoint of an import (dropped_indexes decoded), or None"""
+        raise NotImplementedError
+
+    def start_import(self, import_id, table, source, dropped_indexes):
+        """Create the checkpoint of a new import"""
+        raise NotImplementedError
+
+    def set_import_indexes(self, import_id, dropped_indexes):
+        """Record the indexes an import has dropped and must rebuild"""
+        raise NotImplementedError
+
+    def load_history_chunk(self, import_id, table, rows, deltas, rows_done, rows_loaded, rows_rejected):
+        """Insert a chunk of imported rows, add its (account_number, delta) balance
+        changes and advance the checkpoint, all in one transaction"""
+        raise NotImplementedError
+
+    def finish_import(self, import_id):
+        """Apply the balance changes of an import and mark it DONE (one transaction).
+        Returns the number of accounts updated"""
+        raise NotImplementedError
+
+    def drop_secondary_indexes(self, table):
+        """Drop the non-unique secondary indexes of a table. Returns [(name, ddl)]"""
+        raise NotImplementedError
+
+    def restore_indexes(self, indexes):
+        """Recreate dropped indexes that do not exist (again)"""
+        raise NotImplementedError
+
+    # --- Reconciliation ---
+
+    def get_last_reconciliation(self):
+        """Get the most recent saved reconciliation run, or None"""
+        raise NotImplementedError
+
+    def reconciliation_scan(self, transfer_after=0, transaction_after=0, batch_size=10000):
+        """Read everything a reconciliation needs from one consistent snapshot.
+
+        Yields ('watermarks', {'transfer_id', 'transaction_id',
+        'settled_transaction_id'}) first, then (kind, rows) with rows in
+        lists of up to batch_size:
+        'accounts': (account_id, account_number, balance, opening_balance,
+        reconciled balance or None), ordered by account_id;
+        'transfers': (transfer_id, account_number, change, created_at) after transfer_after;
+        'transactions': (transaction_id, account_id, change, status,
+        transaction_type, created_at) of every transaction after transaction_after
+        (change is only meaningful for deposits and withdrawals). Both ordered by id.
+        """
+        raise NotImplementedError
+
+    def save_reconciliation(self, run, balances):
+        """Record a run (mode, transfer_watermark, transaction_watermark, accounts,
+        discrepancies) and upsert its (account_id, expected_balance) rows in one
+        transaction. Returns the run_id"""
+        raise NotImplementedError
+
+    # --- Analytics rollups ---
+
+    def get_rollup_watermark(self):
+        """Get the transfer_id up to which transfer_history is rolled up"""
+        raise NotImplementedError
+
+    def get_transfers_after(self, transfer_id, limit):
+        """Get up to limit transfer_history rows after transfer_id, oldest first, as
+        (transfer_id, account_number, counterparty, transaction_type, amount, created_at)
+        where account_number is the side the row belongs to"""
+        raise NotImplementedError
+
+    def apply_rollup(self, after, high_water, aggregates):
+        """Add (account_number, granularity, counterparty, bucket, amount_in, count_in,
+        amount_out, count_out) rows to the rollups and move the watermark from after
+        to high_water, in one transaction. Returns False, changing nothing, if the
+        watermark is no longer at after"""
+        raise NotImplementedError
+
+    def get_top_payees(self, user_id, limit=5):
+        """Get the user's largest payees by all-time amount paid (own accounts
+        excluded) as dicts with counterparty, amount and count"""
+        raise NotImplementedError
+
+    def get_rollup_series(self, user_id, granularity, since):
+        """Get the user's totals per bucket of a granularity from bucket since on,
+        oldest first, as dicts with bucket, amount_in, count_in, amount_out, count_out"""
+        raise NotImplementedError
+
+class SQLStorage(StorageBackend):
+    """Storage on the configured SQL database, through DatabaseAdapter"""
+
+    def _write(self, operation):
+        """Run operation(conn) in one write transaction.
+
+        With group commit on, the writes of many threads share one commit.
+        Bulk writes (account batches, import chunks, rollups) open
+        DatabaseAdapter.writer() themselves instead, so a large batch neither
+        holds up other writes nor is rolled back with them.
+        """
+        writer = get_group_commit_writer()
+        if writer:
+            return writer.execute(operation)
+        with DatabaseAdapter.writer() as conn:
+            return operation(conn)
+
+    def _fetch_all(self, name, params=()):
+        with DatabaseAdapter.reader() as conn:
+            return [dict(row) for row in DatabaseAdapter.fetch_all(conn, name, params)]
+
+    def _fetch_one(self, name, params=()):
+        with DatabaseAdapter.reader() as conn:
+            row = DatabaseAdapter.fetch_one(conn, name, params)
+        return dict(row) if row is not None else None
+
+    def _execute(self, name, params=()):
+        """Run one write statement and return its rowcount"""
+        with DatabaseAdapter.writer() as conn:
+            cursor = DatabaseAdapter.execute(conn, name, params)
+            updated = cursor.rowcount
+            cursor.close()
+        return updated
+
+    # --- Users ---
+
+    def get_user(self, username):
+        return self._fetch_one('users.login', (username,))
+
+    def create_user(self, username, password_hash, salt, full_name, email, is_admin=False):
+        with DatabaseAdapter.writer() as conn:
+            if DatabaseAdapter.fetch_one(conn, 'users.username_exists', (username,)):
+                return False, "Username already exists"
+
+            if DatabaseAdapter.fetch_one(conn, 'users.email_exists', (email,)):
+                return False, "Email already registered"
+
+            cursor = DatabaseAdapter.execute(conn, 'users.create', (
+                username, password_hash, salt, full_name, email, 1 if is_admin else 0
+            ))
+            user_id = cursor.lastrowid
+            cursor.close()
+
+        return True, user_id
+
+    def update_password(self, username, password_hash, salt):
+        return self._execute('users.update_password', (password_hash, salt, username)) > 0
+
+    def list_users(self):
+        return self._fetch_all('users.list_with_account_counts')
+
+    # --- Accounts ---
+
+    def create_account(self, user_id, account_number, account_type, balance=0.0):
+        with DatabaseAdapter.writer() as conn:
+            cursor = DatabaseAdapter.execute(conn, 'accounts.create',
+                                             (user_id, account_number, account_type, balance, balance))
+            account_id = cursor.lastrowid
+            cursor.close()
+        return account_id
+
+    def create_accounts(self, rows):
+        with DatabaseAdapter.writer() as conn:
+            return DatabaseAdapter.execute_many(conn, 'accounts.create', [tuple(row) + (row[3],) for row in rows])
+
+    def reserve_sequence(self, name, count):
+        with DatabaseAdapter.writer() as conn:
+            DatabaseAdapter.execute(conn, 'sequences.ensure', (name,)).close()
+            # The UPDATE locks the row until commit, so concurrent reservations never overlap
+            DatabaseAdapter.execute(conn, 'sequences.advance', (count, name)).close()
+            row = DatabaseAdapter.fetch_one(conn, 'sequences.get', (name,))
+        return row['next_value'] - count
+
+    def get_accounts(self, user_id):
+        return self._fetch_all('accounts.by_user', (user_id,))
+
+    def get_balance(self, account_number):
+        row = self._fetch_one('accounts.balance', (account_number,))
+        return row['balance'] if row else None
+
+    def adjust_balance(self, account_number, amount_change):
+        return self._execute('accounts.update_balance', (amount_change, account_number)) > 0
+
+    def link_bank_account(self, user_id, bank_name, account_number, account_holder_name, ifsc_code=None):
+        with DatabaseAdapter.writer() as conn:
+            cursor = DatabaseAdapter.execute(conn, 'linked_banks.create',
+                                             (user_id, bank_name, account_number, account_holder_name, ifsc_code))
+            link_id = cursor.lastrowid
+            cursor.close()
+        return link_id
+
+    def verify_bank_account(self, user_id, account_number):
+        return self._execute('linked_banks.verify', (user_id, account_number)) > 0
+
+    def get_linked_bank_accounts(self, user_id):
+        return [dict(row) for row in self._fetch_all('linked_banks.by_user', (user_id,))]
+
+    # --- Transfers ---
+
+    def transfer(self, source_account, destination_account, amount, description=None):
+        # The debit, the credit and both history rows are one transaction
+        return self._write(
+            lambda conn: self._apply_transfer(conn, source_account, destination_account, amount, description)
+        )
+
+    def _apply_transfer(self, conn, source_account, destination_account, amount, description):
+        """Perform a transfer on an open connection (no commit).
+
+        The caller owns the surrounding transaction. Raises if the transfer
+        fails half way so the caller can roll it back.
+        """
+        if DatabaseAdapter.fetch_one(conn, 'accounts.balance', (source_account,)) is None:
+            return False, "Source account not found"
+
+        if DatabaseAdapter.fetch_one(conn, 'accounts.balance', (destination_account,)) is None:
+            return False, "Destination account not found"
+
+        # The funds check is part of the debit, so it holds across connections and processes
+        cursor = DatabaseAdapter.execute(conn, 'accounts.debit', (amount, source_account, amount))
+        debited = cursor.rowcount
+        cursor.close()
+        if debited <= 0:
+            return False, "Insufficient funds in source account"
+
+        cursor = DatabaseAdapter.execute(conn, 'accounts.update_balance', (amount, destination_account))
+        updated = cursor.rowcount
+        cursor.close()
+        if updated <= 0:
+            raise RuntimeError("Failed to update destination account")
+
+        # Record debit from source account and credit to destination account
+        for transaction_type in ('OUTGOING', 'INCOMING'):
+            DatabaseAdapter.execute(conn, 'transfers.record', (
+                source_account, destination_account, amount, description, transaction_type
+            )).close()
+
+        return True, "Transfer completed successfully"
+
+    def get_transfer_history(self, account_number, limit=10):
+        return self._fetch_all('transfers.history', (account_number, account_number, limit))
+
+    def ensure_transfer_history(self):
+        self._execute('transfers.create_table')
+
+    def add_directory_entry(self, phone, account_number, display_name):
+        with DatabaseAdapter.writer() as conn:
+            if DatabaseAdapter.fetch_one(conn, 'accounts.balance', (account_number,)) is None:
+                return False, "Account not found"
+
+            if DatabaseAdapter.fetch_one(conn, 'directory.by_phone', (phone,)):
+                return False, "Phone number already registered"
+
+            DatabaseAdapter.execute(conn, 'directory.create', (phone, account_number, display_name)).close()
+        return True, "Phone number registered successfully"
+
+    def get_directory_entry(self, phone):
+        return self._fetch_one('directory.by_phone', (phone,))
+
+    def list_directory(self):
+        return self._fetch_all('directory.all')
+
+    def recent_payees(self, user_id, limit=5):
+        return self._fetch_all('directory.recent_payees', (user_id, limit))
+
+    def reserve_idempotency_key(self, key):
+        return self._execute('idempotency.reserve', (key,)) > 0
+
+    def get_idempotency_key(self, key):
+        return self._fetch_one('idempotency.get', (key,))
+
+    def complete_idempotency_key(self, key, success, message):
+        self._execute('idempotency.complete', (1 if success else 0, message, key))
+
+    def release_idempotency_key(self, key):
+        self._execute('idempotency.release', (key,))
+
+    def take_over_idempotency_key(self, key, reserved_before, completed_before):
+        return self._execute('idempotency.take_over', (key, reserved_before, completed_before)) > 0
+
+    def purge_idempotency_keys(self, before):
+        return self._execute('idempotency.purge', (before,))
+
+    def create_verification_job(self, user_id, account_number, next_attempt_at):
+        with DatabaseAdapter.writer() as conn:
+            cursor = DatabaseAdapter.execute(conn, 'verification.create',
+                                             (user_id, account_number, next_attempt_at))
+            job_id = cursor.lastrowid
+            cursor.close()
+        return job_id
+
+    def update_verification_job(self, job_id, status, attempts, next_attempt_at, last_error=None):
+        self._execute('verification.update', (status, attempts, next_attempt_at, last_error, job_id))
+
+    def get_verification_job(self, job_id):
+        return self._fetch_one('verification.get', (job_id,))
+
+    def get_verification_jobs(self, user_id):
+        return self._fetch_all('verification.by_user', (user_id,))
+
+    def get_unfinished_verification_jobs(self):
+        return self._fetch_all('verification.unfinished')
+
+    def get_dashboard_summary(self, user_id, transfer_limit=10, since=None):
+        since = since or '1970-01-01 00:00:00'
+
+        # One pooled connection for the whole summary
+        with DatabaseAdapter.reader() as conn:
+            accounts = DatabaseAdapter.fetch_all(conn, 'accounts.by_user', (user_id,))
+            linked_banks = DatabaseAdapter.fetch_all(conn, 'linked_banks.by_user', (user_id,))
+            transfers = DatabaseAdapter.fetch_all(conn, 'transfers.recent_for_user',
+                                                  (user_id, user_id, transfer_limit))
+            totals = DatabaseAdapter.fetch_all(conn, 'transfers.totals_for_user',
+                                               (since, user_id, user_id))
+
+        totals = {row['transaction_type']: row['total'] or 0.0 for row in totals}
+        return {
+            'accounts': [dict(row) for row in accounts],
+            'linked_banks': [dict(row) for row in linked_banks],
+            'recent_transfers': [dict(row) for row in transfers],
+            'daily_totals': {
+                'incoming': totals.get('INCOMING', 0.0),
+                'outgoing': totals.get('OUTGOING', 0.0)
+            }
+        }
+
+    # --- Transactions and the processing queue ---
+
+    def record_transaction(self, account_id, transaction_type, amount, description=None, related_account=None):
+        # Transaction row and queue entry share one commit
+        return self._write(
+            lambda conn: self._insert_transaction(conn, account_id, transaction_type, amount,
+                                                  description, related_account)
+        )
+
+    def _insert_transaction(self, conn, account_id, transaction_type, amount, description, related_account):
+        """Insert a transaction and its queue entry on an open connection (no commit)"""
+        cursor = DatabaseAdapter.execute(conn, 'transactions.create', (
+            account_id, transaction_type.upper(), amount, description, related_account
+        ))
+        transaction_id = cursor.lastrowid
+        cursor.close()
+
+        # Add to transaction queue for processing
+        DatabaseAdapter.execute(conn, 'queue.enqueue', (transaction_id,)).close()
+
+        return transaction_id
+
+    def get_transaction_history(self, account_id, limit=10):
+        return self._fetch_all('transactions.history', (account_id, limit))
+
+    def list_queued(self, order='FIFO', limit=1):
+        name = 'queue.next_priority' if order == 'PRIORITY' else 'queue.next_fifo'
+        return self._fetch_all(name, (limit,))
+
+    def list_queued_after(self, queue_id, limit=1000):
+        return self._fetch_all('queue.next_after', (queue_id, limit))
+
+    def list_queued_partition(self, partitions, partition, limit=1):
+        return self._fetch_all('queue.next_partition', (partitions, partition, limit))
+
+    def queue_heads(self):
+        return self._fetch_all('queue.heads')
+
+    def claim_transaction(self, transaction_id):
+        return self._execute('queue.claim', (claim_owner(), transaction_id)) > 0
+
+    def claim_transactions(self, transaction_ids):
+        ids = json.dumps([int(transaction_id) for transaction_id in transaction_ids])
+
+        def claim(conn):
+            claimed = {row['transaction_id'] for row in DatabaseAdapter.fetch_all(conn, 'queue.claimable', (ids,))}
+            if claimed:
+                DatabaseAdapter.execute(conn, 'queue.claim_batch', (claim_owner(), ids)).close()
+            return claimed
+
+        return self._write(claim)
+
+    def release_transactions(self, transaction_ids):
+        if not transaction_ids:
+            return
+        with DatabaseAdapter.writer() as conn:
+            DatabaseAdapter.execute_many(conn, 'queue.release', [(transaction_id,) for transaction_id in transaction_ids])
+
+    def requeue_claims(self, owner=None, claimed_before=None):
+        requeued = 0
+        with DatabaseAdapter.writer() as conn:
+            for name, param in (('queue.requeue_owner', owner), ('queue.requeue_stale', claimed_before)):
+                if param is not None:
+                    cursor = DatabaseAdapter.execute(conn, name, (param,))
+                    requeued += cursor.rowcount
+                    cursor.close()
+        return requeued
+
+    def finish_transaction(self, transaction_id, status):
+        with DatabaseAdapter.writer() as conn:
+            DatabaseAdapter.execute(conn, 'transactions.set_status', (status, transaction_id)).close()
+            DatabaseAdapter.execute(conn, 'queue.set_status', (status, transaction_id)).close()
+
+    def apply_transaction(self, transaction_id, account_number, amount_change):
+        def apply(conn):
+            cursor = DatabaseAdapter.execute(conn, 'queue.finish_claimed', ('COMPLETED', transaction_id, claim_owner()))
+            claimed = cursor.rowcount > 0
+            cursor.close()
+            if not claimed:
+                return None
+
+            cursor = DatabaseAdapter.execute(conn, 'accounts.update_balance', (amount_change, account_number))
+            status = 'COMPLETED' if cursor.rowcount > 0 else 'FAILED'
+            cursor.close()
+            if status == 'FAILED':
+                DatabaseAdapter.execute(conn, 'queue.set_status', (status, transaction_id)).close()
+            DatabaseAdapter.execute(conn, 'transactions.set_status', (status, transaction_id)).close()
+            return status
+
+        return self._write(apply)
+
+    def set_queue_priority(self, transaction_id, priority):
+        return self._execute('queue.set_priority', (priority, transaction_id)) > 0
+
+    def recent_queue(self, limit=50):
+        return self._fetch_all('queue.recent', (limit,))
+
+    def get_recent_transactions(self, limit):
+        with DatabaseAdapter.reader() as conn:
+            return [tuple(row) if DB_TYPE == 'sqlite' else tuple(row.values())
+                    for row in DatabaseAdapter.fetch_all(conn, 'transactions.recent_completed', (limit,))]
+
+    # --- Held transactions (risk review) ---
+
+    def hold_transactions(self, holds):
+        holds = list(holds)
+        with DatabaseAdapter.writer() as conn:
+            DatabaseAdapter.execute_many(conn, 'holds.create', holds)
+            statuses = [('HELD', transaction_id) for transaction_id, _ in holds]
+            DatabaseAdapter.execute_many(conn, 'transactions.set_status', statuses)
+            DatabaseAdapter.execute_many(conn, 'queue.set_status', statuses)
+
+    def list_held(self, limit=50):
+        return self._fetch_all('holds.list', (limit,))
+
+    def claim_held(self, transaction_id, decision):
+        with DatabaseAdapter.writer() as conn:
+            cursor = DatabaseAdapter.execute(conn, 'holds.claim', (transaction_id,))
+            claimed = cursor.rowcount > 0
+            cursor.close()
+            if claimed:
+                DatabaseAdapter.execute(conn, 'holds.review', (decision, transaction_id)).close()
+        return claimed
+
+    def export_rows(self, table, since=None, until=None, account_number=None, batch_size=1000):
+        params = (since, since, until, until, account_number, account_number)
+        with DatabaseAdapter.reader() as conn:
+            yield from DatabaseAdapter.stream(conn, f'export.{table}', params, batch_size)
+
+    def get_account_ids(self):
+        with DatabaseAdapter.reader() as conn:
+            return {
+                row['account_number']: row['account_id']
+                for batch in DatabaseAdapter.stream(conn, 'accounts.ids', batch_size=10000) for row in batch
+            }
+
+    def get_import_checkpoint(self, import_id):
+        checkpoint = self._fetch_one('import.checkpoint', (import_id,))
+        if checkpoint:
+            checkpoint['dropped_indexes'] = json.loads(checkpoint['dropped_indexes'] or '[]')
+        return checkpoint
+
+    def start_import(self, import_id, table, source, dropped_indexes):
+        self._execute('import.start', (import_id, table, source, json.dumps(dropped_indexes)))
+
+    def set_import_indexes(self, import_id, dropped_indexes):
+        self._execute('import.dropped_indexes', (json.dumps(dropped_indexes), import_id))
+
+    def load_history_chunk(self, import_id, table, rows, deltas, rows_done, rows_loaded, rows_rejected):
+        name = 'import.transaction' if table == 'transactions' else 'import.transfer'
+        with DatabaseAdapter.writer() as conn:
+            if rows:
+                DatabaseAdapter.execute_many(conn, name, rows)
+            if deltas:
+                DatabaseAdapter.execute_many(conn, 'import.add_delta',
+                                             [(import_id, account_number, delta) for account_number, delta in deltas])
+            DatabaseAdapter.execute(conn, 'import.progress',
+                                    (rows_done, rows_loaded, rows_rejected, import_id)).close()
+
+    def finish_import(self, import_id):
+        with DatabaseAdapter.writer() as conn:
+            cursor = DatabaseAdapter.execute(conn, 'import.apply_deltas', (import_id, import_id))
+            updated = cursor.rowcount
+            cursor.close()
+            DatabaseAdapter.execute(conn, 'import.clear_deltas', (import_id,)).close()
+            DatabaseAdapter.execute(conn, 'import.done', (import_id,)).close()
+        return updated
+
+    def drop_secondary_indexes(self, table):
+        indexes = [(row['name'], row['ddl']) for row in self._fetch_all('schema.secondary_indexes', (table,))]
+        with DatabaseAdapter.writer() as conn:
+            cursor = conn.cursor()
+            try:
+                for name, _ in indexes:
+                    # Names come from the catalog, but they are identifiers and cannot be bound
+                    if not re.fullmatch(r'\w+', name):
+                        raise ValueError(f"Unexpected index name {name!r}")
+                    cursor.execute(f"DROP INDEX {name}" if DB_TYPE == 'sqlite' else f"DROP INDEX {name} ON {table}")
+            finally:
+                cursor.close()
+        return indexes
+
+    def restore_indexes(self, indexes):
+        with DatabaseAdapter.writer() as conn:
+            cursor = conn.cursor()
+            try:
+                for name, ddl in indexes:
+                    table = re.search(r'\bON\s+(\w+)', ddl, re.IGNORECASE).group(1)
+                    existing = {row['name'] for row in DatabaseAdapter.fetch_all(conn, 'schema.secondary_indexes', (table,))}
+                    if name not in existing:
+                        cursor.execute(ddl)
+            finally:
+                cursor.close()
+
+    def get_last_reconciliation(self):
+        return self._fetch_one('reconcile.last_run')
+
+    def reconciliation_scan(self, transfer_after=0, transaction_after=0, batch_size=10000):
+        with DatabaseAdapter.snapshot() as conn:
+            watermarks = dict(DatabaseAdapter.fetch_one(conn, 'reconcile.watermarks'))
+            yield 'watermarks', watermarks
+            # Each stream is drained before the next one starts on the same connection
+            for kind, params in (
+                ('accounts', ()),
+                ('transfers', (transfer_after, watermarks['transfer_id'])),
+                ('transactions', (transaction_after, watermarks['transaction_id']))
+            ):
+                for batch in DatabaseAdapter.stream(conn, f'reconcile.{kind}', params, batch_size, raw=True):
+                    yield kind, batch
+
+    def save_reconciliation(self, run, balances):
+        with DatabaseAdapter.writer() as conn:
+            if balances:
+                DatabaseAdapter.execute_many(conn, 'reconcile.save_balance', balances)
+            cursor = DatabaseAdapter.execute(conn, 'reconcile.record_run', (
+                run['mode'], run['transfer_watermark'], run['transaction_watermark'],
+                run['accounts'], run['discrepancies']
+            ))
+            run_id = cursor.lastrowid
+            cursor.close()
+        return run_id
+
+    def get_rollup_watermark(self):
+        return self._fetch_one('analytics.watermark', ('transfer_history',))['high_water']
+
+    def get_transfers_after(self, transfer_id, limit):
+        with DatabaseAdapter.reader() as conn:
+            return [tuple(row) if DB_TYPE == 'sqlite' else tuple(row.values())
+                    for row in DatabaseAdapter.fetch_all(conn, 'analytics.transfers_after', (transfer_id, limit))]
+
+    def apply_rollup(self, after, high_water, aggregates):
+        with DatabaseAdapter.writer() as conn:
+            cursor = DatabaseAdapter.execute(conn, 'analytics.advance', (high_water, 'transfer_history', after))
+            advanced = cursor.rowcount > 0
+            cursor.close()
+            if advanced and aggregates:
+                DatabaseAdapter.execute_many(conn, 'analytics.add', aggregates)
+        return advanced
+
+    def get_top_payees(self, user_id, limit=5):
+        return self._fetch_all('analytics.top_payees', (user_id, user_id, limit))
+
+    def get_rollup_series(self, user_id, granularity, since):
+        return self._fetch_all('analytics.series', (user_id, granularity, since))
+
+class SQLiteStorage(SQLStorage):
+    """SQLite storage. Writes are serialized on the adapter's writer connection"""
+
+class MySQLStorage(SQLStorage):
+    """MySQL storage. Every write opens its own connection; transfers check
+    the funds in the debit itself, so they are safe across processes"""
+
+class MemoryStorage(StorageBackend):
+    """In-process storage for tests and benchmarks (nothing is persisted)"""
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.RLock()
+        self._ids = {}
+
+        self._users = {}
+        self._users_by_name = {}
+        self._emails = set()
+        self._accounts = {}
+        self._accounts_by_number = {}
+        self._sequences = {}
+        self._linked_banks = {}
+        self._transfers = []
+        self._directory = {}
+        self._idempotency_keys = {}
+        self._verification_jobs = {}
+        self._imports = {}
+        self._import_deltas = {}
+        self._reconciled = {}
+        self._reconciliation_runs = []
+        self._rollups = {}
+        self._rollup_watermark = 0
+        self._transactions = {}
+        self._queue = {}
+        self._queue_by_transaction = {}
+        self._queued = {}  # Queue entries still QUEUED, in insertion (FIFO) order
+        self._holds = {}
+
+    def _next_id(self, table):
+        counter = self._ids.get(table)
+        if counter is None:
+            counter = self._ids[table] = itertools.count(1)
+        return next(counter)
+
+    @staticmethod
+    def _newest_first(rows, id_field, limit=None):
+        rows = sorted(rows, key=lambda row: (row['created_at'], row[id_field]), reverse=True)
+        return [dict(row) for row in (rows[:limit] if limit is not None else rows)]
+
+    # --- Users ---
+
+    def get_user(self, username):
+        with self._lock:
+            user = self._users_by_name.get(username)
+            return dict(user) if user else None
+
+    def create_user(self, username, password_hash, salt, full_name, email, is_admin=False):
+        with self._lock:
+            if username in self._users_by_name:
+                return False, "Username already exists"
+            if email in self._emails:
+                return False, "Email already registered"
+
+            user_id = self._next_id('users')
+            user = {
+                'user_id': user_id,
+                'username': username,
+                'password_hash': password_hash,
+                'salt': salt,
+                'full_name': full_name,
+                'email': email,
+                'is_admin': 1 if is_admin else 0,
+                'created_at': utc_timestamp()
+            }
+            self._users[user_id] = user
+            self._users_by_name[username] = user
+            self._emails.add(email)
+            return True, user_id
+
+    def update_password(self, username, password_hash, salt):
+        with self._lock:
+            user = self._users_by_name.get(username)
+            if not user:
+                return False
+            user['password_hash'] = password_hash
+            user['salt'] = salt
+            return True
+
+    def list_users(self):
+        with self._lock:
+            counts = {}
+            for account in self._accounts.values():
+                counts[account['user_id']] = counts.get(account['user_id'], 0) + 1
+            return [
+                {
+                    'user_id': user['user_id'],
+                    'username': user['username'],
+                    'full_name': user['full_name'],
+                    'email': user['email'],
+                    'account_count': counts.get(user['user_id'], 0)
+                }
+                for user in sorted(self._users.values(), key=lambda u: u['user_id'])
+            ]
+
+    # --- Accounts ---
+
+    def create_account(self, user_id, account_number, account_type, balance=0.0):
+        with self._lock:
+            if account_number in self._accounts_by_number:
+                raise ValueError(f"Account number {account_number} already exists")
+            account_id = self._next_id('accounts')
+            account = {
+                'account_id': account_id,
+                'user_id': user_id,
+                'account_number': account_number,
+                'account_type': account_type,
+                'balance': float(balance),
+                'opening_balance': float(balance),
+                'created_at': utc_timestamp()
+            }
+            self._accounts[account_id] = account
+            self._accounts_by_number[account_number] = account
+            return account_id
+
+    def create_accounts(self, rows):
+        rows = list(rows)
+        with self._lock:
+            numbers = set()
+            for row in rows:
+                account_number = row[1]
+                if account_number in self._accounts_by_number or account_number in numbers:
+                    raise ValueError(f"Account number {account_number} already exists")
+                numbers.add(account_number)
+            for user_id, account_number, account_type, balance in rows:
+                self.create_account(user_id, account_number, account_type, balance)
+            return len(rows)
+
+    def reserve_sequence(self, name, count):
+        with self._lock:
+            first = self._sequences.get(name, 0)
+            self._sequences[name] = first + count
+            return first
+
+    def get_accounts(self, user_id):
+        with self._lock:
+            return self._newest_first(
+                [a for a in self._accounts.values() if a['user_id'] == user_id], 'account_id'
+            )
+
+    def get_balance(self, account_number):
+        with self._lock:
+            account = self._accounts_by_number.get(account_number)
+            return account['balance'] if account else None
+
+    def adjust_balance(self, account_number, amount_change):
+        with self._lock:
+            account = self._accounts_by_number.get(account_number)
+            if not account:
+                return False
+            account['balance'] += amount_change
+            return True
+
+    def link_bank_account(self, user_id, bank_name, account_number, account_holder_name, ifsc_code=None):
+        with self._lock:
+            if (user_id, account_number) in self._linked_banks:
+                raise ValueError("Bank account is already linked")
+            link_id = self._next_id('linked_bank_accounts')
+            self._linked_banks[(user_id, account_number)] = {
+                'link_id': link_id,
+                'user_id': user_id,
+                'bank_name': bank_name,
+                'account_number': account_number,
+                'account_holder_name': account_holder_name,
+                'ifsc_code': ifsc_code,
+                'is_verified': 0,
+                'created_at': utc_timestamp()
+            }
+            return link_id
+
+    def verify_bank_account(self, user_id, account_number):
+        with self._lock:
+            link = self._linked_banks.get((user_id, account_number))
+            if not link:
+                return False
+            link['is_verified'] = 1
+            return True
+
+    def get_linked_bank_accounts(self, user_id):
+        with self._lock:
+            return self._newest_first(
+                [l for l in self._linked_banks.values() if l['user_id'] == user_id], 'link_id'
+            )
+
+    # --- Transfers ---
+
+    def transfer(self, source_account, destination_account, amount, description=None):
+        with self._lock:
+            source = self._accounts_by_number.get(source_account)
+            if source is None:
+                return False, "Source account not found"
+
+            destination = self._accounts_by_number.get(destination_account)
+            if destination is None:
+                return False, "Destination account not found"
+
+            if source['balance'] < amount:
+                return False, "Insufficient funds in source account"
+
+            source['balance'] -= amount
+            destination['balance'] += amount
+
+            created_at = utc_timestamp()
+            for transaction_type in ('OUTGOING', 'INCOMING'):
+                self._transfers.append({
+                    'transfer_id': self._next_id('transfer_history'),
+                    'source_account': source_account,
+                    'destination_account': destination_account,
+                    'amount': amount,
+                    'description': description,
+                    'transaction_type': transaction_type,
+                    'created_at': created_at
+                })
+
+            return True, "Transfer completed successfully"
+
+    def get_transfer_history(self, account_number, limit=10):
+        with self._lock:
+            return self._newest_first(
+                [t for t in self._transfers
+                 if account_number in (t['source_account'], t['destination_account'])],
+                'transfer_id', limit
+            )
+
+    def add_directory_entry(self, phone, account_number, display_name):
+        with self._lock:
+            if account_number not in self._accounts_by_number:
+                return False, "Account not found"
+
+            if phone in self._directory:
+                return False, "Phone number already registered"
+
+            self._directory[phone] = {
+                'phone': phone,
+                'account_number': account_number,
+                'display_name': display_name
+            }
+        return True, "Phone number registered successfully"
+
+    def get_directory_entry(self, phone):
+        with self._lock:
+            entry = self._directory.get(phone)
+            return dict(entry) if entry else None
+
+    def list_directory(self):
+        with self._lock:
+            return [dict(self._directory[phone]) for phone in sorted(self._directory)]
+
+    def recent_payees(self, user_id, limit=5):
+        with self._lock:
+            owned = {a['account_number'] for a in self._accounts.values() if a['user_id'] == user_id}
+            by_account = {}
+            for entry in self._directory.values():
+                by_account.setdefault(entry['account_number'], []).append(entry)
+
+            payees = {}
+            for transfer in reversed(self._transfers):
+                if transfer['transaction_type'] != 'OUTGOING' or transfer['source_account'] not in owned:
+                    continue
+                for entry in by_account.get(transfer['destination_account'], ()):
+                    if entry['phone'] not in payees:
+                        payees[entry['phone']] = dict(entry, last_paid=transfer['created_at'],
+                                                      last_transfer_id=transfer['transfer_id'])
+            return list(payees.values())[:limit]
+
+    def reserve_idempotency_key(self, key):
+        with self._lock:
+            if key in self._idempotency_keys:
+                return False
+            self._idempotency_keys[key] = {
+                'idem_key': key,
+                'status': 'PENDING',
+                'success': None,
+                'message': None,
+                'created_at': utc_timestamp()
+            }
+            return True
+
+    def get_idempotency_key(self, key):
+        with self._lock:
+            row = self._idempotency_keys.get(key)
+            return dict(row) if row else None
+
+    def complete_idempotency_key(self, key, success, message):
+        with self._lock:
+            row = self._idempotency_keys.get(key)
+            if row:
+                row.update(status='DONE', success=1 if success else 0, message=message)
+
+    def release_idempotency_key(self, key):
+        with self._lock:
+            self._idempotency_keys.pop(key, None)
+
+    def take_over_idempotency_key(self, key, reserved_before, completed_before):
+        with self._lock:
+            row = self._idempotency_keys.get(key)
+            if not row or row['created_at'] >= (reserved_before if row['status'] == 'PENDING' else completed_before):
+                return False
+            row.update(status='PENDING', success=None, message=None, created_at=utc_timestamp())
+            return True
+
+    def purge_idempotency_keys(self, before):
+        with self._lock:
+            expired = [key for key, row in self._idempotency_keys.items() if row['created_at'] < before]
+            for key in expired:
+                del self._idempotency_keys[key]
+            return len(expired)
+
+    def create_verification_job(self, user_id, account_number, next_attempt_at):
+        with self._lock:
+            job_id = self._next_id('verification_jobs')
+            now = utc_timestamp()
+            self._verification_jobs[job_id] = {
+                'job_id': job_id,
+                'user_id': user_id,
+                'account_number': account_number,
+                'status': 'PENDING',
+                'attempts': 0,
+                'next_attempt_at': next_attempt_at,
+                'last_error': None,
+                'created_at': now,
+                'updated_at': now
+            }
+            return job_id
+
+    def update_verification_job(self, job_id, status, attempts, next_attempt_at, last_error=None):
+        with self._lock:
+            job = self._verification_jobs.get(job_id)
+            if job:
+                job.update(status=status, attempts=attempts, next_attempt_at=next_attempt_at,
+                           last_error=last_error, updated_at=utc_timestamp())
+
+    def get_verification_job(self, job_id):
+        with self._lock:
+            job = self._verification_jobs.get(job_id)
+            return dict(job) if job else None
+
+    def get_verification_jobs(self, user_id):
+        with self._lock:
+            jobs = [job for job in self._verification_jobs.values() if job['user_id'] == user_id]
+            return [dict(job) for job in sorted(jobs, key=lambda job: job['job_id'], reverse=True)]
+
+    def get_unfinished_verification_jobs(self):
+        with self._lock:
+            jobs = [job for job in self._verification_jobs.values() if job['status'] in ('PENDING', 'RUNNING')]
+            return [dict(job) for job in sorted(jobs, key=lambda job: (job['next_attempt_at'], job['job_id']))]
+
+    def get_dashboard_summary(self, user_id, transfer_limit=10, since=None):
+        with self._lock:
+            owned = {a['account_number'] for a in self._accounts.values() if a['user_id'] == user_id}
+            mine = [
+                t for t in self._transfers
+                if (t['transaction_type'] == 'OUTGOING' and t['source_account'] in owned)
+                or (t['transaction_type'] == 'INCOMING' and t['destination_account'] in owned)
+            ]
+            today = [t for t in mine if since is None or t['created_at'] >= since]
+            return {
+                'accounts': self.get_accounts(user_id),
+                'linked_banks': self.get_linked_bank_accounts(user_id),
+                'recent_transfers': self._newest_first(mine, 'transfer_id', transfer_limit),
+                'daily_totals': {
+                    'incoming': sum(t['amount'] for t in today if t['transaction_type'] == 'INCOMING'),
+                    'outgoing': sum(t['amount'] for t in today if t['transaction_type'] == 'OUTGOING')
+                }
+            }
+
+    # --- Transactions and the processing queue ---
+
+    def record_transaction(self, account_id, transaction_type, amount, description=None, related_account=None):
+        with self._lock:
+            created_at = utc_timestamp()
+            transaction_id = self._next_id('transactions')
+            self._transactions[transaction_id] = {
+                'transaction_id': transaction_id,
+                'account_id': account_id,
+                'transaction_type': transaction_type.upper(),
+                'amount': amount,
+                'description': description,
+                'related_account': related_account,
+                'status': 'PENDING',
+                'created_at': created_at
+            }
+
+            queue_id = self._next_id('transaction_queue')
+            entry = {
+                'queue_id': queue_id,
+                'transaction_id': transaction_id,
+                'priority': 5,
+                'status': 'QUEUED',
+                'added_at': created_at
+            }
+            self._queue[queue_id] = entry
+            self._queue_by_transaction[transaction_id] = entry
+            self._queued[queue_id] = entry
+            return transaction_id
+
+    def get_transaction_history(self, account_id, limit=10):
+        with self._lock:
+            return [
+                {key: t[key] for key in ('transaction_id', 'transaction_type', 'amount', 'description',
+                                         'related_account', 'status', 'created_at')}
+                for t in self._newest_first(
+                    [t for t in self._transactions.values() if t['account_id'] == account_id],
+                    'transaction_id', limit
+                )
+            ]
+
+    def _queued_row(self, entry):
+        transaction = self._transactions[entry['transaction_id']]
+        account = self._accounts.get(transaction['account_id'])
+        return {
+            'queue_id': entry['queue_id'],
+            'transaction_id': transaction['transaction_id'],
+            'account_id': transaction['account_id'],
+            'transaction_type': transaction['transaction_type'],
+            'amount': transaction['amount'],
+            'related_account': transaction['related_account'],
+            'account_number': account['account_number'] if account else None,
+            'account_type': account['account_type'] if account else None,
+            'priority': entry['priority'],
+            'added_at': entry['added_at']
+        }
+
+    def list_queued(self, order='FIFO', limit=1):
+        with self._lock:
+            if order == 'PRIORITY':
+                entries = sorted(self._queued.values(), key=lambda e: (-e['priority'], e['queue_id']))
+            else:
+                entries = self._queued.values()
+            return [self._queued_row(e) for e in itertools.islice(entries, limit)]
+
+    def list_queued_after(self, queue_id, limit=1000):
+        with self._lock:
+            entries = (e for e in self._queued.values() if e['queue_id'] > queue_id)
+            return [self._queued_row(e) for e in itertools.islice(entries, limit)]
+
+    def list_queued_partition(self, partitions, partition, limit=1):
+        with self._lock:
+            entries = (e for e in self._queued.values()
+                       if self._transactions[e['transaction_id']]['account_id'] % partitions == partition)
+            return [self._queued_row(e) for e in itertools.islice(entries, limit)]
+
+    def queue_heads(self):
+        with self._lock:
+            heads = {}
+            for entry in self._queued.values():
+                account_id = self._transactions[entry['transaction_id']]['account_id']
+                if account_id not in heads:
+                    heads[account_id] = entry
+            return [self._queued_row(e) for e in heads.values()]
+
+    def claim_transaction(self, transaction_id):
+        with self._lock:
+            entry = self._queue_by_transaction.get(transaction_id)
+            if not entry or entry['status'] != 'QUEUED':
+                return False
+            entry.update(status='PROCESSING', claimed_by=claim_owner(), claimed_at=utc_timestamp())
+            del self._queued[entry['queue_id']]
+            return True
+
+    def claim_transactions(self, transaction_ids):
+        with self._lock:
+            return {transaction_id for transaction_id in transaction_ids if self.claim_transaction(transaction_id)}
+
+    def release_transactions(self, transaction_ids):
+        with self._lock:
+            for transaction_id in transaction_ids:
+                entry = self._queue_by_transaction.get(transaction_id)
+                if entry and entry['status'] == 'PROCESSING':
+                    self._requeue(entry)
+            # Back in its place in FIFO order
+            self._queued = dict(sorted(self._queued.items()))
+
+    def requeue_claims(self, owner=None, claimed_before=None):
+        with self._lock:
+            stale = [
+                entry for entry in self._queue_by_transaction.values()
+                if entry['status'] == 'PROCESSING' and (
+                    (owner is not None and entry.get('claimed_by') == owner)
+                    or (claimed_before is not None and entry.get('claimed_at') is not None
+                        and entry['claimed_at'] < claimed_before)
+                )
+            ]
+            for entry in stale:
+                self._requeue(entry)
+            self._queued = dict(sorted(self._queued.items()))
+            return len(stale)
+
+    def _requeue(self, entry):
+        entry.update(status='QUEUED', claimed_by=None, claimed_at=None)
+        self._queued[entry['queue_id']] = entry
+
+    def finish_transaction(self, transaction_id, status):
+        with self._lock:
+            transaction = self._transactions.get(transaction_id)
+            if transaction:
+                transaction['status'] = status
+            entry = self._queue_by_transaction.get(transaction_id)
+            if entry:
+                entry['status'] = status
+                self._queued.pop(entry['queue_id'], None)
+
+    def apply_transaction(self, transaction_id, account_number, amount_change):
+        with self._lock:
+            entry = self._queue_by_transaction.get(transaction_id)
+            if not entry or entry['status'] != 'PROCESSING' or entry.get('claimed_by') not in (None, claim_owner()):
+                return None
+            status = 'COMPLETED' if self.adjust_balance(account_number, amount_change) else 'FAILED'
+            self.finish_transaction(transaction_id, status)
+            return status
+
+    def set_queue_priority(self, transaction_id, priority):
+        with self._lock:
+            entry = self._queue_by_transaction.get(transaction_id)
+            if not entry:
+                return False
+            entry['priority'] = priority
+            return True
+
+    def recent_queue(self, limit=50):
+        with self._lock:
+            entries = sorted(self._queue.values(), key=lambda e: (e['added_at'], e['queue_id']), reverse=True)
+            rows = []
+            for entry in entries[:limit]:
+                row = self._queued_row(entry)
+                rows.append({
+                    'queue_id': row['queue_id'],
+                    'transaction_id': row['transaction_id'],
+                    'account_number': row['account_number'],
+                    'amount': row['amount'],
+                    'status': entry['status'],
+                    'added_at': entry['added_at']
+                })
+            return rows
+
+    def get_recent_transactions(self, limit):
+        with self._lock:
+            first = max(self._transactions, default=0) - limit
+            return [
+                (t['account_id'], t['transaction_type'], t['amount'], t['created_at'])
+                for t in (self._transactions[key] for key in sorted(self._transactions) if key > first)
+                if t['status'] == 'COMPLETED'
+            ]
+
+    # --- Held transactions (risk review) ---
+
+    def hold_transactions(self, holds):
+        with self._lock:
+            held_at = utc_timestamp()
+            for transaction_id, reason in holds:
+                self._holds[transaction_id] = {'reason': reason, 'decision': None, 'held_at': held_at}
+                self.finish_transaction(transaction_id, 'HELD')
+
+    def list_held(self, limit=50):
+        with self._lock:
+            held = [entry for entry in self._queue.values() if entry['status'] == 'HELD']
+            return [
+                dict(self._queued_row(entry), reason=self._holds[entry['transaction_id']]['reason'],
+                     held_at=self._holds[entry['transaction_id']]['held_at'])
+                for entry in held[:limit]
+            ]
+
+    def claim_held(self, transaction_id, decision):
+        with self._lock:
+            entry = self._queue_by_transaction.get(transaction_id)
+            if not entry or entry['status'] != 'HELD':
+                return False
+            entry.update(status='PROCESSING', claimed_by=None, claimed_at=None)
+            self._holds[transaction_id].update(decision=decision, reviewed_at=utc_timestamp())
+            return True
+
+    # --- Exports ---
+
+    def _export_row(self, table, item):
+        """Shape a stored item like a row of the export query of its table"""
+        if table == 'transfer_history':
+            return dict(item)
+
+        if table == 'transactions':
+            account = self._accounts.get(item['account_id'])
+            return {
+                'transaction_id': item['transaction_id'],
+                'account_number': account['account_number'] if account else None,
+                'transaction_type': item['transaction_type'],
+                'amount': item['amount'],
+                'description': item['description'],
+                'related_account': item['related_account'],
+                'status': item['status'],
+                'created_at': item['created_at']
+            }
+
+        transaction = self._transactions[item['transaction_id']]
+        account = self._accounts.get(transaction['account_id'])
+        return {
+            'queue_id': item['queue_id'],
+            'transaction_id': item['transaction_id'],
+            'account_number': account['account_number'] if account else None,
+            'transaction_type': transaction['transaction_type'],
+            'amount': transaction['amount'],
+            'priority': item['priority'],
+            'status': item['status'],
+            'added_at': item['added_at']
+        }
+
+    def export_rows(self, table, since=None, until=None, account_number=None, batch_size=1000):
+        with self._lock:
+            if table == 'transfer_history':
+                items = list(self._transfers)
+            elif table == 'transactions':
+                items = [self._transactions[key] for key in sorted(self._transactions)]
+            elif table == 'transaction_queue':
+                items = [self._queue[key] for key in sorted(self._queue)]
+            else:
+                raise ValueError(f"Unknown export table '{table}'")
+
+        time_field = 'added_at' if table == 'transaction_queue' else 'created_at'
+        batch = []
+        for item in items:
+            with self._lock:
+                row = self._export_row(table, item)
+            if since is not None and row[time_field] < since:
+                continue
+            if until is not None and row[time_field] >= until:
+                continue
+            if account_number is not None:
+                if table == 'transfer_history':
+                    accounts = (row['source_account'], row['destination_account'])
+                else:
+                    accounts = (row['account_number'],)
+                if account_number not in accounts:
+                    continue
+
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    # --- Bulk history imports ---
+
+    def get_account_ids(self):
+        with self._lock:
+            return {number: account['account_id'] for number, account in self._accounts_by_number.items()}
+
+    def get_import_checkpoint(self, import_id):
+        with self._lock:
+            checkpoint = self._imports.get(import_id)
+            return dict(checkpoint, dropped_indexes=list(checkpoint['dropped_indexes'])) if checkpoint else None
+
+    def start_import(self, import_id, table, source, dropped_indexes):
+        with self._lock:
+            if import_id in self._imports:
+                raise ValueError(f"Import {import_id} already exists")
+            now = utc_timestamp()
+            self._imports[import_id] = {
+                'import_id': import_id,
+                'table_name': table,
+                'source': source,
+                'status': 'LOADING',
+                'rows_done': 0,
+                'rows_loaded': 0,
+                'rows_rejected': 0,
+                'dropped_indexes': list(dropped_indexes),
+                'created_at': now,
+                'updated_at': now
+            }
+
+    def set_import_indexes(self, import_id, dropped_indexes):
+        with self._lock:
+            self._imports[import_id].update(dropped_indexes=list(dropped_indexes), updated_at=utc_timestamp())
+
+    def load_history_chunk(self, import_id, table, rows, deltas, rows_done, rows_loaded, rows_rejected):
+        with self._lock:
+            for row in rows:
+                if table == 'transactions':
+                    account_id, transaction_type, amount, description, related_account, status, created_at = row
+                    transaction_id = self._next_id('transactions')
+                    self._transactions[transaction_id] = {
+                        'transaction_id': transaction_id,
+                        'account_id': account_id,
+                        'transaction_type': transaction_type,
+                        'amount': amount,
+                        'description': description,
+                        'related_account': related_account,
+                        'status': status,
+                        'created_at': created_at
+                    }
+                else:
+                    source_account, destination_account, amount, description, transaction_type, created_at = row
+                    self._transfers.append({
+                        'transfer_id': self._next_id('transfer_history'),
+                        'source_account': source_account,
+                        'destination_account': destination_account,
+                        'amount': amount,
+                        'description': description,
+                        'transaction_type': transaction_type,
+                        'created_at': created_at
+                    })
+            for account_number, delta in deltas:
+                key = (import_id, account_number)
+                self._import_deltas[key] = self._import_deltas.get(key, 0.0) + delta
+            self._imports[import_id].update(rows_done=rows_done, rows_loaded=rows_loaded,
+                                            rows_rejected=rows_rejected, updated_at=utc_timestamp())
+
+    def finish_import(self, import_id):
+        with self._lock:
+            updated = 0
+            for key in [key for key in self._import_deltas if key[0] == import_id]:
+                account = self._accounts_by_number.get(key[1])
+                delta = self._import_deltas.pop(key)
+                if account:
+                    account['balance'] += delta
+                    updated += 1
+            self._imports[import_id].update(status='DONE', dropped_indexes=[], updated_at=utc_timestamp())
+            return updated
+
+    def drop_secondary_indexes(self, table):
+        # Nothing is indexed here
+        return []
+
+    def restore_indexes(self, indexes):
+        pass
+
+    # --- Reconciliation ---
+
+    def get_last_reconciliation(self):
+        with self._lock:
+            return dict(self._reconciliation_runs[-1]) if self._reconciliation_runs else None
+
+    def reconciliation_scan(self, transfer_after=0, transaction_after=0, batch_size=10000):
+        with self._lock:
+            accounts = [
+                (a['account_id'], a['account_number'], a['balance'], a['opening_balance'],
+                 self._reconciled.get(a['account_id']))
+                for a in (self._accounts[key] for key in sorted(self._accounts))
+            ]
+            transfers = [
+                (t['transfer_id'],
+                 t['source_account'] if t['transaction_type'] == 'OUTGOING' else t['destination_account'],
+                 -t['amount'] if t['transaction_type'] == 'OUTGOING' else t['amount'], t['created_at'])
+                for t in self._transfers if t['transfer_id'] > transfer_after
+            ]
+            transactions = [
+                (t['transaction_id'], t['account_id'],
+                 t['amount'] if t['transaction_type'] == 'DEPOSIT' else -t['amount'], t['status'],
+                 t['transaction_type'], t['created_at'])
+                for t in (self._transactions[key] for key in sorted(self._transactions))
+                if t['transaction_id'] > transaction_after
+            ]
+            last_transaction = max(self._transactions, default=0)
+            pending = [key for key, t in self._transactions.items() if t['status'] in ('PENDING', 'HELD')]
+            watermarks = {
+                'transfer_id': self._transfers[-1]['transfer_id'] if self._transfers else 0,
+                'transaction_id': last_transaction,
+                'settled_transaction_id': min(pending) - 1 if pending else last_transaction
+            }
+
+        yield 'watermarks', watermarks
+        for kind, rows in (('accounts', accounts), ('transfers', transfers), ('transactions', transactions)):
+            for start in range(0, len(rows), batch_size):
+                yield kind, rows[start:start + batch_size]
+
+    def save_reconciliation(self, run, balances):
+        with self._lock:
+            self._reconciled.update(balances)
+            run_id = len(self._reconciliation_runs) + 1
+            self._reconciliation_runs.append(dict(run, run_id=run_id, created_at=utc_timestamp()))
+            return run_id
+
+    # --- Analytics rollups ---
+
+    def get_rollup_watermark(self):
+        with self._lock:
+            return self._rollup_watermark
+
+    def get_transfers_after(self, transfer_id, limit):
+        with self._lock:
+            rows = []
+            for t in self._transfers:
+                if t['transfer_id'] <= transfer_id:
+                    continue
+                outgoing = t['transaction_type'] == 'OUTGOING'
+                rows.append((t['transfer_id'],
+                             t['source_account'] if outgoing else t['destination_account'],
+                             t['destination_account'] if outgoing else t['source_account'],
+                             t['transaction_type'], t['amount'], t['created_at']))
+                if len(rows) >= limit:
+                    break
+            return rows
+
+    def apply_rollup(self, after, high_water, aggregates):
+        with self._lock:
+            if self._rollup_watermark != after:
+                return False
+            for account_number, granularity, counterparty, bucket, *totals in aggregates:
+                key = (account_number, granularity, counterparty, bucket)
+                current = self._rollups.get(key, (0.0, 0, 0.0, 0))
+                self._rollups[key] = tuple(a + b for a, b in zip(current, totals))
+            self._rollup_watermark = high_water
+            return True
+
+    def _user_rollups(self, user_id, granularity):
+        owned = {a['account_number'] for a in self._accounts.values() if a['user_id'] == user_id}
+        return owned, [
+            (key, totals) for key, totals in self._rollups.items()
+            if key[0] in owned and key[1] == granularity
+        ]
+
+    def get_top_payees(self, user_id, limit=5):
+        with self._lock:
+            owned, rollups = self._user_rollups(user_id, 'A')
+            payees = {}
+            for (_, _, counterparty, _), (_, _, amount_out, count_out) in rollups:
+                if count_out and counterparty not in owned:
+                    amount, count = payees.get(counterparty, (0.0, 0))
+                    payees[counterparty] = (amount + amount_out, count + count_out)
+        ranked = sorted(payees.items(), key=lambda item: (-item[1][0], item[0]))[:limit]
+        return [{'counterparty': c, 'amount': amount, 'count': count} for c, (amount, count) in ranked]
+
+    def get_rollup_series(self, user_id, granularity, since):
+        with self._lock:
+            _, rollups = self._user_rollups(user_id, granularity)
+            series = {}
+            for (_, _, counterparty, bucket), totals in rollups:
+                if counterparty == '' and bucket >= since:
+                    current = series.get(bucket, (0.0, 0, 0.0, 0))
+                    series[bucket] = tuple(a + b for a, b in zip(current, totals))
+        return [
+            {'bucket': bucket, 'amount_in': t[0], 'count_in': t[1], 'amount_out': t[2], 'count_out': t[3]}
+            for bucket, t in sorted(series.items())
+        ]
+
+BACKENDS = {
+    'sqlite': SQLiteStorage,
+    'mysql': MySQLStorage,
+    'memory': MemoryStorage
+}
+
+def get_storage():
+    """Get the storage backend selected by STORAGE_BACKEND"""
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            try:
+                _storage = BACKENDS[STORAGE_BACKEND]()
+            except KeyError:
+                raise ValueError(f"Unknown storage backend '{STORAGE_BACKEND}'") from None
+        return _storage
+
+def set_storage(storage):
+    """Replace the storage backend (e.g. with a MemoryStorage in tests).
+
+    Returns the previous backend so it can be restored.
+    """
+    global _storage
+    with _storage_lock:
+        previous = _storage
+        _storage = storage
+        return previous
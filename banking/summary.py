@@ -0,0 +1,228 @@
+# Dashboard summary module
+#
+# A DashboardSummary is loaded once per session and then kept current from
+# events published by the banking engines, so the dashboard does not have
+# to re-query after every transfer. Listeners are told which sections
+# changed and re-render only those.
+import threading
+from . import analytics, events
+from .events import event_bus
+from .storage import get_storage, utc_timestamp
+
+# Sections of the summary
+ACCOUNTS = 'accounts'
+LINKED_BANKS = 'linked_banks'
+RECENT_TRANSFERS = 'recent_transfers'
+DAILY_TOTALS = 'daily_totals'
+ANALYTICS = 'analytics'
+
+class DashboardSummary:
+    """Accounts, balances, linked banks, recent transfers, daily totals and
+    analytics (top payees, spending trend) of one user"""
+    def __init__(self, user_id, transfer_limit=10):
+        self.user_id = user_id
+        self.transfer_limit = transfer_limit
+        self.lock = threading.RLock()
+        self.listeners = []
+
+        self.accounts = []
+        self.linked_banks = []
+        self.recent_transfers = []
+        self.daily_totals = {'incoming': 0.0, 'outgoing': 0.0}
+        self.day = None
+        self.top_payees = []
+        self.spending_trend = []
+
+    def load(self):
+        """(Re)load every section from storage"""
+        now = utc_timestamp()
+        data = get_storage().get_dashboard_summary(
+            self.user_id, self.transfer_limit, since=now[:10] + ' 00:00:00'
+        )
+        with self.lock:
+            self.accounts = data['accounts']
+            self.linked_banks = data['linked_banks']
+            self.recent_transfers = data['recent_transfers']
+            self.daily_totals = data['daily_totals']
+            self.day = now[:10]
+        self._load_analytics()
+        self._notify({ACCOUNTS, LINKED_BANKS, RECENT_TRANSFERS, DAILY_TOTALS, ANALYTICS})
+        return self
+
+    def _load_analytics(self):
+        # Read from the rollups: a handful of rows however long the history is
+        top_payees = analytics.top_payees(self.user_id)
+        spending_trend = analytics.spending_trend(self.user_id)
+        with self.lock:
+            self.top_payees = top_payees
+            self.spending_trend = spending_trend
+
+    def subscribe(self, listener):
+        """Call listener(changed_sections) after every change"""
+        with self.lock:
+            if listener not in self.listeners:
+                self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        with self.lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+
+    def get_account(self, account_number):
+        """Get one of the user's accounts by number, or None"""
+        with self.lock:
+            for account in self.accounts:
+                if account['account_number'] == account_number:
+                    return account
+        return None
+
+    def total_balance(self):
+        with self.lock:
+            return sum(account['balance'] for account in self.accounts)
+
+    def apply_event(self, topic, payload):
+        """Update the summary from an engine event. Returns the changed sections"""
+        if topic == events.TRANSFER_COMPLETED:
+            changed = self._apply_transfer(payload)
+        elif topic == events.BALANCE_CHANGED:
+            changed = self._apply_balance_change(payload['account_number'], payload['amount_change'])
+        elif (topic == events.ACCOUNT_CREATED and payload.get('user_id') == self.user_id
+              or topic == events.ACCOUNTS_PROVISIONED and self.user_id in payload.get('user_ids', ())):
+            accounts = get_storage().get_accounts(self.user_id)
+            with self.lock:
+                self.accounts = accounts
+            changed = {ACCOUNTS}
+        elif topic == events.ANALYTICS_UPDATED and self._owns_any(payload['account_numbers']):
+            self._load_analytics()
+            changed = {ANALYTICS}
+        elif topic in (events.BANK_LINKED, events.BANK_VERIFIED) and payload.get('user_id') == self.user_id:
+            linked_banks = get_storage().get_linked_bank_accounts(self.user_id)
+            with self.lock:
+                self.linked_banks = linked_banks
+            changed = {LINKED_BANKS}
+        else:
+            changed = set()
+
+        self._notify(changed)
+        return changed
+
+    def _owns_any(self, account_numbers):
+        with self.lock:
+            return any(account['account_number'] in account_numbers for account in self.accounts)
+
+    def _apply_balance_change(self, account_number, amount_change):
+        with self.lock:
+            account = self.get_account(account_number)
+            if account is None:
+                return set()
+            account['balance'] = float(account['balance']) + amount_change
+            return {ACCOUNTS}
+
+    def _apply_transfer(self, payload):
+        source = payload['source_account']
+        destination = payload['destination_account']
+        amount = payload['amount']
+        now = utc_timestamp()
+
+        changed = set()
+        with self.lock:
+            if self.day != now[:10]:
+                # First event of a new day
+                self.daily_totals = {'incoming': 0.0, 'outgoing': 0.0}
+                self.day = now[:10]
+                changed.add(DAILY_TOTALS)
+
+            for account_number, transaction_type, sign, total in (
+                (source, 'OUTGOING', -1, 'outgoing'),
+                (destination, 'INCOMING', 1, 'incoming')
+            ):
+                account = self.get_account(account_number)
+                if account is None:
+                    continue
+                account['balance'] = float(account['balance']) + sign * amount
+                self.daily_totals[total] += amount
+                self.recent_transfers.insert(0, {
+                    'transfer_id': None,
+                    'source_account': source,
+                    'destination_account': destination,
+                    'amount': amount,
+                    'description': payload.get('description'),
+                    'transaction_type': transaction_type,
+                    'created_at': now
+                })
+                changed.update((ACCOUNTS, RECENT_TRANSFERS, DAILY_TOTALS))
+
+            del self.recent_transfers[self.transfer_limit:]
+        return changed
+
+    def _notify(self, changed):
+        if not changed:
+            return
+        with self.lock:
+            listeners = list(self.listeners)
+        for listener in listeners:
+            listener(changed)
+
+class SummaryCache:
+    """Dashboard summaries cached per session and kept current from the event bus"""
+    TOPICS = (events.TRANSFER_COMPLETED, events.BALANCE_CHANGED, events.ACCOUNT_CREATED,
+              events.ACCOUNTS_PROVISIONED, events.BANK_LINKED, events.BANK_VERIFIED, events.ANALYTICS_UPDATED)
+
+    def __init__(self, bus=event_bus):
+        self.bus = bus
+        self.lock = threading.Lock()
+        self.summaries = {}
+        self.loading = {}  # session_id -> load in progress, so a session is loaded once
+        for topic in SummaryCache.TOPICS:
+            bus.subscribe(topic, self._on_event)
+
+    def get(self, session_id, user_id, transfer_limit=10):
+        """Get the summary of a session, loading it on first use.
+
+        A summary is only published once it is loaded: concurrent calls for
+        the same session wait for that load instead of getting an empty one.
+        """
+        with self.lock:
+            summary = self.summaries.get(session_id)
+            if summary is not None and summary.user_id == user_id:
+                return summary
+            loading = self.loading.get(session_id)
+            if loading is None or loading[0] != user_id:
+                loading = self.loading[session_id] = (user_id, threading.Lock())
+
+        with loading[1]:
+            with self.lock:
+                summary = self.summaries.get(session_id)
+                if summary is not None and summary.user_id == user_id:
+                    return summary
+            summary = DashboardSummary(user_id, transfer_limit).load()
+            with self.lock:
+                # Unless the session was dropped (or taken by another user) meanwhile
+                if self.loading.get(session_id) is loading:
+                    del self.loading[session_id]
+                    self.summaries[session_id] = summary
+            return summary
+
+    def drop(self, session_id):
+        """Forget the summary of a session (e.g. on logout)"""
+        with self.lock:
+            self.summaries.pop(session_id, None)
+            self.loading.pop(session_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.summaries.clear()
+            self.loading.clear()
+
+    def close(self):
+        """Stop following the event bus"""
+        for topic in SummaryCache.TOPICS:
+            self.bus.unsubscribe(topic, self._on_event)
+
+    def _on_event(self, topic, payload):
+        with self.lock:
+            summaries = list(self.summaries.values())
+        for summary in summaries:
+            summary.apply_event(topic, payload)
+
+summary_cache = SummaryCache()
@@ -1,9 +1,8 @@
-import mysql.connector
-import sqlite3
-from config import DB_CONFIG, DB_TYPE
-from datetime import datetime
 from threading import Lock, Semaphore
-from .accounts import AccountManager
+from config import RISK_CONFIG
+from . import events
+from .events import event_bus
+from .storage import get_storage
 
 # Limiting concurrent transaction processing
 transaction_semaphore = Semaphore(5)  # Allow 5 concurrent transactions
@@ -14,164 +13,150 @@ class TransactionManager:
     def record_transaction(account_id, transaction_type, amount, description=None, related_account=None):
         """Record a transaction in the database"""
         try:
-            if DB_TYPE == 'sqlite':
-                # SQLite connection
-                conn = sqlite3.connect(DB_CONFIG['database'])
-                cursor = conn.cursor()
-                
-                cursor.execute("""
-                    INSERT INTO transactions 
-                    (account_id, transaction_type, amount, description, related_account, status)
-                    VALUES (?, ?, ?, ?, ?, 'PENDING')
-                """, (account_id, transaction_type.upper(), amount, description, related_account))
-                
-                transaction_id = cursor.lastrowid
-                
-                # Add to transaction queue for processing
-                cursor.execute("""
-                    INSERT INTO transaction_queue (transaction_id)
-                    VALUES (?)
-                """, (transaction_id,))
-                conn.commit()
-            else:
-                # MySQL connection
-                conn = mysql.connector.connect(**DB_CONFIG)
-                cursor = conn.cursor()
-                
-                cursor.execute("""
-                    INSERT INTO transactions 
-                    (account_id, transaction_type, amount, description, related_account, status)
-                    VALUES (%s, %s, %s, %s, %s, 'PENDING')
-                """, (account_id, transaction_type.upper(), amount, description, related_account))
-                
-                transaction_id = cursor.lastrowid
-                conn.commit()
-                
-                # Add to transaction queue for processing
-                cursor.execute("""
-                    INSERT INTO transaction_queue (transaction_id)
-                    VALUES (%s)
-                """, (transaction_id,))
-                conn.commit()
-            
-            return transaction_id
+            # Transaction row and queue entry are stored together
+            transaction_id = get_storage().record_transaction(
+                account_id, transaction_type, amount, description, related_account
+            )
         except Exception as err:
-            if 'conn' in locals():
-                conn.rollback()
             return None
-        finally:
-            if 'cursor' in locals():
-                cursor.close()
-            if 'conn' in locals():
-                conn.close()
+        
+        event_bus.publish(events.TRANSACTION_QUEUED, transaction_id=transaction_id, account_id=account_id)
+        return transaction_id
     
     @staticmethod
-    def process_transactions():
-        """Process pending transactions (to be run in a separate thread)"""
-        while True:
-            transaction_semaphore.acquire()
-            
-            conn = mysql.connector.connect(**DB_CONFIG)
-            cursor = conn.cursor(dictionary=True)
-            
-            try:
-                with transaction_lock:
-                    # Get next transaction from queue
-                    cursor.execute("""
-                        SELECT t.transaction_id, t.account_id, t.transaction_type, 
-                               t.amount, t.related_account, a.account_number
-                        FROM transaction_queue q
-                        JOIN transactions t ON q.transaction_id = t.transaction_id
-                        JOIN accounts a ON t.account_id = a.account_id
-                        WHERE q.status = 'QUEUED'
-                        ORDER BY q.added_at ASC
-                        LIMIT 1
-                        FOR UPDATE
-                    """)
-                    
-                    transaction = cursor.fetchone()
+    def process_transactions(stop_event=None, batch_size=None, partition=None):
+        """Process pending transactions until the queue is empty (to be run in a separate thread).
+        
+        partition=(partitions, index) only takes the transactions of the
+        accounts with account_id % partitions == index, as worker processes
+        do to split the queue. Returns the number of transactions processed.
+        """
+        storage = get_storage()
+        batch_size = batch_size or RISK_CONFIG['batch_size']
+        processed = 0
+        
+        while stop_event is None or not stop_event.is_set():
+            with transaction_semaphore:
+                try:
+                    with transaction_lock:
+                        # Get the next batch from the queue
+                        if partition:
+                            queued = storage.list_queued_partition(partition[0], partition[1], batch_size)
+                        else:
+                            queued = storage.list_queued('FIFO', batch_size)
                     
-                    if not transaction:
-                        transaction_semaphore.release()
-                        continue
+                    if not queued:
+                        break
                     
-                    # Mark as processing
-                    cursor.execute("""
-                        UPDATE transaction_queue
-                        SET status = 'PROCESSING'
-                        WHERE queue_id = (
-                            SELECT queue_id FROM transaction_queue
-                            WHERE transaction_id = %s
-                            LIMIT 1
-                        )
-                    """, (transaction['transaction_id'],))
-                    conn.commit()
-                
-                # Process the transaction
-                result = TransactionManager._execute_transaction(
-                    transaction['account_id'],
-                    transaction['transaction_type'],
-                    transaction['amount'],
-                    transaction['related_account'],
-                    transaction['account_number']
-                )
+                    statuses = TransactionManager.process_batch(queued)
+                    processed += sum(1 for status in statuses if status is not None)
                 
-                # Update transaction status
-                with transaction_lock:
-                    status = 'COMPLETED' if result else 'FAILED'
-                    cursor.execute("""
-                        UPDATE transactions
-                        SET status = %s
-                        WHERE transaction_id = %s
-                    """, (status, transaction['transaction_id']))
-                    
-                    cursor.execute("""
-                        UPDATE transaction_queue
-                        SET status = %s
-                        WHERE transaction_id = %s
-                    """, (status, transaction['transaction_id']))
-                    
-                    conn.commit()
-                    
-            except mysql.connector.Error as err:
-                conn.rollback()
-                print(f"Transaction processing error: {err}")
-            finally:
-                cursor.close()
-                conn.close()
-                transaction_semaphore.release()
+                except Exception as err:
+                    print(f"Transaction processing error: {err}")
+                    break
+        
+        return processed
+    
+    @staticmethod
+    def process_transaction(transaction):
+        """Claim and execute one queued transaction.
+        
+        Returns the final status, or None if another worker claimed it first.
+        """
+        return TransactionManager.process_batch([transaction])[0]
+    
+    @staticmethod
+    def process_batch(transactions):
+        """Claim queued transactions, score them for risk and execute the ones that pass.
+        
+        Returns the final status of each (HELD for the ones held for review),
+        or None for those another worker claimed first (or that were queued
+        again because their claim timed out). A transaction that
+        raises is marked FAILED and the rest of the batch still runs; if
+        scoring fails, nothing has run and the whole batch is queued again.
+        """
+        # Scoring needs NumPy, which stays out of startup
+        from .risk import risk_scorer
+        
+        storage = get_storage()
+        claimed_ids = storage.claim_transactions([t['transaction_id'] for t in transactions])
+        claimed = [t for t in transactions if t['transaction_id'] in claimed_ids]
+        
+        try:
+            reasons = risk_scorer.score(claimed)
+            held = [(t['transaction_id'], reason) for t, reason in zip(claimed, reasons) if reason]
+            if held:
+                storage.hold_transactions(held)
+        except Exception:
+            storage.release_transactions(list(claimed_ids))
+            raise
+        
+        statuses = {}
+        for transaction, reason in zip(claimed, reasons):
+            transaction_id = transaction['transaction_id']
+            if reason:
+                statuses[transaction_id] = 'HELD'
+                event_bus.publish(events.TRANSACTION_FINISHED, transaction_id=transaction_id,
+                                  account_number=transaction['account_number'], status='HELD')
+                continue
+            try:
+                statuses[transaction_id] = TransactionManager._run_claimed(transaction)
+            except Exception as err:
+                # Nothing of it was committed, so it can be failed without undoing anything
+                print(f"Transaction {transaction_id} failed: {err}")
+                storage.finish_transaction(transaction_id, 'FAILED')
+                statuses[transaction_id] = 'FAILED'
+                event_bus.publish(events.TRANSACTION_FINISHED, transaction_id=transaction_id,
+                                  account_number=transaction['account_number'], status='FAILED')
+        return [statuses.get(t['transaction_id']) for t in transactions]
     
     @staticmethod
-    def _execute_transaction(account_id, transaction_type, amount, related_account, account_number):
-        """Execute the actual transaction logic"""
-        if transaction_type == 'DEPOSIT':
-            return AccountManager.update_balance(account_number, amount)
-        elif transaction_type == 'WITHDRAWAL':
-            return AccountManager.update_balance(account_number, -amount)
-        elif transaction_type == 'TRANSFER_OUT':
-            # This is handled in the transfers module
-            return True
+    def review_transaction(transaction, approve):
+        """Approve (execute) or reject (fail) a held transaction, as returned by list_held.
+        
+        Returns the final status, or None if it is no longer held.
+        """
+        storage = get_storage()
+        if not storage.claim_held(transaction['transaction_id'], 'APPROVED' if approve else 'REJECTED'):
+            return None
+        if approve:
+            return TransactionManager._run_claimed(transaction)
+        
+        storage.finish_transaction(transaction['transaction_id'], 'FAILED')
+        event_bus.publish(events.TRANSACTION_FINISHED, transaction_id=transaction['transaction_id'],
+                          account_number=transaction['account_number'], status='FAILED')
+        return 'FAILED'
+    
+    @staticmethod
+    def _run_claimed(transaction):
+        """Execute a claimed transaction and record its final status (None if it lost its claim)"""
+        storage = get_storage()
+        transaction_id = transaction['transaction_id']
+        transaction_type = transaction['transaction_type']
+        
+        if transaction_type in ('DEPOSIT', 'WITHDRAWAL'):
+            amount_change = transaction['amount'] if transaction_type == 'DEPOSIT' else -transaction['amount']
+            # The balance change and the final status commit together, so a failure leaves neither
+            status = storage.apply_transaction(transaction_id, transaction['account_number'], amount_change)
+            if status is None:
+                # Queued again after the claim timed out; whoever claims it next runs it
+                return None
+            if status == 'COMPLETED':
+                event_bus.publish(events.BALANCE_CHANGED, account_number=transaction['account_number'],
+                                  amount_change=amount_change)
         else:
-            return False
+            # TRANSFER_OUT is handled in the transfers module
+            status = 'COMPLETED' if transaction_type == 'TRANSFER_OUT' else 'FAILED'
+            storage.finish_transaction(transaction_id, status)
+        
+        event_bus.publish(events.TRANSACTION_FINISHED, transaction_id=transaction_id,
+                          account_number=transaction['account_number'], status=status)
+        return status
     
     @staticmethod
     def get_transaction_history(account_id, limit=10):
         """Get transaction history for an account"""
-        conn = mysql.connector.connect(**DB_CONFIG)
-        cursor = conn.cursor(dictionary=True)
-        
         try:
-            cursor.execute("""
-                SELECT transaction_id, transaction_type, amount, description, 
-                       related_account, status, created_at
-                FROM transactions
-                WHERE account_id = %s
-                ORDER BY created_at DESC
-                LIMIT %s
-            """, (account_id, limit))
-            return cursor.fetchall()
-        except mysql.connector.Error as err:
+            return get_storage().get_transaction_history(account_id, limit)
+        except Exception as err:
             return None
-        finally:
-            cursor.close()
-            conn.close()
\ No newline at end of file
@@ -0,0 +1,201 @@
+# Bank account verification module
+#
+# Linking a bank account queues a verification job instead of verifying
+# inline. A pool of worker threads runs due jobs through a pluggable
+# verifier (by default a simulated micro-deposit provider), retries
+# transient failures with exponential backoff and persists every state
+# change, so unfinished jobs resume after a restart. Progress is published
+# on the event bus (VERIFICATION_UPDATED, then BANK_VERIFIED on success).
+import heapq
+import logging
+import random
+import threading
+import time
+from config import VERIFICATION_CONFIG
+from . import events
+from .events import event_bus
+from .storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+# Job states
+PENDING = 'PENDING'
+RUNNING = 'RUNNING'
+VERIFIED = 'VERIFIED'
+FAILED = 'FAILED'
+
+class VerificationError(Exception):
+    """The account cannot be verified; retrying will not help"""
+
+class Verifier:
+    """Verification provider interface.
+
+    send_deposits(job) makes the micro-deposits and returns their amounts;
+    confirm(job, amounts) checks them. Any exception other than
+    VerificationError is treated as transient and retried.
+    """
+    def send_deposits(self, job):
+        raise NotImplementedError
+
+    def confirm(self, job, amounts):
+        raise NotImplementedError
+
+class SimulatedMicroDepositVerifier(Verifier):
+    """Local stand-in for a bank: two small deposits that are confirmed right away"""
+    def __init__(self, delay=None, failure_rate=0.0):
+        self.delay = VERIFICATION_CONFIG['simulated_delay'] if delay is None else delay
+        self.failure_rate = failure_rate
+        self.deposits = {}
+        self.lock = threading.Lock()
+
+    def send_deposits(self, job):
+        time.sleep(self.delay)  # Simulated round trip to the bank
+        if random.random() < self.failure_rate:
+            raise ConnectionError("Simulated bank connection failure")
+
+        amounts = sorted(round(random.uniform(0.01, 0.99), 2) for _ in range(2))
+        with self.lock:
+            self.deposits[job['job_id']] = amounts
+        return amounts
+
+    def confirm(self, job, amounts):
+        with self.lock:
+            return self.deposits.pop(job['job_id'], None) == amounts
+
+class VerificationService:
+    """Verification job queue served by a pool of worker threads"""
+    def __init__(self, verifier=None, workers=None, max_attempts=None, base_delay=None, max_delay=None):
+        self.verifier = verifier or SimulatedMicroDepositVerifier()
+        self.workers = workers or VERIFICATION_CONFIG['workers']
+        self.max_attempts = max_attempts or VERIFICATION_CONFIG['max_attempts']
+        self.base_delay = VERIFICATION_CONFIG['retry_base_delay'] if base_delay is None else base_delay
+        self.max_delay = VERIFICATION_CONFIG['retry_max_delay'] if max_delay is None else max_delay
+
+        self.condition = threading.Condition()
+        self.due = []  # Heap of (next_attempt_at, job_id)
+        self.active = 0
+        self.threads = []
+        self.stopping = False
+
+    # --- Lifecycle ---
+
+    def start(self):
+        """Start the workers and resume jobs left unfinished by a previous run"""
+        with self.condition:
+            if self.threads:
+                return False
+            self.stopping = False
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, daemon=True, name=f"Verifier-{i + 1}")
+                self.threads.append(thread)
+                thread.start()
+
+        for job in get_storage().get_unfinished_verification_jobs():
+            # RUNNING means the previous run stopped in the middle of it
+            self._schedule(job['job_id'], job['next_attempt_at'])
+        return True
+
+    def stop(self, timeout=5.0):
+        """Stop the workers (jobs that are due stay persisted)"""
+        with self.condition:
+            self.stopping = True
+            self.condition.notify_all()
+            threads, self.threads = self.threads, []
+        for thread in threads:
+            thread.join(timeout)
+        with self.condition:
+            self.due.clear()
+
+    def wait_idle(self, timeout=None):
+        """Block until no job is due or running. Returns False on timeout"""
+        with self.condition:
+            return self.condition.wait_for(lambda: not self.due and not self.active, timeout)
+
+    # --- Jobs ---
+
+    def submit(self, user_id, account_number):
+        """Queue verification of a linked account and return the job id"""
+        if not self.threads:
+            self.start()
+        now = time.time()
+        job_id = get_storage().create_verification_job(user_id, account_number, now)
+        self._publish(get_storage().get_verification_job(job_id))
+        self._schedule(job_id, now)
+        return job_id
+
+    def get_job(self, job_id):
+        """Poll the state of a job"""
+        return get_storage().get_verification_job(job_id)
+
+    def get_jobs(self, user_id):
+        """Get a user's verification jobs, newest first"""
+        return get_storage().get_verification_jobs(user_id)
+
+    def retry_delay(self, attempts):
+        """Seconds to wait after a failed attempt (exponential backoff)"""
+        return min(self.base_delay * 2 ** (attempts - 1), self.max_delay)
+
+    def _schedule(self, job_id, at):
+        with self.condition:
+            heapq.heappush(self.due, (at, job_id))
+            self.condition.notify()
+
+    def _worker(self):
+        while True:
+            with self.condition:
+                while True:
+                    if self.stopping:
+                        return
+                    now = time.time()
+                    if self.due and self.due[0][0] <= now:
+                        _, job_id = heapq.heappop(self.due)
+                        self.active += 1
+                        break
+                    self.condition.wait(self.due[0][0] - now if self.due else None)
+
+            try:
+                self._run(job_id)
+            except Exception:
+                logger.exception("Verification job %s crashed", job_id)
+            finally:
+                with self.condition:
+                    self.active -= 1
+                    self.condition.notify_all()
+
+    def _run(self, job_id):
+        storage = get_storage()
+        job = storage.get_verification_job(job_id)
+        if job is None or job['status'] not in (PENDING, RUNNING):
+            return
+
+        attempts = job['attempts'] + 1
+        storage.update_verification_job(job_id, RUNNING, attempts, job['next_attempt_at'])
+        self._publish(dict(job, status=RUNNING, attempts=attempts))
+
+        try:
+            amounts = self.verifier.send_deposits(job)
+            if not self.verifier.confirm(job, amounts):
+                raise VerificationError("Deposit amounts did not match")
+        except Exception as err:
+            if isinstance(err, VerificationError) or attempts >= self.max_attempts:
+                storage.update_verification_job(job_id, FAILED, attempts, job['next_attempt_at'], str(err))
+                self._publish(dict(job, status=FAILED, attempts=attempts, last_error=str(err)))
+            else:
+                retry_at = time.time() + self.retry_delay(attempts)
+                storage.update_verification_job(job_id, PENDING, attempts, retry_at, str(err))
+                self._publish(dict(job, status=PENDING, attempts=attempts, last_error=str(err)))
+                self._schedule(job_id, retry_at)
+            return
+
+        storage.verify_bank_account(job['user_id'], job['account_number'])
+        storage.update_verification_job(job_id, VERIFIED, attempts, job['next_attempt_at'])
+        event_bus.publish(events.BANK_VERIFIED, user_id=job['user_id'], account_number=job['account_number'])
+        self._publish(dict(job, status=VERIFIED, attempts=attempts, last_error=None))
+
+    @staticmethod
+    def _publish(job):
+        event_bus.publish(events.VERIFICATION_UPDATED, job_id=job['job_id'], user_id=job['user_id'],
+                          account_number=job['account_number'], status=job['status'],
+                          attempts=job['attempts'], last_error=job['last_error'])
+
+verification_service = VerificationService()
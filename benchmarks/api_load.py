@@ -0,0 +1,154 @@
+"""HTTP API load generator.
+
+Starts server.py on a temporary SQLite database, registers a set of users
+over the API and opens a funded account for each directly in the database
+(the API does not let clients choose a balance), then runs keep-alive clients that check balances,
+read transfer history, transfer money between the accounts and queue
+deposits for a fixed time. Reports requests per second and latency
+percentiles per operation.
+
+Usage: python benchmarks/api_load.py [--seconds 10] [--clients 32] [--users 16] [--queue-workers 1]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_DIR)
+
+from config import DB_CONFIG
+from banking.accounts import AccountManager
+from banking.db_adapter import DatabaseAdapter
+
+# (operation, weight)
+MIX = [('balance', 0.4), ('history', 0.25), ('transfer', 0.25), ('deposit', 0.1)]
+
+async def request(connection, method, path, body=None, token=None):
+    """Send one request on a keep-alive connection. Returns (status, payload)"""
+    reader, writer = connection
+    data = json.dumps(body).encode('utf-8') if body is not None else b''
+    head = f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(data)}\r\n"
+    if token:
+        head += f"Authorization: Bearer {token}\r\n"
+    writer.write((head + "\r\n").encode('latin-1') + data)
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line == b'\r\n':
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+def start_server(database, queue_workers):
+    """Run server.py on database and an ephemeral port. Returns (process, port)"""
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(PROJECT_DIR, 'server.py'), '--port', '0', '--database', database,
+         '--queue-workers', str(queue_workers)],
+        cwd=PROJECT_DIR, stdout=subprocess.PIPE, text=True
+    )
+    for line in process.stdout:
+        if line.startswith("Serving on"):
+            return process, int(line.rsplit(':', 1)[1])
+    raise RuntimeError("server.py exited before it started serving")
+
+async def set_up_users(port, users):
+    """Register users with one funded account each. Returns [(token, account_number)]
+
+    The accounts are created in this process, on the server's database.
+    """
+    connection = await asyncio.open_connection('127.0.0.1', port)
+    sessions = []
+    for i in range(users):
+        user = {'username': f"load{i}", 'password': "load-test", 'full_name': f"Load {i}",
+                'email': f"load{i}@example.com"}
+        await request(connection, 'POST', '/register', user)
+        _, login = await request(connection, 'POST', '/login', user)
+        success, account_number = AccountManager.create_account(login['user']['user_id'], 'SAVINGS', 1000000)
+        if not success:
+            raise RuntimeError(account_number)
+        sessions.append((login['session_id'], account_number))
+    connection[1].close()
+    return sessions
+
+async def client(port, sessions, deadline, latencies, errors, rng):
+    connection = await asyncio.open_connection('127.0.0.1', port)
+    operations, weights = zip(*MIX)
+    try:
+        while time.perf_counter() < deadline:
+            token, account = rng.choice(sessions)
+            operation = rng.choices(operations, weights)[0]
+            if operation == 'balance':
+                call = ('GET', f'/accounts/{account}/balance', None)
+            elif operation == 'history':
+                call = ('GET', f'/accounts/{account}/transfers?limit=10', None)
+            elif operation == 'transfer':
+                destination = rng.choice(sessions)[1]
+                call = ('POST', '/transfers', {'source_account': account, 'destination_account': destination,
+                                               'amount': 1.0, 'description': "load test"})
+            else:
+                call = ('POST', '/transactions', {'account_number': account, 'transaction_type': 'DEPOSIT',
+                                                  'amount': 1.0})
+
+            start = time.perf_counter()
+            status, _ = await request(connection, *call, token=token)
+            latencies[operation].append(time.perf_counter() - start)
+            if status >= 400:
+                errors[operation] += 1
+    finally:
+        connection[1].close()
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(fraction * len(values)), len(values) - 1)] if values else 0.0
+
+async def run(port, sessions, seconds, clients, seed):
+    latencies = {operation: [] for operation, _ in MIX}
+    errors = {operation: 0 for operation, _ in MIX}
+    deadline = time.perf_counter() + seconds
+    await asyncio.gather(*(client(port, sessions, deadline, latencies, errors, random.Random(seed + i))
+                           for i in range(clients)))
+    return latencies, errors
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=10.0)
+    parser.add_argument('--clients', type=int, default=32, help="concurrent keep-alive connections")
+    parser.add_argument('--users', type=int, default=16)
+    parser.add_argument('--queue-workers', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        DB_CONFIG['database'] = os.path.join(tmp, 'load.db')
+        process, port = start_server(DB_CONFIG['database'], args.queue_workers)
+        try:
+            sessions = asyncio.run(set_up_users(port, args.users))
+            DatabaseAdapter.close_all()
+            latencies, errors = asyncio.run(run(port, sessions, args.seconds, args.clients, args.seed))
+        finally:
+            process.terminate()
+            process.wait()
+
+    total = sum(len(values) for values in latencies.values())
+    print(f"{args.clients} clients, {args.users} users, {args.seconds:.0f}s: "
+          f"{total} requests, {total / args.seconds:.0f} requests/s")
+    print(f"{'operation':<10} {'requests':>9} {'errors':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for operation, values in list(latencies.items()) + [('all', [v for vs in latencies.values() for v in vs])]:
+        failed = errors.get(operation, sum(errors.values()))
+        print(f"{operation:<10} {len(values):>9} {failed:>7} {percentile(values, 0.5) * 1000:>8.1f} "
+              f"{percentile(values, 0.95) * 1000:>8.1f} {percentile(values, 0.99) * 1000:>8.1f} "
+              f"{max(values, default=0.0) * 1000:>8.1f}")
+
+if __name__ == '__main__':
+    main()
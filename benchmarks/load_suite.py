@@ -0,0 +1,397 @@
+"""Load and soak suite for transfers, logins, registrations and the queue.
+
+Drives each operation at a fixed rate from a few threads against a
+temporary SQLite database, with queue worker threads processing the
+queued deposits and withdrawals, then checks that the balances still add
+up. Reports throughput, latency percentiles and memory growth per
+scenario. Latencies are measured from when each operation was due, so
+falling behind the rate shows up in the percentiles.
+
+With a stored baseline the run fails (exit code 1) if a scenario is
+slower than the baseline by more than --tolerance; a broken invariant
+exits with 2. Run it for minutes (--seconds 600) to soak. The baseline
+stores the settings it was recorded with, so a soak run needs its own
+(--baseline soak.json --save-baseline).
+
+Usage: python benchmarks/load_suite.py [--seconds 10] [--transfer-rate 100] [--baseline benchmarks/load_baseline.json] [--save-baseline]
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import DB_CONFIG
+from banking import events
+from banking.accounts import AccountManager
+from banking.events import event_bus
+from banking.reconciliation import reconcile
+from banking.storage import get_storage
+from banking.transactions import TransactionManager
+from banking.transfers import TransferManager
+from os_concepts.multithreading import BankingThreads
+from security.authh import AuthSystem
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'load_baseline.json')
+
+DEFAULT_PROFILE = {
+    'seconds': 10.0,
+    'users': 10,
+    'accounts': 50,
+    'opening_balance': 100000.0,
+    'threads': 4,  # Per scenario
+    'queue_workers': 2,
+    'rates': {'transfer': 100.0, 'login': 5.0, 'register': 2.0, 'enqueue': 50.0}  # Operations per second
+}
+
+# Absolute allowances on top of --tolerance, so a fast scenario is not failed for a millisecond of noise
+LATENCY_SLACK_MS = 5.0
+MEMORY_SLACK_MB = 1.0
+
+# Memory growth is counted from this far into the run, past the one-off
+# allocations of the first batches (risk scorer buffers, statement caches)
+WARMUP_FRACTION = 0.2
+
+DRAIN_TIMEOUT = 60.0  # Seconds the queue workers get to finish after the load stops
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(fraction * len(values)), len(values) - 1)] if values else 0.0
+
+def summarize(latencies, errors, elapsed):
+    """Throughput and latency percentiles (ms) of one scenario"""
+    return {
+        'operations': len(latencies),
+        'errors': errors,
+        'throughput': len(latencies) / elapsed if elapsed > 0 else 0.0,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'max_ms': max(latencies, default=0.0) * 1000
+    }
+
+class Scenario:
+    """One operation run at a fixed rate by a few threads.
+
+    Operation n is due at start + n / rate; operation(n) returns whether
+    it succeeded.
+    """
+    def __init__(self, name, operation, rate, threads):
+        self.name = name
+        self.operation = operation
+        self.rate = rate
+        self.threads = threads
+        self.lock = threading.Lock()
+        self.issued = 0
+        self.latencies = []
+        self.errors = 0
+
+    def start(self, start, deadline):
+        threads = [threading.Thread(target=self._worker, args=(start, deadline), name=f"{self.name}-{i + 1}",
+                                    daemon=True) for i in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def _worker(self, start, deadline):
+        while True:
+            with self.lock:
+                n = self.issued
+                self.issued += 1
+            due = start + n / self.rate
+            if due >= deadline:
+                return
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+            try:
+                ok = self.operation(n)
+            except Exception as err:
+                print(f"{self.name} failed: {err}")
+                ok = False
+            latency = time.perf_counter() - due
+            with self.lock:
+                self.latencies.append(latency)
+                if not ok:
+                    self.errors += 1
+
+class LoadSuite:
+    """Set up users and accounts in the current database, run the load and check the invariants"""
+    def __init__(self, profile=None):
+        self.profile = dict(DEFAULT_PROFILE, **(profile or {}))
+        self.auth = AuthSystem()
+        self.users = []  # (username, password)
+        self.accounts = []  # (account_id, account_number)
+        self.registered = []
+        self.lock = threading.Lock()
+        self.queued = {}  # transaction_id -> (queued at, signed amount)
+        self.early = {}  # transaction_id -> (finished, status), for those finished before record_transaction returned
+        self.queue_latencies = []
+        self.last_finished = 0.0
+        self.settled = 0.0  # Net amount of the completed deposits and withdrawals
+
+    def set_up(self):
+        profile = self.profile
+        for i in range(profile['users']):
+            username, password = f"loaduser{i}", f"load-password-{i}"
+            success, message = self.auth.register_user(username, password, f"Load User {i}",
+                                                       f"loaduser{i}@example.com")
+            if not success:
+                raise RuntimeError(message)
+            self.users.append((username, password))
+
+        user_ids = [get_storage().get_user(username)['user_id'] for username, _ in self.users]
+        for i in range(profile['accounts']):
+            success, result = AccountManager.create_account(user_ids[i % len(user_ids)], 'SAVINGS',
+                                                            profile['opening_balance'])
+            if not success:
+                raise RuntimeError(result)
+        self.accounts = [(account['account_id'], account['account_number'])
+                         for user_id in user_ids for account in get_storage().get_accounts(user_id)]
+
+    def transfer(self, n):
+        rng = random.Random(n)
+        source, destination = rng.sample(self.accounts, 2)
+        success, _ = TransferManager.transfer_funds(source[1], destination[1], round(rng.uniform(1, 50), 2),
+                                                    "Load test")
+        return success
+
+    def login(self, n):
+        username, password = self.users[n % len(self.users)]
+        success, result = self.auth.login(username, password)
+        if not success:
+            return False
+        session_id = result['user']['session_id']
+        valid, _ = self.auth.validate_session(session_id)
+        self.auth.logout(session_id)
+        return valid
+
+    def register(self, n):
+        username = f"registered{n}"
+        success, _ = self.auth.register_user(username, "load-password", f"Registered {n}",
+                                             f"{username}@example.com")
+        if success:
+            with self.lock:
+                self.registered.append(username)
+        return success
+
+    def enqueue(self, n):
+        rng = random.Random(-n)
+        account_id, _ = rng.choice(self.accounts)
+        transaction_type = 'WITHDRAWAL' if rng.random() < 0.25 else 'DEPOSIT'
+        amount = round(rng.uniform(1, 50), 2)
+        signed = amount if transaction_type == 'DEPOSIT' else -amount
+        queued = time.perf_counter()
+        transaction_id = TransactionManager.record_transaction(account_id, transaction_type, amount, "Load test")
+        if transaction_id is None:
+            return False
+        with self.lock:
+            # A worker may have finished it before record_transaction returned
+            early = self.early.pop(transaction_id, None)
+            if early:
+                self._finished(queued, signed, *early)
+            else:
+                self.queued[transaction_id] = (queued, signed)
+        return True
+
+    def _on_finished(self, topic, payload):
+        now = time.perf_counter()
+        with self.lock:
+            queued = self.queued.pop(payload['transaction_id'], None)
+            if queued is None:
+                self.early[payload['transaction_id']] = (now, payload['status'])
+            else:
+                self._finished(*queued, now, payload['status'])
+
+    def _finished(self, queued, amount, finished, status):
+        self.queue_latencies.append(finished - queued)
+        self.last_finished = max(self.last_finished, finished)
+        if status == 'COMPLETED':
+            self.settled += amount
+
+    def run(self):
+        """Run every scenario for profile['seconds'] and return the results"""
+        profile = self.profile
+        operations = {'transfer': self.transfer, 'login': self.login, 'register': self.register,
+                      'enqueue': self.enqueue}
+        scenarios = [Scenario(name, operations[name], rate, profile['threads'])
+                     for name, rate in profile['rates'].items() if rate > 0]
+
+        workers = BankingThreads()
+        event_bus.subscribe(events.TRANSACTION_FINISHED, self._on_finished)
+        tracemalloc.start()
+        try:
+            workers.start_transaction_processors(profile['queue_workers'])
+            start = time.perf_counter()
+            deadline = start + profile['seconds']
+            threads = [thread for scenario in scenarios for thread in scenario.start(start, deadline)]
+            time.sleep(profile['seconds'] * WARMUP_FRACTION)
+            gc.collect()
+            memory_start = tracemalloc.get_traced_memory()[0]
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - start
+
+            drain_deadline = time.perf_counter() + DRAIN_TIMEOUT
+            while self.queued and time.perf_counter() < drain_deadline:
+                time.sleep(0.05)
+        finally:
+            workers.stop_all()
+            event_bus.unsubscribe(events.TRANSACTION_FINISHED, self._on_finished)
+            gc.collect()
+            memory_end, memory_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        results = {scenario.name: summarize(scenario.latencies, scenario.errors, elapsed)
+                   for scenario in scenarios}
+        if 'enqueue' in results:
+            # From queued to executed (or held) by a worker
+            results['queue'] = summarize(self.queue_latencies, len(self.queued),
+                                         max(self.last_finished - start, elapsed))
+        return {
+            'profile': json.loads(json.dumps(profile)),
+            'scenarios': results,
+            'memory': {'growth_mb': (memory_end - memory_start) / 2 ** 20, 'peak_mb': memory_peak / 2 ** 20},
+            'invariants': self.check(results)
+        }
+
+    def check(self, results=None):
+        """Invariants that must hold once the load has stopped. Returns the broken ones"""
+        storage = get_storage()
+        failures = []
+        for name, result in (results or {}).items():
+            if result['errors']:
+                failures.append(f"{name}: {result['errors']} of {result['operations']} operations failed")
+
+        if storage.list_queued('FIFO', 1):
+            failures.append("Transactions are still queued")
+
+        balances = [float(storage.get_balance(number)) for _, number in self.accounts]
+        negative = sum(1 for balance in balances if balance < 0)
+        if negative:
+            failures.append(f"{negative} accounts have a negative balance")
+        # Transfers move money between the accounts; only the queue adds or removes it
+        expected = self.profile['opening_balance'] * len(self.accounts) + self.settled
+        if round(sum(balances) - expected, 2):
+            failures.append(f"Balances total {sum(balances):.2f}, expected {expected:.2f}")
+
+        report = reconcile(incremental=False, save=False)
+        if report['discrepancy_count'] or report['unmatched_rows']:
+            failures.append(f"{report['discrepancy_count']} accounts disagree with the ledger, "
+                            f"{report['unmatched_rows']} history rows belong to no account")
+
+        missing = [username for username in self.registered if storage.get_user(username) is None]
+        if missing:
+            failures.append(f"{len(missing)} registered users cannot be found")
+        return failures
+
+def compare(results, baseline, tolerance=0.5):
+    """Regressions of results against a baseline run, as messages"""
+    if results['profile'] != baseline['profile']:
+        return ["The baseline was recorded with different settings; record a new one with --save-baseline"]
+
+    regressions = []
+    for name, base in baseline['scenarios'].items():
+        current = results['scenarios'].get(name)
+        if current is None:
+            regressions.append(f"{name}: not run")
+            continue
+        if current['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append(f"{name}: {current['throughput']:.1f} operations/s, "
+                               f"baseline {base['throughput']:.1f}")
+        for key in ('p95_ms', 'p99_ms'):
+            if current[key] > base[key] * (1 + tolerance) + LATENCY_SLACK_MS:
+                regressions.append(f"{name}: {key[:3]} {current[key]:.1f} ms, baseline {base[key]:.1f} ms")
+
+    growth, base_growth = results['memory']['growth_mb'], baseline['memory']['growth_mb']
+    if growth > max(base_growth, 0) * (1 + tolerance) + MEMORY_SLACK_MB:
+        regressions.append(f"Memory grew {growth:.1f} MB, baseline {base_growth:.1f} MB")
+    return regressions
+
+def print_report(results):
+    profile = results['profile']
+    print(f"{profile['seconds']:.0f}s, {profile['accounts']} accounts, {profile['threads']} threads per scenario, "
+          f"{profile['queue_workers']} queue workers")
+    print(f"{'scenario':<10} {'target/s':>9} {'ops/s':>8} {'ops':>7} {'errors':>7} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name, result in results['scenarios'].items():
+        target = profile['rates'].get(name)
+        print(f"{name:<10} {target if target else '':>9} {result['throughput']:>8.1f} {result['operations']:>7} "
+              f"{result['errors']:>7} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} "
+              f"{result['p99_ms']:>8.1f} {result['max_ms']:>8.1f}")
+    memory = results['memory']
+    print(f"Python memory grew {memory['growth_mb']:.2f} MB (peak {memory['peak_mb']:.2f} MB)")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=DEFAULT_PROFILE['seconds'])
+    for name, rate in DEFAULT_PROFILE['rates'].items():
+        parser.add_argument(f'--{name}-rate', type=float, default=rate, help="operations per second (0 to skip)")
+    parser.add_argument('--threads', type=int, default=DEFAULT_PROFILE['threads'], help="threads per scenario")
+    parser.add_argument('--queue-workers', type=int, default=DEFAULT_PROFILE['queue_workers'])
+    parser.add_argument('--users', type=int, default=DEFAULT_PROFILE['users'])
+    parser.add_argument('--accounts', type=int, default=DEFAULT_PROFILE['accounts'])
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help="store this run as the baseline")
+    parser.add_argument('--tolerance', type=float, default=0.5, help="allowed slowdown against the baseline")
+    args = parser.parse_args()
+
+    profile = {
+        'seconds': args.seconds,
+        'users': args.users,
+        'accounts': args.accounts,
+        'threads': args.threads,
+        'queue_workers': args.queue_workers,
+        'rates': {name: getattr(args, f'{name}_rate') for name in DEFAULT_PROFILE['rates']}
+    }
+
+    # Opened here so the suite runs on the temporary database
+    from banking.bootstrap import bootstrap_schema
+    from banking.db_adapter import DatabaseAdapter
+
+    with tempfile.TemporaryDirectory() as tmp:
+        DB_CONFIG['database'] = os.path.join(tmp, 'load.db')
+        try:
+            bootstrap_schema()
+            suite = LoadSuite(profile)
+            suite.set_up()
+            results = suite.run()
+        finally:
+            DatabaseAdapter.close_all()
+
+    print_report(results)
+    if results['invariants']:
+        print("Invariants broken:")
+        for failure in results['invariants']:
+            print(f"  {failure}")
+        return 2
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump({key: results[key] for key in ('profile', 'scenarios', 'memory')}, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; record one with --save-baseline")
+        return 0
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    if regressions:
+        print("Regressions against the baseline:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+    print("No regressions against the baseline")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
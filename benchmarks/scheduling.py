@@ -0,0 +1,122 @@
+"""Transaction scheduling benchmark.
+
+Simulates the transaction queue under a steady mix of high and low
+priority transactions, arriving a little faster than they can be
+processed, on a virtual clock so runs are quick and repeatable, and
+serves it with each TransactionScheduler algorithm in turn. Reports how long transactions of each priority waited and how many
+of each type finished after their SLA deadline (SCHEDULER_CONFIG).
+
+Usage: python benchmarks/scheduling.py [--seconds 600] [--load 1.05] [--service 0.1]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import SCHEDULER_CONFIG
+from banking.storage import MemoryStorage, set_storage
+from os_concepts.scheduling import TransactionScheduler
+
+ACCOUNTS = 200
+START = 1_700_000_000.0
+TYPES = [('DEPOSIT', 0.4), ('WITHDRAWAL', 0.3), ('TRANSFER_OUT', 0.2), ('TRANSFER_IN', 0.1)]
+PRIORITIES = [(8, 0.7), (2, 0.3)]  # Most work is urgent, which is what starves the rest
+
+class SimulatedStorage(MemoryStorage):
+    """MemoryStorage stamping rows with the simulation's clock"""
+    def __init__(self):
+        super().__init__()
+        self.now = START
+
+    def _now(self):
+        return time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(self.now))
+
+def workload(seconds, rate, seed):
+    """(arrival time, account, type, priority) of every transaction, in arrival order"""
+    rng = random.Random(seed)
+    types, type_weights = zip(*TYPES)
+    priorities, priority_weights = zip(*PRIORITIES)
+    arrivals = []
+    t = START
+    while True:
+        t += rng.expovariate(rate)
+        if t >= START + seconds:
+            return arrivals
+        arrivals.append((t, rng.randrange(ACCOUNTS), rng.choices(types, type_weights)[0],
+                         rng.choices(priorities, priority_weights)[0]))
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(fraction * len(values)), len(values) - 1)] if values else 0.0
+
+def run(algorithm, arrivals, service):
+    storage = SimulatedStorage()
+    previous = set_storage(storage)
+    try:
+        account_ids = [storage.create_account(i, f"{i:012d}", 'SAVINGS', 1000.0) for i in range(ACCOUNTS)]
+        scheduler = TransactionScheduler(clock=lambda: storage.now)
+        scheduler.set_scheduling_algorithm(algorithm)
+        pick = scheduler.scheduling_algorithms[algorithm]
+
+        recorded = {}  # transaction_id -> (arrival time, type, priority)
+        waits = {priority: [] for priority, _ in PRIORITIES}
+        missed = {transaction_type: [0, 0] for transaction_type, _ in TYPES}
+        next_arrival = 0
+        while next_arrival < len(arrivals) or len(recorded):
+            # Queue everything that has arrived by now
+            while next_arrival < len(arrivals) and arrivals[next_arrival][0] <= storage.now:
+                arrived, account, transaction_type, priority = arrivals[next_arrival]
+                saved, storage.now = storage.now, arrived
+                transaction_id = storage.record_transaction(account_ids[account], transaction_type, 1.0)
+                storage.now = saved
+                storage.set_queue_priority(transaction_id, priority)
+                recorded[transaction_id] = arrivals[next_arrival][0], transaction_type, priority
+                next_arrival += 1
+
+            transaction = pick()
+            if not transaction or not storage.claim_transaction(transaction['transaction_id']):
+                # Idle until the next arrival
+                if next_arrival < len(arrivals):
+                    storage.now = max(storage.now, arrivals[next_arrival][0])
+                    continue
+                if not recorded:
+                    break
+                storage.now += service
+                continue
+
+            storage.now += service
+            storage.finish_transaction(transaction['transaction_id'], 'COMPLETED')
+            arrived, transaction_type, priority = recorded.pop(transaction['transaction_id'])
+            waits[priority].append(storage.now - arrived)
+            missed[transaction_type][1] += 1
+            if storage.now - arrived > SCHEDULER_CONFIG['sla_seconds'][transaction_type]:
+                missed[transaction_type][0] += 1
+    finally:
+        set_storage(previous)
+
+    wait_text = "   ".join(f"p{priority} mean {sum(w) / max(len(w), 1):6.1f}s p99 {percentile(w, 0.99):6.1f}s "
+                           f"max {max(w, default=0.0):6.1f}s" for priority, w in waits.items())
+    miss_text = "  ".join(f"{transaction_type} {late / max(total, 1):6.1%}"
+                          for transaction_type, (late, total) in missed.items())
+    print(f"{algorithm:<12} {wait_text}")
+    print(f"{'':<12} missed SLA: {miss_text}")
+    return waits, missed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=600.0, help="simulated seconds of arrivals")
+    parser.add_argument('--load', type=float, default=1.05, help="arrival rate as a share of capacity")
+    parser.add_argument('--service', type=float, default=0.1, help="seconds to process a transaction")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    arrivals = workload(args.seconds, args.load / args.service, args.seed)
+    print(f"{len(arrivals)} transactions over {args.seconds:.0f}s, load {args.load:.0%}")
+    for algorithm in ('FIFO', 'PRIORITY', 'ROUND_ROBIN', 'AGING', 'FAIR'):
+        run(algorithm, arrivals, args.service)
+
+if __name__ == '__main__':
+    main()
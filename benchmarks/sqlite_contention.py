@@ -0,0 +1,136 @@
+"""SQLite contention benchmark.
+
+Runs reader threads (dashboard / admin panel style SELECTs) against a
+writer thread (transaction worker style balance updates) for a fixed time,
+first with plain per-call connections on the default rollback journal and
+then with the DatabaseAdapter WAL profile and reader/writer connections.
+
+Usage: python benchmarks/sqlite_contention.py [--seconds 5] [--readers 4]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import DB_CONFIG
+from banking.db_adapter import DatabaseAdapter
+
+ACCOUNTS = 1000
+
+def create_database(path):
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=DELETE")
+    conn.execute("""
+        CREATE TABLE accounts (
+            account_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            account_number TEXT NOT NULL UNIQUE,
+            balance REAL DEFAULT 0.00
+        )
+    """)
+    conn.executemany(
+        "INSERT INTO accounts (user_id, account_number, balance) VALUES (?, ?, 1000.0)",
+        [(i % 100, f"{i:012d}") for i in range(ACCOUNTS)]
+    )
+    conn.commit()
+    conn.close()
+
+def plain_read(path, user_id):
+    conn = sqlite3.connect(path, timeout=0.1)
+    try:
+        return conn.execute("SELECT * FROM accounts WHERE user_id = ?", (user_id,)).fetchall()
+    finally:
+        conn.close()
+
+def plain_write(path, account_number):
+    conn = sqlite3.connect(path, timeout=0.1)
+    try:
+        conn.execute("UPDATE accounts SET balance = balance + 1 WHERE account_number = ?",
+                     (account_number,))
+        conn.commit()
+    finally:
+        conn.close()
+
+def tuned_read(path, user_id):
+    with DatabaseAdapter.reader() as db:
+        return db.execute("SELECT * FROM accounts WHERE user_id = ?", (user_id,)).fetchall()
+
+def tuned_write(path, account_number):
+    with DatabaseAdapter.writer() as db:
+        db.execute("UPDATE accounts SET balance = balance + 1 WHERE account_number = ?",
+                   (account_number,))
+
+def run(label, path, read, write, seconds, readers):
+    stop = threading.Event()
+    counts = {'reads': 0, 'writes': 0, 'locked': 0}
+    counts_lock = threading.Lock()
+
+    def reader_loop(n):
+        reads = locked = 0
+        while not stop.is_set():
+            try:
+                read(path, (n + reads) % 100)
+                reads += 1
+            except sqlite3.OperationalError:
+                locked += 1
+        with counts_lock:
+            counts['reads'] += reads
+            counts['locked'] += locked
+
+    def writer_loop():
+        writes = locked = 0
+        while not stop.is_set():
+            try:
+                write(path, f"{writes % ACCOUNTS:012d}")
+                writes += 1
+            except sqlite3.OperationalError:
+                locked += 1
+        with counts_lock:
+            counts['writes'] += writes
+            counts['locked'] += locked
+
+    threads = [threading.Thread(target=reader_loop, args=(i,)) for i in range(readers)]
+    threads.append(threading.Thread(target=writer_loop))
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    print(f"{label:<28} reads/s {counts['reads'] / seconds:>10.0f}   "
+          f"writes/s {counts['writes'] / seconds:>8.0f}   "
+          f"'database is locked' errors {counts['locked']:>6}")
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--readers', type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        plain_path = os.path.join(tmp, 'plain.db')
+        tuned_path = os.path.join(tmp, 'tuned.db')
+        create_database(plain_path)
+        create_database(tuned_path)
+
+        run("rollback journal, per-call", plain_path, plain_read, plain_write,
+            args.seconds, args.readers)
+
+        original = DB_CONFIG['database']
+        DB_CONFIG['database'] = tuned_path
+        try:
+            run("WAL, reader pool + writer", tuned_path, tuned_read, tuned_write,
+                args.seconds, args.readers)
+        finally:
+            DB_CONFIG['database'] = original
+            DatabaseAdapter.close_all()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Queue worker scaling benchmark.
+
+Fills the transaction queue of a temporary SQLite database with deposits
+and times how fast it is drained by 1, 2, 4, ... worker threads
+(BankingThreads.start_transaction_processors) and worker processes
+(BankingThreads.start_transaction_processes), up to the number of cores.
+
+Usage: python benchmarks/worker_processes.py [--transactions 5000] [--max-workers 8]
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import DB_CONFIG
+from banking.bootstrap import bootstrap_schema
+from banking.db_adapter import DatabaseAdapter
+from banking.storage import SQLiteStorage, set_storage
+from os_concepts.multithreading import BankingThreads
+
+ACCOUNTS = 256
+
+def enqueue(path, count):
+    """Queue count deposits spread over the accounts, in one write"""
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        last = conn.execute("SELECT COALESCE(MAX(transaction_id), 0) FROM transactions").fetchone()[0]
+        conn.executemany(
+            "INSERT INTO transactions (account_id, transaction_type, amount, description) "
+            "VALUES (?, 'DEPOSIT', 1.0, 'benchmark')",
+            [(1 + i % ACCOUNTS,) for i in range(count)]
+        )
+        conn.execute("INSERT INTO transaction_queue (transaction_id) "
+                     "SELECT transaction_id FROM transactions WHERE transaction_id > ? ORDER BY transaction_id",
+                     (last,))
+        conn.commit()
+    finally:
+        conn.close()
+
+def drain(path):
+    """Wait until nothing is queued or being processed"""
+    conn = sqlite3.connect(path, timeout=30)
+    try:
+        while conn.execute("SELECT COUNT(*) FROM transaction_queue "
+                           "WHERE status IN ('QUEUED', 'PROCESSING')").fetchone()[0]:
+            time.sleep(0.01)
+    finally:
+        conn.close()
+
+def run(path, mode, workers, transactions):
+    manager = BankingThreads()
+    if mode == 'processes':
+        manager.start_transaction_processes(workers)
+        # Let every process start up (imports, connections) before timing
+        enqueue(path, ACCOUNTS)
+        manager.wake_processes()
+        drain(path)
+    else:
+        manager.start_transaction_processors(workers)
+
+    start = time.perf_counter()
+    enqueue(path, transactions)
+    manager.wake_processes()
+    drain(path)
+    elapsed = time.perf_counter() - start
+    manager.stop_all()
+    return transactions / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--transactions', type=int, default=5000)
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    counts = [1]
+    while counts[-1] * 2 <= args.max_workers:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != args.max_workers:
+        counts.append(args.max_workers)
+
+    print(f"{args.transactions} deposits, {os.cpu_count()} cores")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'bench.db')
+        original = DB_CONFIG['database']
+        DB_CONFIG['database'] = path
+        previous = set_storage(SQLiteStorage())
+        try:
+            with patch('security.hashing.generate_hash', return_value=('salt', 'hash')):
+                bootstrap_schema()
+            storage = SQLiteStorage()
+            for i in range(ACCOUNTS):
+                storage.create_account(1, f"{i:012d}", 'SAVINGS', 0.0)
+
+            for mode in ('threads', 'processes'):
+                baseline = None
+                for workers in counts:
+                    rate = run(path, mode, workers, args.transactions)
+                    baseline = baseline or rate
+                    print(f"{mode:<10} {workers:>3} workers   {rate:>8.0f} transactions/s   "
+                          f"x{rate / baseline:.2f}")
+        finally:
+            set_storage(previous)
+            DB_CONFIG['database'] = original
+            DatabaseAdapter.close_all()
+
+if __name__ == '__main__':
+    main()
@@ -15,12 +15,31 @@ MYSQL_CONFIG = {
     'user': 'root',
     'password': '',
     'database': 'smart_banking',
-    'port': 3306
+    'port': 3306,
+    # Sessions run in UTC, like SQLite's CURRENT_TIMESTAMP, so every timestamp
+    # the app stores and reads back (queue ages, SLA deadlines, key expiry) is UTC
+    'time_zone': '+00:00'
 }
 
 # Use the appropriate database configuration
 DB_CONFIG = SQLITE_CONFIG if DB_TYPE == 'sqlite' else MYSQL_CONFIG
 
+# Storage backend used by the banking managers: 'sqlite', 'mysql' or 'memory'
+# ('memory' keeps everything in process, for tests and benchmarks)
+STORAGE_BACKEND = DB_TYPE
+
+# SQLite tuning profile applied to every connection opened by the DB adapter
+SQLITE_TUNING = {
+    'journal_mode': 'WAL',  # Readers no longer block the writer (and vice versa)
+    'synchronous': 'NORMAL',
+    'busy_timeout_ms': 5000,  # Wait for locks instead of failing with "database is locked"
+    'cache_size_kb': 16384,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+    'statement_cache_size': 256,  # Parsed statements kept per connection
+    'read_pool_size': 4  # Read-only connections shared by reader threads
+}
+
 # Application settings
 APP_CONFIG = {
     'secret_key': 'your-secret-key-here',  # For session management
@@ -29,6 +48,137 @@ APP_CONFIG = {
     'max_login_attempts': 3
 }
 
+# Group commit settings (opt-in batching of transaction and transfer writes)
+GROUP_COMMIT_CONFIG = {
+    'enabled': False,
+    'flush_interval_ms': 5,  # Longest a write waits for its batch to fill
+    'max_batch_size': 100  # Flush as soon as this many writes are queued
+}
+
+# Query instrumentation settings
+INSTRUMENTATION_CONFIG = {
+    'enabled': True,
+    'slow_query_ms': 100,  # Queries slower than this are logged with a stack fingerprint
+    'slow_log_size': 200  # Most recent slow queries kept for the diagnostics tab
+}
+
+# Idempotency keys for payments (duplicate suppression)
+IDEMPOTENCY_CONFIG = {
+    'ttl_seconds': 86400,  # How long a completed payment answers retries of its key
+    'lease_seconds': 120,  # How long a reservation counts as in flight (a crashed request holds it no longer)
+    'cache_size': 10000  # Recent results kept in memory in front of the table
+}
+
+# Bank account verification (simulated micro-deposits)
+VERIFICATION_CONFIG = {
+    'workers': 4,  # Verifications running at the same time
+    'max_attempts': 5,  # Attempts before a job is marked FAILED
+    'retry_base_delay': 2.0,  # Seconds before the first retry; doubles per attempt
+    'retry_max_delay': 60.0,
+    'simulated_delay': 1.0  # Seconds the simulated provider takes to send deposits
+}
+
+# Account provisioning (account number allocation and bulk creation)
+PROVISIONING_CONFIG = {
+    'number_key': 'change-this-permutation-key',  # Keys the account number permutation; never change it once used
+    'block_size': 100,  # Sequence values reserved per round trip by single account creation
+    'chunk_size': 5000  # Accounts inserted per transaction by bulk provisioning
+}
+
+# Data export (transfer history, transaction ledger and queue)
+EXPORT_CONFIG = {
+    'batch_size': 5000  # Rows fetched from the cursor and written at a time
+}
+
+# Bulk import of historical transactions and transfers
+IMPORT_CONFIG = {
+    'chunk_size': 50000,  # Records validated and inserted per transaction
+    'drop_indexes': True  # Drop secondary indexes during the load and rebuild them after
+}
+
+# Incremental readers of transfer_history and transactions (reconciliation, analytics).
+# On MySQL a lower auto-increment id can commit after a higher one, so a reader
+# stops at a missing id until the row after it is this old: by then the missing
+# one was rolled back rather than still being written
+HISTORY_SCAN_CONFIG = {
+    'settle_seconds': 60
+}
+
+# Balance reconciliation
+RECONCILIATION_CONFIG = {
+    'batch_size': 100000,  # History rows read and summed per batch
+    'report_limit': 100  # Largest discrepancies listed in a report
+}
+
+# Transfer analytics rollups
+ANALYTICS_CONFIG = {
+    'batch_size': 10000,  # Transfer history rows rolled up per transaction
+    'delay': 1.0,  # Seconds to let a burst of transfers accumulate before rolling up
+    'top_payees': 5,  # Payees shown on the dashboard
+    'trend_periods': 7  # Days of spending trend shown on the dashboard
+}
+
+# Risk scoring of queued transactions (suspicious debits are HELD for review)
+RISK_CONFIG = {
+    'enabled': True,
+    'batch_size': 1000,  # Queued transactions claimed and scored together by a queue worker
+    'velocity_window': 60,  # Seconds over which an account's transactions are counted
+    'max_velocity': 10,  # Transactions per window; debits beyond it are held
+    'history_size': 32,  # Recent debits per account the amount z-score is taken against
+    'min_history': 5,  # Debits an account needs before its z-score counts
+    'min_amount': 100.0,  # Smaller debits are never held for their amount
+    'zscore_threshold': 4.0,
+    'min_spread': 0.1,  # Standard deviation floor, as a fraction of the mean debit
+    'warm_rows': 100000  # Recent completed transactions the scorer starts from
+}
+
+# Transaction scheduling (AGING and FAIR policies)
+SCHEDULER_CONFIG = {
+    'aging_interval': 10.0,  # Seconds of waiting that raise a transaction's priority by one
+    'sla_seconds': {  # How long each transaction type may wait in the queue
+        'TRANSFER_OUT': 30.0,
+        'WITHDRAWAL': 60.0,
+        'TRANSFER_IN': 300.0,
+        'DEPOSIT': 300.0
+    },
+    'sla_guard': 5.0,  # Serve work this close to its deadline before anything else
+    'refill_interval': 0.5,  # Seconds between reads of newly queued transactions
+    'refill_size': 1000,  # Newly queued transactions read at a time
+    'account_weights': {  # Share of the workers each account of a type gets under FAIR
+        'BUSINESS': 4.0,
+        'CHECKING': 2.0,
+        'SAVINGS': 1.0
+    },
+    'quantum': 1.0,  # Transactions a weight 1 account may run per FAIR round
+    'fairness_window': 1000  # Recent FAIR picks the fairness metrics cover
+}
+
+# Async service layer (banking.service)
+SERVICE_CONFIG = {
+    'db_threads': 4,  # Threads running blocking storage calls for the coroutines
+    'max_in_flight': 256  # Operations running or waiting for a thread; more wait as coroutines
+}
+
+# Headless HTTP/JSON API (server.py)
+API_CONFIG = {
+    'host': '127.0.0.1',  # Local only: the API is for integrations and load tests on this machine
+    'port': 8080,
+    'workers': 8,  # Threads running banking calls for the requests
+    'max_in_flight': 512,  # Requests running or waiting for a worker; more wait as coroutines
+    'keepalive_timeout': 15.0,  # Seconds an idle keep-alive connection stays open
+    'max_body': 64 * 1024,  # Largest request body accepted, in bytes
+    'backlog': 1024  # Connections waiting to be accepted
+}
+
+# Queue worker processes (BankingThreads.start_transaction_processes)
+WORKER_PROCESS_CONFIG = {
+    'processes': None,  # Worker processes to run (None for one per CPU core)
+    'idle_poll': 1.0,  # Seconds an idle worker waits for a wakeup before checking the queue anyway
+    'supervise_interval': 1.0,  # Seconds between checks that every worker is still running
+    'stop_timeout': 5.0,  # Seconds a worker gets to finish its batch when stopping
+    'claim_timeout': 300.0  # Seconds after which a claimed transaction that never finished is queued again
+}
+
 # Path configurations
 BASE_DIR = Path(__file__).parent
 
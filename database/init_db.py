@@ -1,100 +1,68 @@
 import mysql.connector
+import argparse
 import os
 import sys
-import time
 
 # Add parent directory to path to fix imports
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config import DB_CONFIG
+from banking.bootstrap import bootstrap_schema, wait_for_database
 
-def initialize_database():
-    # Give MySQL time to fully start up
-    print("Waiting for MySQL to start...")
-    time.sleep(5)
-    
-    # First try to connect without specifying a database
+def initialize_database(recreate=False, timeout=30.0):
+    """Create the MySQL database (if needed) and bootstrap its schema"""
+    # First connect without specifying a database
     connection_config = DB_CONFIG.copy()
-    if 'database' in connection_config:
-        del connection_config['database']
-    
-    max_retries = 3
-    retry_count = 0
-    
-    while retry_count < max_retries:
-        try:
-            print(f"Connecting to MySQL (attempt {retry_count + 1}/{max_retries})...")
-            conn = mysql.connector.connect(**connection_config)
-            cursor = conn.cursor()
-            
-            print("Connected to MySQL successfully.")
-            
-            # Check if database exists
-            cursor.execute("SHOW DATABASES LIKE 'smart_banking'")
-            result = cursor.fetchone()
-            
-            if result:
-                print("Database 'smart_banking' already exists.")
-                choice = input("Do you want to recreate it? (y/n): ").strip().lower()
-                if choice == 'y':
-                    cursor.execute("DROP DATABASE smart_banking")
-                    print("Existing database dropped.")
-                else:
-                    print("Using existing database.")
-                    conn.database = 'smart_banking'
-                    return
-            
-            # Create database
-            cursor.execute("CREATE DATABASE smart_banking")
-            print("Database 'smart_banking' created successfully.")
-            
-            # Use the new database
-            cursor.execute("USE smart_banking")
-            conn.database = 'smart_banking'
-            
-            # Create tables
-            schema_path = os.path.join(os.path.dirname(__file__), 'banking_schema.sql')
-            with open(schema_path, 'r') as f:
-                sql_script = f.read()
-                # Split the script by semicolons to execute each statement separately
-                statements = sql_script.split(';')
-                for statement in statements:
-                    if statement.strip():
-                        cursor.execute(statement)
-            
-            conn.commit()
-            print("Tables created successfully.")
-            
-            # Create admin user
-            from security.hashing import generate_hash
-            salt, password_hash = generate_hash("admin123")
-            cursor.execute("""
-                INSERT INTO users (username, password_hash, salt, full_name, email, is_admin)
-                VALUES (%s, %s, %s, %s, %s, TRUE)
-            """, ("admin", password_hash, salt, "Administrator", "admin@bank.com"))
-            conn.commit()
-            print("Admin user created successfully.")
-            
-            return True
-            
-        except mysql.connector.Error as err:
-            print(f"Database error: {err}")
-            retry_count += 1
-            if retry_count < max_retries:
-                print(f"Retrying in 5 seconds...")
-                time.sleep(5)
-            else:
-                print("Maximum retry attempts reached. Could not connect to MySQL.")
-                return False
-                
-        finally:
-            if 'conn' in locals() and conn.is_connected():
-                cursor.close()
-                conn.close()
-                print("MySQL connection closed.")
+    database = connection_config.pop('database', 'smart_banking')
+
+    def probe():
+        mysql.connector.connect(**connection_config).close()
+
+    # Poll until MySQL accepts connections instead of sleeping a fixed time
+    print("Waiting for MySQL to start...")
+    try:
+        attempts = wait_for_database(timeout=timeout, probe=probe)
+    except mysql.connector.Error as err:
+        print(f"Could not connect to MySQL within {timeout:.0f} seconds: {err}")
+        return False
+    print(f"Connected to MySQL successfully (attempt {attempts}).")
+
+    conn = mysql.connector.connect(**connection_config)
+    cursor = conn.cursor()
+    try:
+        if recreate:
+            cursor.execute(f"DROP DATABASE IF EXISTS `{database}`")
+            print(f"Existing database '{database}' dropped.")
+        cursor.execute(f"CREATE DATABASE IF NOT EXISTS `{database}`")
+    except mysql.connector.Error as err:
+        print(f"Database error: {err}")
+        return False
+    finally:
+        cursor.close()
+        conn.close()
+
+    # Tables and the admin user (skipped when the schema is already current)
+    try:
+        applied = bootstrap_schema()
+    except mysql.connector.Error as err:
+        print(f"Database error: {err}")
+        return False
+
+    if applied:
+        print(f"Applied {applied} schema migration(s).")
+    else:
+        print("Schema is already up to date.")
+    return True
 
 if __name__ == "__main__":
-    success = initialize_database()
+    parser = argparse.ArgumentParser(description="Initialize the Smart Banking MySQL database")
+    parser.add_argument('--recreate', action='store_true',
+                        help="drop and recreate the database if it already exists")
+    parser.add_argument('--timeout', type=float, default=30.0,
+                        help="seconds to wait for MySQL to accept connections")
+    args = parser.parse_args()
+
+    success = initialize_database(recreate=args.recreate, timeout=args.timeout)
     if success:
         print("Database initialization completed successfully.")
     else:
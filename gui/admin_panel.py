@@ -3,25 +3,53 @@ from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel,
                             QTableWidgetItem, QHeaderView, QMessageBox , QLineEdit , QInputDialog  )
 from PyQt5.QtCore import Qt, pyqtSignal
 from banking.accounts import AccountManager
-from os_concepts.scheduling import TransactionScheduler
-from os_concepts.multithreading import BankingThreads
 from PyQt5.QtWidgets import QComboBox  # Missing in your imports
-import mysql.connector
-import sqlite3
-from config import DB_CONFIG, DB_TYPE
+from PyQt5.QtWidgets import QFileDialog
+from PyQt5.QtWidgets import QCheckBox
+import threading
+from banking.storage import get_storage
+from banking.transactions import TransactionManager
+from banking.instrumentation import query_monitor
+from banking.idempotency import idempotency_store
+from banking.export import FORMATS, TABLES, ExportCancelled, export_table
 
 class AdminPanel(QWidget):
     logout_requested = pyqtSignal()
+    # Emitted from the export thread; delivered on the GUI thread
+    export_progress = pyqtSignal(int)
+    export_finished = pyqtSignal(bool, str)
     
     def __init__(self, parent):
         super().__init__(parent)
         self.parent = parent
         self.account_manager = AccountManager()
-        self.scheduler = TransactionScheduler()
-        self.thread_manager = BankingThreads()
+        self.export_thread = None
+        self.export_cancel = threading.Event()
+        self.export_progress.connect(self.on_export_progress)
+        self.export_finished.connect(self.on_export_finished)
+        # The scheduler and worker threads are created on first use
+        self._scheduler = None
+        self._thread_manager = None
+        self.held = []  # Rows of the held transactions table
         self.init_ui()
         self.load_data()
     
+    @property
+    def scheduler(self):
+        """Transaction scheduler (imported and created on first use)"""
+        if self._scheduler is None:
+            from os_concepts.scheduling import TransactionScheduler
+            self._scheduler = TransactionScheduler()
+        return self._scheduler
+    
+    @property
+    def thread_manager(self):
+        """Transaction processing threads (imported and created on first use)"""
+        if self._thread_manager is None:
+            from os_concepts.multithreading import BankingThreads
+            self._thread_manager = BankingThreads()
+        return self._thread_manager
+    
     def init_ui(self):
         """Initialize the admin panel UI"""
         self.layout = QVBoxLayout()
@@ -51,6 +79,16 @@ class AdminPanel(QWidget):
         self.init_os_tab()
         self.tabs.addTab(self.os_tab, "OS Concepts Demo")
         
+        # Diagnostics Tab
+        self.diagnostics_tab = QWidget()
+        self.init_diagnostics_tab()
+        self.tabs.addTab(self.diagnostics_tab, "Diagnostics")
+        
+        # Data Export Tab
+        self.export_tab = QWidget()
+        self.init_export_tab()
+        self.tabs.addTab(self.export_tab, "Data Export")
+        
         # Logout button
         logout_btn = QPushButton("Logout")
         logout_btn.clicked.connect(self.logout_requested.emit)
@@ -101,6 +139,30 @@ class AdminPanel(QWidget):
         self.queue_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         layout.addWidget(self.queue_table)
         
+        # Transactions held by risk scoring, waiting for review
+        layout.addWidget(QLabel("Held for Review"))
+        self.held_table = QTableWidget()
+        self.held_table.setColumnCount(6)
+        self.held_table.setHorizontalHeaderLabels([
+            "Transaction ID", "Account", "Type", "Amount", "Reason", "Held At"
+        ])
+        self.held_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.held_table.setSelectionBehavior(QTableWidget.SelectRows)
+        layout.addWidget(self.held_table)
+        
+        review = QWidget()
+        review_layout = QHBoxLayout()
+        review.setLayout(review_layout)
+        
+        approve_btn = QPushButton("Approve")
+        approve_btn.clicked.connect(lambda: self.review_held(True))
+        reject_btn = QPushButton("Reject")
+        reject_btn.clicked.connect(lambda: self.review_held(False))
+        
+        review_layout.addWidget(approve_btn)
+        review_layout.addWidget(reject_btn)
+        layout.addWidget(review)
+        
         # System controls
         controls = QWidget()
         controls_layout = QHBoxLayout()
@@ -113,8 +175,12 @@ class AdminPanel(QWidget):
         self.stop_btn.clicked.connect(self.stop_processing)
         self.stop_btn.setEnabled(False)
         
+        # Worker processes use every core, threads share one
+        self.processes_check = QCheckBox("Use worker processes")
+        
         controls_layout.addWidget(self.start_btn)
         controls_layout.addWidget(self.stop_btn)
+        controls_layout.addWidget(self.processes_check)
         
         layout.addWidget(controls)
     
@@ -131,7 +197,7 @@ class AdminPanel(QWidget):
         scheduling_layout.addWidget(QLabel("Scheduling Algorithm:"))
         
         self.algorithm_combo = QComboBox()
-        self.algorithm_combo.addItems(["FIFO", "PRIORITY", "ROUND_ROBIN"])
+        self.algorithm_combo.addItems(["FIFO", "PRIORITY", "ROUND_ROBIN", "AGING", "FAIR"])
         scheduling_layout.addWidget(self.algorithm_combo)
         
         self.set_algorithm_btn = QPushButton("Set Algorithm")
@@ -140,6 +206,20 @@ class AdminPanel(QWidget):
         
         layout.addWidget(scheduling_group)
         
+        # How evenly FAIR scheduling shares the workers between accounts
+        fairness_group = QWidget()
+        fairness_layout = QHBoxLayout()
+        fairness_group.setLayout(fairness_layout)
+        
+        self.fairness_label = QLabel("Fairness: no picks yet")
+        fairness_layout.addWidget(self.fairness_label)
+        
+        fairness_btn = QPushButton("Refresh Fairness")
+        fairness_btn.clicked.connect(self.load_fairness)
+        fairness_layout.addWidget(fairness_btn)
+        
+        layout.addWidget(fairness_group)
+        
         # Demo buttons
         demo_group = QWidget()
         demo_layout = QHBoxLayout()
@@ -156,11 +236,218 @@ class AdminPanel(QWidget):
         
         layout.addWidget(demo_group)
     
+    def init_diagnostics_tab(self):
+        """Initialize the query diagnostics tab"""
+        layout = QVBoxLayout()
+        self.diagnostics_tab.setLayout(layout)
+        
+        # Per-query statistics
+        layout.addWidget(QLabel("Query Statistics"))
+        self.query_stats_table = QTableWidget()
+        self.query_stats_table.setColumnCount(9)
+        self.query_stats_table.setHorizontalHeaderLabels([
+            "Query", "Calls", "Errors", "Rows", "Avg (ms)", "p95 (ms)", "p99 (ms)", "Max (ms)", "Avg Wait (ms)"
+        ])
+        self.query_stats_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        layout.addWidget(self.query_stats_table)
+        
+        # Slow query log
+        layout.addWidget(QLabel("Slow Queries"))
+        self.slow_queries_table = QTableWidget()
+        self.slow_queries_table.setColumnCount(6)
+        self.slow_queries_table.setHorizontalHeaderLabels([
+            "At", "Query", "Elapsed (ms)", "Params", "Location", "Fingerprint"
+        ])
+        self.slow_queries_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        layout.addWidget(self.slow_queries_table)
+        
+        # Duplicate payment suppression
+        self.idempotency_label = QLabel()
+        layout.addWidget(self.idempotency_label)
+        
+        # Diagnostics actions
+        actions = QWidget()
+        actions_layout = QHBoxLayout()
+        actions.setLayout(actions_layout)
+        
+        refresh_btn = QPushButton("Refresh")
+        refresh_btn.clicked.connect(self.load_diagnostics)
+        
+        export_btn = QPushButton("Export JSON")
+        export_btn.clicked.connect(self.export_diagnostics)
+        
+        reset_btn = QPushButton("Reset")
+        reset_btn.clicked.connect(self.reset_diagnostics)
+        
+        actions_layout.addWidget(refresh_btn)
+        actions_layout.addWidget(export_btn)
+        actions_layout.addWidget(reset_btn)
+        
+        layout.addWidget(actions)
+    
+    def init_export_tab(self):
+        """Initialize the data export tab"""
+        layout = QVBoxLayout()
+        self.export_tab.setLayout(layout)
+        
+        # What to export
+        source = QWidget()
+        source_layout = QHBoxLayout()
+        source.setLayout(source_layout)
+        
+        source_layout.addWidget(QLabel("Table:"))
+        self.export_table_combo = QComboBox()
+        self.export_table_combo.addItems(list(TABLES))
+        source_layout.addWidget(self.export_table_combo)
+        
+        source_layout.addWidget(QLabel("Format:"))
+        self.export_format_combo = QComboBox()
+        self.export_format_combo.addItems(list(FORMATS))
+        source_layout.addWidget(self.export_format_combo)
+        
+        layout.addWidget(source)
+        
+        # Filters
+        filters = QWidget()
+        filters_layout = QHBoxLayout()
+        filters.setLayout(filters_layout)
+        
+        self.export_since_input = QLineEdit()
+        self.export_since_input.setPlaceholderText("From (YYYY-MM-DD)")
+        self.export_until_input = QLineEdit()
+        self.export_until_input.setPlaceholderText("To (YYYY-MM-DD)")
+        self.export_account_input = QLineEdit()
+        self.export_account_input.setPlaceholderText("Account number (optional)")
+        
+        filters_layout.addWidget(self.export_since_input)
+        filters_layout.addWidget(self.export_until_input)
+        filters_layout.addWidget(self.export_account_input)
+        
+        layout.addWidget(filters)
+        
+        self.export_status_label = QLabel("No export running")
+        layout.addWidget(self.export_status_label)
+        
+        # Export actions
+        actions = QWidget()
+        actions_layout = QHBoxLayout()
+        actions.setLayout(actions_layout)
+        
+        self.export_btn = QPushButton("Export...")
+        self.export_btn.clicked.connect(self.start_export)
+        
+        self.cancel_export_btn = QPushButton("Cancel")
+        self.cancel_export_btn.clicked.connect(self.export_cancel.set)
+        self.cancel_export_btn.setEnabled(False)
+        
+        actions_layout.addWidget(self.export_btn)
+        actions_layout.addWidget(self.cancel_export_btn)
+        
+        layout.addWidget(actions)
+        layout.addStretch()
+    
+    def start_export(self):
+        """Ask for a file and export the selected table to it in the background"""
+        table = self.export_table_combo.currentText()
+        fmt = self.export_format_combo.currentText()
+        path, _ = QFileDialog.getSaveFileName(self, "Export Data", f"{table}.{fmt}",
+                                              f"{fmt.upper()} Files (*.{fmt})")
+        if not path:
+            return
+        
+        filters = (self.export_since_input.text().strip(), self.export_until_input.text().strip(),
+                   self.export_account_input.text().strip())
+        
+        self.export_cancel.clear()
+        self.export_btn.setEnabled(False)
+        self.cancel_export_btn.setEnabled(True)
+        self.export_status_label.setText(f"Exporting {table}...")
+        
+        self.export_thread = threading.Thread(target=self.run_export, args=(table, path, fmt) + filters,
+                                              daemon=True, name="Export")
+        self.export_thread.start()
+    
+    def run_export(self, table, path, fmt, since, until, account_number):
+        """Export thread: stream the table to the file and report back through signals"""
+        try:
+            rows = export_table(table, path, fmt, since, until, account_number,
+                                progress=self.export_progress.emit, cancelled=self.export_cancel.is_set)
+            self.export_finished.emit(True, f"Exported {rows} rows to {path}")
+        except ExportCancelled:
+            self.export_finished.emit(False, "Export cancelled")
+        except Exception as e:
+            self.export_finished.emit(False, f"Export failed: {str(e)}")
+    
+    def on_export_progress(self, rows):
+        self.export_status_label.setText(f"Exported {rows} rows so far...")
+    
+    def on_export_finished(self, success, message):
+        self.export_btn.setEnabled(True)
+        self.cancel_export_btn.setEnabled(False)
+        self.export_status_label.setText(message)
+        if success:
+            self.parent.show_info(message)
+        else:
+            self.parent.show_error(message)
+    
+    def load_diagnostics(self):
+        """Load query statistics and the slow query log into the tables"""
+        stats = query_monitor.get_stats()
+        self.query_stats_table.setRowCount(len(stats))
+        
+        for row, query in enumerate(stats):
+            values = [
+                query['name'], query['calls'], query['errors'], query['rows'],
+                f"{query['avg_ms']:.2f}", f"{query['p95_ms']:.2f}", f"{query['p99_ms']:.2f}",
+                f"{query['max_ms']:.2f}", f"{query['avg_wait_ms']:.2f}"
+            ]
+            for col, value in enumerate(values):
+                self.query_stats_table.setItem(row, col, QTableWidgetItem(str(value)))
+        
+        slow_queries = query_monitor.get_slow_queries()
+        self.slow_queries_table.setRowCount(len(slow_queries))
+        
+        for row, entry in enumerate(slow_queries):
+            values = [
+                entry['at'], entry['name'], f"{entry['elapsed_ms']:.1f}",
+                ", ".join(entry['params']), entry['location'], entry['fingerprint']
+            ]
+            for col, value in enumerate(values):
+                self.slow_queries_table.setItem(row, col, QTableWidgetItem(str(value)))
+        
+        metrics = idempotency_store.get_metrics()
+        self.idempotency_label.setText(
+            f"Payments: {metrics['requests']} keyed requests, {metrics['executed']} executed, "
+            f"{metrics['duplicates_suppressed']} duplicates suppressed "
+            f"({metrics['in_flight_rejected']} while in flight)"
+        )
+    
+    def export_diagnostics(self):
+        """Export query statistics as JSON"""
+        path, _ = QFileDialog.getSaveFileName(self, "Export Query Statistics",
+                                              "query_stats.json", "JSON Files (*.json)")
+        if not path:
+            return
+        
+        try:
+            query_monitor.export_json(path)
+            self.parent.show_info(f"Query statistics exported to {path}")
+        except Exception as e:
+            self.parent.show_error(f"Failed to export query statistics: {str(e)}")
+    
+    def reset_diagnostics(self):
+        """Clear query statistics"""
+        query_monitor.reset()
+        idempotency_store.reset_metrics()
+        self.load_diagnostics()
+    
     def load_data(self):
         """Load data into the admin tables"""
         try:
             self.load_users()
             self.load_transaction_queue()
+            self.load_held_transactions()
+            self.load_diagnostics()
         except Exception as e:
             self.parent.show_error(f"Failed to load data: {str(e)}")
             # Consider logging the full traceback
@@ -168,37 +455,7 @@ class AdminPanel(QWidget):
     def load_users(self):
         """Load all users into the table"""
         try:
-            if DB_TYPE == 'sqlite':
-                # SQLite connection
-                conn = sqlite3.connect(DB_CONFIG['database'])
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                
-                cursor.execute("""
-                    SELECT u.user_id, u.username, u.full_name, u.email, 
-                           COUNT(a.account_id) as account_count
-                    FROM users u
-                    LEFT JOIN accounts a ON u.user_id = a.user_id
-                    GROUP BY u.user_id
-                    ORDER BY u.user_id
-                """)
-                
-                users = cursor.fetchall()
-            else:
-                # MySQL connection
-                conn = mysql.connector.connect(**DB_CONFIG)
-                cursor = conn.cursor(dictionary=True)
-                
-                cursor.execute("""
-                    SELECT u.user_id, u.username, u.full_name, u.email, 
-                           COUNT(a.account_id) as account_count
-                    FROM users u
-                    LEFT JOIN accounts a ON u.user_id = a.user_id
-                    GROUP BY u.user_id
-                    ORDER BY u.user_id
-                """)
-                
-                users = cursor.fetchall()
+            users = get_storage().list_users()
             
             self.users_table.setRowCount(len(users))
             
@@ -211,46 +468,11 @@ class AdminPanel(QWidget):
         
         except Exception as err:
             self.parent.show_error(f"Failed to load users: {err}")
-        finally:
-            cursor.close()
-            conn.close()
     
     def load_transaction_queue(self):
         """Load the transaction queue into the table"""
         try:
-            if DB_TYPE == 'sqlite':
-                # SQLite connection
-                conn = sqlite3.connect(DB_CONFIG['database'])
-                conn.row_factory = sqlite3.Row
-                cursor = conn.cursor()
-                
-                cursor.execute("""
-                    SELECT q.queue_id, q.transaction_id, a.account_number, 
-                           t.amount, q.status, q.added_at
-                    FROM transaction_queue q
-                    JOIN transactions t ON q.transaction_id = t.transaction_id
-                    JOIN accounts a ON t.account_id = a.account_id
-                    ORDER BY q.added_at DESC
-                    LIMIT 50
-                """)
-                
-                queue_items = cursor.fetchall()
-            else:
-                # MySQL connection
-                conn = mysql.connector.connect(**DB_CONFIG)
-                cursor = conn.cursor(dictionary=True)
-                
-                cursor.execute("""
-                    SELECT q.queue_id, q.transaction_id, a.account_number, 
-                           t.amount, q.status, q.added_at
-                    FROM transaction_queue q
-                    JOIN transactions t ON q.transaction_id = t.transaction_id
-                    JOIN accounts a ON t.account_id = a.account_id
-                    ORDER BY q.added_at DESC
-                    LIMIT 50
-                """)
-                
-                queue_items = cursor.fetchall()
+            queue_items = get_storage().recent_queue(50)
             
             self.queue_table.setRowCount(len(queue_items))
             
@@ -264,17 +486,57 @@ class AdminPanel(QWidget):
         
         except Exception as err:
             self.parent.show_error(f"Failed to load transaction queue: {err}")
-        finally:
-            cursor.close()
-            conn.close()
+    
+    def load_held_transactions(self):
+        """Load the transactions held for review into the table"""
+        try:
+            self.held = get_storage().list_held(50)
+            
+            self.held_table.setRowCount(len(self.held))
+            
+            for row, item in enumerate(self.held):
+                self.held_table.setItem(row, 0, QTableWidgetItem(str(item['transaction_id'])))
+                self.held_table.setItem(row, 1, QTableWidgetItem(item['account_number']))
+                self.held_table.setItem(row, 2, QTableWidgetItem(item['transaction_type']))
+                self.held_table.setItem(row, 3, QTableWidgetItem(f"${item['amount']:.2f}"))
+                self.held_table.setItem(row, 4, QTableWidgetItem(item['reason']))
+                self.held_table.setItem(row, 5, QTableWidgetItem(str(item['held_at'])))
+        
+        except Exception as err:
+            self.parent.show_error(f"Failed to load held transactions: {err}")
+    
+    def review_held(self, approve):
+        """Approve or reject the selected held transaction"""
+        row = self.held_table.currentRow()
+        if row < 0 or row >= len(self.held):
+            self.parent.show_error("Select a held transaction first")
+            return
+        
+        transaction = self.held[row]
+        try:
+            status = TransactionManager.review_transaction(transaction, approve)
+        except Exception as err:
+            self.parent.show_error(f"Failed to review transaction: {err}")
+            return
+        
+        if status is None:
+            self.parent.show_error("The transaction is no longer held")
+        else:
+            self.parent.show_info(f"Transaction {transaction['transaction_id']} {status.lower()}")
+        self.load_transaction_queue()
+        self.load_held_transactions()
     
     def start_processing(self):
         """Start processing transactions"""
         try:
-            self.thread_manager.start_transaction_processors(3)
+            if self.processes_check.isChecked():
+                self.thread_manager.start_transaction_processes()
+            else:
+                self.thread_manager.start_transaction_processors(3)
             self.scheduler.start_scheduler()
             self.start_btn.setEnabled(False)
             self.stop_btn.setEnabled(True)
+            self.processes_check.setEnabled(False)
             self.status_label.setText("System Status: Processing transactions")
             self.status_label.setStyleSheet("font-size: 14px; font-weight: bold; color: green;")
             self.parent.show_info("Transaction processing started")
@@ -294,6 +556,7 @@ class AdminPanel(QWidget):
             self.scheduler.stop_scheduler()
             self.start_btn.setEnabled(True)
             self.stop_btn.setEnabled(False)
+            self.processes_check.setEnabled(True)
             self.status_label.setText("System Status: Idle")
             self.status_label.setStyleSheet("font-size: 14px; font-weight: bold; color: gray;")
             self.parent.show_info("Transaction processing stopped")
@@ -308,6 +571,19 @@ class AdminPanel(QWidget):
         else:
             self.parent.show_error("Failed to set scheduling algorithm")
     
+    def load_fairness(self):
+        """Show the fairness metrics of FAIR scheduling"""
+        metrics = self.scheduler.fairness_metrics()
+        if not metrics['picks']:
+            self.fairness_label.setText("Fairness: no picks yet")
+            return
+        self.fairness_label.setText(
+            f"Fairness: {metrics['fairness']:.2f} over the last {metrics['picks']} picks "
+            f"({metrics['accounts']} accounts) | Busiest account ID: {metrics['top_account']} "
+            f"({metrics['top_share']:.0%}) | Waiting: {metrics['queued']} transactions, "
+            f"{metrics['waiting_accounts']} accounts"
+        )
+    
     def run_concurrent_demo(self):
         """Run the concurrent transfers demo"""
         self.thread_manager.start_concurrent_transfers_demo()
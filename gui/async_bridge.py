@@ -0,0 +1,70 @@
+# asyncio bridge for the GUI
+#
+# With the optional qasync package installed, main.py runs the Qt
+# application on a qasync QEventLoop, so banking.service coroutines run on
+# the GUI thread's own event loop (and async slots can await them
+# directly). Without it, they run on an event loop in a background thread.
+# Either way submit() hands the result to its callback on the GUI thread.
+import asyncio
+import threading
+from PyQt5.QtCore import QObject, pyqtSignal
+
+_qt_loop = None
+
+def install_event_loop(app):
+    """Make a qasync event loop around app the asyncio loop of the GUI thread.
+
+    Returns the loop (run it with loop.run_forever() instead of app.exec_()),
+    or None if qasync is not installed.
+    """
+    global _qt_loop
+    try:
+        import qasync
+    except ImportError:
+        return None
+    _qt_loop = qasync.QEventLoop(app)
+    asyncio.set_event_loop(_qt_loop)
+    return _qt_loop
+
+class AsyncBridge(QObject):
+    """Runs coroutines for widgets and calls back on the GUI thread"""
+    finished = pyqtSignal(object, object, object)  # callback, result, error
+
+    def __init__(self):
+        super().__init__()
+        self.loop = None
+        self.finished.connect(self._deliver)
+
+    def _background_loop(self):
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+            threading.Thread(target=self.loop.run_forever, daemon=True, name="AsyncBridge").start()
+        return self.loop
+
+    def submit(self, coroutine, callback=None):
+        """Run a coroutine; callback(result, error) is called on the GUI thread when it is done"""
+        if _qt_loop is not None:
+            future = asyncio.ensure_future(coroutine, loop=_qt_loop)
+        else:
+            future = asyncio.run_coroutine_threadsafe(coroutine, self._background_loop())
+        future.add_done_callback(lambda done: self._finish(done, callback))
+        return future
+
+    def _finish(self, future, callback):
+        if callback is None:
+            return
+        error = future.exception() if not future.cancelled() else asyncio.CancelledError()
+        # A queued signal when called from the background loop's thread
+        self.finished.emit(callback, None if error else future.result(), error)
+
+    def _deliver(self, callback, result, error):
+        callback(result, error)
+
+_bridge = None
+
+def get_bridge():
+    """The application's AsyncBridge (created on first use, on the GUI thread)"""
+    global _bridge
+    if _bridge is None:
+        _bridge = AsyncBridge()
+    return _bridge
@@ -4,14 +4,19 @@ from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel,
                             QTableWidgetItem, QLineEdit, QComboBox, 
                             QFormLayout, QMessageBox, QHeaderView, QInputDialog,
                             QScrollArea, QGridLayout, QFrame, QSizePolicy)
-from PyQt5.QtCore import Qt, pyqtSignal, QSize
-from PyQt5.QtGui import QDoubleValidator, QIcon, QColor, QPalette, QFont
+from PyQt5.QtCore import Qt, pyqtSignal, QSize, QRect
+from PyQt5.QtGui import QDoubleValidator, QIcon, QColor, QPalette, QFont, QBrush
 from banking.accounts import AccountManager
 from banking.transfers import TransferManager
+from banking import summary as summary_sections
+from banking.summary import summary_cache
+from banking.directory import phone_directory
+from banking import events
+from banking.events import event_bus
+from gui.painting import CachedPainting
 import random
-import string
 
-class CircularContactButton(QPushButton):
+class CircularContactButton(CachedPainting, QPushButton):
     """Custom button for contacts with circular avatars"""
     def __init__(self, name, parent=None):
         super().__init__(parent)
@@ -38,13 +43,9 @@ class CircularContactButton(QPushButton):
         
     def paintEvent(self, event):
         super().paintEvent(event)
-        import math
-        from PyQt5.QtGui import QPainter, QBrush, QPen
-        from PyQt5.QtCore import QRect
-        
-        painter = QPainter(self)
-        painter.setRenderHint(QPainter.Antialiasing)
-        
+        self.paint_cached()
+    
+    def draw_cached(self, painter):
         # Draw circle
         painter.setBrush(QBrush(self.avatar_color))
         painter.setPen(Qt.NoPen)
@@ -56,7 +57,7 @@ class CircularContactButton(QPushButton):
         painter.setFont(QFont("Arial", 14, QFont.Bold))
         painter.drawText(circle_rect, Qt.AlignCenter, self.initials)
 
-class ActionButton(QPushButton):
+class ActionButton(CachedPainting, QPushButton):
     """Custom action button with icon and text"""
     def __init__(self, icon_text, label_text, parent=None):
         super().__init__(parent)
@@ -81,12 +82,9 @@ class ActionButton(QPushButton):
         
     def paintEvent(self, event):
         super().paintEvent(event)
-        from PyQt5.QtGui import QPainter, QBrush, QPen
-        from PyQt5.QtCore import QRect
-        
-        painter = QPainter(self)
-        painter.setRenderHint(QPainter.Antialiasing)
-        
+        self.paint_cached()
+    
+    def draw_cached(self, painter):
         # Draw circle
         painter.setBrush(QBrush(self.icon_color))
         painter.setPen(Qt.NoPen)
@@ -104,8 +102,129 @@ class ActionButton(QPushButton):
         painter.setFont(QFont("Arial", 9))
         painter.drawText(text_rect, Qt.AlignHCenter | Qt.AlignTop, self.label_text)
 
+# Parsed once per card list instead of once per card
+CARD_STYLESHEET = """
+    QFrame#accountCard {
+        background-color: #f8f9fa;
+        border-radius: 10px;
+        padding: 10px;
+        margin-bottom: 10px;
+    }
+    QLabel#cardIcon { font-size: 24px; }
+    QLabel#cardTitle { font-weight: bold; }
+    QLabel#cardSubtitle { color: gray; font-size: 12px; }
+    QLabel#cardStatus { color: orange; font-weight: bold; }
+    QLabel#cardStatus[verified="true"] { color: green; }
+    QLabel#emptyLabel { color: gray; padding: 20px; }
+"""
+
+class BankAccountCard(QFrame):
+    """Card showing one linked bank account; reused as accounts come and go"""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setObjectName("accountCard")
+        self.fields = None
+        
+        card_layout = QHBoxLayout(self)
+        
+        # Bank logo/icon
+        bank_icon = QLabel("🏦")
+        bank_icon.setObjectName("cardIcon")
+        card_layout.addWidget(bank_icon)
+        
+        # Account info
+        info_layout = QVBoxLayout()
+        self.bank_name = QLabel()
+        self.bank_name.setObjectName("cardTitle")
+        self.account_number = QLabel()
+        self.account_number.setObjectName("cardSubtitle")
+        info_layout.addWidget(self.bank_name)
+        info_layout.addWidget(self.account_number)
+        card_layout.addLayout(info_layout)
+        
+        # Verification status
+        self.status = QLabel()
+        self.status.setObjectName("cardStatus")
+        card_layout.addWidget(self.status, alignment=Qt.AlignRight)
+    
+    def set_account(self, account):
+        """Show an account. Returns False if the card already showed it"""
+        fields = (account['bank_name'], account['account_number'], bool(account['is_verified']))
+        if fields == self.fields:
+            return False
+        
+        bank_name, account_number, verified = fields
+        self.bank_name.setText(bank_name)
+        # Mask account number for security
+        self.account_number.setText("•••• " + account_number[-4:])
+        
+        if self.fields is None or self.fields[2] != verified:
+            self.status.setText("✓ Verified" if verified else "⚠ Verification Pending")
+            # Re-apply the shared stylesheet for the new [verified] state
+            self.status.setProperty('verified', verified)
+            self.status.style().unpolish(self.status)
+            self.status.style().polish(self.status)
+        
+        self.fields = fields
+        return True
+
+class BankAccountCardList(QWidget):
+    """List of linked bank account cards backed by a widget pool.
+    
+    Cards are keyed by account number. A refresh updates only cards whose
+    account changed, parks cards of removed accounts in the pool and takes
+    cards for new accounts from it, so nothing is rebuilt or restyled.
+    """
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setStyleSheet(CARD_STYLESHEET)
+        self.cards = {}
+        self.pool = []
+        
+        self.cards_layout = QVBoxLayout(self)
+        self.cards_layout.setContentsMargins(0, 0, 0, 0)
+        
+        self.empty_label = QLabel("No bank accounts linked. Link your bank account to make real transfers.")
+        self.empty_label.setObjectName("emptyLabel")
+        self.cards_layout.addWidget(self.empty_label)
+    
+    def set_accounts(self, accounts):
+        """Show accounts in order. Returns the number of cards that changed"""
+        self.setUpdatesEnabled(False)
+        try:
+            wanted = {account['account_number'] for account in accounts}
+            for account_number in [key for key in self.cards if key not in wanted]:
+                card = self.cards.pop(account_number)
+                card.hide()
+                self.cards_layout.removeWidget(card)
+                self.pool.append(card)
+            
+            touched = 0
+            for position, account in enumerate(accounts, start=1):
+                card = self.cards.get(account['account_number'])
+                if card is None:
+                    card = self.pool.pop() if self.pool else BankAccountCard(self)
+                    self.cards[account['account_number']] = card
+                if card.set_account(account):
+                    touched += 1
+                
+                # Position 0 is the empty label
+                if self.cards_layout.indexOf(card) != position:
+                    self.cards_layout.removeWidget(card)
+                    self.cards_layout.insertWidget(position, card)
+                card.show()
+            
+            self.empty_label.setVisible(not accounts)
+            return touched
+        finally:
+            self.setUpdatesEnabled(True)
+
 class UserDashboard(QWidget):
     logout_requested = pyqtSignal()
+    # Emitted (possibly from a worker thread) with the changed summary sections
+    summary_changed = pyqtSignal(object)
+    # Emitted from verification workers with the updated job
+    verification_updated = pyqtSignal(dict)
     
     def __init__(self, parent):
         super().__init__(parent)
@@ -114,6 +233,27 @@ class UserDashboard(QWidget):
         self.transfer_manager = TransferManager()
         self.user_id = parent.current_user['user_id']
         self.username = parent.current_user['username']
+        
+        # Accounts, linked banks and totals come from the cached session
+        # summary, which the banking engines keep current through events
+        self.summary = summary_cache.get(parent.current_user['session_id'], self.user_id)
+        self.summary_changed.connect(self.on_summary_changed)
+        summary, summary_listener = self.summary, self.summary_changed.emit
+        summary.subscribe(summary_listener)
+        self.destroyed.connect(lambda: summary.unsubscribe(summary_listener))
+        
+        # Bank account verification runs in the background
+        user_id = self.user_id
+        verification_signal = self.verification_updated
+        
+        def on_verification_event(topic, job):
+            if job['user_id'] == user_id:
+                verification_signal.emit(job)
+        
+        self.verification_updated.connect(self.on_verification_updated)
+        event_bus.subscribe(events.VERIFICATION_UPDATED, on_verification_event)
+        self.destroyed.connect(lambda: event_bus.unsubscribe(events.VERIFICATION_UPDATED, on_verification_event))
+        
         self.init_ui()
         self.load_accounts()
     
@@ -147,6 +287,15 @@ class UserDashboard(QWidget):
         welcome_label.setStyleSheet("font-size: 18px; font-weight: bold;")
         banner_layout.addWidget(welcome_label)
         
+        # Balance and today's totals
+        self.balance_label = QLabel()
+        self.balance_label.setStyleSheet("font-size: 14px;")
+        banner_layout.addWidget(self.balance_label)
+        
+        self.daily_totals_label = QLabel()
+        self.daily_totals_label.setStyleSheet("color: gray; font-size: 12px;")
+        banner_layout.addWidget(self.daily_totals_label)
+        
         self.content_layout.addWidget(banner)
         
         # Quick Actions Section
@@ -231,20 +380,47 @@ class UserDashboard(QWidget):
         people_container_layout = QHBoxLayout(people_container)
         people_container_layout.setSpacing(5)
         
-        # Add some dummy contacts
-        dummy_contacts = ["John Smith", "Jane Doe", "Alex Wong", "Maria Garcia", 
-                         "David Kim", "Sarah Johnson", "Michael Brown", "Emily Davis"]
+        # People the user paid recently, from the phone directory
+        payees = phone_directory.recent_payees(self.user_id, limit=8)
         
-        for contact in dummy_contacts:
-            contact_btn = CircularContactButton(contact)
-            contact_btn.clicked.connect(lambda _, name=contact: self.show_contact_transfer(name))
+        for payee in payees:
+            contact_btn = CircularContactButton(payee['display_name'])
+            contact_btn.clicked.connect(lambda _, entry=payee: self.show_contact_transfer(entry))
             people_container_layout.addWidget(contact_btn)
         
+        if not payees:
+            no_payees = QLabel("People you pay by phone will show up here.")
+            no_payees.setStyleSheet("color: gray; padding: 10px;")
+            people_container_layout.addWidget(no_payees)
+        
         people_scroll.setWidget(people_container)
         people_layout.addWidget(people_scroll)
         
         self.content_layout.addWidget(people_frame)
         
+        # Insights Section (top payees and spending, from the analytics rollups)
+        insights_frame = QFrame()
+        insights_frame.setStyleSheet("""
+            background-color: white;
+            border-radius: 15px;
+            margin: 10px;
+        """)
+        insights_layout = QVBoxLayout(insights_frame)
+        
+        insights_title = QLabel("Insights")
+        insights_title.setStyleSheet("font-size: 16px; font-weight: bold;")
+        insights_layout.addWidget(insights_title)
+        
+        self.top_payees_label = QLabel()
+        self.top_payees_label.setWordWrap(True)
+        insights_layout.addWidget(self.top_payees_label)
+        
+        self.trend_label = QLabel()
+        self.trend_label.setStyleSheet("font-family: monospace; color: #444;")
+        insights_layout.addWidget(self.trend_label)
+        
+        self.content_layout.addWidget(insights_frame)
+        
         # Bank Accounts Section
         bank_accounts_frame = QFrame()
         bank_accounts_frame.setStyleSheet("""
@@ -273,8 +449,8 @@ class UserDashboard(QWidget):
         bank_accounts_layout.addLayout(bank_accounts_header)
         
         # Bank accounts list
-        self.bank_accounts_container = QVBoxLayout()
-        bank_accounts_layout.addLayout(self.bank_accounts_container)
+        self.bank_accounts_list = BankAccountCardList()
+        bank_accounts_layout.addWidget(self.bank_accounts_list)
         
         self.content_layout.addWidget(bank_accounts_frame)
         
@@ -316,75 +492,72 @@ class UserDashboard(QWidget):
     
     def load_accounts(self):
         """Load user accounts into the UI"""
-        # Load linked bank accounts
-        self.load_linked_bank_accounts()
+        self.on_summary_changed({
+            summary_sections.ACCOUNTS,
+            summary_sections.LINKED_BANKS,
+            summary_sections.DAILY_TOTALS,
+            summary_sections.ANALYTICS
+        })
+    
+    def on_summary_changed(self, sections):
+        """Re-render only the parts of the dashboard whose summary section changed"""
+        if summary_sections.ACCOUNTS in sections:
+            self.update_balance()
+        if summary_sections.DAILY_TOTALS in sections:
+            self.update_daily_totals()
+        if summary_sections.LINKED_BANKS in sections:
+            self.load_linked_bank_accounts()
+        if summary_sections.ANALYTICS in sections:
+            self.update_insights()
+    
+    def on_verification_updated(self, job):
+        """Tell the user when a linked account could not be verified"""
+        # Verified accounts refresh their card through the summary
+        if job['status'] == 'FAILED':
+            self.parent.show_error(
+                f"Could not verify the bank account ending in {job['account_number'][-4:]}: {job['last_error']}"
+            )
+    
+    def update_balance(self):
+        """Show the total balance of the user's accounts"""
+        self.balance_label.setText(f"Total balance: ${self.summary.total_balance():.2f}")
+    
+    def update_daily_totals(self):
+        """Show today's incoming and outgoing totals"""
+        totals = self.summary.daily_totals
+        self.daily_totals_label.setText(
+            f"Today: +${totals['incoming']:.2f} in, -${totals['outgoing']:.2f} out"
+        )
+    
+    def update_insights(self):
+        """Show the top payees and the spending trend"""
+        payees = self.summary.top_payees
+        if payees:
+            self.top_payees_label.setText("Top payees:\n" + "\n".join(
+                f"{i}. Account ending in {payee['counterparty'][-4:]}: "
+                f"${float(payee['amount']):.2f} in {payee['count']} payments"
+                for i, payee in enumerate(payees, 1)
+            ))
+        else:
+            self.top_payees_label.setText("The people you pay most will show up here.")
+        
+        trend = self.summary.spending_trend
+        peak = max((day['amount_out'] for day in trend), default=0.0)
+        lines = []
+        for day in trend:
+            bar = "█" * round(10 * day['amount_out'] / peak) if peak else ""
+            lines.append(f"{day['bucket'][5:10]} {bar:<10} -${day['amount_out']:.2f}")
+        self.trend_label.setText(f"Spending, last {len(trend)} days:\n" + "\n".join(lines))
     
     def load_linked_bank_accounts(self):
         """Load linked bank accounts into the UI"""
-        # Clear existing bank accounts
-        for i in reversed(range(self.bank_accounts_container.count())):
-            widget = self.bank_accounts_container.itemAt(i).widget()
-            if widget:
-                widget.deleteLater()
-        
-        # Get linked bank accounts
-        bank_accounts = self.account_manager.get_linked_bank_accounts(self.user_id)
-        
-        if not bank_accounts:
-            no_accounts = QLabel("No bank accounts linked. Link your bank account to make real transfers.")
-            no_accounts.setStyleSheet("color: gray; padding: 20px;")
-            self.bank_accounts_container.addWidget(no_accounts)
-            return
-        
-        # Add bank account cards
-        for account in bank_accounts:
-            account_card = QFrame()
-            account_card.setStyleSheet("""
-                background-color: #f8f9fa;
-                border-radius: 10px;
-                padding: 10px;
-                margin-bottom: 10px;
-            """)
-            
-            card_layout = QHBoxLayout(account_card)
-            
-            # Bank logo/icon
-            bank_icon = QLabel("🏦")
-            bank_icon.setStyleSheet("font-size: 24px;")
-            card_layout.addWidget(bank_icon)
-            
-            # Account info
-            info_layout = QVBoxLayout()
-            
-            bank_name = QLabel(account['bank_name'])
-            bank_name.setStyleSheet("font-weight: bold;")
-            
-            # Mask account number for security
-            masked_number = "•••• " + account['account_number'][-4:]
-            account_number = QLabel(masked_number)
-            account_number.setStyleSheet("color: gray; font-size: 12px;")
-            
-            info_layout.addWidget(bank_name)
-            info_layout.addWidget(account_number)
-            
-            card_layout.addLayout(info_layout)
-            
-            # Verification status
-            if account['is_verified']:
-                status = QLabel("✓ Verified")
-                status.setStyleSheet("color: green; font-weight: bold;")
-            else:
-                status = QLabel("⚠ Verification Pending")
-                status.setStyleSheet("color: orange; font-weight: bold;")
-            
-            card_layout.addWidget(status, alignment=Qt.AlignRight)
-            
-            self.bank_accounts_container.addWidget(account_card)
+        # Only cards whose account changed are touched
+        self.bank_accounts_list.set_accounts(self.summary.linked_banks)
     
     def show_transfer_dialog(self):
         """Show transfer dialog"""
-        accounts = self.account_manager.get_accounts(self.user_id)
-        bank_accounts = self.account_manager.get_linked_bank_accounts(self.user_id)
+        accounts = list(self.summary.accounts)
+        bank_accounts = list(self.summary.linked_banks)
         
         if not accounts:
             self.parent.show_error("You need to create an account before making transfers")
@@ -455,7 +628,6 @@ class UserDashboard(QWidget):
             
             if success:
                 self.parent.show_info("Transfer completed successfully")
-                self.load_accounts()
             else:
                 self.parent.show_error(f"Transfer failed: {message}")
     
@@ -521,17 +693,15 @@ class UserDashboard(QWidget):
         # In a real app, we would wait for a callback from the payment gateway
         # For demo purposes, we'll just show a success message
     
-    def show_contact_transfer(self, contact_name):
-        """Show transfer dialog for a specific contact"""
-        accounts = self.account_manager.get_accounts(self.user_id)
+    def show_contact_transfer(self, payee):
+        """Show transfer dialog for a directory contact"""
+        accounts = list(self.summary.accounts)
+        contact_name = payee['display_name']
         
         if not accounts:
             self.parent.show_error("You need to create an account before making transfers")
             return
         
-        # Generate a dummy account number for the contact
-        contact_account = ''.join(random.choices(string.digits, k=12))
-        
         # Get source account
         account_items = [f"{a['account_type']} - {a['account_number']} (${a['balance']:.2f})" for a in accounts]
         source, ok = QInputDialog.getItem(
@@ -559,12 +729,16 @@ class UserDashboard(QWidget):
         if not ok:
             return
         
-        # Show a message that this is a demo feature
-        self.parent.show_info(f"Demo: Payment of ${amount:.2f} to {contact_name} would be processed here.")
+        success, message = phone_directory.pay(source_account, payee['phone'], amount, description or None)
+        
+        if success:
+            self.parent.show_info(f"Paid ${amount:.2f} to {contact_name}")
+        else:
+            self.parent.show_error(f"Payment failed: {message}")
     
     def show_self_transfer(self):
         """Show self-transfer dialog between own accounts"""
-        accounts = self.account_manager.get_accounts(self.user_id)
+        accounts = list(self.summary.accounts)
         
         if not accounts or len(accounts) < 2:
             self.parent.show_error("You need at least two accounts to make a self-transfer")
@@ -614,13 +788,12 @@ class UserDashboard(QWidget):
             
             if success:
                 self.parent.show_info("Transfer completed successfully")
-                self.load_accounts()
             else:
                 self.parent.show_error(f"Transfer failed: {message}")
     
     def show_transaction_history(self):
         """Show transaction history"""
-        accounts = self.account_manager.get_accounts(self.user_id)
+        accounts = list(self.summary.accounts)
         
         if not accounts:
             self.parent.show_error("No accounts found")
@@ -715,15 +888,15 @@ class UserDashboard(QWidget):
             )
             
             if success:
-                self.parent.show_info("Bank account linked successfully")
-                self.load_accounts()
+                # The linked bank cards refresh from the BANK_LINKED and BANK_VERIFIED events
+                self.parent.show_info("Bank account linked successfully. Verification is in progress.")
             else:
                 self.parent.show_error(f"Failed to link bank account: {message}")
-
+    
     def show_qr_scanner(self):
         """Show QR scanner dialog"""
         self.parent.show_qr_scanner()
-
+    
     def show_phone_payment(self):
         """Show phone payment dialog"""
         self.parent.show_phone_payment() 
\ No newline at end of file
@@ -3,27 +3,31 @@ from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel,
                             QCheckBox, QFrame, QGraphicsDropShadowEffect)
 from PyQt5.QtCore import Qt, pyqtSignal, QPropertyAnimation, QEasingCurve, QPoint, QTimer
 from PyQt5.QtGui import QColor, QFont, QLinearGradient, QBrush, QPalette, QPixmap, QPainter, QPainterPath
-from security.auth import AuthSystem
+from security.authh import AuthSystem
+from gui.painting import CachedPainting
 import re
 import os
 
-class GradientFrame(QFrame):
+class GradientFrame(CachedPainting, QFrame):
     def __init__(self, color1="#6a11cb", color2="#2575fc", parent=None):
         super().__init__(parent)
         self.color1 = color1
         self.color2 = color2
         
+    def cache_state(self):
+        return (self.color1, self.color2)
+    
     def paintEvent(self, event):
-        painter = QPainter(self)
-        painter.setRenderHint(QPainter.Antialiasing)
-        
+        self.paint_cached()
+    
+    def draw_cached(self, painter):
         gradient = QLinearGradient(0, 0, 0, self.height())
         gradient.setColorAt(0.0, QColor(self.color1))
         gradient.setColorAt(1.0, QColor(self.color2))
         
         painter.fillRect(self.rect(), QBrush(gradient))
 
-class RoundedButton(QPushButton):
+class RoundedButton(CachedPainting, QPushButton):
     def __init__(self, text, color1="#6a11cb", color2="#2575fc", parent=None):
         super().__init__(text, parent)
         self.color1 = color1
@@ -38,10 +42,13 @@ class RoundedButton(QPushButton):
         shadow.setOffset(0, 5)
         self.setGraphicsEffect(shadow)
         
+    def cache_state(self):
+        return (self.text(), self.color1, self.color2)
+    
     def paintEvent(self, event):
-        painter = QPainter(self)
-        painter.setRenderHint(QPainter.Antialiasing)
-        
+        self.paint_cached()
+    
+    def draw_cached(self, painter):
         # Create gradient
         gradient = QLinearGradient(0, 0, self.width(), 0)
         gradient.setColorAt(0.0, QColor(self.color1))
@@ -446,21 +453,29 @@ class LoginWindow(QWidget):
     
     def process_login(self, username, password, original_text):
         """Process the login after showing loading state"""
-        try:
-            success, result = self.auth_system.login(username, password)
-            
+        # Password hashing runs off the GUI thread, so the window stays responsive
+        from banking.service import banking_service
+        from gui.async_bridge import get_bridge
+        
+        get_bridge().submit(
+            banking_service.login(username, password),
+            lambda result, error: self.finish_login(result, error, original_text)
+        )
+    
+    def finish_login(self, result, error, original_text):
+        """Handle the outcome of a login (on the GUI thread)"""
+        if error is None:
+            success, result = result
             if success:
                 self.login_success.emit(result)
-            else:
-                self.login_button.setText(original_text)
-                self.login_button.setEnabled(True)
-                self.status_label.setText(result)
-                self.shake_animation()
-        except Exception as e:
-            self.login_button.setText(original_text)
-            self.login_button.setEnabled(True)
-            self.status_label.setText(f"Login error: {str(e)}")
-            self.shake_animation()
+                return
+        else:
+            result = f"Login error: {str(error)}"
+        
+        self.login_button.setText(original_text)
+        self.login_button.setEnabled(True)
+        self.status_label.setText(result)
+        self.shake_animation()
     
     def shake_animation(self):
         """Shake animation for failed login"""
@@ -1,10 +1,9 @@
 from PyQt5.QtWidgets import (QMainWindow, QTabWidget, QWidget, QVBoxLayout, 
                             QHBoxLayout, QLabel, QPushButton, QMessageBox)
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QTimer
 from gui.login_window import LoginWindow
-from gui.dashboard import UserDashboard
-from gui.admin_panel import AdminPanel
-from security.auth import AuthSystem
+from security.authh import AuthSystem
+from banking.bootstrap import database_bootstrap
 import time
 
 class MainWindow(QMainWindow):
@@ -46,6 +45,30 @@ class MainWindow(QMainWindow):
         
         # Show login window initially
         self.show_login()
+        
+        # The database bootstraps in the background; poll until it is ready
+        self.bootstrap_timer = QTimer(self)
+        self.bootstrap_timer.timeout.connect(self.check_database_ready)
+        self.check_database_ready()
+        if database_bootstrap.state == database_bootstrap.CONNECTING:
+            self.bootstrap_timer.start(100)
+    
+    def check_database_ready(self):
+        """Show the database connection state and unlock login once it is ready"""
+        state = database_bootstrap.state
+        self.login_window.setEnabled(state == database_bootstrap.READY)
+        
+        if state == database_bootstrap.CONNECTING:
+            self.status_label.setText("Connecting to database...")
+            return
+        
+        self.bootstrap_timer.stop()
+        if state == database_bootstrap.READY:
+            self.status_label.setText("Not logged in")
+        else:
+            self.status_label.setText("Database unavailable")
+            self.status_label.setStyleSheet("font-size: 12px; color: red;")
+            self.show_error(f"Database connection error: {database_bootstrap.error}")
     
     def show_login(self):
         """Show the login window"""
@@ -60,9 +83,12 @@ class MainWindow(QMainWindow):
         """Show the user dashboard"""
         self.clear_content()
         
+        # Dashboards are imported on first use so they don't slow down startup
         if self.is_admin:
+            from gui.admin_panel import AdminPanel
             self.dashboard = AdminPanel(self)
         else:
+            from gui.dashboard import UserDashboard
             self.dashboard = UserDashboard(self)
         
         self.content_layout.addWidget(self.dashboard)
@@ -85,8 +111,9 @@ class MainWindow(QMainWindow):
         print(f"User logged in: {self.current_user['username']}, is_admin: {self.is_admin}")
         
         # Check if user has linked bank accounts
-        from banking.accounts import AccountManager
-        bank_accounts = AccountManager.get_linked_bank_accounts(self.current_user['user_id'])
+        bank_accounts = None
+        if not self.is_admin:
+            bank_accounts = self.get_dashboard_summary().linked_banks
         
         if not bank_accounts and not self.is_admin:
             # Show bank account linking dialog
@@ -209,8 +236,15 @@ class MainWindow(QMainWindow):
         # Show the dialog
         dialog.exec_()
     
+    def get_dashboard_summary(self):
+        """Get the cached dashboard summary of the logged in user"""
+        from banking.summary import summary_cache
+        return summary_cache.get(self.current_user['session_id'], self.current_user['user_id'])
+    
     def on_logout(self):
         """Handle logout"""
+        from banking.summary import summary_cache
+        summary_cache.drop(self.current_user.get('session_id', ''))
         self.auth_system.logout(self.current_user.get('session_id', ''))
         self.current_user = None
         self.is_admin = False
@@ -235,11 +269,20 @@ class MainWindow(QMainWindow):
         import cv2
         import numpy as np
         
+        from banking.directory import phone_directory
+        from banking.idempotency import derive_key, idempotency_store, new_key
+        from banking.transfers import TransferManager
+        
         # Create a dialog for the QR scanner
         scanner_dialog = QDialog(self)
         scanner_dialog.setWindowTitle("QR Code Scanner")
         scanner_dialog.setMinimumSize(400, 500)
         
+        # Every detection of the same code in this scanning session gets the
+        # same idempotency key, so it can be paid at most once
+        scan_nonce = new_key()
+        handled_codes = set()
+        
         layout = QVBoxLayout(scanner_dialog)
         
         # Camera view with real camera feed
@@ -605,6 +648,12 @@ class MainWindow(QMainWindow):
         
         # Function to handle QR code detection
         def on_qr_detected(data):
+            qr_key = derive_key(data, scan_nonce)
+            if qr_key in handled_codes:
+                # The camera reported a code that is already being handled
+                return
+            handled_codes.add(qr_key)
+            
             status_label.setText("QR Code detected! Processing...")
             scan_btn.setEnabled(False)
             
@@ -620,11 +669,12 @@ class MainWindow(QMainWindow):
                     payee_address = params.get('pa', '')
                     amount = float(params.get('am', '0')) if 'am' in params else 0
                     
-                    QTimer.singleShot(1000, lambda: show_payment_form("UPI Payment", payee_name, payee_address, amount))
+                    QTimer.singleShot(1000, lambda: show_payment_form("UPI Payment", payee_name, payee_address, amount, qr_key))
                 else:
                     # Handle as generic account transfer
-                    QTimer.singleShot(1000, lambda: show_payment_form("QR Payment", "Scanned Recipient", data, 0))
+                    QTimer.singleShot(1000, lambda: show_payment_form("QR Payment", "Scanned Recipient", data, 0, qr_key))
             except Exception as e:
+                handled_codes.discard(qr_key)
                 print(f"Error parsing QR data: {e}")
                 status_label.setText(f"Error: Could not process QR code")
                 scan_btn.setEnabled(True)
@@ -679,7 +729,7 @@ class MainWindow(QMainWindow):
         scanner_dialog.finished.connect(on_dialog_close)
         
         # Function to show payment form after successful scan
-        def show_payment_form(title, recipient_name, recipient_id, suggested_amount):
+        def show_payment_form(title, recipient_name, recipient_id, suggested_amount, qr_key):
             camera_view.stop_camera()
             scanner_dialog.accept()
             
@@ -712,19 +762,18 @@ class MainWindow(QMainWindow):
             # Source account selection
             source_combo = QComboBox()
             
-            # Get user's bank accounts
+            # Get user's accounts
             if self.current_user:
-                from banking.accounts import AccountManager
-                bank_accounts = AccountManager.get_linked_bank_accounts(self.current_user['user_id'])
+                accounts = self.get_dashboard_summary().accounts
                 
-                if bank_accounts:
-                    for account in bank_accounts:
+                if accounts:
+                    for account in accounts:
                         source_combo.addItem(
-                            f"{account['bank_name']} (•••• {account['account_number'][-4:]})",
+                            f"{account['account_type']} - {account['account_number']} (₹{account['balance']:.2f})",
                             account['account_number']
                         )
                 else:
-                    source_combo.addItem("No bank accounts linked")
+                    source_combo.addItem("No accounts available")
             
             form_layout.addRow("Pay from:", source_combo)
             
@@ -742,7 +791,34 @@ class MainWindow(QMainWindow):
             
             # Handle payment
             def process_payment():
-                self.show_info(f"Payment of ₹{amount_input.value():.2f} to {recipient_name} initiated successfully!")
+                source_account = source_combo.currentData()
+                if not source_account:
+                    self.show_error("You need an account to make payments")
+                    return
+                
+                amount = amount_input.value()
+                note = note_input.text() or None
+                if title == "UPI Payment":
+                    # Handles like 9876543210@upi pay the phone number's directory entry
+                    handle = recipient_id.split('@')[0]
+                    if phone_directory.lookup(handle):
+                        success, message = phone_directory.pay(source_account, handle, amount, note,
+                                                               idempotency_key=qr_key)
+                    else:
+                        # External UPI handles are handed to the UPI app
+                        success, message = idempotency_store.run(
+                            qr_key, lambda: (True, "External UPI payment initiated")
+                        )
+                else:
+                    success, message = TransferManager.transfer_funds(
+                        source_account, recipient_id, amount, note or "QR payment", idempotency_key=qr_key
+                    )
+                
+                if not success:
+                    self.show_error(f"Payment failed: {message}")
+                    return
+                
+                self.show_info(f"Payment of ₹{amount:.2f} to {recipient_name} initiated successfully!")
                 payment_dialog.accept()
             
             pay_btn.clicked.connect(process_payment)
@@ -820,7 +896,13 @@ class MainWindow(QMainWindow):
         
     def show_phone_payment(self):
         """Show phone number payment dialog"""
-        from PyQt5.QtWidgets import QDialog, QVBoxLayout, QLabel, QPushButton, QComboBox, QLineEdit, QFormLayout, QDoubleSpinBox, QHBoxLayout
+        from PyQt5.QtWidgets import QDialog, QVBoxLayout, QLabel, QPushButton, QComboBox, QLineEdit, QFormLayout, QDoubleSpinBox, QHBoxLayout, QListWidget, QListWidgetItem
+        from banking.directory import phone_directory
+        
+        from banking.idempotency import new_key
+        
+        # One idempotency key per dialog, so double-clicking Pay pays once
+        idempotency_key = new_key()
         
         # Create a dialog for phone payment
         phone_dialog = QDialog(self)
@@ -852,6 +934,12 @@ class MainWindow(QMainWindow):
         lookup_btn.setStyleSheet("background-color: #f1f1f1; padding: 5px;")
         form_layout.addRow("", lookup_btn)
         
+        # Directory matches for what has been typed so far
+        matches_list = QListWidget()
+        matches_list.setMaximumHeight(90)
+        matches_list.hide()
+        form_layout.addRow("", matches_list)
+        
         # Amount input
         amount_input = QDoubleSpinBox()
         amount_input.setRange(1, 10000)
@@ -861,22 +949,21 @@ class MainWindow(QMainWindow):
         amount_input.setStyleSheet("font-size: 18px; padding: 8px;")
         form_layout.addRow("Amount:", amount_input)
         
-        # Source account selection
+        # Source account selection (phone payments go through the transfer engine)
         source_combo = QComboBox()
         
-        # Get user's bank accounts
+        # Get user's accounts
         if self.current_user:
-            from banking.accounts import AccountManager
-            bank_accounts = AccountManager.get_linked_bank_accounts(self.current_user['user_id'])
+            accounts = self.get_dashboard_summary().accounts
             
-            if bank_accounts:
-                for account in bank_accounts:
+            if accounts:
+                for account in accounts:
                     source_combo.addItem(
-                        f"{account['bank_name']} (•••• {account['account_number'][-4:]})",
+                        f"{account['account_type']} - {account['account_number']} (₹{account['balance']:.2f})",
                         account['account_number']
                     )
             else:
-                source_combo.addItem("No bank accounts linked")
+                source_combo.addItem("No accounts available")
         
         form_layout.addRow("Pay from:", source_combo)
         
@@ -887,22 +974,29 @@ class MainWindow(QMainWindow):
         
         layout.addLayout(form_layout)
         
-        # Recent contacts (simulated)
+        # Recent payees from the user's transfer history
         recent_label = QLabel("Recent phone payments:")
         recent_label.setStyleSheet("margin-top: 10px;")
         layout.addWidget(recent_label)
         
-        # Add some dummy recent contacts
-        import random
+        def fill_phone(phone):
+            # Entries are E.164, so they keep their country code
+            phone_number.setText(phone)
         
-        for _ in range(3):
-            random_phone = f"+91 {''.join(random.choices('0123456789', k=10))}"
-            contact_btn = QPushButton(random_phone)
+        recent_payees = phone_directory.recent_payees(self.current_user['user_id']) if self.current_user else []
+        
+        for payee in recent_payees[:3]:
+            contact_btn = QPushButton(f"{payee['display_name']}  {payee['phone']}")
             contact_btn.setStyleSheet("text-align: left; padding: 5px;")
             layout.addWidget(contact_btn)
             
             # Connect to fill the phone number field
-            contact_btn.clicked.connect(lambda _, num=random_phone: phone_number.setText(num.replace("+91 ", "")))
+            contact_btn.clicked.connect(lambda _, num=payee['phone']: fill_phone(num))
+        
+        if not recent_payees:
+            no_recent = QLabel("No recent phone payments")
+            no_recent.setStyleSheet("color: gray; padding: 5px;")
+            layout.addWidget(no_recent)
         
         # Pay button
         pay_btn = QPushButton("Pay Now")
@@ -915,15 +1009,47 @@ class MainWindow(QMainWindow):
             if not phone_number.text():
                 self.show_error("Please enter a phone number")
                 return
-                
-            self.show_info(f"Payment of ₹{amount_input.value():.2f} to {phone} initiated successfully!")
+            
+            source_account = source_combo.currentData()
+            if not source_account:
+                self.show_error("You need an account to make payments")
+                return
+            
+            success, message = phone_directory.pay(
+                source_account, phone_number.text(), amount_input.value(),
+                note_input.text() or None, country_code.currentText(),
+                idempotency_key=idempotency_key
+            )
+            if not success:
+                self.show_error(f"Payment failed: {message}")
+                return
+            
+            self.show_info(f"Payment of ₹{amount_input.value():.2f} to {phone} completed successfully!")
             phone_dialog.accept()
         
         pay_btn.clicked.connect(process_payment)
         
+        # Incremental search as the number is typed
+        def update_matches(text):
+            matches_list.clear()
+            for entry in phone_directory.search(text, country_code.currentText(), limit=5):
+                item = QListWidgetItem(f"{entry['display_name']}  {entry['phone']}")
+                item.setData(Qt.UserRole, entry['phone'])
+                matches_list.addItem(item)
+            matches_list.setVisible(matches_list.count() > 0)
+        
+        phone_number.textChanged.connect(update_matches)
+        matches_list.itemClicked.connect(lambda item: fill_phone(item.data(Qt.UserRole)))
+        
         # Handle contact lookup
         def show_contacts():
-            self.show_info("Contact lookup would display your contacts here")
+            entry = phone_directory.lookup(phone_number.text(), country_code.currentText())
+            if entry:
+                self.show_info(f"{entry['phone']} belongs to {entry['display_name']}")
+            else:
+                update_matches(phone_number.text())
+                if not matches_list.count():
+                    self.show_error("No contacts found for this number")
         
         lookup_btn.clicked.connect(show_contacts)
         
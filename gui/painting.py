@@ -0,0 +1,61 @@
+# Cached painting for custom-drawn widgets
+from PyQt5.QtCore import Qt, QEvent
+from PyQt5.QtGui import QPainter, QPixmap
+
+# Events after which a cached rendering may look different
+THEME_EVENTS = (QEvent.PaletteChange, QEvent.StyleChange, QEvent.FontChange)
+
+class CachedPainting:
+    """Mixin that renders a widget's custom drawing once into a QPixmap.
+
+    Subclasses draw in draw_cached(painter) and return whatever else affects
+    their look (text, colors, ...) from cache_state(). The pixmap is keyed by
+    size, device pixel ratio and that state, so repaints that change nothing
+    (animations, moves, overlapping windows) only blit it. Palette, style and
+    font changes throw it away.
+    """
+    _pixmap = None
+    _pixmap_key = None
+
+    def cache_state(self):
+        """Everything besides size and DPI that changes how the widget looks"""
+        return ()
+
+    def draw_cached(self, painter):
+        """Draw the widget onto painter (called only when the cache is stale)"""
+        raise NotImplementedError
+
+    def cached_pixmap(self):
+        """Get the rendering for the current size, DPI and state"""
+        ratio = self.devicePixelRatioF()
+        key = (self.width(), self.height(), ratio, self.cache_state())
+        if key != self._pixmap_key:
+            pixmap = QPixmap(round(self.width() * ratio), round(self.height() * ratio))
+            pixmap.setDevicePixelRatio(ratio)
+            pixmap.fill(Qt.transparent)
+
+            painter = QPainter(pixmap)
+            painter.setRenderHint(QPainter.Antialiasing)
+            painter.setFont(self.font())
+            self.draw_cached(painter)
+            painter.end()
+
+            self._pixmap = pixmap
+            self._pixmap_key = key
+        return self._pixmap
+
+    def paint_cached(self):
+        """Blit the cached rendering onto the widget"""
+        painter = QPainter(self)
+        painter.drawPixmap(0, 0, self.cached_pixmap())
+        painter.end()
+
+    def invalidate_paint_cache(self):
+        """Force the next repaint to draw again"""
+        self._pixmap = None
+        self._pixmap_key = None
+
+    def changeEvent(self, event):
+        if event.type() in THEME_EVENTS:
+            self.invalidate_paint_cache()
+        super().changeEvent(event)
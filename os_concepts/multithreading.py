@@ -1,82 +1,270 @@
-import threading
-import time
-import random
-from queue import Queue
-from banking.transactions import TransactionManager
-
-class BankingThreads:
-    def __init__(self):
-        self.threads = []
-        self.stop_event = threading.Event()
-    
-    def start_transaction_processors(self, num_threads=3):
-        """Start multiple threads to process transactions"""
-        for i in range(num_threads):
-            thread = threading.Thread(
-                target=self._transaction_processor_worker,
-                name=f"TransactionProcessor-{i+1}",
-                daemon=True
-            )
-            thread.start()
-            self.threads.append(thread)
-    
-    def _transaction_processor_worker(self):
-        """Worker function for transaction processing threads"""
-        while not self.stop_event.is_set():
-            TransactionManager.process_transactions()
-            time.sleep(0.1)  # Small delay to prevent CPU overuse
-    
-    def start_concurrent_transfers_demo(self):
-        """Demonstrate concurrent transfers with potential race conditions"""
-        print("\n=== Concurrent Transfers Demo ===")
-        
-        # Create test accounts
-        from banking.accounts import AccountManager
-        from banking.transfers import TransferManager
-        
-        # Create two test accounts with initial balances
-        AccountManager.create_account(1, 'SAVINGS', 1000.00)
-        AccountManager.create_account(2, 'SAVINGS', 1000.00)
-        
-        accounts = AccountManager.get_accounts(1)
-        account1 = accounts[0]['account_number']
-        account2 = AccountManager.get_accounts(2)[0]['account_number']
-        
-        print(f"Account 1: {account1}, Account 2: {account2}")
-        print("Initial balances:")
-        print(f"Account 1: {AccountManager.get_account_balance(account1)}")
-        print(f"Account 2: {AccountManager.get_account_balance(account2)}")
-        
-        # Function to perform transfers
-        def transfer_worker(amount, iterations):
-            for _ in range(iterations):
-                TransferManager.transfer_funds(account1, account2, amount, "Demo transfer")
-                time.sleep(random.uniform(0.01, 0.1))
-        
-        # Create multiple threads performing transfers
-        threads = []
-        for i in range(5):
-            amount = random.randint(1, 10)
-            t = threading.Thread(
-                target=transfer_worker,
-                args=(amount, 10),
-                name=f"TransferWorker-{i+1}"
-            )
-            threads.append(t)
-            t.start()
-        
-        # Wait for all threads to complete
-        for t in threads:
-            t.join()
-        
-        # Show final balances
-        print("\nFinal balances:")
-        print(f"Account 1: {AccountManager.get_account_balance(account1)}")
-        print(f"Account 2: {AccountManager.get_account_balance(account2)}")
-        print("Note how the balances remain consistent despite concurrent transfers")
-    
-    def stop_all(self):
-        """Stop all running threads"""
-        self.stop_event.set()
-        for thread in self.threads:
-            thread.join()
+import multiprocessing
+import os
+import threading
+import time
+import random
+from queue import Queue
+import config
+from config import WORKER_PROCESS_CONFIG
+from banking import events
+from banking.events import event_bus
+from banking.storage import BACKENDS, claim_owner, get_storage, set_storage, utc_timestamp
+from banking.transactions import TransactionManager
+
+# Events of worker processes that are passed on to the bus of the process that started them
+FORWARDED_TOPICS = (events.BALANCE_CHANGED, events.TRANSACTION_FINISHED)
+
+# Settings handed to worker processes as they are when the workers start
+PROCESS_CONFIGS = ('DB_CONFIG', 'RISK_CONFIG', 'SCHEDULER_CONFIG', 'WORKER_PROCESS_CONFIG')
+
+def transaction_process_worker(backend, configs, partitions, partition, wakeup, stop_event, events_out):
+    """Queue worker run in its own process, for the accounts of one partition.
+    
+    Workers share nothing but the database, where claims keep two of them
+    from running the same transaction. The supervisor sets wakeup when work
+    is recorded for the partition; events_out carries events back to it.
+    """
+    # Spawned processes start from a fresh import of config
+    for name, values in configs.items():
+        getattr(config, name).update(values)
+    set_storage(BACKENDS[backend]())
+    for topic in FORWARDED_TOPICS:
+        event_bus.subscribe(topic, lambda topic, payload: events_out.put((topic, payload)))
+    
+    try:
+        while not stop_event.is_set():
+            wakeup.clear()
+            TransactionManager.process_transactions(stop_event, partition=(partitions, partition))
+            wakeup.wait(WORKER_PROCESS_CONFIG['idle_poll'])
+    except KeyboardInterrupt:
+        pass
+
+def requeue_stale_claims(owner=None):
+    """Queue again the transactions claimed by owner (a worker process that
+    died) and those claimed longer than claim_timeout ago. Returns how many"""
+    requeued = get_storage().requeue_claims(owner, utc_timestamp(WORKER_PROCESS_CONFIG['claim_timeout']))
+    if requeued:
+        print(f"Queued {requeued} unfinished transactions again")
+    return requeued
+
+class BankingThreads:
+    def __init__(self):
+        self.threads = []
+        self.stop_event = threading.Event()
+        # Worker processes: partition -> (process, wakeup event)
+        self.processes = {}
+        self.process_stop = None
+        self.process_events = None
+        self.supervisor = None
+        self.relay = None
+        self.restarts = 0  # Worker processes restarted by the supervisor
+        self._process_args = None  # (backend, configs, count) the worker processes are started with
+        self._last_requeue = 0.0  # When the supervisor last looked for timed out claims
+        self._context = multiprocessing.get_context('spawn')
+    
+    def start_transaction_processors(self, num_threads=3):
+        """Start multiple threads to process transactions"""
+        # Claims left by a previous run that stopped half way
+        requeue_stale_claims()
+        for i in range(num_threads):
+            thread = threading.Thread(
+                target=self._transaction_processor_worker,
+                name=f"TransactionProcessor-{i+1}",
+                daemon=True
+            )
+            thread.start()
+            self.threads.append(thread)
+    
+    def _transaction_processor_worker(self):
+        """Worker function for transaction processing threads"""
+        while not self.stop_event.is_set():
+            TransactionManager.process_transactions(self.stop_event)
+            self.stop_event.wait(0.1)  # Small delay to prevent CPU overuse
+    
+    def start_transaction_processes(self, num_processes=None):
+        """Start worker processes, one per CPU core by default, that split the queue by account.
+        
+        Unlike threads they run CPU-bound work (risk scoring, hashing) in
+        parallel. A supervisor thread restarts any that exit. Returns False
+        if they are already running.
+        """
+        if self.processes:
+            return False
+        
+        storage = get_storage()
+        backend = next((name for name, cls in BACKENDS.items() if type(storage) is cls), None)
+        if backend in (None, 'memory'):
+            raise ValueError("Worker processes need a database storage backend")
+        
+        count = num_processes or WORKER_PROCESS_CONFIG['processes'] or os.cpu_count() or 1
+        requeue_stale_claims()
+        self.process_stop = self._context.Event()
+        self.process_events = self._context.Queue()
+        configs = {name: dict(getattr(config, name)) for name in PROCESS_CONFIGS}
+        self._process_args = (backend, configs, count)
+        for partition in range(count):
+            self._start_process(partition)
+        
+        event_bus.subscribe(events.TRANSACTION_QUEUED, self._wake_process)
+        self.relay = threading.Thread(target=self._relay_events, args=(self.process_events,),
+                                      name="TransactionEventRelay", daemon=True)
+        self.relay.start()
+        self.supervisor = threading.Thread(target=self._supervise, name="TransactionSupervisor", daemon=True)
+        self.supervisor.start()
+        return True
+    
+    def _start_process(self, partition):
+        backend, configs, count = self._process_args
+        wakeup = self._context.Event()
+        process = self._context.Process(
+            target=transaction_process_worker,
+            args=(backend, configs, count, partition, wakeup, self.process_stop, self.process_events),
+            name=f"TransactionProcess-{partition+1}",
+            daemon=True
+        )
+        process.start()
+        self.processes[partition] = (process, wakeup)
+    
+    def _wake_process(self, topic, payload):
+        """Wake the worker process of the account a transaction was recorded for"""
+        processes = self.processes
+        if processes:
+            processes[payload['account_id'] % len(processes)][1].set()
+    
+    def wake_processes(self):
+        """Wake every worker process (e.g. after transactions were added outside this process)"""
+        for _, wakeup in list(self.processes.values()):
+            wakeup.set()
+    
+    def _supervise(self):
+        """Restart worker processes that exit while they should be running"""
+        while not self.process_stop.wait(WORKER_PROCESS_CONFIG['supervise_interval']):
+            self._check_processes()
+    
+    def _check_processes(self):
+        """Restart dead worker processes, after queueing their claimed transactions
+        again, and now and then queue again claims that timed out"""
+        for partition, (process, _) in list(self.processes.items()):
+            if not process.is_alive() and not self.process_stop.is_set():
+                print(f"{process.name} exited with code {process.exitcode}, restarting it")
+                requeue_stale_claims(claim_owner(process.pid))
+                self.restarts += 1
+                self._start_process(partition)
+        
+        # A live worker can still hang on a claim
+        now = time.monotonic()
+        if now - self._last_requeue >= WORKER_PROCESS_CONFIG['claim_timeout'] / 10:
+            self._last_requeue = now
+            requeue_stale_claims()
+    
+    def _relay_events(self, queue):
+        """Publish the events of the worker processes on this process's bus"""
+        while True:
+            item = queue.get()
+            if item is None:
+                break
+            topic, payload = item
+            event_bus.publish(topic, **payload)
+    
+    def stop_processes(self):
+        """Stop the worker processes, letting each finish its current batch"""
+        if not self.processes:
+            return
+        
+        event_bus.unsubscribe(events.TRANSACTION_QUEUED, self._wake_process)
+        self.process_stop.set()
+        self.supervisor.join()
+        self.wake_processes()
+        for process, _ in self.processes.values():
+            process.join(WORKER_PROCESS_CONFIG['stop_timeout'])
+            if process.is_alive():
+                print(f"{process.name} did not stop in time, terminating it")
+                process.terminate()
+                process.join()
+                requeue_stale_claims(claim_owner(process.pid))
+        self.processes = {}
+        
+        self.process_events.put(None)
+        self.relay.join()
+    
+    def start_concurrent_transfers_demo(self):
+        """Demonstrate concurrent transfers with potential race conditions.
+        
+        Returns True if no money was lost or created and both balances
+        reconcile with the transfer history.
+        """
+        print("\n=== Concurrent Transfers Demo ===")
+        
+        # Create test accounts
+        from banking.accounts import AccountManager
+        from banking.reconciliation import reconcile
+        from banking.transfers import TransferManager
+        
+        # Create two test accounts with initial balances
+        AccountManager.create_account(1, 'SAVINGS', 1000.00)
+        AccountManager.create_account(2, 'SAVINGS', 1000.00)
+        
+        accounts = AccountManager.get_accounts(1)
+        account1 = accounts[0]['account_number']
+        account2 = AccountManager.get_accounts(2)[0]['account_number']
+        
+        print(f"Account 1: {account1}, Account 2: {account2}")
+        print("Initial balances:")
+        print(f"Account 1: {AccountManager.get_account_balance(account1)}")
+        print(f"Account 2: {AccountManager.get_account_balance(account2)}")
+        
+        # Function to perform transfers
+        moved = []  # Amounts of the transfers that succeeded
+        def transfer_worker(amount, iterations):
+            for _ in range(iterations):
+                success, _ = TransferManager.transfer_funds(account1, account2, amount, "Demo transfer")
+                if success:
+                    moved.append(amount)
+                time.sleep(random.uniform(0.01, 0.1))
+        
+        # Create multiple threads performing transfers
+        threads = []
+        for i in range(5):
+            amount = random.randint(1, 10)
+            t = threading.Thread(
+                target=transfer_worker,
+                args=(amount, 10),
+                name=f"TransferWorker-{i+1}"
+            )
+            threads.append(t)
+            t.start()
+        
+        # Wait for all threads to complete
+        for t in threads:
+            t.join()
+        
+        # Show final balances
+        balance1 = AccountManager.get_account_balance(account1)
+        balance2 = AccountManager.get_account_balance(account2)
+        print("\nFinal balances:")
+        print(f"Account 1: {balance1}")
+        print(f"Account 2: {balance2}")
+        
+        # Every successful transfer moved its amount exactly once
+        total = sum(moved)
+        conserved = (round(float(balance1), 2), round(float(balance2), 2)) == (1000.00 - total, 1000.00 + total)
+        print(f"{len(moved)} transfers moved {total:.2f}: "
+              f"{'balances are consistent' if conserved else 'BALANCES ARE INCONSISTENT'}")
+        
+        # And the balances agree with what the transfer history says
+        report = reconcile(save=False, limit=0)
+        if report['discrepancy_count']:
+            report = reconcile(save=False, limit=report['discrepancy_count'])
+        off = [row for row in report['discrepancies'] if row['account_number'] in (account1, account2)]
+        for row in off:
+            print(f"Account {row['account_number']} is off by {row['difference']:+.2f} against its history")
+        if not off:
+            print("Both balances reconcile with the transfer history")
+        return conserved and not off
+    
+    def stop_all(self):
+        """Stop all running threads and worker processes"""
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join()
+        self.stop_processes()
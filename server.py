@@ -0,0 +1,334 @@
+"""Headless HTTP/JSON API for the banking engine.
+
+Serves the account, transfer, transaction and login operations on a local
+port, for integrations and load tests that should not drive the GUI. One
+asyncio event loop holds the connections (HTTP/1.1 keep-alive); banking
+calls run on the worker threads of a BankingService (API_CONFIG workers).
+Requests other than /register and /login need the session_id that /login
+returns, as "Authorization: Bearer <session_id>".
+
+    POST /register                          username, password, full_name, email
+    POST /login                             username, password
+    POST /logout
+    GET  /accounts
+    POST /accounts                          account_type (accounts open empty)
+    GET  /accounts/<number>/balance
+    GET  /accounts/<number>/transfers       ?limit=10
+    GET  /accounts/<number>/transactions    ?limit=10
+    POST /transfers                         source_account, destination_account, amount,
+                                            description, idempotency_key
+    POST /transactions                      account_number, transaction_type (DEPOSIT or
+                                            WITHDRAWAL), amount, description
+
+Usage: python server.py [--host 127.0.0.1] [--port 8080] [--database smart_banking.db] [--queue-workers 1]
+"""
+import argparse
+import asyncio
+import datetime
+import decimal
+import json
+import math
+import os
+import re
+import sys
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from config import API_CONFIG, DB_CONFIG
+from banking.accounts import AccountManager
+from banking.service import BankingService
+from banking.transactions import TransactionManager
+
+class HTTPError(Exception):
+    """Ends a request with an error status and {"error": message}"""
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+def _json_default(value):
+    # MySQL returns DECIMAL balances and DATETIME timestamps
+    if isinstance(value, decimal.Decimal):
+        return float(value)
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat(sep=' ')
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def _field(body, name, kind=str, required=True):
+    value = body.get(name)
+    if value is None:
+        if required:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"Missing field '{name}'")
+        return None
+    try:
+        value = kind(value)
+    except (TypeError, ValueError, OverflowError):
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f"Invalid field '{name}'") from None
+    # json.loads accepts NaN and Infinity, which no amount comparison rejects
+    if kind is float and not math.isfinite(value):
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f"Invalid field '{name}'")
+    return value
+
+class BankingAPI:
+    """Routes JSON requests to the banking managers through a BankingService"""
+    def __init__(self, service=None, config=None):
+        self.config = dict(API_CONFIG, **(config or {}))
+        self.service = service or BankingService({'db_threads': self.config['workers'],
+                                                  'max_in_flight': self.config['max_in_flight']})
+        self.routes = [
+            ('POST', re.compile(r'/register'), self.register, False),
+            ('POST', re.compile(r'/login'), self.login, False),
+            ('POST', re.compile(r'/logout'), self.logout, True),
+            ('GET', re.compile(r'/accounts'), self.accounts, True),
+            ('POST', re.compile(r'/accounts'), self.create_account, True),
+            ('GET', re.compile(r'/accounts/(\w+)/balance'), self.balance, True),
+            ('GET', re.compile(r'/accounts/(\w+)/transfers'), self.transfers, True),
+            ('GET', re.compile(r'/accounts/(\w+)/transactions'), self.transactions, True),
+            ('POST', re.compile(r'/transfers'), self.transfer, True),
+            ('POST', re.compile(r'/transactions'), self.enqueue, True)
+        ]
+
+    # --- HTTP ---
+
+    async def handle_connection(self, reader, writer):
+        """Serve the requests of one connection until it closes or idles out"""
+        try:
+            while True:
+                try:
+                    request_line = await asyncio.wait_for(reader.readline(), self.config['keepalive_timeout'])
+                except asyncio.TimeoutError:
+                    break
+                if not request_line.strip():
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self._respond(writer, HTTPStatus.BAD_REQUEST, {'error': "Malformed request line"}, False)
+                    break
+                keep_alive = (headers.get('connection', '').lower() != 'close' if version == 'HTTP/1.1'
+                              else headers.get('connection', '').lower() == 'keep-alive')
+
+                if 'transfer-encoding' in headers:
+                    await self._respond(writer, HTTPStatus.LENGTH_REQUIRED, {'error': "Send a Content-Length"}, False)
+                    break
+                try:
+                    length = int(headers.get('content-length') or 0)
+                except ValueError:
+                    await self._respond(writer, HTTPStatus.BAD_REQUEST, {'error': "Invalid Content-Length"}, False)
+                    break
+                if length > self.config['max_body']:
+                    await self._respond(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {'error': "Body too large"}, False)
+                    break
+                body = await reader.readexactly(length) if length else b''
+
+                status, payload = await self.dispatch(method, target, headers, body)
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except asyncio.CancelledError:
+            # The server is shutting down
+            pass
+        finally:
+            writer.close()
+
+    async def _respond(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload, default=_json_default).encode('utf-8')
+        writer.write(
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode('latin-1') + body
+        )
+        await writer.drain()
+
+    async def dispatch(self, method, target, headers, body):
+        """Run the route of a request. Returns (HTTPStatus, JSON payload)"""
+        url = urlsplit(target)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        try:
+            allowed = False
+            for route_method, pattern, handler, needs_session in self.routes:
+                match = pattern.fullmatch(url.path)
+                if not match:
+                    continue
+                allowed = True
+                if route_method != method:
+                    continue
+
+                try:
+                    data = json.loads(body) if body else {}
+                except ValueError:
+                    raise HTTPError(HTTPStatus.BAD_REQUEST, "Body is not JSON") from None
+                if not isinstance(data, dict):
+                    raise HTTPError(HTTPStatus.BAD_REQUEST, "Body must be a JSON object")
+
+                session = await self._session(headers) if needs_session else None
+                return await handler(session, *match.groups(), query=query, body=data, headers=headers)
+
+            if allowed:
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, f"{method} is not allowed on {url.path}")
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"No route for {url.path}")
+        except HTTPError as err:
+            return err.status, {'error': err.message}
+        except Exception as err:
+            print(f"API error on {method} {url.path}: {err}")
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {'error': "Internal error"}
+
+    async def _session(self, headers):
+        """(session_id, user) of the request's bearer token"""
+        scheme, _, session_id = headers.get('authorization', '').partition(' ')
+        if scheme.lower() != 'bearer' or not session_id:
+            raise HTTPError(HTTPStatus.UNAUTHORIZED, "Log in and send 'Authorization: Bearer <session_id>'")
+        valid, user = await self.service.call(self.service.auth.validate_session, session_id.strip())
+        if not valid:
+            raise HTTPError(HTTPStatus.UNAUTHORIZED, "Session expired or unknown")
+        return session_id.strip(), user
+
+    async def _own_account(self, session, account_number):
+        """The caller's account with this number (404 for other people's accounts too)"""
+        accounts = await self.service.call(AccountManager.get_accounts, session[1]['user_id']) or []
+        for account in accounts:
+            if account['account_number'] == account_number:
+                return account
+        raise HTTPError(HTTPStatus.NOT_FOUND, f"No account {account_number}")
+
+    # --- Routes ---
+
+    async def register(self, session, query, body, headers):
+        success, message = await self.service.call(
+            self.service.auth.register_user, _field(body, 'username'), _field(body, 'password'),
+            _field(body, 'full_name'), _field(body, 'email')
+        )
+        if not success:
+            raise HTTPError(HTTPStatus.CONFLICT, message)
+        return HTTPStatus.CREATED, {'message': message}
+
+    async def login(self, session, query, body, headers):
+        success, result = await self.service.login(_field(body, 'username'), _field(body, 'password'))
+        if not success:
+            raise HTTPError(HTTPStatus.UNAUTHORIZED, result)
+        return HTTPStatus.OK, {'session_id': result['user']['session_id'], 'user': result['user']}
+
+    async def logout(self, session, query, body, headers):
+        await self.service.call(self.service.auth.logout, session[0])
+        return HTTPStatus.OK, {'message': "Logged out"}
+
+    async def accounts(self, session, query, body, headers):
+        accounts = await self.service.call(AccountManager.get_accounts, session[1]['user_id'])
+        if accounts is None:
+            raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, "Accounts are unavailable")
+        return HTTPStatus.OK, {'accounts': accounts}
+
+    async def create_account(self, session, query, body, headers):
+        account_type = _field(body, 'account_type').upper()
+        if account_type not in ('SAVINGS', 'CHECKING', 'BUSINESS'):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "account_type must be SAVINGS, CHECKING or BUSINESS")
+        if 'initial_balance' in body:
+            # Clients would otherwise mint money; funds arrive by deposit or transfer
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "initial_balance cannot be set; accounts open empty")
+        success, result = await self.service.call(AccountManager.create_account, session[1]['user_id'],
+                                                  account_type)
+        if not success:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, result)
+        return HTTPStatus.CREATED, {'account_number': result}
+
+    async def balance(self, session, account_number, query, body, headers):
+        await self._own_account(session, account_number)
+        balance = await self.service.call(AccountManager.get_account_balance, account_number)
+        return HTTPStatus.OK, {'account_number': account_number, 'balance': balance}
+
+    async def transfers(self, session, account_number, query, body, headers):
+        await self._own_account(session, account_number)
+        history = await self.service.history(account_number, _field(query, 'limit', int, required=False) or 10)
+        return HTTPStatus.OK, {'transfers': history or []}
+
+    async def transactions(self, session, account_number, query, body, headers):
+        account = await self._own_account(session, account_number)
+        history = await self.service.call(TransactionManager.get_transaction_history, account['account_id'],
+                                          _field(query, 'limit', int, required=False) or 10)
+        return HTTPStatus.OK, {'transactions': history or []}
+
+    async def transfer(self, session, query, body, headers):
+        source_account = _field(body, 'source_account')
+        await self._own_account(session, source_account)
+        success, message = await self.service.transfer(
+            source_account, _field(body, 'destination_account'), _field(body, 'amount', float),
+            _field(body, 'description', required=False),
+            _field(body, 'idempotency_key', required=False) or headers.get('idempotency-key')
+        )
+        if not success:
+            raise HTTPError(HTTPStatus.UNPROCESSABLE_ENTITY, message)
+        return HTTPStatus.OK, {'message': message}
+
+    async def enqueue(self, session, query, body, headers):
+        account = await self._own_account(session, _field(body, 'account_number'))
+        transaction_type = _field(body, 'transaction_type').upper()
+        if transaction_type not in ('DEPOSIT', 'WITHDRAWAL'):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "transaction_type must be DEPOSIT or WITHDRAWAL")
+        amount = _field(body, 'amount', float)
+        if amount <= 0:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "amount must be greater than zero")
+        transaction_id = await self.service.enqueue(account['account_id'], transaction_type, amount,
+                                                    _field(body, 'description', required=False))
+        if transaction_id is None:
+            raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, "The transaction could not be queued")
+        return HTTPStatus.ACCEPTED, {'transaction_id': transaction_id}
+
+async def serve(api, host, port, started=None):
+    """Serve api until cancelled; started(server) is called once it listens"""
+    server = await asyncio.start_server(api.handle_connection, host, port, backlog=API_CONFIG['backlog'])
+    if started:
+        started(server)
+    async with server:
+        await server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default=API_CONFIG['host'])
+    parser.add_argument('--port', type=int, default=API_CONFIG['port'])
+    parser.add_argument('--database', help="SQLite database file (default from config)")
+    parser.add_argument('--queue-workers', type=int, default=1,
+                        help="threads processing queued transactions (0 to leave them queued)")
+    args = parser.parse_args()
+
+    if args.database:
+        DB_CONFIG['database'] = args.database
+
+    from banking.bootstrap import database_bootstrap
+    if not database_bootstrap.run():
+        print(f"[!] Database connection error: {database_bootstrap.error}")
+        return 1
+
+    threads = None
+    if args.queue_workers:
+        from os_concepts.multithreading import BankingThreads
+        threads = BankingThreads()
+        threads.start_transaction_processors(args.queue_workers)
+
+    api = BankingAPI()
+    started = lambda server: print(f"Serving on http://{args.host}:{server.sockets[0].getsockname()[1]}", flush=True)
+    try:
+        asyncio.run(serve(api, args.host, args.port, started))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if threads:
+            threads.stop_all()
+        api.service.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+import io
+import os
+import tempfile
+import time
+import unittest
+from contextlib import redirect_stderr
+from datetime import datetime, timezone
+from unittest.mock import patch
+from banking import analytics, events
+from banking.analytics import (RollupEngine, aggregate, bucket_start, main, recent_buckets, spending_trend,
+                               top_payees)
+from banking.bootstrap import bootstrap_schema
+from banking.db_adapter import DatabaseAdapter
+from banking.events import EventBus
+from banking.storage import MemoryStorage, SQLiteStorage, set_storage
+from banking.transfers import TransferManager
+from config import DB_CONFIG
+
+class TestBuckets(unittest.TestCase):
+    """Test bucketing and aggregation"""
+
+    def test_buckets(self):
+        """Times fall in the bucket that starts at their hour, day or month"""
+        self.assertEqual(bucket_start('2024-02-29 13:45:10', analytics.HOURLY), '2024-02-29 13:00:00')
+        self.assertEqual(bucket_start('2024-02-29 13:45:10', analytics.DAILY), '2024-02-29 00:00:00')
+        self.assertEqual(bucket_start(datetime(2024, 2, 29, 13, 45), analytics.MONTHLY), '2024-02-01 00:00:00')
+        self.assertEqual(bucket_start('2024-02-29 13:45:10', analytics.ALL_TIME), '')
+
+        now = datetime(2024, 1, 1, 0, 30, tzinfo=timezone.utc)
+        self.assertEqual(recent_buckets(analytics.MONTHLY, 3, now),
+                         ['2023-11-01 00:00:00', '2023-12-01 00:00:00', '2024-01-01 00:00:00'])
+        self.assertEqual(recent_buckets(analytics.HOURLY, 2, now), ['2023-12-31 23:00:00', '2024-01-01 00:00:00'])
+        self.assertEqual(recent_buckets(analytics.DAILY, 1, now), ['2024-01-01 00:00:00'])
+
+    def test_aggregate(self):
+        """Rows of one batch are summed per account, granularity, counterparty and bucket"""
+        rows = [
+            (1, '111', '222', 'OUTGOING', 10.0, '2024-05-01 10:15:00'),
+            (2, '222', '111', 'INCOMING', 10.0, '2024-05-01 10:15:00'),
+            (3, '111', '333', 'OUTGOING', 2.5, '2024-05-01 11:00:00'),
+            (4, '111', '222', 'OUTGOING', 0.1, '2024-05-02 09:00:00')
+        ]
+        rollups = {row[:4]: row[4:] for row in aggregate(rows)}
+        self.assertEqual(rollups[('111', 'M', '', '2024-05-01 00:00:00')], (0.0, 0, 12.6, 3))
+        self.assertEqual(rollups[('111', 'H', '', '2024-05-01 10:00:00')], (0.0, 0, 10.0, 1))
+        self.assertEqual(rollups[('111', 'A', '222', '')], (0.0, 0, 10.1, 2))
+        self.assertEqual(rollups[('222', 'D', '111', '2024-05-01 00:00:00')], (10.0, 1, 0.0, 0))
+        self.assertNotIn(('111', 'H', '222', '2024-05-01 10:00:00'), rollups)
+        self.assertEqual(len(rollups), 6 + 6 + 4 + 3)
+
+class TestRollupEngine(unittest.TestCase):
+    """Test incremental rollups on the in-memory backend"""
+
+    def setUp(self):
+        self.storage = MemoryStorage()
+        previous = set_storage(self.storage)
+        self.addCleanup(set_storage, previous)
+        for user_id, number in ((1, '111'), (1, '112'), (2, '222'), (3, '333')):
+            self.storage.create_account(user_id, number, 'SAVINGS', 1000.0)
+        self.bus = EventBus()
+        self.updates = []
+        self.bus.subscribe(events.ANALYTICS_UPDATED, lambda topic, payload: self.updates.append(payload))
+
+    def test_incremental_updates(self):
+        """Each transfer is rolled up once, in batches, from the high-water mark"""
+        for destination, amount in (('222', 30.0), ('333', 5.0), ('222', 20.0), ('112', 100.0)):
+            self.storage.transfer('111', destination, amount)
+
+        engine = RollupEngine(batch_size=3, bus=self.bus)
+        self.assertEqual(engine.update(max_batches=1), 3)
+        self.assertEqual(engine.update(), 5)
+        self.assertEqual(engine.update(), 0)
+        self.assertEqual(self.storage.get_rollup_watermark(), 8)
+        self.assertEqual(self.updates[-1]['account_numbers'], {'333', '111', '222', '112'})
+
+        self.assertEqual(top_payees(1), [{'counterparty': '222', 'amount': 50.0, 'count': 2},
+                                         {'counterparty': '333', 'amount': 5.0, 'count': 1}])
+        self.assertEqual(top_payees(1, limit=1)[0]['counterparty'], '222')
+        trend = spending_trend(1, periods=3)
+        self.assertEqual([day['bucket'] for day in trend], recent_buckets(analytics.DAILY, 3))
+        self.assertEqual((trend[-1]['amount_out'], trend[-1]['count_out'], trend[-1]['amount_in']),
+                         (155.0, 4, 100.0))
+        self.assertEqual(trend[0]['count_out'], 0)
+
+    def test_missing_transfers_hold_the_watermark(self):
+        """Rollups stop at a missing transfer_id until it commits or has settled"""
+        for amount in (1.0, 2.0, 4.0):
+            self.storage.transfer('111', '222', amount)
+        in_flight = self.storage._transfers[2:4]
+        del self.storage._transfers[2:4]
+
+        engine = RollupEngine(bus=self.bus)
+        self.assertEqual(engine.update(), 2)
+        self.assertTrue(engine.waiting)
+        self.assertEqual(self.storage.get_rollup_watermark(), 2)
+
+        self.storage._transfers[2:2] = in_flight
+        self.assertEqual(engine.update(), 4)
+        self.assertFalse(engine.waiting)
+        self.assertEqual(top_payees(1)[0]['amount'], 7.0)
+
+        # A rolled back transfer: its gap is passed once the row after it has settled
+        self.storage.transfer('111', '222', 8.0)
+        self.storage.transfer('111', '222', 16.0)
+        del self.storage._transfers[6:8]
+        self.assertEqual(engine.update(), 0)
+        for row in self.storage._transfers[6:]:
+            row['created_at'] = '2024-01-01 00:00:00'
+        self.assertEqual(engine.update(), 2)
+        self.assertEqual((self.storage.get_rollup_watermark(), top_payees(1)[0]['amount']), (10, 23.0))
+
+    def test_concurrent_updaters(self):
+        """An updater that lost the race to another process moves on from its mark"""
+        self.storage.transfer('111', '222', 1.0)
+        apply = self.storage.apply_rollup
+        calls = []
+        def another_process_first(after, high_water, aggregates):
+            calls.append(after)
+            if len(calls) == 1:
+                apply(after, high_water, aggregates)
+            return apply(after, high_water, aggregates)
+
+        with patch.object(self.storage, 'apply_rollup', side_effect=another_process_first):
+            self.assertEqual(RollupEngine(bus=self.bus).update(), 0)
+        self.assertEqual(calls, [0])
+        self.assertEqual(top_payees(1), [{'counterparty': '222', 'amount': 1.0, 'count': 1}])
+        self.assertEqual(self.updates, [])
+
+    def test_background_updates(self):
+        """The running engine rolls up after transfers"""
+        engine = RollupEngine(delay=0.01, bus=self.bus)
+        with patch('banking.transfers.event_bus', self.bus):
+            self.assertTrue(engine.start())
+            self.addCleanup(engine.stop)
+            self.assertFalse(engine.start())
+            TransferManager.transfer_funds('111', '333', 12.0)
+
+            deadline = time.monotonic() + 5
+            while self.storage.get_rollup_watermark() < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+        self.assertEqual(self.storage.get_rollup_watermark(), 2)
+        engine.stop()
+        self.assertIsNone(engine.thread)
+
+    def test_cli(self):
+        """The command line entry point brings the rollups up to date"""
+        self.storage.transfer('111', '222', 7.0)
+        with redirect_stderr(io.StringIO()) as output:
+            self.assertEqual(main(['--batch-size', '1']), 0)
+            with patch.object(self.storage, 'get_rollup_watermark', side_effect=OSError("Database is locked")):
+                self.assertEqual(main([]), 1)
+        self.assertIn("Rolled up 2 transfer history rows", output.getvalue())
+        self.assertIn("Rollup failed: Database is locked", output.getvalue())
+
+class TestSQLiteRollups(unittest.TestCase):
+    """Test rollups against a bootstrapped SQLite database"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        patcher = patch.dict(DB_CONFIG, {'database': os.path.join(tmp.name, 'test.db')})
+        patcher.start()
+        self.addCleanup(tmp.cleanup)
+        self.addCleanup(patcher.stop)
+        self.addCleanup(DatabaseAdapter.close_all)
+
+        with patch('security.hashing.generate_hash', return_value=('salt', 'hash')):
+            bootstrap_schema()
+        self.storage = SQLiteStorage()
+        previous = set_storage(self.storage)
+        self.addCleanup(set_storage, previous)
+
+    def test_rollups_match_history(self):
+        """Rolled up totals equal the sums over the raw history"""
+        self.storage.create_accounts([(i % 3, f'{i:03d}', 'SAVINGS', 1000.0) for i in range(9)])
+        paid = {}
+        for i in range(300):
+            source, destination = f'{i % 9:03d}', f'{(i * 5 + 1) % 9:03d}'
+            amount = round(0.37 * (i % 11 + 1), 2)
+            self.assertTrue(self.storage.transfer(source, destination, amount)[0])
+            if int(source) % 3 == 0 and int(destination) % 3 != 0:
+                paid[destination] = round(paid.get(destination, 0.0) + amount, 2)
+
+        self.assertEqual(RollupEngine(batch_size=64, bus=EventBus()).update(), 600)
+        payees = top_payees(0, limit=10)
+        self.assertEqual({p['counterparty']: round(p['amount'], 2) for p in payees}, paid)
+        self.assertEqual(sorted(paid.values(), reverse=True), [round(p['amount'], 2) for p in payees])
+
+        days = self.storage.get_rollup_series(0, analytics.DAILY, '')
+        self.assertEqual(sum(day['count_out'] for day in days), 100)
+        self.assertEqual(RollupEngine(bus=EventBus()).update(), 0)
+
+if __name__ == '__main__':
+    unittest.main()
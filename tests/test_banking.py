@@ -1,23 +1,86 @@
+import copy
+import os
+import tempfile
 import unittest
-from security.hashing import generate_hash, verify_password
-
-class TestSecurity(unittest.TestCase):
-    """Test security and authentication components"""
-    
-    def test_password_hashing(self):
-        """Test that password hashing and verification works"""
-        password = "securepassword123"
-        salt, pwdhash = generate_hash(password)
-        
-        # Should verify correct password
-        self.assertTrue(verify_password(pwdhash, salt, password))
-        
-        # Should reject wrong password
-        self.assertFalse(verify_password(pwdhash, salt, "wrongpassword"))
-        
-        # Different salts should produce different hashes
-        _, newhash = generate_hash(password)
-        self.assertNotEqual(pwdhash, newhash)
+from unittest.mock import patch
+from banking.bootstrap import bootstrap_schema
+from banking.db_adapter import DatabaseAdapter
+from banking.storage import SQLiteStorage, get_storage, set_storage
+from benchmarks.load_suite import LoadSuite, compare
+from config import DB_CONFIG
+
+class TestBankingUnderLoad(unittest.TestCase):
+    """Run a short load suite on a temporary SQLite database"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        patcher = patch.dict(DB_CONFIG, {'database': os.path.join(tmp.name, 'test.db')})
+        patcher.start()
+        self.addCleanup(tmp.cleanup)
+        self.addCleanup(patcher.stop)
+        self.addCleanup(DatabaseAdapter.close_all)
+        previous = set_storage(SQLiteStorage())
+        self.addCleanup(set_storage, previous)
+        # Hashing is what makes logins slow on purpose; the suite measures it, the test does not need to
+        for name, fake in [('generate_hash', lambda password: ('salt', password)),
+                           ('verify_password', lambda stored, salt, password: stored == password)]:
+            patcher = patch(f'security.authh.{name}', side_effect=fake)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        with patch('security.hashing.generate_hash', return_value=('salt', 'hash')):
+            bootstrap_schema()
+
+    def test_invariants_hold(self):
+        """Concurrent transfers, logins, registrations and queued transactions keep the books balanced"""
+        suite = LoadSuite({'seconds': 1.0, 'users': 3, 'accounts': 6, 'threads': 2, 'queue_workers': 1,
+                           'rates': {'transfer': 40.0, 'login': 10.0, 'register': 10.0, 'enqueue': 20.0}})
+        suite.set_up()
+        results = suite.run()
+
+        self.assertEqual(results['invariants'], [])
+        scenarios = results['scenarios']
+        self.assertEqual(set(scenarios), {'transfer', 'login', 'register', 'enqueue', 'queue'})
+        self.assertEqual(scenarios['transfer']['operations'], 40)
+        self.assertEqual(scenarios['queue']['operations'], scenarios['enqueue']['operations'])
+        self.assertEqual(len(suite.registered), 10)
+        self.assertLessEqual(scenarios['transfer']['p50_ms'], scenarios['transfer']['p99_ms'])
+
+        # Money that appears outside the ledger breaks both balance checks
+        get_storage().adjust_balance(suite.accounts[0][1], 5.0)
+        failures = suite.check()
+        self.assertEqual(len(failures), 2)
+        self.assertTrue(failures[0].startswith("Balances total"))
+        self.assertEqual(failures[1], "1 accounts disagree with the ledger, 0 history rows belong to no account")
+
+class TestBaselineComparison(unittest.TestCase):
+    """Test the regression check against a stored baseline"""
+
+    def setUp(self):
+        self.baseline = {
+            'profile': {'seconds': 10.0, 'rates': {'transfer': 100.0}},
+            'scenarios': {'transfer': {'throughput': 100.0, 'p95_ms': 10.0, 'p99_ms': 20.0}},
+            'memory': {'growth_mb': 0.5}
+        }
+
+    def test_within_tolerance(self):
+        results = copy.deepcopy(self.baseline)
+        results['scenarios']['transfer'].update(throughput=80.0, p95_ms=19.0, p99_ms=34.0)
+        results['memory']['growth_mb'] = 1.5
+        self.assertEqual(compare(results, self.baseline, 0.5), [])
+
+    def test_regressions(self):
+        results = copy.deepcopy(self.baseline)
+        results['scenarios']['transfer'].update(throughput=40.0, p95_ms=30.0)
+        results['memory']['growth_mb'] = 5.0
+        self.assertEqual(compare(results, self.baseline, 0.5), [
+            "transfer: 40.0 operations/s, baseline 100.0",
+            "transfer: p95 30.0 ms, baseline 10.0 ms",
+            "Memory grew 5.0 MB, baseline 0.5 MB"
+        ])
+
+        results = copy.deepcopy(self.baseline)
+        results['profile']['seconds'] = 600.0
+        self.assertEqual(len(compare(results, self.baseline)), 1)
 
 if __name__ == '__main__':
-    unittest.main()
\ No newline at end of file
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from config import DB_CONFIG
+from banking.bootstrap import (DatabaseBootstrap, SCHEMA_VERSION, bootstrap_schema,
+                               get_schema_version, wait_for_database)
+from banking.db_adapter import DatabaseAdapter
+
+class TestBootstrap(unittest.TestCase):
+    """Test versioned schema bootstrap and readiness polling"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        patcher = patch.dict(DB_CONFIG, {'database': os.path.join(self.tmp.name, 'test.db')})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        DatabaseAdapter.close_all()
+        self.tmp.cleanup()
+
+    def test_bootstrap_is_idempotent(self):
+        """A fresh database is migrated once; a current one is left alone"""
+        self.assertEqual(bootstrap_schema(), SCHEMA_VERSION)
+
+        with DatabaseAdapter.reader() as conn:
+            self.assertEqual(get_schema_version(conn), SCHEMA_VERSION)
+            self.assertIsNotNone(DatabaseAdapter.fetch_one(conn, 'users.username_exists', ('admin',)))
+            self.assertIsNotNone(DatabaseAdapter.fetch_one(conn, 'schema.table_exists', ('transfer_history',)))
+
+        with patch('security.hashing.generate_hash') as generate_hash:
+            self.assertEqual(bootstrap_schema(), 0)
+        generate_hash.assert_not_called()
+
+    def test_mysql_upgrade_resumes(self):
+        """On MySQL, a migration that failed partway resumes after its last completed statement"""
+        statements = [
+            "CREATE TABLE schema_version (version INTEGER)",
+            "CREATE TABLE ledger (amount INTEGER)",
+            "INSERT INTO ledger (amount) VALUES (1)",
+            "INSERT INTO missing_table (amount) VALUES (2)"
+        ]
+        migrations = {1: {'mysql': statements}}
+        with patch('banking.bootstrap.DB_TYPE', 'mysql'), patch('banking.bootstrap.MIGRATIONS', migrations), \
+                patch('banking.bootstrap.SCHEMA_VERSION', 1), patch('banking.bootstrap._ensure_admin'):
+            with self.assertRaises(Exception):
+                bootstrap_schema()
+            # Rerunning the CREATE TABLEs or the first INSERT would fail or double the row
+            statements[3] = "INSERT INTO ledger (amount) VALUES (2)"
+            self.assertEqual(bootstrap_schema(), 1)
+
+            with DatabaseAdapter.reader() as conn:
+                self.assertEqual(get_schema_version(conn), 1)
+                self.assertEqual([row[0] for row in conn.execute("SELECT amount FROM ledger ORDER BY amount")], [1, 2])
+                self.assertEqual(conn.execute("SELECT COUNT(*) FROM schema_steps").fetchone()[0], 4)
+
+    def test_wait_for_database_backs_off(self):
+        """Readiness polling retries with growing delays, then gives up"""
+        failures = [ConnectionError("down"), ConnectionError("down")]
+
+        def probe():
+            if failures:
+                raise failures.pop(0)
+
+        with patch('banking.bootstrap.time.sleep') as sleep:
+            self.assertEqual(wait_for_database(timeout=5, initial_delay=0.1, probe=probe), 3)
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [0.1, 0.2])
+
+        def always_down():
+            raise ConnectionError("down")
+
+        with self.assertRaises(ConnectionError):
+            wait_for_database(timeout=0.05, initial_delay=0.01, probe=always_down)
+
+    def test_background_bootstrap(self):
+        """The bootstrap thread reports when the database is ready"""
+        bootstrap = DatabaseBootstrap()
+        self.assertEqual(bootstrap.state, DatabaseBootstrap.CONNECTING)
+        bootstrap.start()
+        self.assertTrue(bootstrap.wait(10))
+        self.assertIsNone(bootstrap.error)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import importlib.util
+import os
+import unittest
+
+def account(number, verified=0, bank_name="Test Bank"):
+    return {'bank_name': bank_name, 'account_number': number, 'is_verified': verified}
+
+@unittest.skipUnless(importlib.util.find_spec('PyQt5'), "PyQt5 is not installed")
+class TestBankAccountCardList(unittest.TestCase):
+    """Test that linked bank cards are recycled rather than rebuilt"""
+
+    @classmethod
+    def setUpClass(cls):
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        from PyQt5.QtWidgets import QApplication
+        cls.app = QApplication.instance() or QApplication([])
+
+    def setUp(self):
+        from gui.dashboard import BankAccountCardList
+        self.cards = BankAccountCardList()
+        self.addCleanup(self.cards.deleteLater)
+
+    def test_refresh_touches_only_changed_cards(self):
+        """Unchanged accounts keep their card and cost nothing"""
+        accounts = [account(f"10000000{i:04d}") for i in range(30)]
+        self.assertEqual(self.cards.set_accounts(accounts), 30)
+        first = self.cards.cards[accounts[0]['account_number']]
+
+        self.assertEqual(self.cards.set_accounts(accounts), 0)
+        accounts[0] = account(accounts[0]['account_number'], verified=1)
+        self.assertEqual(self.cards.set_accounts(accounts), 1)
+        self.assertIs(self.cards.cards[accounts[0]['account_number']], first)
+        self.assertEqual(first.status.text(), "✓ Verified")
+        self.assertTrue(self.cards.empty_label.isHidden())
+
+    def test_removed_cards_are_pooled(self):
+        """Cards of removed accounts are reused for new ones"""
+        self.cards.set_accounts([account("111122223333"), account("444455556666")])
+        removed = self.cards.cards["444455556666"]
+
+        self.cards.set_accounts([account("111122223333")])
+        self.assertEqual(self.cards.pool, [removed])
+
+        self.cards.set_accounts([account("777788889999"), account("111122223333")])
+        self.assertIs(self.cards.cards["777788889999"], removed)
+        self.assertEqual(self.cards.pool, [])
+        self.assertEqual(self.cards.cards_layout.indexOf(removed), 1)
+
+        self.cards.set_accounts([])
+        self.assertFalse(self.cards.empty_label.isHidden())
+
+if __name__ == '__main__':
+    unittest.main()
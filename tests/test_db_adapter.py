@@ -0,0 +1,104 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest.mock import Mock, patch
+from config import DB_CONFIG
+from banking.db_adapter import DatabaseAdapter
+
+class TestDatabaseAdapter(unittest.TestCase):
+    """Test the SQLite tuning profile and reader/writer connection model"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        patcher = patch.dict(DB_CONFIG, {'database': os.path.join(self.tmp.name, 'test.db')})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        DatabaseAdapter.close_all()
+        self.tmp.cleanup()
+
+    def test_tuning_profile(self):
+        """Writer connections run in WAL mode with a busy timeout"""
+        with DatabaseAdapter.writer() as db:
+            self.assertEqual(db.execute("PRAGMA journal_mode").fetchone()[0], 'wal')
+            self.assertGreater(db.execute("PRAGMA busy_timeout").fetchone()[0], 0)
+
+    def test_readers_are_read_only(self):
+        """Reads go through read-only connections that see committed writes"""
+        DatabaseAdapter.execute_query("CREATE TABLE items (name TEXT)", commit=True)
+        DatabaseAdapter.execute_query("INSERT INTO items (name) VALUES (%s)", ('a',), commit=True)
+
+        rows = DatabaseAdapter.execute_query("SELECT name FROM items", fetch_all=True, dictionary=True)
+        self.assertEqual([row['name'] for row in rows], ['a'])
+
+        with DatabaseAdapter.reader() as db:
+            with self.assertRaises(sqlite3.OperationalError):
+                db.execute("INSERT INTO items (name) VALUES ('b')")
+
+class TestMySQLConnections(unittest.TestCase):
+    """Test that MySQL connections and prepared cursors are kept per thread (on mock connections)"""
+
+    def setUp(self):
+        self.connections = []
+        patchers = [patch('banking.db_adapter.DB_TYPE', 'mysql'),
+                    patch.object(DatabaseAdapter, 'get_connection', side_effect=self._connect)]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(DatabaseAdapter.close_all)
+
+    def _connect(self):
+        conn = Mock(in_transaction=False)
+        conn.cursor.side_effect = lambda **kwargs: Mock(rowcount=1, column_names=('n',),
+                                                        fetchall=Mock(return_value=[(1,)]))
+        self.connections.append(conn)
+        return conn
+
+    def test_connections_are_reused(self):
+        """Blocks of one thread share a connection; nested blocks and other threads get their own"""
+        with DatabaseAdapter.writer() as first:
+            with DatabaseAdapter.reader() as nested:
+                self.assertIsNot(nested, first)
+        with DatabaseAdapter.reader() as again:
+            self.assertIn(again, (first, nested))
+
+        seen = []
+
+        def other_thread():
+            with DatabaseAdapter.reader() as conn:
+                seen.append(conn)
+
+        thread = threading.Thread(target=other_thread)
+        thread.start()
+        thread.join()
+        self.assertEqual(len(self.connections), 3)
+        self.assertNotIn(seen[0], (first, nested))
+
+        DatabaseAdapter.close_all()
+        first.close.assert_called_once_with()
+
+    def test_prepared_cursors_are_kept(self):
+        """A statement is prepared once per connection, and callers cannot close its cursor"""
+        with DatabaseAdapter.writer() as conn:
+            for _ in range(3):
+                DatabaseAdapter.execute(conn, 'users.username_exists', ('admin',)).close()
+                self.assertEqual(DatabaseAdapter.fetch_one(conn, 'users.username_exists', ('admin',)), {'n': 1})
+        self.assertEqual(conn.cursor.call_count, 1)
+        self.assertEqual(conn.cursor.call_args.kwargs, {'prepared': True})
+        self.assertEqual(len(self.connections), 1)
+
+    def test_broken_connections_are_dropped(self):
+        """A connection that failed and no longer answers is replaced"""
+        with self.assertRaises(RuntimeError):
+            with DatabaseAdapter.writer() as conn:
+                conn.is_connected.return_value = False
+                raise RuntimeError("connection lost")
+        conn.close.assert_called_once_with()
+        with DatabaseAdapter.reader() as replacement:
+            self.assertIsNot(replacement, conn)
+
+if __name__ == '__main__':
+    unittest.main()
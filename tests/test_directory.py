@@ -0,0 +1,86 @@
+import math
+import unittest
+from banking.directory import PhoneDirectory, PhoneIndex, normalize_phone, normalize_prefix
+from banking.storage import MemoryStorage, set_storage
+
+class TestPhoneDirectory(unittest.TestCase):
+    """Test phone number normalization, lookup and phone payments"""
+
+    def setUp(self):
+        self.storage = MemoryStorage()
+        previous = set_storage(self.storage)
+        self.addCleanup(set_storage, previous)
+
+        self.storage.create_account(1, '111', 'SAVINGS', 100.0)
+        self.storage.create_account(2, '222', 'SAVINGS', 0.0)
+        self.directory = PhoneDirectory()
+
+    def test_normalize(self):
+        """Numbers in any common notation map to one E.164 key"""
+        for number in ("98765 43210", "098765-43210", "+91 98765 43210", "0091 (98765) 43210"):
+            self.assertEqual(normalize_phone(number), "+919876543210")
+        self.assertEqual(normalize_phone("(415) 555-2671", country_code="+1"), "+14155552671")
+        self.assertEqual(normalize_prefix("987"), "+91987")
+        self.assertEqual(normalize_prefix(""), "")
+
+        for number in ("12345", "+91 98765 4321x", "+1234567890123456"):
+            with self.assertRaises(ValueError):
+                normalize_phone(number)
+
+    def test_register_lookup_and_search(self):
+        """Registered numbers are found by exact number or by prefix"""
+        self.assertTrue(self.directory.register("98765 43210", '222', "Bob")[0])
+        self.assertEqual(self.directory.register("+919876543210", '111', "Alice"),
+                         (False, "Phone number already registered"))
+        self.assertFalse(self.directory.register("123", '111', "Alice")[0])
+
+        self.assertEqual(self.directory.lookup("+91-98765-43210")['account_number'], '222')
+        self.assertIsNone(self.directory.lookup("98765 00000"))
+
+        # Registrations after the index was loaded are searchable right away
+        self.assertTrue(self.directory.register("98765 11111", '111', "Alice")[0])
+        self.assertEqual([e['display_name'] for e in self.directory.search("98765")], ["Alice", "Bob"])
+        self.assertEqual(self.directory.search("98765 4"), [self.directory.lookup("9876543210")])
+        self.assertEqual(self.directory.search("99"), [])
+
+    def test_pay_uses_transfer_engine(self):
+        """Phone payments move money and feed the recent payees list"""
+        self.directory.register("98765 43210", '222', "Bob")
+
+        self.assertEqual(self.directory.pay('111', "98765 00000", 10.0),
+                         (False, "Phone number is not registered"))
+        self.assertTrue(self.directory.pay('111', "98765 43210", 25.0)[0])
+        self.assertEqual(self.storage.get_balance('111'), 75.0)
+        self.assertEqual(self.storage.get_balance('222'), 25.0)
+        self.assertEqual([p['phone'] for p in self.directory.recent_payees(1)], ["+919876543210"])
+
+    def test_lookup_scales(self):
+        """Exact and prefix lookups binary-search a million entries instead of scanning them"""
+        size = 1000000
+        index = PhoneIndex.from_columns(
+            [f"+91{9000000000 + i}" for i in range(size)],
+            [f"{100000000000 + i}" for i in range(size)],
+            ["Payee"] * size
+        )
+        index.phones = CountingList(index.phones)
+        steps = math.ceil(math.log2(size)) + 1
+
+        for i in range(0, size, size // 100):
+            index.phones.reads = 0
+            self.assertIsNotNone(index.get(f"+91{9000000000 + i}"))
+            self.assertLessEqual(index.phones.reads, steps + 1)
+
+            index.phones.reads = 0
+            self.assertEqual(len(index.search(f"+91{9000000000 + i}"[:10], limit=5)), 5)
+            self.assertLessEqual(index.phones.reads, steps + 2 * 5)  # Two reads per match
+
+class CountingList(list):
+    """A list that counts how many items are read from it"""
+    reads = 0
+
+    def __getitem__(self, position):
+        self.reads += 1
+        return super().__getitem__(position)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import csv
+import importlib.util
+import io
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+from banking.export import ExportCancelled, detect_format, export_table, main, parse_bound
+from banking.storage import MemoryStorage, set_storage
+
+class TestExport(unittest.TestCase):
+    """Test streaming exports to files"""
+
+    def setUp(self):
+        self.storage = MemoryStorage()
+        previous = set_storage(self.storage)
+        self.addCleanup(set_storage, previous)
+
+        self.storage.create_account(1, '111', 'SAVINGS', 1000.0)
+        self.storage.create_account(2, '222', 'SAVINGS', 0.0)
+        for i in range(25):
+            self.storage.transfer('111', '222', float(i + 1), f"Payment {i}" if i % 2 else None)
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+
+    def test_csv(self):
+        """CSV exports have a header and every row, written batch by batch"""
+        path = os.path.join(self.dir, 'transfers.csv')
+        progress = []
+        self.assertEqual(export_table('transfer_history', path, batch_size=20, progress=progress.append), 50)
+        self.assertEqual(progress, [20, 40, 50])
+
+        with open(path, newline='', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+        self.assertEqual(len(rows), 50)
+        self.assertEqual((rows[0]['source_account'], rows[0]['amount'], rows[0]['description']), ('111', '1.0', ''))
+        self.assertFalse(os.path.exists(path + '.part'))
+
+    def test_jsonl_with_filters(self):
+        """JSON lines exports honour the account and date filters"""
+        self.storage.create_account(3, '333', 'SAVINGS', 0.0)
+        self.storage.transfer('111', '333', 7.0)
+
+        path = os.path.join(self.dir, 'transfers.jsonl')
+        self.assertEqual(export_table('transfer_history', path, account_number='333'), 2)
+        with open(path, encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual({row['transaction_type'] for row in rows}, {'OUTGOING', 'INCOMING'})
+
+        self.assertEqual(export_table('transfer_history', path, until='2000-01-01'), 0)
+        today = next(self.storage.export_rows('transfer_history'))[0]['created_at'][:10]
+        self.assertEqual(export_table('transfer_history', path, since=today, until=today), 52)
+
+    def test_cancel(self):
+        """A cancelled export leaves no file behind"""
+        path = os.path.join(self.dir, 'transfers.csv')
+        with self.assertRaises(ExportCancelled):
+            export_table('transfer_history', path, batch_size=10, cancelled=lambda: True)
+        self.assertEqual(os.listdir(self.dir), [])
+
+    def test_arguments(self):
+        """Formats follow the extension; bounds are validated and a bare end date is inclusive"""
+        self.assertEqual(detect_format('out.PARQUET'), 'parquet')
+        self.assertEqual(detect_format('out.ndjson'), 'jsonl')
+        self.assertEqual(parse_bound('2024-01-31', end=True), '2024-02-01 00:00:00')
+        self.assertEqual(parse_bound('2024-01-31 12:30'), '2024-01-31 12:30:00')
+        self.assertIsNone(parse_bound(''))
+        with self.assertRaises(ValueError):
+            parse_bound('yesterday')
+        with self.assertRaises(ValueError):
+            export_table('users', os.path.join(self.dir, 'users.csv'))
+
+    def test_cli(self):
+        """The command line entry point exports and reports failures with an exit code"""
+        path = os.path.join(self.dir, 'transfers.csv')
+        with redirect_stderr(io.StringIO()):
+            self.assertEqual(main(['transfer_history', path, '--account', '222', '--batch-size', '7']), 0)
+            self.assertEqual(main(['transfer_history', path, '--since', 'not a date']), 1)
+        with open(path, newline='', encoding='utf-8') as f:
+            self.assertEqual(len(list(csv.DictReader(f))), 50)
+
+    @unittest.skipUnless(importlib.util.find_spec('pyarrow'), "pyarrow is not installed")
+    def test_parquet(self):
+        """Parquet exports write one row group per batch with a fixed schema"""
+        import pyarrow.parquet
+        path = os.path.join(self.dir, 'transfers.parquet')
+        self.assertEqual(export_table('transfer_history', path, batch_size=20), 50)
+        parquet_file = pyarrow.parquet.ParquetFile(path)
+        self.assertEqual(parquet_file.metadata.num_rows, 50)
+        self.assertEqual(parquet_file.num_row_groups, 3)
+
+if __name__ == '__main__':
+    unittest.main()
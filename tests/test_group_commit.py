@@ -0,0 +1,109 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+from config import DB_CONFIG, GROUP_COMMIT_CONFIG
+from banking.db_adapter import DatabaseAdapter
+from banking.group_commit import GroupCommitWriter, shutdown_group_commit_writer
+from banking.transfers import TransferManager
+
+class TestGroupCommit(unittest.TestCase):
+    """Test batched writes through the group commit writer"""
+
+    def setUp(self):
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        conn = sqlite3.connect(self.db_path)
+        conn.executescript("""
+            CREATE TABLE accounts (
+                account_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                account_number TEXT NOT NULL UNIQUE,
+                balance REAL DEFAULT 0.00
+            );
+            CREATE TABLE transfer_history (
+                transfer_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                source_account TEXT NOT NULL,
+                destination_account TEXT NOT NULL,
+                amount REAL NOT NULL,
+                description TEXT,
+                transaction_type TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+            INSERT INTO accounts (account_number, balance) VALUES ('111', 100.0), ('222', 0.0);
+        """)
+        conn.commit()
+        conn.close()
+
+    def tearDown(self):
+        shutdown_group_commit_writer()
+        DatabaseAdapter.close_all()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(self.db_path + suffix):
+                os.remove(self.db_path + suffix)
+
+    def test_writes_are_batched(self):
+        """Concurrent writes share commits and failing writes are isolated"""
+        patcher = patch.dict(DB_CONFIG, {'database': self.db_path})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        writer = GroupCommitWriter(flush_interval_ms=50, max_batch_size=20)
+        writer.start()
+
+        def insert(conn, amount):
+            if amount < 0:
+                raise ValueError("negative amount")
+            cursor = conn.execute("""
+                INSERT INTO transfer_history
+                (source_account, destination_account, amount, transaction_type)
+                VALUES ('111', '222', ?, 'OUTGOING')
+            """, (amount,))
+            return cursor.lastrowid
+
+        futures = [writer.submit(lambda conn, a=amount: insert(conn, a))
+                   for amount in [1, 2, -1, 3, 4]]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result(5))
+            except ValueError:
+                results.append(None)
+        writer.stop()
+
+        self.assertEqual(results.count(None), 1)
+        stats = writer.get_stats()
+        self.assertEqual(stats['writes'], 5)
+        self.assertEqual(stats['failed_writes'], 1)
+        self.assertLess(stats['batches'], 5)
+
+        conn = sqlite3.connect(self.db_path)
+        count = conn.execute("SELECT COUNT(*) FROM transfer_history").fetchone()[0]
+        conn.close()
+        self.assertEqual(count, 4)
+
+    def test_transfers_through_writer(self):
+        """Transfers keep balances consistent when group commit is enabled"""
+        with patch.dict(DB_CONFIG, {'database': self.db_path}), \
+             patch.dict(GROUP_COMMIT_CONFIG, {'enabled': True}):
+            success, message = TransferManager.transfer_funds('111', '999', 1.0)
+            self.assertFalse(success)
+            self.assertEqual(message, "Destination account not found")
+
+            threads = [
+                threading.Thread(target=TransferManager.transfer_funds, args=('111', '222', 10.0))
+                for _ in range(15)
+            ]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+        conn = sqlite3.connect(self.db_path)
+        balances = dict(conn.execute("SELECT account_number, balance FROM accounts"))
+        conn.close()
+        self.assertEqual(balances['111'], 0.0)
+        self.assertEqual(balances['222'], 100.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,233 @@
+import csv
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+from contextlib import redirect_stderr
+from unittest.mock import patch
+from banking.bootstrap import bootstrap_schema
+from banking.db_adapter import DatabaseAdapter
+from banking.export import export_table
+from banking.history_import import import_history, main, validate_transactions, validate_transfers
+from banking.storage import MemoryStorage, SQLiteStorage, set_storage
+from config import DB_CONFIG
+
+TRANSACTION_FIELDS = ['account_number', 'transaction_type', 'amount', 'description', 'status', 'created_at']
+
+class TestValidation(unittest.TestCase):
+    """Test vectorized validation of record chunks"""
+
+    def test_transactions(self):
+        """Each bad record gets the reason of its first failing check"""
+        records = [
+            {'account_number': '111', 'transaction_type': 'deposit', 'amount': '10.004', 'created_at': '2020-01-01'},
+            {'account_number': '999', 'transaction_type': 'DEPOSIT', 'amount': '1', 'created_at': '2020-01-01'},
+            {'account_number': '111', 'transaction_type': 'GIFT', 'amount': '1', 'created_at': '2020-01-01'},
+            {'account_number': '111', 'transaction_type': 'WITHDRAWAL', 'amount': 'ten', 'created_at': '2020-01-01'},
+            {'account_number': '111', 'transaction_type': 'WITHDRAWAL', 'amount': '-4', 'created_at': '2020-01-01'},
+            {'account_number': '111', 'transaction_type': 'WITHDRAWAL', 'amount': '4', 'status': 'PENDING',
+             'created_at': '2020-01-01'},
+            {'account_number': '111', 'transaction_type': 'WITHDRAWAL', 'amount': '4', 'created_at': 'yesterday'},
+            {'account_number': '111', 'transaction_type': 'WITHDRAWAL', 'amount': '4', 'created_at': '2999-01-01'},
+            None,
+            {'account_number': '111', 'transaction_type': 'WITHDRAWAL', 'amount': '3.5', 'status': 'FAILED',
+             'created_at': '2020-01-02 08:00:00'},
+            {'account_number': '111', 'transaction_type': 'WITHDRAWAL', 'amount': '2.5', 'created_at': '2020-01-02T09:00'}
+        ]
+        rows, deltas, reasons = validate_transactions(records, {'111': 7})
+
+        self.assertEqual(list(reasons), [
+            '', "Unknown account", "Invalid transaction type", "Invalid amount", "Invalid amount",
+            "Invalid status", "Invalid created_at", "created_at is in the future", "Malformed record", '', ''
+        ])
+        self.assertEqual(rows[0], (7, 'DEPOSIT', 10.0, None, None, 'COMPLETED', '2020-01-01 00:00:00'))
+        self.assertEqual(rows[2][-1], '2020-01-02 09:00:00')
+        # The failed withdrawal does not count
+        self.assertEqual(deltas, [('111', 7.5)])
+
+    def test_transfers(self):
+        """Untyped transfers become both rows; only known accounts get balance changes"""
+        records = [
+            {'source_account': '111', 'destination_account': '222', 'amount': '5', 'created_at': '2020-01-01'},
+            {'source_account': '333', 'destination_account': '111', 'amount': '2', 'transaction_type': 'INCOMING',
+             'created_at': '2020-01-01'},
+            {'source_account': '111', 'destination_account': '111', 'amount': '2', 'created_at': '2020-01-01'},
+            {'source_account': '', 'destination_account': '111', 'amount': '2', 'created_at': '2020-01-01'}
+        ]
+        rows, deltas, reasons = validate_transfers(records, {'111': 1, '222': 2})
+
+        self.assertEqual(list(reasons), ['', '', "Source and destination are the same", "Missing account"])
+        self.assertEqual([row[4] for row in rows], ['OUTGOING', 'INCOMING', 'INCOMING'])
+        self.assertEqual(deltas, [('111', -3.0), ('222', 5.0)])
+
+class TestHistoryImport(unittest.TestCase):
+    """Test chunked, resumable imports on the in-memory backend"""
+
+    def setUp(self):
+        self.storage = MemoryStorage()
+        previous = set_storage(self.storage)
+        self.addCleanup(set_storage, previous)
+        self.storage.create_account(1, '111', 'SAVINGS', 100.0)
+        self.storage.create_account(2, '222', 'SAVINGS', 0.0)
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+
+    def write_csv(self, name, records, fields=TRANSACTION_FIELDS):
+        path = os.path.join(self.dir, name)
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fields)
+            writer.writeheader()
+            writer.writerows(records)
+        return path
+
+    def test_resume_after_failure(self):
+        """An interrupted import resumes after its last committed chunk and applies balances once"""
+        records = [
+            {'account_number': '111', 'transaction_type': 'DEPOSIT', 'amount': 1, 'status': 'COMPLETED',
+             'created_at': f'2020-01-{day:02d} 10:00:00'}
+            for day in range(1, 26)
+        ] + [{'account_number': '333', 'transaction_type': 'DEPOSIT', 'amount': 1, 'created_at': '2020-02-01'}]
+        path = self.write_csv('ledger.csv', records)
+
+        load = self.storage.load_history_chunk
+        calls = []
+        def crash_on_third_chunk(*args):
+            calls.append(args)
+            if len(calls) == 3:
+                raise OSError("Disk full")
+            return load(*args)
+
+        with patch.object(self.storage, 'load_history_chunk', side_effect=crash_on_third_chunk):
+            with self.assertRaises(OSError):
+                import_history('transactions', path, chunk_size=10)
+        self.assertEqual(self.storage.get_balance('111'), 100.0)
+
+        progress = []
+        report = import_history('transactions', path, chunk_size=10, progress=progress.append)
+        self.assertEqual(report['resumed_at'], 20)
+        self.assertEqual([update['rows_done'] for update in progress], [26])
+        self.assertEqual((report['status'], report['rows_loaded'], report['rows_rejected']), ('DONE', 25, 1))
+        self.assertEqual(report['reasons'], {"Unknown account": 1})
+        self.assertEqual(self.storage.get_balance('111'), 125.0)
+        self.assertEqual(len(self.storage.get_transaction_history(1, limit=100)), 25)
+
+        with open(path + '.rejects.jsonl', encoding='utf-8') as f:
+            rejected = [json.loads(line) for line in f]
+        self.assertEqual([(r['record'], r['reason']) for r in rejected], [(26, "Unknown account")])
+
+        # Running it again changes nothing
+        self.assertEqual(import_history('transactions', path)['status'], 'DONE')
+        self.assertEqual(self.storage.get_balance('111'), 125.0)
+
+    def test_export_round_trip(self):
+        """Transfer history exported by banking.export imports again"""
+        self.storage.transfer('111', '222', 30.0, "Rent")
+        exported = os.path.join(self.dir, 'transfers.jsonl')
+        export_table('transfer_history', exported)
+
+        target = MemoryStorage()
+        target.create_account(1, '111', 'SAVINGS', 0.0)
+        target.create_account(2, '222', 'SAVINGS', 0.0)
+        set_storage(target)
+        report = import_history('transfer_history', exported)
+
+        self.assertEqual(report['rows_loaded'], 2)
+        self.assertEqual((target.get_balance('111'), target.get_balance('222')), (-30.0, 30.0))
+        self.assertEqual([t['description'] for t in target.get_transfer_history('111')], ["Rent", "Rent"])
+
+    def test_cli(self):
+        """The command line entry point imports and reports failures with an exit code"""
+        path = self.write_csv('ledger.csv', [
+            {'account_number': '222', 'transaction_type': 'DEPOSIT', 'amount': 5, 'created_at': '2021-03-04'}
+        ])
+        with redirect_stderr(io.StringIO()) as output:
+            self.assertEqual(main(['transactions', path]), 0)
+            self.assertEqual(main(['transactions', os.path.join(self.dir, 'missing.csv')]), 1)
+        self.assertIn("1 loaded", output.getvalue())
+        self.assertEqual(self.storage.get_balance('222'), 5.0)
+
+class TestSQLiteHistoryImport(unittest.TestCase):
+    """Test imports against a bootstrapped SQLite database"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.dir = tmp.name
+        self.path = os.path.join(tmp.name, 'test.db')
+        patcher = patch.dict(DB_CONFIG, {'database': self.path})
+        patcher.start()
+        self.addCleanup(tmp.cleanup)
+        self.addCleanup(patcher.stop)
+        self.addCleanup(DatabaseAdapter.close_all)
+
+        with patch('security.hashing.generate_hash', return_value=('salt', 'hash')):
+            bootstrap_schema()
+        self.storage = SQLiteStorage()
+        previous = set_storage(self.storage)
+        self.addCleanup(set_storage, previous)
+        self.storage.create_account(1, '111', 'SAVINGS', 0.0)
+
+    def indexes(self):
+        DatabaseAdapter.close_all()
+        conn = sqlite3.connect(self.path)
+        names = {row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'transfer_history'")}
+        conn.close()
+        return names
+
+    def test_indexes_dropped_and_rebuilt(self):
+        """Secondary indexes are gone during the load and back afterwards"""
+        path = os.path.join(self.dir, 'transfers.jsonl')
+        with open(path, 'w', encoding='utf-8') as f:
+            for i in range(1000):
+                f.write(json.dumps({'source_account': '111', 'destination_account': f'EXT{i % 7}',
+                                    'amount': 1.25, 'created_at': '2019-06-01 12:00:00'}) + '\n')
+
+        seen = []
+        report = import_history('transfer_history', path, chunk_size=300,
+                                progress=lambda update: seen.append(self.indexes()))
+        self.assertTrue(all('idx_transfer_history_source' not in names for names in seen))
+        self.assertIn('idx_transfer_history_source', self.indexes())
+
+        # Records, not the two rows each typeless transfer becomes
+        self.assertEqual((report['rows_loaded'], report['accounts_updated']), (1000, 1))
+        self.assertEqual(report['rows_loaded'] + report['rows_rejected'], report['rows_done'])
+        self.assertEqual(self.storage.get_balance('111'), -1250.0)
+
+    def test_indexes_rebuilt_after_failure(self):
+        """A failed load or registration leaves the secondary indexes in place"""
+        path = os.path.join(self.dir, 'transfers.jsonl')
+        with open(path, 'w', encoding='utf-8') as f:
+            for i in range(10):
+                f.write(json.dumps({'source_account': '111', 'destination_account': '999',
+                                    'amount': 1, 'created_at': '2019-06-01 12:00:00'}) + '\n')
+            f.write(json.dumps({'source_account': '111', 'destination_account': '111', 'amount': 1}) + '\n')
+
+        with patch.object(self.storage, 'start_import', side_effect=OSError("Disk full")):
+            with self.assertRaises(OSError):
+                import_history('transfer_history', path)
+        self.assertIn('idx_transfer_history_source', self.indexes())
+
+        rejects = path + '.rejects.jsonl'
+        def crash(*args):
+            # The rejects of the chunk are already on disk when it is committed
+            with open(rejects, encoding='utf-8') as f:
+                self.assertEqual(len(f.readlines()), 1)
+            raise OSError("Disk full")
+
+        with patch.object(self.storage, 'load_history_chunk', side_effect=crash):
+            with self.assertRaises(OSError):
+                import_history('transfer_history', path)
+        self.assertIn('idx_transfer_history_source', self.indexes())
+
+        report = import_history('transfer_history', path)
+        self.assertEqual((report['rows_loaded'], report['rows_rejected']), (10, 1))
+        with open(rejects, encoding='utf-8') as f:
+            self.assertEqual([json.loads(line)['record'] for line in f], [11])
+        self.assertIn('idx_transfer_history_source', self.indexes())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import threading
+import unittest
+from datetime import datetime, timezone
+from unittest.mock import patch
+from banking.idempotency import IdempotencyStore, TTLCache, derive_key, new_key
+from banking.storage import MemoryStorage, set_storage, utc_timestamp
+from banking.transfers import TransferManager
+
+class TestIdempotency(unittest.TestCase):
+    """Test duplicate suppression of keyed payment requests"""
+
+    def setUp(self):
+        self.storage = MemoryStorage()
+        previous = set_storage(self.storage)
+        self.addCleanup(set_storage, previous)
+
+        self.storage.create_account(1, '111', 'SAVINGS', 100.0)
+        self.storage.create_account(2, '222', 'SAVINGS', 0.0)
+        self.store = IdempotencyStore(ttl=60, cache_size=100)
+        patcher = patch('banking.transfers.idempotency_store', self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_retries_replay_the_result(self):
+        """A repeated request returns the first result without moving money again"""
+        key = new_key()
+        first = TransferManager.transfer_funds('111', '222', 40.0, idempotency_key=key)
+        self.assertTrue(first[0])
+        self.assertEqual(TransferManager.transfer_funds('111', '222', 40.0, idempotency_key=key), first)
+        self.assertEqual(self.storage.get_balance('111'), 60.0)
+
+        # After a restart (empty cache) the table still knows the key
+        restarted = IdempotencyStore(ttl=60, cache_size=100)
+        with patch('banking.transfers.idempotency_store', restarted):
+            self.assertEqual(TransferManager.transfer_funds('111', '222', 40.0, idempotency_key=key), first)
+        self.assertEqual(self.storage.get_balance('222'), 40.0)
+
+        metrics = self.store.get_metrics()
+        self.assertEqual((metrics['requests'], metrics['executed'], metrics['duplicates_suppressed']), (2, 1, 1))
+        self.assertEqual(restarted.get_metrics()['store_hits'], 1)
+
+    def test_failures_can_be_retried(self):
+        """A failed request releases its key"""
+        key = new_key()
+        self.assertFalse(TransferManager.transfer_funds('111', '222', 500.0, idempotency_key=key)[0])
+        self.storage.adjust_balance('111', 1000.0)
+        self.assertTrue(TransferManager.transfer_funds('111', '222', 500.0, idempotency_key=key)[0])
+        self.assertEqual(self.storage.get_balance('222'), 500.0)
+
+    def test_concurrent_duplicate_is_rejected(self):
+        """A retry while the first request runs is refused, not run twice"""
+        key = derive_key("upi://pay?pa=bob@upi&am=10", "scan-session")
+        started, release = threading.Event(), threading.Event()
+        results = []
+
+        def slow_payment():
+            started.set()
+            release.wait(5)
+            return True, "paid"
+
+        worker = threading.Thread(target=lambda: results.append(self.store.run(key, slow_payment)))
+        worker.start()
+        self.assertTrue(started.wait(5))
+        self.assertEqual(self.store.run(key, slow_payment), (False, "This payment is already being processed"))
+        release.set()
+        worker.join(5)
+
+        self.assertEqual(results, [(True, "paid")])
+        self.assertEqual(self.store.get_metrics()['in_flight_rejected'], 1)
+
+    def test_abandoned_and_expired_keys_are_taken_over(self):
+        """A reservation is in flight only for its lease; a result is replayed only for the TTL"""
+        store = IdempotencyStore(ttl=3600, cache_size=100, lease=60)
+        self.storage.reserve_idempotency_key('crashed')
+        self.assertEqual(store.run('crashed', lambda: (True, "paid")), (False, "This payment is already being processed"))
+
+        self.storage._idempotency_keys['crashed']['created_at'] = utc_timestamp(120)
+        self.assertEqual(store.run('crashed', lambda: (True, "paid")), (True, "paid"))
+        self.assertEqual(self.storage.get_idempotency_key('crashed')['status'], 'DONE')
+
+        # Past the lease but within the TTL, a result is still replayed (the cache is bypassed, as after a restart)
+        self.storage._idempotency_keys['crashed']['created_at'] = utc_timestamp(120)
+        store.cache.clear()
+        self.assertEqual(store.run('crashed', lambda: (True, "again")), (True, "paid"))
+        self.storage._idempotency_keys['crashed']['created_at'] = utc_timestamp(7200)
+        store.cache.clear()
+        self.assertEqual(store.run('crashed', lambda: (True, "again")), (True, "again"))
+
+    def test_mysql_rows(self):
+        """Keys stored as MySQL returns them (datetime created_at) are replayed"""
+        now = datetime.now(timezone.utc).replace(tzinfo=None)
+        row = {'idem_key': 'fresh', 'status': 'DONE', 'success': 1, 'message': "paid", 'created_at': now}
+        ran = []
+        with patch.object(self.storage, 'reserve_idempotency_key', return_value=False), \
+                patch.object(self.storage, 'take_over_idempotency_key', return_value=False), \
+                patch.object(self.storage, 'get_idempotency_key', return_value=row):
+            self.assertEqual(self.store.run('fresh', lambda: ran.append('fresh') or (True, "again")), (True, "paid"))
+        self.assertEqual(ran, [])
+
+    def test_ttl_cache(self):
+        """The cache is bounded and forgets expired entries"""
+        cache = TTLCache(max_size=2, ttl=60)
+        for key in ('a', 'b', 'c'):
+            cache.put(key, key.upper())
+        self.assertEqual((cache.get('a'), cache.get('c'), len(cache)), (None, 'C', 2))
+
+        with patch('banking.idempotency.time.monotonic', return_value=10 ** 9):
+            self.assertIsNone(cache.get('c'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from config import DB_CONFIG, INSTRUMENTATION_CONFIG
+from banking.bootstrap import bootstrap_schema
+from banking.db_adapter import DatabaseAdapter
+from banking.instrumentation import query_monitor, redact_params
+from security.authh import AuthSystem
+
+class TestQueryInstrumentation(unittest.TestCase):
+    """Test query latency statistics and the slow query log"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        patcher = patch.dict(DB_CONFIG, {'database': os.path.join(self.tmp.name, 'test.db')})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        with patch('security.hashing.generate_hash', return_value=('salt', 'hash')):
+            bootstrap_schema()
+        query_monitor.reset()
+
+    def tearDown(self):
+        DatabaseAdapter.close_all()
+        query_monitor.reset()
+        self.tmp.cleanup()
+
+    def test_records_statistics(self):
+        """Named and ad hoc queries are recorded with rows and a histogram"""
+        auth = AuthSystem()
+        auth.register_user("alice", "password123", "Alice", "alice@example.com")
+        auth.login("alice", "password123")
+        DatabaseAdapter.execute_query("SELECT username FROM users", fetch_all=True)
+
+        stats = {s['name']: s for s in query_monitor.get_stats()}
+        self.assertEqual(stats['users.login']['calls'], 1)
+        self.assertEqual(stats['users.login']['rows'], 1)
+        self.assertEqual(sum(stats['users.login']['histogram'].values()), 1)
+        self.assertEqual(stats['SELECT username FROM users']['rows'], 2)  # alice and the admin
+
+        exported = json.loads(query_monitor.export_json())
+        self.assertIn('users.login', [q['name'] for q in exported['queries']])
+
+    def test_errors_are_counted(self):
+        """A failing query is counted and re-raised"""
+        with self.assertLogs('banking.query_error', level='WARNING'):
+            with self.assertRaises(Exception):
+                DatabaseAdapter.execute_query("SELECT * FROM no_such_table", fetch_all=True)
+
+        stats = query_monitor.get_stats()
+        self.assertEqual(stats[0]['errors'], 1)
+
+    def test_slow_query_log(self):
+        """Queries over the threshold are logged with redacted params and a fingerprint"""
+        with patch.dict(INSTRUMENTATION_CONFIG, {'slow_query_ms': 0}):
+            with self.assertLogs('banking.slow_query', level='WARNING') as logs:
+                DatabaseAdapter.execute_query("SELECT %s", ("secret-value",), fetch_one=True)
+
+        self.assertNotIn("secret-value", "\n".join(logs.output))
+        entry = query_monitor.get_slow_queries()[0]
+        self.assertEqual(entry['params'], ['<str:12>'])
+        self.assertEqual(len(entry['fingerprint']), 12)
+        self.assertTrue(entry['location'].startswith('test_instrumentation.py'))
+
+    def test_redact_params(self):
+        """Parameter values never appear in the redacted form"""
+        self.assertEqual(redact_params((None, 42, 1.5, "abc")), ['NULL', '<int>', '<float>', '<str:3>'])
+        self.assertEqual(redact_params(None), [])
+
+if __name__ == '__main__':
+    unittest.main()
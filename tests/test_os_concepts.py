@@ -1,12 +1,30 @@
+import io
+import os
+import tempfile
 import unittest
 import threading
 import time
-from os_concepts.multithreading import BankingThreads
-from os_concepts.scheduling import TransactionScheduler
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta, timezone
+from unittest.mock import Mock, patch
+from banking import events
+from banking.bootstrap import bootstrap_schema
+from banking.db_adapter import DatabaseAdapter
+from banking.events import event_bus
+from banking.storage import MemoryStorage, SQLiteStorage, claim_owner, set_storage
+from banking.transactions import TransactionManager
+from config import DB_CONFIG, MYSQL_CONFIG, RISK_CONFIG, WORKER_PROCESS_CONFIG
+from os_concepts.multithreading import BankingThreads, requeue_stale_claims, transaction_process_worker
+from os_concepts.scheduling import AgingQueue, FairQueue, TransactionScheduler, queued_at
 
 class TestOSConcepts(unittest.TestCase):
     """Test operating system concepts implementation"""
     
+    def setUp(self):
+        self.storage = MemoryStorage()
+        previous = set_storage(self.storage)
+        self.addCleanup(set_storage, previous)
+    
     def test_thread_manager(self):
         """Test banking thread manager starts and stops correctly"""
         thread_manager = BankingThreads()
@@ -25,6 +43,12 @@ class TestOSConcepts(unittest.TestCase):
         for thread in thread_manager.threads:
             self.assertFalse(thread.is_alive())
     
+    def test_concurrent_transfers_demo(self):
+        """The transfer demo checks that its balances are conserved and reconcile"""
+        with patch('os_concepts.multithreading.time.sleep'), redirect_stdout(io.StringIO()) as output:
+            self.assertTrue(BankingThreads().start_concurrent_transfers_demo())
+        self.assertIn("Both balances reconcile with the transfer history", output.getvalue())
+    
     def test_scheduler(self):
         """Test transaction scheduler"""
         scheduler = TransactionScheduler()
@@ -33,6 +57,8 @@ class TestOSConcepts(unittest.TestCase):
         self.assertTrue(scheduler.set_scheduling_algorithm('FIFO'))
         self.assertTrue(scheduler.set_scheduling_algorithm('PRIORITY'))
         self.assertTrue(scheduler.set_scheduling_algorithm('ROUND_ROBIN'))
+        self.assertTrue(scheduler.set_scheduling_algorithm('AGING'))
+        self.assertTrue(scheduler.set_scheduling_algorithm('FAIR'))
         self.assertFalse(scheduler.set_scheduling_algorithm('INVALID'))
         
         # Test thread starts and stops
@@ -42,6 +68,262 @@ class TestOSConcepts(unittest.TestCase):
         scheduler.stop_scheduler()
         time.sleep(0.1)
         self.assertFalse(scheduler.scheduler_thread.is_alive())
+    
+    def test_round_robin_scheduling(self):
+        """Test round robin alternates between accounts with queued work"""
+        first = self.storage.create_account(1, '111', 'SAVINGS', 0.0)
+        second = self.storage.create_account(2, '222', 'SAVINGS', 0.0)
+        for account_id in (first, first, second):
+            TransactionManager.record_transaction(account_id, 'DEPOSIT', 10.0)
+        
+        scheduler = TransactionScheduler()
+        scheduler.set_scheduling_algorithm('ROUND_ROBIN')
+        served = []
+        while True:
+            transaction = scheduler._round_robin_scheduling()
+            if not transaction:
+                break
+            served.append(transaction['account_number'])
+            scheduler._process_transaction(transaction)
+        
+        self.assertEqual(served, ['111', '222', '111'])
+        self.assertEqual(self.storage.get_balance('111'), 20.0)
+        self.assertEqual(self.storage.get_balance('222'), 10.0)
+    
+    def test_aging_queue(self):
+        """Test waiting raises priority and work near its SLA deadline goes first"""
+        config = {'aging_interval': 10.0, 'sla_guard': 5.0,
+                  'sla_seconds': {'WITHDRAWAL': 30.0, 'DEPOSIT': 300.0}}
+        queue = AgingQueue(config)
+        row = lambda n, transaction_type, priority: {'queue_id': n, 'transaction_id': n, 'priority': priority,
+                                                    'transaction_type': transaction_type, 'added_at': None}
+        
+        # A priority 1 deposit that waited 51s outranks fresh priority 5 ones, one that waited 21s does not
+        queue.add(row(1, 'DEPOSIT', 1), arrived=1000.0)
+        queue.add(row(2, 'DEPOSIT', 5), arrived=1049.0)
+        queue.add(row(3, 'DEPOSIT', 5), arrived=1051.0)
+        queue.add(row(4, 'DEPOSIT', 1), arrived=1030.0)
+        self.assertEqual([queue.pop(1051.0)['transaction_id'] for _ in range(4)], [1, 2, 3, 4])
+        
+        # A withdrawal within sla_guard of its deadline jumps the queue, one already late does not
+        queue.add(row(5, 'DEPOSIT', 9), arrived=1100.0)
+        queue.add(row(6, 'WITHDRAWAL', 1), arrived=1072.0)
+        queue.add(row(7, 'WITHDRAWAL', 1), arrived=1060.0)
+        self.assertEqual([queue.pop(1100.0)['transaction_id'] for _ in range(3)], [6, 5, 7])
+        self.assertIsNone(queue.pop(1100.0))
+        self.assertEqual(queue.high_water, 7)
+    
+    def test_queued_at_timezone(self):
+        """Test queue ages and deadlines do not move with the local timezone"""
+        with patch.dict(os.environ, {'TZ': 'Asia/Kolkata'}):
+            time.tzset()
+            self.addCleanup(time.tzset)
+            self.assertNotEqual(time.timezone, 0)
+            
+            # 2024-01-01 09:00:00 UTC, however the database handed it over
+            expected = 1704099600
+            self.assertEqual(queued_at('2024-01-01 09:00:00'), expected)
+            self.assertEqual(queued_at(datetime(2024, 1, 1, 9, 0)), expected)
+            self.assertEqual(queued_at(datetime(2024, 1, 1, 14, 30, tzinfo=timezone(timedelta(hours=5, minutes=30)))),
+                             expected)
+            
+            queue = AgingQueue({'aging_interval': 10.0, 'sla_guard': 5.0, 'sla_seconds': {'WITHDRAWAL': 30.0}})
+            queue.add({'queue_id': 1, 'transaction_id': 1, 'priority': 5, 'transaction_type': 'WITHDRAWAL',
+                       'added_at': '2024-01-01 09:00:00'})
+            self.assertEqual(queue.entries[1]['deadline'], expected + 30.0)
+        
+        # MySQL sessions store and return timestamps in UTC too
+        self.assertEqual(MYSQL_CONFIG['time_zone'], '+00:00')
+    
+    def test_aging_scheduling(self):
+        """Test aging scheduling reads the queue in refills, not on every pick"""
+        account_id = self.storage.create_account(1, '111', 'SAVINGS', 0.0)
+        for _ in range(3):
+            TransactionManager.record_transaction(account_id, 'DEPOSIT', 10.0)
+        
+        now = [time.time()]
+        scheduler = TransactionScheduler(clock=lambda: now[0])
+        scheduler.set_scheduling_algorithm('AGING')
+        with patch.object(self.storage, 'list_queued_after', wraps=self.storage.list_queued_after) as refill:
+            first = scheduler._aging_scheduling()
+            scheduler._process_transaction(first)
+            TransactionManager.record_transaction(account_id, 'DEPOSIT', 10.0)
+            second = scheduler._aging_scheduling()
+            self.assertEqual(refill.call_count, 1)
+            
+            # New work is picked up once refill_interval has passed
+            now[0] += 60.0
+            served = [first['transaction_id'], second['transaction_id']]
+            while True:
+                transaction = scheduler._aging_scheduling()
+                if not transaction:
+                    break
+                served.append(transaction['transaction_id'])
+        self.assertEqual(served, [1, 2, 3, 4])
+        self.assertGreater(refill.call_count, 1)
+    
+    def test_fair_queue(self):
+        """Test busy accounts share picks by weight, however much work they queue"""
+        config = {'account_weights': {'BUSINESS': 2.0, 'SAVINGS': 1.0}, 'quantum': 1.0, 'fairness_window': 100}
+        queue = FairQueue(config)
+        rows = [(1, 'SAVINGS')] * 50 + [(2, 'BUSINESS')] * 6 + [(3, 'SAVINGS')] * 3
+        for n, (account_id, account_type) in enumerate(rows, 1):
+            queue.add({'queue_id': n, 'transaction_id': n, 'account_id': account_id, 'account_type': account_type})
+        
+        picks = [queue.pop()['account_id'] for _ in range(12)]
+        self.assertEqual(picks, [1, 2, 2, 3, 1, 2, 2, 3, 1, 2, 2, 3])
+        
+        metrics = queue.metrics()
+        self.assertEqual((metrics['picks'], metrics['accounts'], metrics['queued']), (12, 3, 47))
+        self.assertAlmostEqual(metrics['fairness'], 1.0)
+        self.assertAlmostEqual(metrics['top_share'], 0.5)
+        
+        # Left alone, the noisy account gets the workers to itself
+        picks = [queue.pop()['account_id'] for _ in range(47)]
+        self.assertEqual(set(picks), {1})
+        self.assertIsNone(queue.pop())
+        self.assertLess(queue.metrics()['fairness'], 0.5)
+        
+        # Weights below one add up over turns
+        queue = FairQueue(dict(config, quantum=0.5))
+        for n, account_id in enumerate([1, 1, 1, 2, 2, 2], 1):
+            queue.add({'queue_id': n, 'transaction_id': n, 'account_id': account_id, 'account_type': 'SAVINGS'})
+        self.assertEqual([queue.pop()['account_id'] for _ in range(6)], [1, 2, 1, 2, 1, 2])
+        
+        # Weights or quanta that never earn credit are refused up front
+        for bad in ({'quantum': 0}, {'quantum': -1.0}, {'account_weights': {'SAVINGS': 0.0}},
+                    {'account_weights': {'SAVINGS': float('nan')}}):
+            with self.assertRaises(ValueError):
+                FairQueue(dict(config, **bad))
+    
+    def test_fair_scheduling(self):
+        """Test fair scheduling serves accounts by the weight of their account type"""
+        savings = self.storage.create_account(1, '111', 'SAVINGS', 0.0)
+        business = self.storage.create_account(2, '222', 'BUSINESS', 0.0)
+        for account_id in [savings] * 4 + [business] * 8:
+            TransactionManager.record_transaction(account_id, 'DEPOSIT', 10.0)
+        
+        scheduler = TransactionScheduler()
+        served = []
+        while True:
+            transaction = scheduler._fair_scheduling()
+            if not transaction:
+                break
+            served.append(transaction['account_number'])
+            scheduler._process_transaction(transaction)
+        
+        self.assertEqual(served, ['111', '222', '222', '222', '222'] * 2 + ['111', '111'])
+        self.assertEqual(self.storage.get_balance('222'), 80.0)
+        self.assertEqual(scheduler.fairness_metrics()['picks'], 12)
+
+class TestWorkerProcesses(unittest.TestCase):
+    """Test queue worker processes against a bootstrapped SQLite database"""
+    
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        patcher = patch.dict(DB_CONFIG, {'database': os.path.join(tmp.name, 'test.db')})
+        patcher.start()
+        self.addCleanup(tmp.cleanup)
+        self.addCleanup(patcher.stop)
+        self.addCleanup(DatabaseAdapter.close_all)
+        
+        with patch('security.hashing.generate_hash', return_value=('salt', 'hash')):
+            bootstrap_schema()
+        self.storage = SQLiteStorage()
+        previous = set_storage(self.storage)
+        self.addCleanup(set_storage, previous)
+    
+    def wait_for(self, condition, timeout=30.0):
+        deadline = time.time() + timeout
+        while not condition():
+            self.assertLess(time.time(), deadline, "timed out")
+            time.sleep(0.05)
+    
+    def test_worker_processes(self):
+        """Worker processes run the queue, pass their events back and are restarted when they die"""
+        changes = []
+        handler = lambda topic, payload: changes.append(payload['account_number'])
+        event_bus.subscribe(events.BALANCE_CHANGED, handler)
+        self.addCleanup(event_bus.unsubscribe, events.BALANCE_CHANGED, handler)
+        
+        manager = BankingThreads()
+        self.addCleanup(manager.stop_processes)
+        with patch.dict(WORKER_PROCESS_CONFIG, {'supervise_interval': 0.1}):
+            self.assertTrue(manager.start_transaction_processes(2))
+            self.assertFalse(manager.start_transaction_processes(2))
+            
+            accounts = [self.storage.create_account(1, number, 'SAVINGS', 0.0) for number in ('111', '222', '333')]
+            for account_id in accounts * 3:
+                TransactionManager.record_transaction(account_id, 'DEPOSIT', 10.0)
+            balances = lambda: [self.storage.get_balance(number) for number in ('111', '222', '333')]
+            self.wait_for(lambda: balances() == [30.0] * 3)
+            self.assertEqual(self.storage.list_queued('FIFO', 1), [])
+            self.wait_for(lambda: len(changes) == 9)
+            self.assertEqual(sorted(set(changes)), ['111', '222', '333'])
+            
+            process, _ = manager.processes[0]
+            process.terminate()
+            self.wait_for(lambda: manager.restarts == 1 and manager.processes[0][0].is_alive())
+            TransactionManager.record_transaction(accounts[1], 'DEPOSIT', 10.0)
+            self.wait_for(lambda: self.storage.get_balance('222') == 40.0)
+            
+            processes = [process for process, _ in manager.processes.values()]
+            manager.stop_all()
+        self.assertEqual(manager.processes, {})
+        self.assertFalse(any(process.is_alive() for process in processes))
+    
+    def test_worker_configuration(self):
+        """Worker processes get the settings of the process that starts them, not the config defaults"""
+        manager = BankingThreads()
+        self.addCleanup(manager.stop_processes)
+        with patch.dict(DB_CONFIG, {'host': 'db.internal'}), patch.dict(RISK_CONFIG, {'max_velocity': 3}), \
+                patch.dict(WORKER_PROCESS_CONFIG, {'processes': 1}):
+            manager.start_transaction_processes()
+            backend, configs, count = manager._process_args
+            manager.stop_processes()
+        self.assertEqual((backend, count), ('sqlite', 1))
+        self.assertEqual(configs['DB_CONFIG']['host'], 'db.internal')
+        self.assertEqual(configs['RISK_CONFIG']['max_velocity'], 3)
+
+        # What the worker does first in its new process
+        stop = threading.Event()
+        stop.set()
+        with patch.dict(DB_CONFIG), patch.dict(RISK_CONFIG), patch('os_concepts.multithreading.set_storage'), \
+                patch('os_concepts.multithreading.event_bus'):
+            transaction_process_worker(backend, configs, 1, 0, threading.Event(), stop, None)
+            self.assertEqual((DB_CONFIG['host'], RISK_CONFIG['max_velocity']), ('db.internal', 3))
+
+    def test_claims_of_dead_workers_requeued(self):
+        """Transactions claimed by a worker that died, or claimed too long ago, are queued again"""
+        account_id = self.storage.create_account(1, '111', 'SAVINGS', 0.0)
+        ids = [TransactionManager.record_transaction(account_id, 'DEPOSIT', 10.0) for _ in range(3)]
+        with patch('banking.storage.claim_owner', return_value=claim_owner(99999)):
+            self.assertEqual(self.storage.claim_transactions(ids[:2]), set(ids[:2]))
+        self.assertTrue(self.storage.claim_transaction(ids[2]))
+        
+        manager = BankingThreads()
+        manager.process_stop = threading.Event()
+        dead = Mock(pid=99999, exitcode=-9)
+        dead.name = "TransactionProcess-1"
+        dead.is_alive.return_value = False
+        manager.processes = {0: (dead, threading.Event())}
+        manager._last_requeue = time.monotonic()
+        with patch.object(manager, '_start_process') as restart, redirect_stdout(io.StringIO()):
+            manager._check_processes()
+        restart.assert_called_once_with(0)
+        self.assertEqual([t['transaction_id'] for t in self.storage.list_queued('FIFO', 10)], ids[:2])
+        
+        # This process's claim is live until it times out
+        self.assertEqual(requeue_stale_claims(), 0)
+        with patch.dict(WORKER_PROCESS_CONFIG, {'claim_timeout': -5.0}), redirect_stdout(io.StringIO()):
+            self.assertEqual(requeue_stale_claims(), 1)
+        self.assertEqual(len(self.storage.list_queued('FIFO', 10)), 3)
+    
+    def test_memory_storage_rejected(self):
+        """Worker processes cannot share in-memory storage"""
+        set_storage(MemoryStorage())
+        with self.assertRaises(ValueError):
+            BankingThreads().start_transaction_processes(2)
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
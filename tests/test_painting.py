@@ -0,0 +1,70 @@
+import importlib.util
+import os
+import time
+import unittest
+from unittest.mock import patch
+
+REPAINTS = 200
+
+@unittest.skipUnless(importlib.util.find_spec('PyQt5'), "PyQt5 is not installed")
+class TestCachedPainting(unittest.TestCase):
+    """Test that custom-drawn widgets repaint from their cached pixmap"""
+
+    @classmethod
+    def setUpClass(cls):
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        from PyQt5.QtWidgets import QApplication
+        cls.app = QApplication.instance() or QApplication([])
+
+    def show(self, widget, width, height):
+        from PyQt5.QtTest import QTest
+        widget.resize(width, height)
+        widget.show()
+        self.addCleanup(widget.deleteLater)
+        self.assertTrue(QTest.qWaitForWindowExposed(widget))
+        return widget
+
+    def repaint_time(self, widget, cached):
+        """Best of three timings of REPAINTS synchronous repaints"""
+        timings = []
+        for _ in range(3):
+            start = time.perf_counter()
+            for _ in range(REPAINTS):
+                if not cached:
+                    widget.invalidate_paint_cache()
+                widget.repaint()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    def test_repaints_reuse_pixmap(self):
+        """Only size, DPI and state changes draw again"""
+        from gui.login_window import RoundedButton
+        button = self.show(RoundedButton("Login"), 300, 45)
+
+        with patch.object(RoundedButton, 'draw_cached', autospec=True,
+                          side_effect=RoundedButton.draw_cached) as draw:
+            for _ in range(10):
+                button.repaint()
+            self.assertEqual(draw.call_count, 0)
+
+            button.setText("Logging in...")
+            button.repaint()
+            button.resize(320, 45)
+            button.repaint()
+            self.assertEqual(draw.call_count, 2)
+
+    def test_paint_benchmark(self):
+        """Cached repaints are cheaper than drawing from scratch"""
+        from gui.dashboard import ActionButton
+        from gui.login_window import GradientFrame, RoundedButton
+
+        for widget, size in ((GradientFrame(), (400, 600)),
+                             (RoundedButton("Login"), (300, 45)),
+                             (ActionButton("QR", "Scan QR\ncode"), (70, 90))):
+            self.show(widget, *size)
+            uncached = self.repaint_time(widget, cached=False)
+            cached = self.repaint_time(widget, cached=True)
+            self.assertLess(cached, uncached)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest.mock import patch
+from banking import events
+from banking.accounts import AccountManager
+from banking.bootstrap import bootstrap_schema
+from banking.db_adapter import DatabaseAdapter
+from banking.events import event_bus
+from banking.provisioning import AccountNumberAllocator, AccountProvisioner, FeistelPermutation
+from banking.storage import MemoryStorage, SQLiteStorage, set_storage
+from config import DB_CONFIG
+
+class TestFeistelPermutation(unittest.TestCase):
+    """Test the account number permutation"""
+
+    def test_bijection(self):
+        """Every number in the domain is hit exactly once, and the mapping inverts"""
+        permutation = FeistelPermutation('test-key', digits=4)
+        image = [permutation.permute(value) for value in range(10 ** 4)]
+        self.assertEqual(sorted(image), list(range(10 ** 4)))
+        self.assertEqual([permutation.invert(number) for number in image], list(range(10 ** 4)))
+
+    def test_not_sequential(self):
+        """Consecutive sequence values do not give consecutive account numbers"""
+        permutation = FeistelPermutation('test-key')
+        numbers = [permutation.permute(value) for value in range(100)]
+        self.assertFalse(any(b - a == 1 for a, b in zip(numbers, numbers[1:])))
+        self.assertNotEqual(numbers, [FeistelPermutation('other-key').permute(v) for v in range(100)])
+
+class TestProvisioning(unittest.TestCase):
+    """Test single and bulk account creation on the in-memory backend"""
+
+    def setUp(self):
+        self.storage = MemoryStorage()
+        previous = set_storage(self.storage)
+        self.addCleanup(set_storage, previous)
+        self.provisioner = AccountProvisioner(AccountNumberAllocator('test-key', block_size=10))
+
+    def test_single_accounts_are_unique(self):
+        """Single creations share reserved blocks and never repeat a number"""
+        numbers = [self.provisioner.create_one(1, 'SAVINGS') for _ in range(25)]
+        self.assertEqual(len(set(numbers)), 25)
+        self.assertTrue(all(len(number) == 12 and number.isdigit() for number in numbers))
+        self.assertEqual(self.storage.reserve_sequence('account_number', 1), 30)
+
+    def test_legacy_collision_gets_a_new_number(self):
+        """A number already taken by a randomly numbered account is skipped"""
+        taken = self.provisioner.allocator.format(0)
+        self.storage.create_account(9, taken, 'SAVINGS')
+
+        number = self.provisioner.create_one(1, 'SAVINGS', 50.0)
+        self.assertNotEqual(number, taken)
+        self.assertEqual(self.storage.get_balance(number), 50.0)
+
+        # In bulk, the chunk falls back to row by row
+        taken = self.provisioner.allocator.format(10)
+        self.storage.create_account(9, taken, 'SAVINGS')
+        updates = list(self.provisioner.provision([(2, 'SAVINGS')] * 3))
+        self.assertEqual(updates[-1]['created'], 3)
+        self.assertNotIn(taken, updates[-1]['account_numbers'])
+        self.assertEqual(len(self.storage.get_accounts(2)), 3)
+
+    def test_bulk_progress(self):
+        """Rows from a generator are created in chunks, with progress after each"""
+        provisioned = []
+        handler = lambda topic, payload: provisioned.append((payload['user_ids'], payload['count']))
+        event_bus.subscribe(events.ACCOUNTS_PROVISIONED, handler)
+        self.addCleanup(event_bus.unsubscribe, events.ACCOUNTS_PROVISIONED, handler)
+
+        rows = ((i % 3, 'SAVINGS', 10.0) for i in range(250))
+        updates = []
+        with patch('banking.accounts.account_provisioner', self.provisioner):
+            self.assertEqual(AccountManager.create_accounts_bulk(rows, chunk_size=100, progress=updates.append),
+                             (True, 250))
+
+        self.assertEqual([update['created'] for update in updates], [100, 200, 250])
+        numbers = [number for update in updates for number in update['account_numbers']]
+        self.assertEqual(len(set(numbers)), 250)
+        self.assertEqual(self.storage.get_balance(numbers[-1]), 10.0)
+        self.assertEqual(provisioned[-1], ({0, 1, 2}, 50))
+
+    def test_bulk_failure_reports_progress(self):
+        """A bad row stops provisioning; earlier chunks are kept"""
+        rows = [(1, 'SAVINGS')] * 4 + [(1,)]
+        with patch('banking.accounts.account_provisioner', self.provisioner):
+            success, message = AccountManager.create_accounts_bulk(rows, chunk_size=2)
+        self.assertFalse(success)
+        self.assertIn("after 4 accounts", message)
+        self.assertEqual(len(self.storage.get_accounts(1)), 4)
+
+    def test_fallback_failure_counts_created_rows(self):
+        """Rows created one by one before a failing row are reported and kept"""
+        taken = self.provisioner.allocator.format(1)
+        self.storage.create_account(9, taken, 'SAVINGS')
+        rows = [(2, 'SAVINGS'), (2, 'SAVINGS'), (2, 'BROKEN'), (2, 'SAVINGS')]
+
+        create_account = self.storage.create_account
+        def reject_broken(user_id, account_number, account_type, initial_balance=0.0):
+            if account_type == 'BROKEN':
+                raise ValueError("Unknown account type")
+            return create_account(user_id, account_number, account_type, initial_balance)
+
+        updates = []
+        with patch.object(self.storage, 'create_account', side_effect=reject_broken), \
+                patch('banking.accounts.account_provisioner', self.provisioner):
+            success, message = AccountManager.create_accounts_bulk(rows, progress=updates.append)
+        self.assertFalse(success)
+        self.assertIn("after 2 accounts", message)
+        self.assertEqual(updates[-1]['created'], 2)
+        self.assertEqual(len(updates[-1]['account_numbers']), 2)
+        self.assertEqual(len(self.storage.get_accounts(2)), 2)
+
+class TestSQLiteProvisioning(unittest.TestCase):
+    """Test bulk provisioning against a bootstrapped SQLite database"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(tmp.name, 'test.db')
+        patcher = patch.dict(DB_CONFIG, {'database': self.path})
+        patcher.start()
+        self.addCleanup(tmp.cleanup)
+        self.addCleanup(patcher.stop)
+        self.addCleanup(DatabaseAdapter.close_all)
+
+        with patch('security.hashing.generate_hash', return_value=('salt', 'hash')):
+            bootstrap_schema()
+        previous = set_storage(SQLiteStorage())
+        self.addCleanup(set_storage, previous)
+
+    def test_bulk_insert(self):
+        """Chunks are inserted with executemany and every number is unique"""
+        provisioner = AccountProvisioner(AccountNumberAllocator('test-key'))
+        updates = list(provisioner.provision(((i % 50, 'SAVINGS', 1.0) for i in range(20000)), chunk_size=5000))
+        self.assertEqual(len(updates), 4)
+        DatabaseAdapter.close_all()
+
+        conn = sqlite3.connect(self.path)
+        count, distinct, total = conn.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT account_number), SUM(balance) FROM accounts"
+        ).fetchone()
+        conn.close()
+        self.assertEqual((count, distinct, total), (20000, 20000, 20000.0))
+
+if __name__ == '__main__':
+    unittest.main()
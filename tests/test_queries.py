@@ -0,0 +1,53 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from config import DB_CONFIG
+from banking.bootstrap import bootstrap_schema
+from banking.db_adapter import DatabaseAdapter
+from banking.queries import Statement, get_statement, get_query_stats, reset_query_stats
+from security.authh import AuthSystem
+
+class TestQueryRegistry(unittest.TestCase):
+    """Test named statements and their call statistics"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        patcher = patch.dict(DB_CONFIG, {'database': os.path.join(self.tmp.name, 'test.db')})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        with patch('security.hashing.generate_hash', return_value=('salt', 'hash')):
+            bootstrap_schema()
+        reset_query_stats()
+
+    def tearDown(self):
+        DatabaseAdapter.close_all()
+        self.tmp.cleanup()
+
+    def test_compiled_once_for_sqlite(self):
+        """Placeholders are rewritten when the statement is declared"""
+        self.assertEqual(Statement.compile_sqlite(" SELECT %s, %s "), "SELECT ?, ?")
+        self.assertNotIn("%s", get_statement('accounts.update_balance').sql)
+        with self.assertRaises(KeyError):
+            get_statement('no.such.statement')
+
+    def test_call_statistics(self):
+        """Executing named statements records per-statement counts"""
+        auth = AuthSystem()
+        success, _ = auth.register_user("alice", "password123", "Alice", "alice@example.com")
+        self.assertTrue(success)
+        success, _ = auth.register_user("alice", "password123", "Alice", "alice@example.com")
+        self.assertFalse(success)
+
+        success, result = auth.login("alice", "password123")
+        self.assertTrue(success)
+        self.assertEqual(result['user']['username'], "alice")
+
+        stats = {s['name']: s for s in get_query_stats()}
+        self.assertEqual(stats['users.create']['calls'], 1)
+        self.assertEqual(stats['users.username_exists']['calls'], 2)
+        self.assertEqual(stats['users.login']['calls'], 1)
+        self.assertGreaterEqual(stats['users.login']['total_ms'], 0.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,204 @@
+import io
+import os
+import sqlite3
+import tempfile
+import unittest
+from contextlib import redirect_stderr, redirect_stdout
+from unittest.mock import patch
+from banking.bootstrap import bootstrap_schema
+from banking.db_adapter import DatabaseAdapter
+from banking.reconciliation import main, reconcile
+from banking.storage import MemoryStorage, SQLiteStorage, set_storage
+from banking.transactions import TransactionManager
+from config import DB_CONFIG
+
+class TestReconciliation(unittest.TestCase):
+    """Test full and incremental reconciliation on the in-memory backend"""
+
+    def setUp(self):
+        self.storage = MemoryStorage()
+        previous = set_storage(self.storage)
+        self.addCleanup(set_storage, previous)
+        self.first = self.storage.create_account(1, '111', 'SAVINGS', 100.0)
+        self.second = self.storage.create_account(2, '222', 'SAVINGS', 0.0)
+        for _ in range(3):
+            self.storage.transfer('111', '222', 10.1)
+
+    def test_consistent_balances(self):
+        """Opening balances plus history give the current balances"""
+        TransactionManager.record_transaction(self.second, 'DEPOSIT', 0.2)
+        TransactionManager.record_transaction(self.second, 'WITHDRAWAL', 500.0)
+        TransactionManager.process_transactions()
+
+        report = reconcile(batch_size=2)
+        self.assertEqual((report['mode'], report['accounts'], report['transfers_scanned'],
+                          report['transactions_scanned']), ('FULL', 2, 6, 2))
+        self.assertEqual(report['discrepancy_count'], 0)
+        self.assertEqual(self.storage.get_last_reconciliation()['transfer_watermark'], 6)
+
+    def test_discrepancies(self):
+        """Balances changed outside the ledger are reported, largest first"""
+        self.storage.adjust_balance('111', 0.01)
+        self.storage.adjust_balance('222', -25.0)
+
+        report = reconcile(save=False)
+        self.assertEqual(report['discrepancy_count'], 2)
+        self.assertEqual([(row['account_number'], row['difference']) for row in report['discrepancies']],
+                         [('222', -25.0), ('111', 0.01)])
+        self.assertEqual((report['discrepancies'][0]['expected'], report['discrepancies'][0]['actual']),
+                         (30.3, 5.3))
+        self.assertIsNone(self.storage.get_last_reconciliation())
+        self.assertEqual(reconcile(save=False, limit=1)['discrepancies'][0]['account_number'], '222')
+
+    def test_incremental(self):
+        """An incremental run only reads history after the saved watermark"""
+        reconcile()
+        self.storage.transfer('222', '111', 5.0)
+        third = self.storage.create_account(3, '333', 'SAVINGS', 40.0)
+
+        report = reconcile()
+        self.assertEqual((report['mode'], report['transfers_scanned'], report['discrepancy_count']),
+                         ('INCREMENTAL', 2, 0))
+        self.assertEqual(self.storage._reconciled, {self.first: 74.7, self.second: 25.3, third: 40.0})
+
+        # Drift is still found, and stays reported until it is fixed
+        self.storage.adjust_balance('333', 1.0)
+        self.assertEqual(reconcile()['discrepancy_count'], 1)
+        self.assertEqual(reconcile()['discrepancy_count'], 1)
+        self.assertEqual(reconcile(incremental=False)['transfers_scanned'], 8)
+
+    def test_pending_transactions_hold_the_watermark(self):
+        """A transaction still pending at one run is counted once it completes"""
+        pending = TransactionManager.record_transaction(self.first, 'DEPOSIT', 3.0)
+        TransactionManager.record_transaction(self.first, 'DEPOSIT', 4.0)
+        queued = self.storage.list_queued('FIFO', 2)
+        TransactionManager.process_transaction(queued[1])
+
+        report = reconcile()
+        self.assertEqual((report['transaction_watermark'], report['discrepancy_count']), (pending - 1, 0))
+
+        # Moved the balance but not yet marked COMPLETED: reported, with a pending count
+        self.storage.claim_transaction(pending)
+        self.storage.adjust_balance('111', 3.0)
+        self.assertEqual(reconcile(save=False)['discrepancies'][0]['pending'], 1)
+
+        self.storage.finish_transaction(pending, 'COMPLETED')
+        report = reconcile()
+        self.assertEqual((report['mode'], report['transactions_scanned'], report['discrepancy_count']),
+                         ('INCREMENTAL', 2, 0))
+        self.assertEqual(self.storage._reconciled[self.first], 76.7)
+
+    def test_held_transactions_hold_the_watermark(self):
+        """A transaction held for review is counted once it is approved"""
+        held = TransactionManager.record_transaction(self.first, 'WITHDRAWAL', 50.0)
+        self.storage.claim_transaction(held)
+        self.storage.hold_transactions([(held, "Unusual amount")])
+
+        report = reconcile()
+        self.assertEqual((report['transaction_watermark'], report['discrepancy_count']), (held - 1, 0))
+
+        TransactionManager.review_transaction(self.storage.list_held()[0], approve=True)
+        report = reconcile()
+        self.assertEqual((report['transactions_scanned'], report['discrepancy_count']), (1, 0))
+        self.assertEqual(self.storage._reconciled[self.first], 19.7)
+
+    def test_uncommitted_transfers_hold_the_watermark(self):
+        """A transfer that commits after a later one is read by the next run"""
+        self.storage.transfer('111', '222', 1.0)
+        self.storage.transfer('222', '111', 2.0)
+        # The first one is still being written when the snapshot is taken
+        in_flight = self.storage._transfers[6:8]
+        del self.storage._transfers[6:8]
+        self.storage.adjust_balance('111', 1.0)
+        self.storage.adjust_balance('222', -1.0)
+
+        report = reconcile()
+        self.assertEqual((report['transfer_watermark'], report['transfers_scanned'], report['discrepancy_count']),
+                         (6, 8, 0))
+
+        self.storage._transfers[6:6] = in_flight
+        self.storage.adjust_balance('111', -1.0)
+        self.storage.adjust_balance('222', 1.0)
+        report = reconcile()
+        self.assertEqual((report['transfer_watermark'], report['transfers_scanned'], report['discrepancy_count']),
+                         (10, 4, 0))
+
+        # A transfer that was rolled back leaves a gap for good: passed once the row after it has settled
+        self.storage.transfer('111', '222', 1.0)
+        self.storage.transfer('111', '222', 1.0)
+        del self.storage._transfers[10:12]
+        self.storage.adjust_balance('111', 1.0)
+        self.storage.adjust_balance('222', -1.0)
+        self.assertEqual(reconcile()['transfer_watermark'], 10)
+        for row in self.storage._transfers[10:]:
+            row['created_at'] = '2024-01-01 00:00:00'
+        report = reconcile()
+        self.assertEqual((report['transfer_watermark'], report['discrepancy_count']), (14, 0))
+
+    def test_cli(self):
+        """The command line entry point exits with 2 when balances are off"""
+        with redirect_stdout(io.StringIO()) as output, redirect_stderr(io.StringIO()):
+            self.assertEqual(main(['--no-save']), 0)
+            self.storage.adjust_balance('222', 1.0)
+            self.assertEqual(main(['--full']), 2)
+        self.assertIn("222: balance 31.30, expected 30.30, off by +1.00", output.getvalue())
+
+class TestSQLiteReconciliation(unittest.TestCase):
+    """Test reconciliation and the opening balance backfill on SQLite"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(tmp.name, 'test.db')
+        patcher = patch.dict(DB_CONFIG, {'database': self.path})
+        patcher.start()
+        self.addCleanup(tmp.cleanup)
+        self.addCleanup(patcher.stop)
+        self.addCleanup(DatabaseAdapter.close_all)
+        previous = set_storage(SQLiteStorage())
+        self.addCleanup(set_storage, previous)
+
+    def bootstrap(self):
+        with patch('security.hashing.generate_hash', return_value=('salt', 'hash')):
+            bootstrap_schema()
+
+    def test_backfill_existing_accounts(self):
+        """Accounts from before opening balances get the one their history implies"""
+        with patch('banking.bootstrap.SCHEMA_VERSION', 6):
+            self.bootstrap()
+        DatabaseAdapter.close_all()
+        conn = sqlite3.connect(self.path)
+        conn.executescript("""
+            INSERT INTO accounts (user_id, account_number, account_type, balance) VALUES
+                (1, '111', 'SAVINGS', 60.0), (1, '222', 'SAVINGS', 45.0);
+            INSERT INTO transfer_history (source_account, destination_account, amount, transaction_type) VALUES
+                ('111', '222', 40.0, 'OUTGOING'), ('111', '222', 40.0, 'INCOMING');
+            INSERT INTO transactions (account_id, transaction_type, amount, status) VALUES
+                (2, 'DEPOSIT', 5.0, 'COMPLETED'), (2, 'DEPOSIT', 9.0, 'FAILED');
+        """)
+        conn.commit()
+        conn.close()
+
+        self.bootstrap()
+        conn = sqlite3.connect(self.path)
+        openings = conn.execute("SELECT account_number, opening_balance FROM accounts ORDER BY 1").fetchall()
+        leftovers = conn.execute("SELECT COUNT(*) FROM reconciliation_balances").fetchone()[0]
+        conn.close()
+        self.assertEqual(openings, [('111', 100.0), ('222', 0.0)])
+        self.assertEqual(leftovers, 0)
+        self.assertEqual(reconcile()['discrepancy_count'], 0)
+
+    def test_batches(self):
+        """Many transfers, read in small batches, sum to the stored balances"""
+        self.bootstrap()
+        storage = SQLiteStorage()
+        storage.create_accounts([(1, f'{i:03d}', 'SAVINGS', 1000.0) for i in range(20)])
+        for i in range(400):
+            storage.transfer(f'{i % 20:03d}', f'{(i * 7 + 3) % 20:03d}', 0.01 * (i % 13 + 1))
+
+        report = reconcile(batch_size=64)
+        self.assertEqual((report['accounts'], report['transfers_scanned'], report['discrepancy_count']),
+                         (20, 800, 0))
+        self.assertEqual(reconcile()['transfers_scanned'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
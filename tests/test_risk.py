@@ -0,0 +1,185 @@
+import os
+import tempfile
+import unittest
+from contextlib import nullcontext
+from datetime import datetime
+from decimal import Decimal
+from unittest.mock import patch
+from banking import events
+from banking.bootstrap import bootstrap_schema
+from banking.db_adapter import DatabaseAdapter
+from banking.events import EventBus
+from banking.risk import TOO_FAST, UNUSUAL_AMOUNT, RiskScorer
+from banking.storage import MemoryStorage, SQLiteStorage, set_storage
+from banking.transactions import TransactionManager
+from config import DB_CONFIG
+
+def queued(transaction_id, account_id, transaction_type, amount, related_account=None,
+           added_at='2024-05-01 12:00:00'):
+    """A row shaped like those of StorageBackend.list_queued"""
+    return {'queue_id': transaction_id, 'transaction_id': transaction_id, 'account_id': account_id,
+            'transaction_type': transaction_type, 'amount': amount, 'related_account': related_account,
+            'account_number': str(account_id), 'priority': 5, 'added_at': added_at}
+
+class TestRiskScorer(unittest.TestCase):
+    """Test the batch checks of the risk scorer"""
+
+    def setUp(self):
+        previous = set_storage(MemoryStorage())
+        self.addCleanup(set_storage, previous)
+        self.scorer = RiskScorer()
+
+    def test_velocity(self):
+        """Debits past max_velocity in the window are held, counting earlier batches"""
+        batch = [queued(i, 1, 'WITHDRAWAL', 5.0, added_at=f'2024-05-01 12:00:{i:02d}') for i in range(6)]
+        batch.append(queued(6, 2, 'WITHDRAWAL', 5.0))
+        self.assertEqual(list(self.scorer.score(batch)), [''] * 7)
+
+        later = [queued(10 + i, 1, 'DEPOSIT' if i < 3 else 'WITHDRAWAL', 5.0, added_at='2024-05-01 12:00:30')
+                 for i in range(6)]
+        self.assertEqual(list(self.scorer.score(later)), [''] * 4 + [TOO_FAST] * 2)
+
+        # A minute later the window has moved on
+        self.assertEqual(self.scorer.score([queued(20, 1, 'WITHDRAWAL', 5.0, added_at='2024-05-01 12:01:31')])[0], '')
+
+    def test_unusual_amount(self):
+        """Debits far above the account's usual ones are held once it has enough history"""
+        history = [queued(i, 1, 'WITHDRAWAL', amount, added_at=f'2024-05-0{i + 1} 12:00:00')
+                   for i, amount in enumerate([100.0, 120.0, 90.0, 110.0])]
+        self.assertEqual(list(self.scorer.score(history)), [''] * 4)
+        self.assertEqual(self.scorer.score([queued(4, 1, 'WITHDRAWAL', 5000.0, added_at='2024-05-06 12:00:00')])[0], '')
+
+        # The 5000 went through and is now part of the history, so 5000 again is less unusual than 50000
+        batch = [queued(5, 1, 'WITHDRAWAL', 130.0), queued(6, 1, 'WITHDRAWAL', 50000.0),
+                 queued(7, 1, 'DEPOSIT', 50000.0), queued(8, 2, 'WITHDRAWAL', 50000.0)]
+        self.assertEqual(list(self.scorer.score(batch)), ['', UNUSUAL_AMOUNT, '', ''])
+
+        # Accounts that always pay the same get a spread of min_spread of the mean
+        for i in range(5):
+            self.scorer.score([queued(10 + i, 3, 'WITHDRAWAL', 200.0, added_at=f'2024-05-0{i + 1} 09:00:00')])
+        self.assertEqual(list(self.scorer.score([queued(20, 3, 'WITHDRAWAL', 270.0),
+                                                 queued(21, 3, 'WITHDRAWAL', 290.0)])),
+                         ['', UNUSUAL_AMOUNT])
+
+    def test_disabled(self):
+        """A disabled scorer lets everything through"""
+        scorer = RiskScorer({'enabled': False})
+        batch = [queued(i, 1, 'WITHDRAWAL', 5000.0) for i in range(20)]
+        self.assertEqual(list(scorer.score(batch)), [''] * 20)
+
+    def test_warm_start(self):
+        """The scorer starts from the recent completed transactions of the current backend"""
+        storage = MemoryStorage()
+        set_storage(storage)
+        account_id = storage.create_account(1, '111', 'SAVINGS', 10000.0)
+        for amount in (100.0, 120.0, 90.0, 110.0, 100.0):
+            transaction_id = storage.record_transaction(account_id, 'WITHDRAWAL', amount)
+            storage.finish_transaction(transaction_id, 'COMPLETED')
+        storage.record_transaction(account_id, 'WITHDRAWAL', 9000.0)
+
+        self.assertEqual(list(self.scorer.score(storage.list_queued('FIFO', 10))), [UNUSUAL_AMOUNT])
+
+        # Another backend starts over
+        set_storage(MemoryStorage())
+        self.assertEqual(self.scorer.score([queued(1, account_id, 'WITHDRAWAL', 9000.0)])[0], '')
+
+    def test_warm_start_dict_rows(self):
+        """The scorer warms up from MySQL-shaped rows (dicts, Decimals, datetimes)"""
+        rows = [{'account_id': 1, 'transaction_type': 'WITHDRAWAL', 'amount': Decimal(amount),
+                 'created_at': datetime(2024, 5, 1, 12, i)}
+                for i, amount in enumerate(('100.00', '120.00', '90.00', '110.00', '100.00'))]
+        storage = SQLiteStorage()
+        set_storage(storage)
+        with patch('banking.storage.DB_TYPE', 'mysql'), \
+                patch.object(DatabaseAdapter, 'reader', return_value=nullcontext()), \
+                patch.object(DatabaseAdapter, 'fetch_all', return_value=rows):
+            self.assertEqual(list(self.scorer.score([queued(9, 1, 'WITHDRAWAL', 9000.0)])), [UNUSUAL_AMOUNT])
+
+        # A history row that cannot be read only skips the warm-up (so there is no history to hold against)
+        storage.get_recent_transactions = lambda limit: [(1, 'WITHDRAWAL', 100.0, 'not a time')]
+        set_storage(storage)
+        self.scorer.storage = None
+        with self.assertLogs('banking.risk', 'WARNING'):
+            self.assertEqual(list(self.scorer.score([queued(9, 1, 'WITHDRAWAL', 9000.0)])), [''])
+
+    def test_many_accounts(self):
+        """Buffers grow with the accounts and keep each account's history apart"""
+        for day in range(1, 6):
+            batch = [queued(i, i * 7 + 3, 'WITHDRAWAL', 100.0 + i % 10, added_at=f'2024-05-0{day} 12:00:00')
+                     for i in range(3000)]
+            self.assertEqual((self.scorer.score(batch) != '').sum(), 0)
+
+        batch = [queued(i, i * 7 + 3, 'WITHDRAWAL', 5000.0 if i % 1000 == 0 else 100.0) for i in range(3000)]
+        self.assertEqual(list((self.scorer.score(batch) != '').nonzero()[0]), [0, 1000, 2000])
+
+class TestHeldTransactions(unittest.TestCase):
+    """Test holding and reviewing transactions in the queue pipeline"""
+
+    def setUp(self):
+        self.storage = MemoryStorage()
+        previous = set_storage(self.storage)
+        self.addCleanup(set_storage, previous)
+        self.account_id = self.storage.create_account(1, '111', 'SAVINGS', 100.0)
+
+        self.bus = EventBus()
+        self.finished = []
+        self.bus.subscribe(events.TRANSACTION_FINISHED, lambda topic, payload: self.finished.append(payload))
+        patcher = patch('banking.transactions.event_bus', self.bus)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_hold_and_review(self):
+        """Held debits leave the balance alone until approved"""
+        for _ in range(12):
+            TransactionManager.record_transaction(self.account_id, 'WITHDRAWAL', 1.0)
+        self.assertEqual(TransactionManager.process_transactions(batch_size=5), 12)
+        self.assertEqual(self.storage.get_balance('111'), 90.0)
+        self.assertEqual([payload['status'] for payload in self.finished], ['COMPLETED'] * 10 + ['HELD'] * 2)
+
+        held = self.storage.list_held()
+        self.assertEqual([row['reason'] for row in held], [TOO_FAST, TOO_FAST])
+        self.assertEqual(TransactionManager.review_transaction(held[0], approve=True), 'COMPLETED')
+        self.assertEqual(TransactionManager.review_transaction(held[1], approve=False), 'FAILED')
+        self.assertIsNone(TransactionManager.review_transaction(held[1], approve=True))
+        self.assertEqual(self.storage.get_balance('111'), 89.0)
+        self.assertEqual(self.storage.list_held(), [])
+
+class TestSQLiteHeldTransactions(unittest.TestCase):
+    """Test held transactions against a bootstrapped SQLite database"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        patcher = patch.dict(DB_CONFIG, {'database': os.path.join(tmp.name, 'test.db')})
+        patcher.start()
+        self.addCleanup(tmp.cleanup)
+        self.addCleanup(patcher.stop)
+        self.addCleanup(DatabaseAdapter.close_all)
+
+        with patch('security.hashing.generate_hash', return_value=('salt', 'hash')):
+            bootstrap_schema()
+        self.storage = SQLiteStorage()
+        previous = set_storage(self.storage)
+        self.addCleanup(set_storage, previous)
+
+    def test_unusual_amount_held(self):
+        """A withdrawal far above the account's usual ones is held, and paid once approved"""
+        account_id = self.storage.create_account(1, '111', 'SAVINGS', 10000.0)
+        for amount in (100.0, 120.0, 90.0, 110.0, 100.0):
+            TransactionManager.record_transaction(account_id, 'WITHDRAWAL', amount)
+        self.assertEqual(TransactionManager.process_transactions(), 5)
+        large = TransactionManager.record_transaction(account_id, 'WITHDRAWAL', 5000.0)
+        self.assertEqual(TransactionManager.process_transactions(), 1)
+
+        held = self.storage.list_held()
+        self.assertEqual([(row['transaction_id'], row['reason']) for row in held], [(large, UNUSUAL_AMOUNT)])
+        def statuses():
+            return {t['transaction_id']: t['status'] for t in TransactionManager.get_transaction_history(account_id)}
+
+        self.assertEqual(statuses()[large], 'HELD')
+        self.assertEqual(self.storage.get_balance('111'), 9480.0)
+        self.assertEqual(TransactionManager.review_transaction(held[0], approve=True), 'COMPLETED')
+        self.assertEqual(statuses()[large], 'COMPLETED')
+        self.assertEqual(self.storage.get_balance('111'), 4480.0)
+
+if __name__ == '__main__':
+    unittest.main()
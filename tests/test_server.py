@@ -0,0 +1,165 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import patch
+from banking.storage import MemoryStorage, set_storage
+from server import BankingAPI, serve
+
+async def request(connection, method, path, body=None, token=None):
+    """Send one request on an open (reader, writer) connection. Returns (status, payload, headers)"""
+    reader, writer = connection
+    data = json.dumps(body).encode('utf-8') if body is not None else b''
+    headers = f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(data)}\r\n"
+    if token:
+        headers += f"Authorization: Bearer {token}\r\n"
+    writer.write((headers + "\r\n").encode('latin-1') + data)
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    response_headers = {}
+    while True:
+        line = (await reader.readline()).decode('latin-1')
+        if line == '\r\n':
+            break
+        name, _, value = line.partition(':')
+        response_headers[name.strip().lower()] = value.strip()
+    payload = json.loads(await reader.readexactly(int(response_headers['content-length'])))
+    return status, payload, response_headers
+
+class TestBankingAPI(unittest.TestCase):
+    """Test the HTTP/JSON API over a real socket, against the in-memory backend"""
+
+    def setUp(self):
+        self.storage = MemoryStorage()
+        previous = set_storage(self.storage)
+        self.addCleanup(set_storage, previous)
+        self.api = BankingAPI(config={'workers': 2})
+        self.addCleanup(self.api.service.close)
+
+    def run_client(self, client):
+        async def main():
+            started = asyncio.get_running_loop().create_future()
+            server = asyncio.ensure_future(serve(self.api, '127.0.0.1', 0, started.set_result))
+            port = (await started).sockets[0].getsockname()[1]
+            try:
+                return await client(port)
+            finally:
+                server.cancel()
+
+        with patch('security.authh.generate_hash', return_value=('salt', 'hash')), \
+                patch('security.authh.verify_password', side_effect=lambda h, s, p: p == 'secret'):
+            return asyncio.run(main())
+
+    def test_banking_flow(self):
+        """Register, log in and move money on one keep-alive connection"""
+        async def client(port):
+            connection = await asyncio.open_connection('127.0.0.1', port)
+            results = []
+            for method, path, body in [
+                ('POST', '/register', {'username': 'alice', 'password': 'secret', 'full_name': 'Alice',
+                                       'email': 'alice@example.com'}),
+                ('POST', '/login', {'username': 'alice', 'password': 'wrong'}),
+                ('POST', '/login', {'username': 'alice', 'password': 'secret'})
+            ]:
+                results.append(await request(connection, method, path, body))
+            token = results[-1][1]['session_id']
+
+            minted = await request(connection, 'POST', '/accounts',
+                                   {'account_type': 'savings', 'initial_balance': 100}, token)
+            status, payload, _ = await request(connection, 'POST', '/accounts', {'account_type': 'savings'}, token)
+            results.append((status, payload))
+            source = payload['account_number']
+            self.storage.adjust_balance(source, 100.0)
+            destination = self.storage.create_account(99, '999', 'SAVINGS', 0.0) and '999'
+            for method, path, body in [
+                ('POST', '/transfers', {'source_account': source, 'destination_account': destination,
+                                        'amount': 30, 'idempotency_key': 'k1'}),
+                ('POST', '/transfers', {'source_account': source, 'destination_account': destination,
+                                        'amount': 30, 'idempotency_key': 'k1'}),
+                ('POST', '/transfers', {'source_account': source, 'destination_account': destination,
+                                        'amount': 500}),
+                ('GET', f'/accounts/{source}/balance', None),
+                ('GET', f'/accounts/{source}/transfers?limit=5', None),
+                ('POST', '/transactions', {'account_number': source, 'transaction_type': 'deposit',
+                                           'amount': 5}),
+                ('GET', '/accounts/999/balance', None),
+                ('GET', '/accounts', None)
+            ]:
+                results.append(await request(connection, method, path, body, token))
+            connection[1].close()
+            return results + [minted]
+
+        (registered, bad_login, login, created, transfer, retry, overdraft, balance, transfers,
+         queued, foreign, accounts, minted) = self.run_client(client)
+        self.assertEqual(registered[0], 201)
+        self.assertEqual(bad_login[0], 401)
+        self.assertEqual((login[0], login[1]['user']['username']), (200, 'alice'))
+        self.assertEqual(login[2]['connection'], 'keep-alive')
+        self.assertEqual(minted[:2], (400, {'error': "initial_balance cannot be set; accounts open empty"}))
+        self.assertEqual(created[0], 201)
+        self.assertEqual(transfer[0], 200)
+        self.assertEqual(retry[:2], transfer[:2])
+        self.assertEqual(overdraft[0], 422)
+        self.assertEqual(balance[1]['balance'], 70.0)
+        self.assertEqual([row['amount'] for row in transfers[1]['transfers']], [30.0, 30.0])
+        self.assertEqual(queued[0], 202)
+        self.assertEqual(self.storage.list_queued('FIFO', 1)[0]['transaction_id'], queued[1]['transaction_id'])
+        self.assertEqual(foreign[0], 404)
+        self.assertEqual([account['account_number'] for account in accounts[1]['accounts']],
+                         [created[1]['account_number']])
+
+    def test_errors(self):
+        """Requests without a session, to unknown routes or with bad bodies get JSON errors"""
+        async def client(port):
+            connection = await asyncio.open_connection('127.0.0.1', port)
+            results = [
+                await request(connection, 'GET', '/accounts'),
+                await request(connection, 'GET', '/accounts', token='nope'),
+                await request(connection, 'GET', '/nowhere'),
+                await request(connection, 'DELETE', '/transfers'),
+                await request(connection, 'POST', '/login', {'username': 'alice'})
+            ]
+            reader, writer = connection
+            writer.write(b"GET /accounts HTTP/1.0\r\n\r\n")
+            results.append((await reader.read()).split(b'\r\n')[0])
+            writer.close()
+            return results
+
+        no_session, bad_session, missing, not_allowed, bad_body, closed = self.run_client(client)
+        self.assertEqual(no_session[0], 401)
+        self.assertEqual(bad_session[:2], (401, {'error': "Session expired or unknown"}))
+        self.assertEqual(missing[0], 404)
+        self.assertEqual(not_allowed[0], 405)
+        self.assertEqual(bad_body[:2], (400, {'error': "Missing field 'password'"}))
+        # HTTP/1.0 without keep-alive gets its answer and the connection is closed
+        self.assertEqual(closed, b"HTTP/1.1 401 Unauthorized")
+
+    def test_non_finite_amounts(self):
+        """NaN and Infinity amounts are refused by the transfer and transaction routes"""
+        async def client(port):
+            connection = await asyncio.open_connection('127.0.0.1', port)
+            user = {'username': 'alice', 'password': 'secret', 'full_name': 'Alice', 'email': 'alice@example.com'}
+            await request(connection, 'POST', '/register', user)
+            token = (await request(connection, 'POST', '/login', user))[1]['session_id']
+            source = (await request(connection, 'POST', '/accounts', {'account_type': 'savings'}, token))[1]
+            self.storage.adjust_balance(source['account_number'], 100.0)
+            self.storage.create_account(99, '999', 'SAVINGS', 0.0)
+
+            results = []
+            for amount in (float('nan'), float('inf'), float('-inf')):
+                results.append(await request(connection, 'POST', '/transfers', {
+                    'source_account': source['account_number'], 'destination_account': '999', 'amount': amount
+                }, token))
+                results.append(await request(connection, 'POST', '/transactions', {
+                    'account_number': source['account_number'], 'transaction_type': 'deposit', 'amount': amount
+                }, token))
+            connection[1].close()
+            return source['account_number'], results
+
+        source, results = self.run_client(client)
+        self.assertEqual([result[:2] for result in results], [(400, {'error': "Invalid field 'amount'"})] * 6)
+        self.assertEqual((self.storage.get_balance(source), self.storage.get_balance('999')), (100.0, 0.0))
+        self.assertEqual(self.storage.list_queued('FIFO', 1), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import asyncio
+import threading
+import time
+import unittest
+from unittest.mock import patch
+from banking.service import BankingService
+from banking.storage import MemoryStorage, set_storage
+
+class TestBankingService(unittest.TestCase):
+    """Test the async service layer over the in-memory backend"""
+
+    def setUp(self):
+        self.storage = MemoryStorage()
+        previous = set_storage(self.storage)
+        self.addCleanup(set_storage, previous)
+        self.service = BankingService({'db_threads': 2, 'max_in_flight': 8})
+        self.addCleanup(self.service.close)
+
+    def test_operations(self):
+        """transfer, history, login and enqueue run the banking managers"""
+        source = self.storage.create_account(1, '111', 'SAVINGS', 100.0)
+        self.storage.create_account(2, '222', 'SAVINGS', 0.0)
+        with patch('security.authh.generate_hash', return_value=('salt', 'hash')):
+            self.service.auth.register_user('alice', 'secret', 'Alice', 'alice@example.com')
+
+        async def scenario():
+            transfer = await self.service.transfer('111', '222', 30.0, "Rent")
+            history = await self.service.history('222')
+            with patch('security.authh.verify_password', side_effect=lambda h, s, p: p == 'secret'):
+                good = await self.service.login('alice', 'secret')
+                bad = await self.service.login('alice', 'wrong')
+            transaction_id = await self.service.enqueue(source, 'DEPOSIT', 5.0)
+            return transfer, history, good, bad, transaction_id
+
+        transfer, history, good, bad, transaction_id = asyncio.run(scenario())
+        self.assertTrue(transfer[0])
+        self.assertEqual(sorted((row['amount'], row['transaction_type']) for row in history),
+                         [(30.0, 'INCOMING'), (30.0, 'OUTGOING')])
+        self.assertTrue(good[0])
+        self.assertEqual(good[1]['user']['username'], 'alice')
+        self.assertEqual(bad, (False, "Invalid username or password"))
+        self.assertEqual(self.storage.list_queued('FIFO', 1)[0]['transaction_id'], transaction_id)
+
+    def test_bounded_concurrency(self):
+        """Thousands of pending operations share a few threads and a bounded number of slots"""
+        running = []
+        peak = [0]
+        lock = threading.Lock()
+
+        def slow(n):
+            with lock:
+                running.append(n)
+                peak[0] = max(peak[0], len(running))
+            time.sleep(0.001)
+            with lock:
+                running.remove(n)
+            return n
+
+        threads_before = threading.active_count()
+
+        async def scenario():
+            return await asyncio.gather(*(self.service.call(slow, n) for n in range(2000)))
+
+        self.assertEqual(asyncio.run(scenario()), list(range(2000)))
+        self.assertLessEqual(peak[0], 2)
+        self.assertEqual(self.service.peak_in_flight, 8)
+        self.assertEqual(self.service.in_flight, 0)
+        self.assertLessEqual(threading.active_count() - threads_before, 2)
+
+    def test_errors_propagate(self):
+        """An exception in a call is raised in the awaiting coroutine"""
+        def fail():
+            raise RuntimeError("boom")
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(self.service.call(fail))
+        self.assertEqual(self.service.in_flight, 0)
+
+if __name__ == '__main__':
+    unittest.main()
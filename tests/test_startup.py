@@ -0,0 +1,57 @@
+import importlib.util
+import os
+import subprocess
+import sys
+import unittest
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must only be loaded on first use, never at startup
+LAZY_MODULES = ('cv2', 'numpy', 'pyzbar', 'mysql', 'gui.admin_panel', 'gui.dashboard',
+                'os_concepts.scheduling', 'os_concepts.multithreading')
+
+# Cold-start budget for everything main.py imports before the login window shows
+STARTUP_IMPORT_BUDGET_MS = 1500
+
+def import_times(statement):
+    """Run statement in a fresh interpreter under -X importtime.
+
+    Returns {module: cumulative import time in microseconds}.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', statement],
+        cwd=PROJECT_DIR, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise AssertionError(f"'{statement}' failed:\n{result.stderr[-2000:]}")
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        times[module.strip()] = int(cumulative)
+    return times
+
+class TestStartup(unittest.TestCase):
+    """Test that startup only imports what the login window needs"""
+
+    def assertNotImported(self, times):
+        loaded = [m for m in times if m.split('.')[0] in LAZY_MODULES or m in LAZY_MODULES]
+        self.assertEqual(loaded, [])
+
+    def test_core_modules_import_lazily(self):
+        """The banking and security layers don't pull in optional dependencies"""
+        times = import_times("import banking.accounts, banking.transfers, banking.transactions, "
+                             "security.authh, security.hashing")
+        self.assertNotImported(times)
+
+    @unittest.skipUnless(importlib.util.find_spec('PyQt5'), "PyQt5 is not installed")
+    def test_startup_budget(self):
+        """main.py imports within budget and defers heavy modules"""
+        times = import_times("import main")
+        self.assertNotImported(times)
+        self.assertLess(times['main'] / 1000, STARTUP_IMPORT_BUDGET_MS)
+
+if __name__ == '__main__':
+    unittest.main()
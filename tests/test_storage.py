@@ -0,0 +1,529 @@
+import io
+import os
+import sqlite3
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch
+from config import DB_CONFIG
+from banking.db_adapter import DatabaseAdapter
+from banking.storage import MemoryStorage, SQLiteStorage, claim_owner, set_storage, utc_timestamp
+from banking.transactions import TransactionManager
+from banking.transfers import TransferManager
+from security.authh import AuthSystem
+
+SQLITE_SCHEMA = """
+    CREATE TABLE users (
+        user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT NOT NULL UNIQUE,
+        password_hash TEXT NOT NULL,
+        salt TEXT NOT NULL,
+        full_name TEXT NOT NULL,
+        email TEXT NOT NULL UNIQUE,
+        is_admin INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE accounts (
+        account_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        account_number TEXT NOT NULL UNIQUE,
+        account_type TEXT NOT NULL,
+        balance REAL DEFAULT 0.00,
+        opening_balance REAL NOT NULL DEFAULT 0.00,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE transactions (
+        transaction_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        account_id INTEGER NOT NULL,
+        transaction_type TEXT NOT NULL,
+        amount REAL NOT NULL,
+        description TEXT,
+        related_account TEXT,
+        status TEXT DEFAULT 'PENDING',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE transaction_queue (
+        queue_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        transaction_id INTEGER NOT NULL,
+        priority INTEGER DEFAULT 5,
+        status TEXT DEFAULT 'QUEUED',
+        added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        claimed_by TEXT,
+        claimed_at TIMESTAMP
+    );
+    CREATE TABLE idempotency_keys (
+        idem_key TEXT PRIMARY KEY,
+        status TEXT NOT NULL DEFAULT 'PENDING',
+        success INTEGER,
+        message TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE verification_jobs (
+        job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        account_number TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'PENDING',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        next_attempt_at REAL NOT NULL,
+        last_error TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE phone_directory (
+        phone TEXT PRIMARY KEY,
+        account_number TEXT NOT NULL,
+        display_name TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE sequences (
+        name TEXT PRIMARY KEY,
+        next_value INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE TABLE import_checkpoints (
+        import_id TEXT PRIMARY KEY,
+        table_name TEXT NOT NULL,
+        source TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'LOADING',
+        rows_done INTEGER NOT NULL DEFAULT 0,
+        rows_loaded INTEGER NOT NULL DEFAULT 0,
+        rows_rejected INTEGER NOT NULL DEFAULT 0,
+        dropped_indexes TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE import_balance_deltas (
+        import_id TEXT NOT NULL,
+        account_number TEXT NOT NULL,
+        delta REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (import_id, account_number)
+    );
+    CREATE TABLE reconciliation_balances (
+        account_id INTEGER PRIMARY KEY,
+        expected_balance REAL NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE reconciliation_runs (
+        run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        mode TEXT NOT NULL,
+        transfer_watermark INTEGER NOT NULL,
+        transaction_watermark INTEGER NOT NULL,
+        accounts INTEGER NOT NULL,
+        discrepancies INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    CREATE TABLE transfer_rollups (
+        account_number TEXT NOT NULL,
+        granularity TEXT NOT NULL,
+        counterparty TEXT NOT NULL DEFAULT '',
+        bucket TEXT NOT NULL,
+        amount_in REAL NOT NULL DEFAULT 0,
+        count_in INTEGER NOT NULL DEFAULT 0,
+        amount_out REAL NOT NULL DEFAULT 0,
+        count_out INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (account_number, granularity, counterparty, bucket)
+    ) WITHOUT ROWID;
+    CREATE TABLE rollup_state (
+        name TEXT PRIMARY KEY,
+        high_water INTEGER NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    INSERT INTO rollup_state (name, high_water) VALUES ('transfer_history', 0);
+    CREATE TABLE transaction_holds (
+        transaction_id INTEGER PRIMARY KEY,
+        reason TEXT NOT NULL,
+        decision TEXT,
+        held_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        reviewed_at TIMESTAMP
+    );
+"""
+
+class StorageContract:
+    """Behaviour every storage backend must provide"""
+
+    def create_storage(self):
+        raise NotImplementedError
+
+    def setUp(self):
+        self.storage = self.create_storage()
+        previous = set_storage(self.storage)
+        self.addCleanup(set_storage, previous)
+
+    def test_users_and_sessions(self):
+        """Users are unique by username and email; sessions round-trip"""
+        auth = AuthSystem()
+        self.assertTrue(auth.register_user("alice", "password123", "Alice", "alice@example.com")[0])
+        self.assertEqual(auth.register_user("alice", "x", "A", "other@example.com"),
+                         (False, "Username already exists"))
+        self.assertEqual(auth.register_user("bob", "x", "B", "alice@example.com"),
+                         (False, "Email already registered"))
+
+        success, result = auth.login("alice", "password123")
+        self.assertTrue(success)
+        session_id = result['user']['session_id']
+        self.assertEqual(auth.validate_session(session_id)[1]['username'], "alice")
+        self.assertTrue(auth.logout(session_id))
+        self.assertEqual(auth.validate_session(session_id), (False, None))
+
+        self.assertEqual([u['username'] for u in self.storage.list_users()], ["alice"])
+
+    def test_transfers(self):
+        """Transfers move money atomically and record both sides"""
+        self.storage.create_account(1, '111', 'SAVINGS', 100.0)
+        self.storage.create_account(2, '222', 'SAVINGS', 0.0)
+
+        self.assertEqual(TransferManager.transfer_funds('111', '999', 1.0),
+                         (False, "Destination account not found"))
+        # Both backends check the destination before the funds
+        self.assertEqual(TransferManager.transfer_funds('111', '999', 500.0),
+                         (False, "Destination account not found"))
+        self.assertEqual(TransferManager.transfer_funds('111', '222', 500.0),
+                         (False, "Insufficient funds in source account"))
+        self.assertTrue(TransferManager.transfer_funds('111', '222', 40.0)[0])
+
+        self.assertEqual(self.storage.get_balance('111'), 60.0)
+        self.assertEqual(self.storage.get_balance('222'), 40.0)
+        history = TransferManager.get_transfer_history('222')
+        self.assertEqual(sorted(t['transaction_type'] for t in history), ['INCOMING', 'OUTGOING'])
+
+    def test_phone_directory(self):
+        """Directory entries are unique per phone; recent payees come from transfers"""
+        self.storage.create_account(1, '111', 'SAVINGS', 100.0)
+        self.storage.create_account(2, '222', 'SAVINGS', 0.0)
+        self.storage.create_account(3, '333', 'SAVINGS', 0.0)
+
+        self.assertTrue(self.storage.add_directory_entry('+919800000002', '222', "Bob")[0])
+        self.assertTrue(self.storage.add_directory_entry('+919800000003', '333', "Carol")[0])
+        self.assertEqual(self.storage.add_directory_entry('+919800000002', '333', "Bob"),
+                         (False, "Phone number already registered"))
+        self.assertEqual(self.storage.add_directory_entry('+919800000004', '999', "Dan"),
+                         (False, "Account not found"))
+        self.assertEqual(self.storage.get_directory_entry('+919800000003')['display_name'], "Carol")
+        self.assertEqual([e['phone'] for e in self.storage.list_directory()],
+                         ['+919800000002', '+919800000003'])
+
+        for destination in ('222', '333', '222'):
+            TransferManager.transfer_funds('111', destination, 1.0)
+        self.assertEqual([p['display_name'] for p in self.storage.recent_payees(1)], ["Bob", "Carol"])
+        self.assertEqual(self.storage.recent_payees(2), [])
+
+    def test_idempotency_keys(self):
+        """A key can be reserved once until it is released or purged"""
+        self.assertTrue(self.storage.reserve_idempotency_key('k1'))
+        self.assertFalse(self.storage.reserve_idempotency_key('k1'))
+        self.assertEqual(self.storage.get_idempotency_key('k1')['status'], 'PENDING')
+
+        self.storage.complete_idempotency_key('k1', True, "done")
+        row = self.storage.get_idempotency_key('k1')
+        self.assertEqual((row['status'], bool(row['success']), row['message']), ('DONE', True, "done"))
+
+        self.storage.reserve_idempotency_key('k2')
+        self.storage.release_idempotency_key('k2')
+        self.assertIsNone(self.storage.get_idempotency_key('k2'))
+
+        # Taken over only once the PENDING lease or the DONE TTL has run out, and only once
+        self.assertFalse(self.storage.take_over_idempotency_key('k1', '9999-12-31 00:00:00', '2000-01-01 00:00:00'))
+        self.assertTrue(self.storage.take_over_idempotency_key('k1', '2000-01-01 00:00:00', '9999-12-31 00:00:00'))
+        self.assertEqual(self.storage.get_idempotency_key('k1')['status'], 'PENDING')
+        self.assertFalse(self.storage.take_over_idempotency_key('k1', '2000-01-01 00:00:00', '9999-12-31 00:00:00'))
+        self.assertTrue(self.storage.take_over_idempotency_key('k1', '9999-12-31 00:00:00', '2000-01-01 00:00:00'))
+        self.assertFalse(self.storage.take_over_idempotency_key('missing', '9999-12-31 00:00:00', '9999-12-31 00:00:00'))
+
+        self.assertEqual(self.storage.purge_idempotency_keys('9999-12-31 00:00:00'), 1)
+        self.assertTrue(self.storage.reserve_idempotency_key('k1'))
+
+    def test_bulk_accounts_and_sequences(self):
+        """Bulk account creation is all or nothing; sequence blocks never overlap"""
+        self.assertEqual(self.storage.create_accounts([(1, '111', 'SAVINGS', 10.0), (2, '222', 'CURRENT', 0.0)]), 2)
+        self.assertEqual(self.storage.get_balance('111'), 10.0)
+
+        with self.assertRaises(Exception):
+            self.storage.create_accounts([(1, '333', 'SAVINGS', 0.0), (1, '111', 'SAVINGS', 0.0)])
+        self.assertIsNone(self.storage.get_balance('333'))
+
+        self.assertEqual(self.storage.reserve_sequence('numbers', 10), 0)
+        self.assertEqual(self.storage.reserve_sequence('numbers', 5), 10)
+        self.assertEqual(self.storage.reserve_sequence('other', 1), 0)
+
+    def test_export_rows(self):
+        """Exports stream filtered rows in batches, oldest first"""
+        account_id = self.storage.create_account(1, '111', 'SAVINGS', 100.0)
+        self.storage.create_account(2, '222', 'SAVINGS', 0.0)
+        self.storage.create_account(3, '333', 'SAVINGS', 0.0)
+        for destination in ('222', '333', '222'):
+            self.storage.transfer('111', destination, 1.0)
+        self.storage.record_transaction(account_id, 'DEPOSIT', 5.0)
+
+        batches = list(self.storage.export_rows('transfer_history', batch_size=4))
+        self.assertEqual([len(batch) for batch in batches], [4, 2])
+        ids = [row['transfer_id'] for batch in batches for row in batch]
+        self.assertEqual(ids, sorted(ids))
+
+        rows = [row for batch in self.storage.export_rows('transfer_history', account_number='333') for row in batch]
+        self.assertEqual({(row['destination_account'], row['transaction_type']) for row in rows},
+                         {('333', 'OUTGOING'), ('333', 'INCOMING')})
+        self.assertEqual(list(self.storage.export_rows('transfer_history', since='9999-01-01 00:00:00')), [])
+        self.assertEqual(len(list(self.storage.export_rows('transfer_history', until='9999-01-01 00:00:00'))), 1)
+
+        transaction = next(self.storage.export_rows('transactions', account_number='111'))[0]
+        self.assertEqual((transaction['account_number'], transaction['transaction_type'], transaction['amount']),
+                         ('111', 'DEPOSIT', 5.0))
+        queued = next(self.storage.export_rows('transaction_queue'))[0]
+        self.assertEqual((queued['account_number'], queued['status'], queued['priority']), ('111', 'QUEUED', 5))
+        self.assertEqual(list(self.storage.export_rows('transaction_queue', account_number='222')), [])
+
+    def test_history_import_chunks(self):
+        """Imported chunks and their checkpoint commit together; balances change once at the end"""
+        account_id = self.storage.create_account(1, '111', 'SAVINGS', 100.0)
+        self.assertEqual(self.storage.get_account_ids(), {'111': account_id})
+
+        self.storage.start_import('imp', 'transactions', 'ledger.csv', [['idx', 'CREATE INDEX idx ON t (c)']])
+        self.storage.load_history_chunk('imp', 'transactions', [
+            (account_id, 'DEPOSIT', 50.0, None, None, 'COMPLETED', '2020-01-01 10:00:00')
+        ], [('111', 50.0)], 2, 1, 1)
+        self.storage.load_history_chunk('imp', 'transactions', [], [('111', -20.0)], 3, 1, 2)
+
+        checkpoint = self.storage.get_import_checkpoint('imp')
+        self.assertEqual((checkpoint['status'], checkpoint['rows_done'], checkpoint['rows_loaded'],
+                          checkpoint['rows_rejected']), ('LOADING', 3, 1, 2))
+        self.assertEqual(checkpoint['dropped_indexes'], [['idx', 'CREATE INDEX idx ON t (c)']])
+        self.assertEqual(self.storage.get_balance('111'), 100.0)
+
+        self.assertEqual(self.storage.finish_import('imp'), 1)
+        self.assertEqual(self.storage.get_balance('111'), 130.0)
+        self.assertEqual(self.storage.get_import_checkpoint('imp')['status'], 'DONE')
+        self.assertEqual(self.storage.get_transaction_history(account_id)[0]['created_at'], '2020-01-01 10:00:00')
+        self.assertEqual(self.storage.list_queued('FIFO', 10), [])
+
+    def test_reconciliation_scan(self):
+        """The scan reads accounts and signed history past the watermarks; runs are saved"""
+        first = self.storage.create_account(1, '111', 'SAVINGS', 100.0)
+        second = self.storage.create_account(2, '222', 'SAVINGS', 0.0)
+        self.storage.transfer('111', '222', 30.0)
+        deposit = self.storage.record_transaction(second, 'DEPOSIT', 5.0)
+        self.storage.finish_transaction(deposit, 'COMPLETED')
+        pending = self.storage.record_transaction(first, 'WITHDRAWAL', 7.0)
+        self.storage.record_transaction(first, 'TRANSFER_OUT', 1.0)
+        self.assertIsNone(self.storage.get_last_reconciliation())
+
+        scan = {}
+        for kind, rows in self.storage.reconciliation_scan(batch_size=1):
+            scan.setdefault(kind, []).extend([tuple(row) for row in rows] if kind != 'watermarks' else [rows])
+        self.assertEqual(scan['watermarks'], [{'transfer_id': 2, 'transaction_id': pending + 1,
+                                               'settled_transaction_id': deposit}])
+        self.assertEqual(scan['accounts'], [(first, '111', 70.0, 100.0, None), (second, '222', 30.0, 0.0, None)])
+        self.assertEqual([row[:3] for row in scan['transfers']], [(1, '111', -30.0), (2, '222', 30.0)])
+        self.assertEqual([row[:5] for row in scan['transactions']], [
+            (deposit, second, 5.0, 'COMPLETED', 'DEPOSIT'), (pending, first, -7.0, 'PENDING', 'WITHDRAWAL'),
+            (pending + 1, first, -1.0, 'PENDING', 'TRANSFER_OUT')
+        ])
+
+        run = {'mode': 'FULL', 'transfer_watermark': 2, 'transaction_watermark': deposit,
+               'accounts': 2, 'discrepancies': 0}
+        self.storage.save_reconciliation(run, [(first, 70.0), (second, 35.0)])
+        self.assertEqual({key: self.storage.get_last_reconciliation()[key] for key in run}, run)
+        accounts = [tuple(row) for kind, rows in self.storage.reconciliation_scan(2, deposit)
+                    if kind == 'accounts' for row in rows]
+        self.assertEqual([row[4] for row in accounts], [70.0, 35.0])
+        self.assertEqual([kind for kind, _ in self.storage.reconciliation_scan(2, deposit)],
+                         ['watermarks', 'accounts', 'transactions'])
+
+    def test_analytics_rollups(self):
+        """Rollups add up, move the watermark once and are read per user"""
+        self.storage.create_account(1, '111', 'SAVINGS', 100.0)
+        self.storage.create_account(1, '112', 'SAVINGS', 0.0)
+        self.storage.create_account(2, '222', 'SAVINGS', 0.0)
+        self.storage.transfer('111', '222', 30.0)
+        rows = self.storage.get_transfers_after(0, 10)
+        self.assertEqual([row[:5] for row in rows], [(1, '111', '222', 'OUTGOING', 30.0),
+                                                     (2, '222', '111', 'INCOMING', 30.0)])
+        self.assertEqual(self.storage.get_transfers_after(1, 10)[0][0], 2)
+        self.assertEqual(self.storage.get_rollup_watermark(), 0)
+
+        day = '2024-05-01 00:00:00'
+        self.assertTrue(self.storage.apply_rollup(0, 2, [
+            ('111', 'A', '222', '', 0.0, 0, 30.0, 1), ('111', 'D', '', day, 0.0, 0, 30.0, 1),
+            ('112', 'A', '111', '', 0.0, 0, 0.0, 0), ('112', 'A', '111', '', 0.0, 0, 5.0, 1)
+        ]))
+        self.assertFalse(self.storage.apply_rollup(0, 4, [('111', 'A', '222', '', 0.0, 0, 99.0, 1)]))
+        self.assertTrue(self.storage.apply_rollup(2, 3, [('111', 'A', '222', '', 0.0, 0, 10.0, 2),
+                                                         ('112', 'D', '', day, 4.0, 1, 0.0, 0)]))
+        self.assertEqual(self.storage.get_rollup_watermark(), 3)
+
+        # Transfers between a user's own accounts are not payees
+        self.assertEqual(self.storage.get_top_payees(1), [{'counterparty': '222', 'amount': 40.0, 'count': 3}])
+        self.assertEqual(self.storage.get_top_payees(2), [])
+        self.assertEqual(self.storage.get_rollup_series(1, 'D', day), [
+            {'bucket': day, 'amount_in': 4.0, 'count_in': 1, 'amount_out': 30.0, 'count_out': 1}
+        ])
+        self.assertEqual(self.storage.get_rollup_series(1, 'D', '2024-05-02 00:00:00'), [])
+
+    def test_verification_jobs(self):
+        """Verification job state is persisted; unfinished jobs come back due-first"""
+        first = self.storage.create_verification_job(1, '111', 20.0)
+        second = self.storage.create_verification_job(1, '222', 10.0)
+        self.storage.create_verification_job(2, '333', 5.0)
+
+        self.storage.update_verification_job(first, 'RUNNING', 1, 20.0)
+        self.assertEqual([j['job_id'] for j in self.storage.get_unfinished_verification_jobs()][1:],
+                         [second, first])
+
+        self.storage.update_verification_job(second, 'FAILED', 3, 10.0, "Bank did not answer")
+        job = self.storage.get_verification_job(second)
+        self.assertEqual((job['status'], job['attempts'], job['last_error']), ('FAILED', 3, "Bank did not answer"))
+        self.assertEqual([j['job_id'] for j in self.storage.get_verification_jobs(1)], [second, first])
+        self.assertEqual(len(self.storage.get_unfinished_verification_jobs()), 2)
+
+    def test_queue_processing(self):
+        """Queued transactions are claimed once, executed and finished"""
+        account_id = self.storage.create_account(1, '111', 'SAVINGS', 100.0)
+        first = TransactionManager.record_transaction(account_id, 'deposit', 10.0)
+        second = TransactionManager.record_transaction(account_id, 'WITHDRAWAL', 30.0)
+        self.storage.set_queue_priority(second, 9)
+
+        self.assertEqual(self.storage.list_queued('FIFO', 1)[0]['transaction_id'], first)
+        self.assertEqual(self.storage.list_queued('PRIORITY', 1)[0]['transaction_id'], second)
+        self.assertEqual([t['transaction_id'] for t in self.storage.queue_heads()], [first])
+        after = self.storage.list_queued_after(0, 10)
+        self.assertEqual([(t['transaction_id'], t['priority']) for t in after], [(first, 5), (second, 9)])
+        self.assertEqual(after[0]['account_type'], 'SAVINGS')
+        partition = self.storage.list_queued_partition(2, account_id % 2, 10)
+        self.assertEqual([t['transaction_id'] for t in partition], [first, second])
+        self.assertEqual(self.storage.list_queued_partition(2, (account_id + 1) % 2, 10), [])
+        self.assertEqual([t['transaction_id'] for t in self.storage.list_queued_after(after[0]['queue_id'])], [second])
+
+        self.assertTrue(self.storage.claim_transaction(first))
+        self.assertFalse(self.storage.claim_transaction(first))
+        self.storage.finish_transaction(first, 'COMPLETED')
+
+        self.assertEqual(TransactionManager.process_transactions(), 1)
+        self.assertEqual(self.storage.list_queued('FIFO', 10), [])
+        self.assertEqual(self.storage.get_balance('111'), 70.0)
+
+        statuses = {t['transaction_id']: t['status'] for t in TransactionManager.get_transaction_history(account_id)}
+        self.assertEqual(statuses, {first: 'COMPLETED', second: 'COMPLETED'})
+        self.assertEqual(len(self.storage.recent_queue(10)), 2)
+
+    def test_batch_claims(self):
+        """A batch is claimed in one go, skipping transactions someone else claimed"""
+        account_id = self.storage.create_account(1, '111', 'SAVINGS', 100.0)
+        ids = [self.storage.record_transaction(account_id, 'DEPOSIT', 1.0) for _ in range(3)]
+        self.assertTrue(self.storage.claim_transaction(ids[1]))
+        self.assertEqual(self.storage.claim_transactions(ids), {ids[0], ids[2]})
+        self.assertEqual(self.storage.claim_transactions(ids), set())
+        self.assertEqual(self.storage.claim_transactions([]), set())
+        self.assertEqual(self.storage.list_queued('FIFO', 10), [])
+
+        self.storage.release_transactions([ids[0], ids[2]])
+        self.assertEqual([t['transaction_id'] for t in self.storage.list_queued('FIFO', 10)], [ids[0], ids[2]])
+        self.assertIsNone(self.storage.apply_transaction(ids[0], '111', 5.0))
+        self.assertEqual(self.storage.claim_transactions(ids), {ids[0], ids[2]})
+        self.assertEqual(self.storage.apply_transaction(ids[0], '111', 5.0), 'COMPLETED')
+        self.assertEqual(self.storage.apply_transaction(ids[2], '999', 5.0), 'FAILED')
+        self.assertEqual(self.storage.get_balance('111'), 105.0)
+        statuses = {t['transaction_id']: t['status'] for t in self.storage.get_transaction_history(account_id)}
+        self.assertEqual((statuses[ids[0]], statuses[ids[2]]), ('COMPLETED', 'FAILED'))
+
+    def test_requeue_claims(self):
+        """Claims are queued again by owner or age, and a lost claim is not applied"""
+        account_id = self.storage.create_account(1, '111', 'SAVINGS', 100.0)
+        ids = [self.storage.record_transaction(account_id, 'DEPOSIT', 1.0) for _ in range(2)]
+        self.assertEqual(self.storage.claim_transactions(ids), set(ids))
+
+        self.assertEqual(self.storage.requeue_claims(owner='elsewhere:1', claimed_before='2000-01-01 00:00:00'), 0)
+        self.assertEqual(self.storage.requeue_claims(owner=claim_owner()), 2)
+        self.assertEqual(self.storage.claim_transactions(ids), set(ids))
+        self.assertEqual(self.storage.requeue_claims(claimed_before=utc_timestamp(-5)), 2)
+
+        # Whoever claimed it first finds its claim gone and changes nothing
+        self.assertIsNone(self.storage.apply_transaction(ids[0], '111', 1.0))
+        self.assertEqual(self.storage.get_balance('111'), 100.0)
+
+    def test_batch_failures(self):
+        """One failing transaction does not strand the rest of its batch"""
+        account_id = self.storage.create_account(1, '111', 'SAVINGS', 100.0)
+        for _ in range(5):
+            TransactionManager.record_transaction(account_id, 'DEPOSIT', 1.0)
+        batch = self.storage.list_queued('FIFO', 10)
+
+        with patch('banking.risk.risk_scorer.score', side_effect=RuntimeError("Scoring failed")):
+            with self.assertRaises(RuntimeError):
+                TransactionManager.process_batch(batch)
+        self.assertEqual(len(self.storage.list_queued('FIFO', 10)), 5)
+
+        apply = self.storage.apply_transaction
+        def fail_third(transaction_id, *args):
+            if transaction_id == batch[2]['transaction_id']:
+                raise OSError("Disk full")
+            return apply(transaction_id, *args)
+
+        with patch.object(self.storage, 'apply_transaction', side_effect=fail_third), redirect_stdout(io.StringIO()):
+            statuses = TransactionManager.process_batch(batch)
+        self.assertEqual(statuses, ['COMPLETED', 'COMPLETED', 'FAILED', 'COMPLETED', 'COMPLETED'])
+        self.assertEqual(self.storage.get_balance('111'), 104.0)
+        self.assertEqual(self.storage.list_queued('FIFO', 10), [])
+        history = self.storage.get_transaction_history(account_id)
+        self.assertEqual(sorted(t['status'] for t in history), ['COMPLETED'] * 4 + ['FAILED'])
+
+    def test_held_transactions(self):
+        """Held transactions are listed with their reason and reviewed once"""
+        account_id = self.storage.create_account(1, '111', 'SAVINGS', 100.0)
+        completed = self.storage.record_transaction(account_id, 'WITHDRAWAL', 10.0)
+        self.storage.finish_transaction(completed, 'COMPLETED')
+        held = self.storage.record_transaction(account_id, 'TRANSFER_OUT', 90.0, related_account='999')
+        self.storage.record_transaction(account_id, 'DEPOSIT', 5.0)
+
+        self.assertTrue(self.storage.claim_transaction(held))
+        self.storage.hold_transactions([(held, "Unusual amount")])
+        rows = self.storage.list_held()
+        self.assertEqual([(row['transaction_id'], row['related_account'], row['reason']) for row in rows],
+                         [(held, '999', "Unusual amount")])
+        statuses = {t['transaction_id']: t['status'] for t in self.storage.get_transaction_history(account_id)}
+        self.assertEqual(statuses[held], 'HELD')
+
+        recent = self.storage.get_recent_transactions(10)
+        self.assertEqual([row[:3] for row in recent], [(account_id, 'WITHDRAWAL', 10.0)])
+        self.assertEqual(self.storage.get_recent_transactions(2), [])
+
+        self.assertTrue(self.storage.claim_held(held, 'REJECTED'))
+        self.assertFalse(self.storage.claim_held(held, 'APPROVED'))
+        self.storage.finish_transaction(held, 'FAILED')
+        self.assertEqual(self.storage.list_held(), [])
+
+class TestMemoryStorage(StorageContract, unittest.TestCase):
+    """Run the storage contract against the in-memory backend"""
+
+    def create_storage(self):
+        return MemoryStorage()
+
+class TestSQLiteStorage(StorageContract, unittest.TestCase):
+    """Run the storage contract against SQLite"""
+
+    def create_storage(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        path = os.path.join(self.tmp.name, 'test.db')
+        conn = sqlite3.connect(path)
+        conn.executescript(SQLITE_SCHEMA)
+        conn.close()
+
+        patcher = patch.dict(DB_CONFIG, {'database': path})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.tmp.cleanup)
+        self.addCleanup(DatabaseAdapter.close_all)
+
+        storage = SQLiteStorage()
+        storage.ensure_transfer_history()
+        return storage
+
+    def test_debit_checks_funds(self):
+        """A stale balance read cannot overdraw: the funds are checked by the debit itself"""
+        self.storage.create_account(1, '111', 'SAVINGS', 50.0)
+        self.storage.create_account(2, '222', 'SAVINGS', 0.0)
+        with patch.object(DatabaseAdapter, 'fetch_one', return_value={'balance': 10 ** 9}):
+            self.assertEqual(self.storage.transfer('111', '222', 80.0),
+                             (False, "Insufficient funds in source account"))
+        self.assertEqual((self.storage.get_balance('111'), self.storage.get_balance('222')), (50.0, 0.0))
+        self.assertEqual(self.storage.get_transfer_history('111'), [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+import threading
+import unittest
+from unittest.mock import patch
+from banking import events, summary as sections
+from banking.accounts import AccountManager
+from banking.analytics import RollupEngine
+from banking.events import event_bus
+from banking.storage import MemoryStorage, set_storage
+from banking.summary import SummaryCache
+from banking.transactions import TransactionManager
+from banking.transfers import TransferManager
+
+class TestDashboardSummary(unittest.TestCase):
+    """Test the cached dashboard summary and its event-driven updates"""
+
+    def setUp(self):
+        self.storage = MemoryStorage()
+        previous = set_storage(self.storage)
+        self.addCleanup(set_storage, previous)
+
+        self.cache = SummaryCache()
+        self.addCleanup(self.cache.close)
+
+        self.account_id = self.storage.create_account(1, '111', 'SAVINGS', 100.0)
+        self.storage.create_account(1, '112', 'CHECKING', 0.0)
+        self.storage.create_account(2, '222', 'SAVINGS', 0.0)
+
+    def test_load(self):
+        """A new session loads every section once"""
+        summary = self.cache.get('session', 1)
+        self.assertEqual(sorted(a['account_number'] for a in summary.accounts), ['111', '112'])
+        self.assertEqual(summary.total_balance(), 100.0)
+        self.assertEqual(summary.linked_banks, [])
+        self.assertEqual(summary.daily_totals, {'incoming': 0.0, 'outgoing': 0.0})
+        self.assertIs(self.cache.get('session', 1), summary)
+
+    def test_transfer_updates_summary_without_reload(self):
+        """A completed transfer patches balances, recent transfers and totals"""
+        summary = self.cache.get('session', 1)
+        changes = []
+        summary.subscribe(changes.append)
+
+        with patch.object(self.storage, 'get_dashboard_summary') as reload:
+            self.assertTrue(TransferManager.transfer_funds('111', '222', 40.0, "Rent")[0])
+        reload.assert_not_called()
+
+        self.assertEqual(summary.get_account('111')['balance'], 60.0)
+        self.assertEqual(summary.recent_transfers[0]['transaction_type'], 'OUTGOING')
+        self.assertEqual(summary.daily_totals, {'incoming': 0.0, 'outgoing': 40.0})
+        self.assertEqual(changes, [{sections.ACCOUNTS, sections.RECENT_TRANSFERS, sections.DAILY_TOTALS}])
+
+        # A self transfer shows up on both sides
+        TransferManager.transfer_funds('111', '112', 10.0)
+        self.assertEqual(summary.total_balance(), 60.0)
+        self.assertEqual([t['transaction_type'] for t in summary.recent_transfers[:2]],
+                         ['INCOMING', 'OUTGOING'])
+
+    def test_unrelated_events_are_ignored(self):
+        """Other users' changes notify nobody"""
+        summary = self.cache.get('session', 1)
+        changes = []
+        summary.subscribe(changes.append)
+
+        AccountManager.update_balance('222', 5.0)
+        with patch('banking.accounts.verification_service'):
+            AccountManager.link_external_bank_account(2, "Other Bank", "999900001111", "Bob")
+            self.assertEqual(changes, [])
+
+            AccountManager.link_external_bank_account(1, "My Bank", "123400005678", "Alice")
+        self.assertEqual([b['bank_name'] for b in summary.linked_banks], ["My Bank"])
+        self.assertIn({sections.LINKED_BANKS}, changes)
+
+    def test_queued_deposit_updates_balance(self):
+        """Balances changed by the transaction queue reach the summary"""
+        summary = self.cache.get('session', 1)
+        TransactionManager.record_transaction(self.account_id, 'DEPOSIT', 25.0)
+        self.assertEqual(TransactionManager.process_transactions(), 1)
+        self.assertEqual(summary.get_account('111')['balance'], 125.0)
+
+    def test_analytics_updates(self):
+        """Rolled up transfers refresh the insights of their owners only"""
+        summary = self.cache.get('session', 1)
+        self.assertEqual(summary.top_payees, [])
+        changes = []
+        summary.subscribe(changes.append)
+
+        self.storage.transfer('111', '222', 15.0)
+        RollupEngine(bus=event_bus).update()
+        self.assertEqual(summary.top_payees, [{'counterparty': '222', 'amount': 15.0, 'count': 1}])
+        self.assertEqual(summary.spending_trend[-1]['amount_out'], 15.0)
+        self.assertEqual(changes, [{sections.ANALYTICS}])
+
+        event_bus.publish(events.ANALYTICS_UPDATED, account_numbers={'222'})
+        self.assertEqual(len(changes), 1)
+
+    def test_concurrent_first_gets(self):
+        """A session is loaded once, and nobody is handed a summary before it is loaded"""
+        loads = []
+        started, release = threading.Event(), threading.Event()
+        original = self.storage.get_dashboard_summary
+
+        def slow_summary(*args, **kwargs):
+            loads.append(args)
+            started.set()
+            release.wait(5)
+            return original(*args, **kwargs)
+
+        results = []
+        with patch.object(self.storage, 'get_dashboard_summary', side_effect=slow_summary):
+            threads = [threading.Thread(target=lambda: results.append(self.cache.get('session', 1)))
+                       for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            self.assertTrue(started.wait(5))
+            self.assertEqual(self.cache.summaries, {})
+            release.set()
+            for thread in threads:
+                thread.join(5)
+
+        self.assertEqual(len(loads), 1)
+        self.assertEqual(len({id(summary) for summary in results}), 1)
+        self.assertEqual(results[0].total_balance(), 100.0)
+        self.assertIs(self.cache.get('session', 1), results[0])
+
+    def test_drop(self):
+        """Dropped sessions stop receiving events"""
+        summary = self.cache.get('session', 1)
+        self.cache.drop('session')
+        TransferManager.transfer_funds('111', '222', 40.0)
+        self.assertEqual(summary.total_balance(), 100.0)
+        self.assertIsNot(self.cache.get('session', 1), summary)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import threading
+import time
+import unittest
+from unittest.mock import patch
+from banking import events
+from banking.accounts import AccountManager
+from banking.events import event_bus
+from banking.storage import MemoryStorage, set_storage
+from banking.verification import (FAILED, PENDING, RUNNING, VERIFIED, SimulatedMicroDepositVerifier,
+                                  VerificationError, VerificationService, Verifier)
+
+class FlakyVerifier(Verifier):
+    """Fails with a transient error a given number of times, then succeeds"""
+    def __init__(self, failures):
+        self.failures = failures
+        self.lock = threading.Lock()
+
+    def send_deposits(self, job):
+        with self.lock:
+            if self.failures:
+                self.failures -= 1
+                raise TimeoutError("Bank did not answer")
+        return [0.12, 0.34]
+
+    def confirm(self, job, amounts):
+        if job['account_number'].endswith('0000'):
+            raise VerificationError("Account is closed")
+        return True
+
+class TestVerificationService(unittest.TestCase):
+    """Test background bank account verification"""
+
+    def setUp(self):
+        self.storage = MemoryStorage()
+        previous = set_storage(self.storage)
+        self.addCleanup(set_storage, previous)
+
+        self.updates = []
+        handler = lambda topic, job: self.updates.append((job['job_id'], job['status']))
+        event_bus.subscribe(events.VERIFICATION_UPDATED, handler)
+        self.addCleanup(event_bus.unsubscribe, events.VERIFICATION_UPDATED, handler)
+
+    def create_service(self, verifier, **options):
+        service = VerificationService(verifier, **options)
+        self.addCleanup(service.stop)
+        return service
+
+    def test_linking_does_not_block(self):
+        """Linking many accounts returns at once; workers verify them in parallel"""
+        service = self.create_service(SimulatedMicroDepositVerifier(delay=0.02), workers=8)
+
+        start = time.perf_counter()
+        with patch('banking.accounts.verification_service', service):
+            for i in range(100):
+                self.assertTrue(AccountManager.link_external_bank_account(1, "Bank", f"5000{i:08d}", "Alice")[0])
+        self.assertLess(time.perf_counter() - start, 1.0)
+
+        self.assertTrue(service.wait_idle(10))
+        linked = self.storage.get_linked_bank_accounts(1)
+        self.assertEqual(len(linked), 100)
+        self.assertTrue(all(account['is_verified'] for account in linked))
+        self.assertEqual({job['status'] for job in service.get_jobs(1)}, {VERIFIED})
+
+    def test_retry_with_backoff(self):
+        """Transient failures are retried with growing delays until they succeed"""
+        service = self.create_service(FlakyVerifier(failures=2), workers=1, base_delay=0.01, max_delay=1.0)
+        self.storage.link_bank_account(1, "Bank", "111122223333", "Alice")
+
+        job_id = service.submit(1, "111122223333")
+        self.assertTrue(service.wait_idle(5))
+
+        job = service.get_job(job_id)
+        self.assertEqual((job['status'], job['attempts']), (VERIFIED, 3))
+        self.assertEqual([status for update_id, status in self.updates if update_id == job_id],
+                         [PENDING, RUNNING, PENDING, RUNNING, PENDING, RUNNING, VERIFIED])
+        self.assertEqual([service.retry_delay(n) for n in (1, 2, 3, 8)], [0.01, 0.02, 0.04, 1.0])
+
+    def test_failures(self):
+        """Permanent errors fail at once; transient ones after max_attempts"""
+        service = self.create_service(FlakyVerifier(failures=100), workers=2, max_attempts=3,
+                                      base_delay=0.01)
+        flaky = service.submit(1, "111122223333")
+        self.assertTrue(service.wait_idle(5))
+        self.assertEqual((service.get_job(flaky)['status'], service.get_job(flaky)['attempts']), (FAILED, 3))
+
+        service.verifier.failures = 0
+        closed = service.submit(1, "444455550000")
+        self.assertTrue(service.wait_idle(5))
+        job = service.get_job(closed)
+        self.assertEqual((job['status'], job['attempts'], job['last_error']), (FAILED, 1, "Account is closed"))
+
+    def test_resume_after_restart(self):
+        """Jobs persisted as PENDING or RUNNING are picked up when the service starts"""
+        self.storage.link_bank_account(1, "Bank", "111122223333", "Alice")
+        job_id = self.storage.create_verification_job(1, "111122223333", time.time())
+        self.storage.update_verification_job(job_id, RUNNING, 1, time.time())
+
+        service = self.create_service(FlakyVerifier(failures=0))
+        service.start()
+        self.assertTrue(service.wait_idle(5))
+        self.assertEqual(service.get_job(job_id)['status'], VERIFIED)
+        self.assertEqual(self.storage.get_linked_bank_accounts(1)[0]['is_verified'], 1)
+
+if __name__ == '__main__':
+    unittest.main()